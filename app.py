@@ -1,13 +1,38 @@
-from flask import Flask, request
+from flask import Flask, Response, g, request
 from flask_restful import Api, Resource
+import werkzeug.exceptions
 from functools import wraps
+import atexit
+import asyncio
 import socket
 import os
 import logging
 import threading
 import time
+import uuid
+from contextlib import nullcontext
+from contextvars import ContextVar
 from dotenv import load_dotenv
-from printers import refresh_printers_from_erp, get_printers_snapshot
+from printers import (refresh_printers_from_erp, get_printers_snapshot, merge_printers, ensure_initial_sync,
+                      initial_sync_done, set_registry_leader)
+from singleflight import SingleFlight
+from events import EventBus, PrinterStateTracker, publish_job, sse_stream, monitor_printers
+from zebra_status import query_host_status
+from shared_state import HostLeader, get_shared_dir, printer_lock
+import cluster
+import discovery
+import raw_ingress
+import render_cache
+from raw_ingress import RAW_CHUNK_BYTES, ClientDisconnected
+import job_history
+import metrics
+import pacing
+import print_confirm
+import profiling
+import timeouts
+import tracing
+from labels import get_label_type
+from logconfig import configure_logging
 from zpl_generator import generate_zpl, generate_msl_sticker, generate_special_instructions_label, generate_dry_label, generate_tracescan_label, generate_svt_fortlox_label_ok, generate_svt_fortlox_label_nok
 from validation import validate_request, validate_msl_request, validate_special_instructions_request, validate_dry_request, validate_tracescan_request, validate_svt_fortlox_request_ok, validate_svt_fortlox_request_nok
 
@@ -15,9 +40,136 @@ from validation import validate_request, validate_msl_request, validate_special_
 load_dotenv()
 APIKEY = os.getenv('APIKEY')
 
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except Exception:
+        return float(default)
+
+
+# Optional reuse window for coalesced reload/status results (0 = only share in-flight runs)
+PRINTERS_RELOAD_CACHE_SECONDS = _env_float('PRINTERS_RELOAD_CACHE_SECONDS', 0)
+PRINTERS_STATUS_CACHE_SECONDS = _env_float('PRINTERS_STATUS_CACHE_SECONDS', 0)
+_single_flight = SingleFlight()
+
+# Multi-process mode (see wsgi.py): cross-process registry, leader and per-printer locks
+_shared_dir = get_shared_dir()
+_host_leader = None
+_raw_ingress = None
+_cluster_started = False
+
+# Requests slower than this are kept for GET /debug/slow-requests (0 disables)
+slow_requests = tracing.SlowRequestLog(
+    threshold_seconds=_env_float('SLOW_REQUEST_SECONDS', 2),
+    size=int(_env_float('SLOW_REQUEST_BUFFER', 100)),
+)
+
+# Every job's ZPL and outcome, for /jobs queries and reprints (off unless JOB_HISTORY_DB or a shared dir)
+history = job_history.open_from_env(_shared_dir)
+
+# Printer state and job lifecycle events, streamed to dashboards via /events
+event_bus = EventBus()
+printer_states = PrinterStateTracker(
+    event_bus,
+    circuit_failures=int(_env_float('PRINTER_CIRCUIT_FAILURES', 0)),
+    circuit_reset_seconds=_env_float('PRINTER_CIRCUIT_RESET_SECONDS', 30),
+)
+
+# Timeout ceilings; below them each printer's timeout follows its observed latency (timeouts.py)
+SEND_TIMEOUT_SECONDS = 10
+PROBE_TIMEOUT_SECONDS = 5
+adaptive_timeouts, hedge_groups = timeouts.from_env()
+# Set by a send whose connect was won by a hedge peer, so the job is accounted to that printer
+_printed_by: ContextVar = ContextVar('miniprint_printed_by', default=None)
+
+# Optional end-to-end confirmation that labels came out (PRINT_CONFIRM, print_confirm.py)
+print_confirmation = print_confirm.from_env()
+# Set by a confirmed send, for run_job's printed/unconfirmed event
+_confirmation: ContextVar = ContextVar('miniprint_print_confirmation', default=None)
+
+# Large jobs are held back while the printer's receive buffer is full (PRINT_PACING, pacing.py)
+print_pacing = pacing.from_env()
+
+# Rendered ZPL by content hash, for POST /render/<label_type>
+renders = render_cache.from_env()
+
+# On-demand sampling or cProfile sessions, controlled through /debug/profile
+profiler = profiling.Profiler()
+
+# Multi-node mode: printers sharded over CLUSTER_NODES by consistent hashing (cluster.py)
+node_cluster = cluster.from_env(APIKEY)
+
 app = Flask(__name__)
 api = Api(app)
-logging.basicConfig(level=logging.DEBUG)
+configure_logging()
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    tracing.start_trace()
+
+
+@app.before_request
+def _route_to_owner():
+    """Forward a print request to the cluster node owning its printer"""
+    if node_cluster is None or request.method != 'POST' or not request.path.startswith('/print'):
+        return None
+    if request.headers.get(cluster.FORWARDED_HEADER):
+        # Already routed by another node; never forward twice
+        return None
+    printer_id = cluster.printer_id_of(request.get_json(silent=True))
+    owner = node_cluster.owner(printer_id) if printer_id else node_cluster.node_id
+    if owner == node_cluster.node_id:
+        return None
+    with tracing.phase('forward'):
+        forwarded = node_cluster.forward(owner, request.path, request.get_data(), request.headers.get('apikey'))
+    if forwarded is None:
+        return None
+    status, body, content_type, handled_by = forwarded
+    response = Response(body, status=status, content_type=content_type)
+    response.headers[cluster.NODE_HEADER] = handled_by
+    return response
+
+
+@app.before_request
+def _start_request_profile():
+    if profiler.active and not request.path.startswith('/debug/profile'):
+        g.profiled = True
+        g.profile = profiler.request_started()
+
+
+@app.teardown_request
+def _finish_request_profile(error=None):
+    # Teardown also runs when the view raised, so the profile is never left enabled
+    if g.pop('profiled', False):
+        profiler.request_finished(g.profile)
+
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        # Label by route pattern, not raw path, to keep series bounded
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.HTTP_LATENCY.labels(endpoint=endpoint, method=request.method).observe(time.perf_counter() - started)
+        metrics.HTTP_REQUESTS.labels(endpoint=endpoint, method=request.method, status=str(response.status_code)).inc()
+
+    if node_cluster is not None and cluster.NODE_HEADER not in response.headers:
+        response.headers[cluster.NODE_HEADER] = node_cluster.node_id
+
+    trace = tracing.end_trace()
+    if trace is not None:
+        response.headers['Server-Timing'] = trace.server_timing()
+        slow_requests.maybe_record(
+            trace,
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+            payload_bytes=request.content_length or 0,
+        )
+    return response
+
 
 def require_apikey(f):
     @wraps(f)
@@ -31,26 +183,274 @@ def require_apikey(f):
     return decorated_function
 
 
+def _keep_chunks(chunks, kept):
+    """Pass chunks through, keeping a copy for the job history while it stays small"""
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if kept is not None and size <= job_history.MAX_STORED_BYTES:
+            kept.append(chunk)
+        elif kept:
+            kept.clear()
+            kept = None
+        yield chunk
+
+
+def _record_job(record, outcome, error=None):
+    """Store a finished job; the history is best effort and never fails a print"""
+    if history is None:
+        return
+    zpl = record['zpl']
+    if isinstance(zpl, list):
+        zpl = b''.join(zpl) if zpl else None
+    try:
+        history.record(**dict(record, zpl=zpl), outcome=outcome, error=error, finished_at=time.time())
+    except Exception as e:
+        logging.error("Failed to record job %s: %s", record['job_id'], e)
+
+
+def _hedge_peer(printer_id):
+    """(peer id, address, connect timeout) a slow connect to printer_id may be hedged to, or None"""
+    peers = hedge_groups.get(printer_id) if printer_id else None
+    if not peers:
+        return None
+    registry = get_printers_snapshot()
+    healthy = [p for p in peers if p in registry and not printer_states.circuit_open(p)]
+    if not healthy:
+        return None
+    peer = min(healthy, key=adaptive_timeouts.srtt)
+    return (peer, (registry[peer]['ip'], registry[peer]['port']),
+            adaptive_timeouts.timeout(peer, timeouts.CONNECT, SEND_TIMEOUT_SECONDS))
+
+
+def _env_list(name, default=''):
+    return [v.strip() for v in os.getenv(name, default).split(',') if v.strip()]
+
+
+def discovery_request(body):
+    """
+    (cidrs, ports) of a discovery request. cidrs default to DISCOVERY_CIDRS and must lie
+    within it, ports to DISCOVERY_PORTS; at most DISCOVERY_MAX_ADDRESSES are scanned.
+    """
+    allowed = _env_list('DISCOVERY_CIDRS')
+    if not allowed:
+        raise ValueError('Discovery is disabled: set DISCOVERY_CIDRS to the ranges it may scan')
+    cidrs = body.get('cidrs') or allowed
+    if isinstance(cidrs, str):
+        cidrs = [cidrs]
+    if not all(isinstance(c, str) for c in cidrs):
+        raise ValueError('"cidrs" must be a list of CIDR ranges')
+    # Raises ValueError on a malformed range
+    foreign = discovery.outside(cidrs, allowed)
+    if foreign:
+        raise ValueError(f"Ranges outside DISCOVERY_CIDRS: {', '.join(foreign)}")
+    allowed_ports = [int(p) for p in _env_list('DISCOVERY_PORTS', ','.join(map(str, discovery.DEFAULT_PORTS)))]
+    ports = [int(p) for p in body.get('ports') or allowed_ports]
+    if not set(ports) <= set(allowed_ports):
+        raise ValueError(f"Ports outside DISCOVERY_PORTS: {', '.join(str(p) for p in ports if p not in allowed_ports)}")
+    count = discovery.count_addresses(cidrs, ports)
+    limit = int(_env_float('DISCOVERY_MAX_ADDRESSES', 65536))
+    if count > limit:
+        raise ValueError(f"{count} addresses to scan, more than DISCOVERY_MAX_ADDRESSES ({limit})")
+    return cidrs, ports
+
+
+def render_request(label_type, body, if_none_match=None):
+    """
+    (status, body, headers) of a render request. The body is ZPL bytes on 200, empty on
+    304 and a JSON-able error otherwise. printer_id is optional since nothing is sent.
+    """
+    try:
+        label = get_label_type(label_type)
+    except ValueError as e:
+        return 404, {'error': str(e)}, {}
+    if not isinstance(body, dict):
+        return 400, {'errors': ['Input data must be a dictionary']}, {}
+    data = {'printer_id': '', **body}
+    with tracing.phase('validate'):
+        errors = label.validate(data)
+    if errors:
+        return 400, {'errors': errors}, {}
+    tracing.annotate(label_type=label.name)
+    with tracing.phase('render'):
+        rendered = renders.render(label, data, if_none_match)
+    headers = {'ETag': rendered.etag, 'Cache-Control': 'no-cache',
+               'X-Template-Version': render_cache.TEMPLATE_VERSION,
+               'X-Render-Cache': 'hit' if rendered.cached else 'miss'}
+    if rendered.zpl is None:
+        return 304, b'', headers
+    return 200, rendered.zpl, headers
+
+
+def _publish_confirmation(job_id, printer_id, label_type):
+    """Publish a confirmed send's printed/unconfirmed event; returns the job's history outcome"""
+    confirmation = _confirmation.get()
+    if confirmation is None:
+        return 'sent'
+    status = 'printed' if confirmation.printed else 'unconfirmed'
+    publish_job(event_bus, job_id, status, printer_id, label_type, **confirmation.details())
+    return 'printed' if confirmation.printed else 'sent'
+
+
 # Common printer communication mixin
 class PrinterCommunicationMixin:
-    def send_zpl_to_printer(self, printer_ip, printer_port, zpl_data):
+    def send_zpl_to_printer(self, printer_ip, printer_port, zpl_data, printer_id=None):
+        self.send_bytes_to_printer(printer_ip, printer_port, (zpl_data.encode('utf-8'),), printer_id)
+
+    def send_bytes_to_printer(self, printer_ip, printer_port, chunks, printer_id=None):
+        """
+        Send chunks over one connection and return the byte count. Each chunk is written
+        out before the next is pulled, so a streamed body is never buffered beyond one chunk.
+        """
+        printer_label = printer_id or f"{printer_ip}:{printer_port}"
+        sent = 0
+        phase, winner = timeouts.CONNECT, printer_id
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.settimeout(10)  # Add timeout for better error handling
-                sock.connect((printer_ip, printer_port))
-                sock.sendall(zpl_data.encode('utf-8'))
+            started = time.perf_counter()
+            connect_timeout = adaptive_timeouts.timeout(printer_id, timeouts.CONNECT, SEND_TIMEOUT_SECONDS)
+            hedge = _hedge_peer(printer_id)
+            with tracing.phase('connect'):
+                if hedge is None:
+                    sock = socket.create_connection((printer_ip, printer_port), timeout=connect_timeout)
+                else:
+                    delay = adaptive_timeouts.hedge_delay(printer_id)
+                    winner, sock = timeouts.hedged_connect(
+                        (printer_id, (printer_ip, printer_port), connect_timeout), hedge, delay)
+            connected = time.perf_counter()
+            if hedge is not None and connected - started >= delay:
+                timeouts.PRINTER_HEDGES.labels(printer=printer_id, winner=winner).inc()
+            if winner == printer_id:
+                adaptive_timeouts.observe(printer_id, timeouts.CONNECT, connected - started, SEND_TIMEOUT_SECONDS)
+            else:
+                logging.warning("Connect to %s was slow, job sent to %s instead", printer_id, winner,
+                                extra={'printer_id': printer_id})
+                _printed_by.set(winner)
+                printer_label = winner
+            # The hedge peer is not covered by run_job's printer lock
+            lock = printer_lock(_shared_dir, winner) if _shared_dir and winner != printer_id else nullcontext()
+            with sock, lock:
+                policy = print_confirmation if print_confirmation and print_confirmation.applies(printer_id) else None
+                tally = None
+                if policy is not None:
+                    before = print_confirm.counter_before(sock, winner, policy)
+                    tally = print_confirm.LabelTally()
+                if print_pacing is not None and print_pacing.applies(winner):
+                    chunks = pacing.paced(sock, chunks, pacing.Pacer(print_pacing, winner))
+                phase = timeouts.SEND
+                send_started = time.perf_counter()
+                with tracing.phase('send'):
+                    for chunk in chunks:
+                        sock.settimeout(adaptive_timeouts.timeout(winner, timeouts.SEND, SEND_TIMEOUT_SECONDS))
+                        chunk_started = time.perf_counter()
+                        sock.sendall(chunk)
+                        adaptive_timeouts.observe(winner, timeouts.SEND, time.perf_counter() - chunk_started,
+                                                  SEND_TIMEOUT_SECONDS)
+                        sent += len(chunk)
+                        if tally is not None:
+                            tally.feed(chunk)
+                metrics.PRINTER_CONNECT_LATENCY.labels(printer=printer_label).observe(connected - started)
+                metrics.PRINTER_SEND_LATENCY.labels(printer=printer_label).observe(time.perf_counter() - send_started)
+                metrics.PRINTER_BYTES_SENT.labels(printer=printer_label).inc(sent)
+                if tally is not None and tally.finish():
+                    with tracing.phase('confirm'):
+                        _confirmation.set(print_confirm.wait_printed(sock, printer_label, before, tally.labels,
+                                                                     send_started, policy))
+                return sent
         except socket.timeout as e:
-            logging.error(f"Connection timeout to printer at {printer_ip}:{printer_port}")
+            adaptive_timeouts.timed_out(winner, phase)
+            metrics.PRINTER_ERRORS.labels(printer=printer_label, type='timeout').inc()
+            logging.error("Connection timeout to printer at %s:%s", printer_ip, printer_port,
+                          extra={'printer_id': printer_id})
             raise Exception("Printer connection timeout") from e
         except socket.error as e:
-            logging.error(f"Socket error while connecting to printer at {printer_ip}:{printer_port}: {str(e)}")
+            metrics.PRINTER_ERRORS.labels(printer=printer_label, type='socket').inc()
+            logging.error("Socket error while connecting to printer at %s:%s: %s", printer_ip, printer_port, e,
+                          extra={'printer_id': printer_id})
             raise Exception(f"Printer connection error: {str(e)}") from e
+        except pacing.PrinterStalled as e:
+            metrics.PRINTER_ERRORS.labels(printer=printer_label, type='stalled').inc()
+            logging.error("%s after %d bytes", e, sent, extra={'printer_id': printer_id})
+            raise
+        except ClientDisconnected:
+            # The sender's fault, not the printer's
+            raise
         except Exception as e:
-            logging.error(f"Unexpected error while sending data to printer: {str(e)}")
+            metrics.PRINTER_ERRORS.labels(printer=printer_label, type='other').inc()
+            logging.error("Unexpected error while sending data to printer: %s", e, extra={'printer_id': printer_id})
             raise
 
+    def validate_payload(self, validator, data):
+        """Run one of the validation functions as the 'validate' phase of the request"""
+        with tracing.phase('validate'):
+            return validator(data)
+
+    def render_label(self, generator, data):
+        """Render a label with one of the zpl_generator functions, recording render time"""
+        with tracing.phase('render'), metrics.RENDER_LATENCY.labels(generator=generator.__name__).time():
+            return generator(**data)
+
+    def send_job(self, printer_id, printer, label_type, zpl_data, data=None):
+        """Send a rendered label, tracking printer state and publishing job events. Returns the job id."""
+        tracing.annotate(label_type=label_type, zpl_bytes=len(zpl_data))
+        payload = zpl_data.encode('utf-8')
+        job_id, _ = self.run_job(printer_id, label_type, lambda: self.send_bytes_to_printer(
+            printer['ip'], printer['port'], (payload,), printer_id=printer_id),
+            zpl=payload, refs=job_history.references(data), bytes=len(zpl_data))
+        return job_id
+
+    def stream_job(self, printer_id, printer, chunks):
+        """Pass raw ZPL chunks through to the printer as a job. Returns (job id, bytes sent)."""
+        tracing.annotate(label_type='raw')
+        kept = []
+        job_id, sent = self.run_job(printer_id, 'raw', lambda: self.send_bytes_to_printer(
+            printer['ip'], printer['port'], _keep_chunks(raw_ingress.whole_formats(chunks), kept),
+            printer_id=printer_id), zpl=kept)
+        return job_id, sent
+
+    def run_job(self, printer_id, label_type, send, zpl=None, refs=None, reprint_of=None, **details):
+        """
+        Run send() as a print job: circuit breaker, printer lock, state tracking, job events
+        and job history. zpl is the bytes sent (or a list filled with the chunks while sending).
+        """
+        job_id = uuid.uuid4().hex
+        tracing.annotate(job_id=job_id)
+        started = time.time()
+        record = dict(job_id=job_id, printer_id=printer_id, label_type=label_type, created_at=started,
+                      zpl=zpl, reprint_of=reprint_of, **(refs or {}))
+        if printer_states.circuit_open(printer_id):
+            publish_job(event_bus, job_id, 'failed', printer_id, label_type, error='circuit open')
+            _record_job(record, 'failed', error='circuit open')
+            raise Exception(f"Printer {printer_id} is unavailable (circuit open)")
+
+        publish_job(event_bus, job_id, 'sending', printer_id, label_type, **details)
+        _printed_by.set(None)
+        _confirmation.set(None)
+        try:
+            if _shared_dir is None:
+                result = send()
+            else:
+                # Other worker processes may be printing to the same device
+                with printer_lock(_shared_dir, printer_id):
+                    result = send()
+        except Exception as e:
+            failed = _printed_by.get() or printer_id
+            if not isinstance(e, ClientDisconnected):
+                printer_states.record_failure(failed, str(e))
+            publish_job(event_bus, job_id, 'failed', failed, label_type, error=str(e))
+            _record_job(dict(record, printer_id=failed), 'failed', error=str(e))
+            raise
+        printed_by = _printed_by.get() or printer_id
+        printer_states.record_success(printed_by)
+        hedged = {'requested_printer_id': printer_id} if printed_by != printer_id else {}
+        publish_job(event_bus, job_id, 'sent', printed_by, label_type, **hedged)
+        outcome = _publish_confirmation(job_id, printed_by, label_type)
+        _record_job(dict(record, printer_id=printed_by), outcome)
+        return job_id, result
+
     def get_printer_info(self, printer_id):
-        printer = get_printers_snapshot().get(printer_id)
+        tracing.annotate(printer_id=printer_id)
+        with tracing.phase('lookup'):
+            printer = get_printers_snapshot().get(printer_id)
         if not printer:
             raise ValueError('Printer ID not found')
         return printer
@@ -68,11 +468,39 @@ class PrintersReload(Resource):
 
     def post(self):
         try:
-            refresh_printers_from_erp()
-            count = len(get_printers_snapshot())
+            count = _single_flight.do('printers-reload', self.reload, ttl=PRINTERS_RELOAD_CACHE_SECONDS)
             return {'message': 'Printers reload triggered', 'count': count}
         except Exception as e:
-            logging.error(f"Error reloading printers: {str(e)}")
+            logging.error("Error reloading printers: %s", e)
+            return {'error': str(e)}, 500
+
+    @staticmethod
+    def reload():
+        refresh_printers_from_erp()
+        # A reload changes what a status sweep would probe
+        _single_flight.forget('printers-status')
+        return len(get_printers_snapshot())
+
+
+class PrintersDiscover(Resource):
+    method_decorators = [require_apikey]
+
+    def post(self):
+        """Scan CIDR ranges for Zebras and diff against the registry; {"merge": true} applies moved printers"""
+        body = request.get_json(silent=True) or {}
+        try:
+            cidrs, ports = discovery_request(body)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        try:
+            key = f"printers-discover:{','.join(cidrs)}:{','.join(map(str, ports))}"
+            result = dict(_single_flight.do(key, lambda: asyncio.run(discovery.discover(cidrs, ports))))
+            if body.get('merge'):
+                result['merged'] = merge_printers(discovery.merge(result, bool(body.get('add_unregistered'))))
+                _single_flight.forget('printers-status')
+            return result
+        except Exception as e:
+            logging.error("Error in PrintersDiscover: %s", e)
             return {'error': str(e)}, 500
 
 
@@ -80,24 +508,37 @@ class PrinterStatus(Resource):
     method_decorators = [require_apikey]
 
     def get(self):
+        # Concurrent pollers share one probe sweep
+        return dict(_single_flight.do('printers-status', self.probe_all, ttl=PRINTERS_STATUS_CACHE_SECONDS))
+
+    def probe_all(self):
         status = {}
         for printer_id, printer_info in get_printers_snapshot().items():
             try:
-                online = self.check_printer_status(printer_info['ip'], printer_info['port'])
+                online = self.check_printer_status(printer_info['ip'], printer_info['port'], printer_id)
                 status[printer_id] = 'Online' if online else 'Offline'
+                if online:
+                    printer_states.record_success(printer_id)
+                else:
+                    printer_states.record_failure(printer_id)
             except Exception as e:
-                logging.error(f"Error checking printer {printer_id} status: {str(e)}")
+                logging.error("Error checking printer %s status: %s", printer_id, e, extra={'printer_id': printer_id})
                 status[printer_id] = 'Error'
         return status
 
-    def check_printer_status(self, printer_ip, printer_port):
+    def check_printer_status(self, printer_ip, printer_port, printer_id=None):
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.settimeout(5)
+            sock.settimeout(adaptive_timeouts.timeout(printer_id, timeouts.CONNECT, PROBE_TIMEOUT_SECONDS))
             try:
+                started = time.perf_counter()
                 sock.connect((printer_ip, printer_port))
+                adaptive_timeouts.observe(printer_id, timeouts.CONNECT, time.perf_counter() - started,
+                                          PROBE_TIMEOUT_SECONDS)
                 return True
             except Exception as e:
-                logging.warning(f"Failed to connect to {printer_ip}:{printer_port} - {e}")
+                if isinstance(e, socket.timeout):
+                    adaptive_timeouts.timed_out(printer_id, timeouts.CONNECT)
+                logging.warning("Failed to connect to %s:%s - %s", printer_ip, printer_port, e)
                 return False
 
 
@@ -106,21 +547,21 @@ class PrintLabel(Resource, PrinterCommunicationMixin):
 
     def post(self):
         try:
-            errors = validate_request(request.json)
+            errors = self.validate_payload(validate_request, request.json)
             if errors:
                 return {'errors': errors}, 400
 
             data = request.json
             printer = self.get_printer_info(data['printer_id'])
             
-            zpl_command = generate_zpl(**data)
-            self.send_zpl_to_printer(printer['ip'], printer['port'], zpl_command)
+            zpl_command = self.render_label(generate_zpl, data)
+            job_id = self.send_job(data['printer_id'], printer, 'standard', zpl_command, data)
             
-            return {'message': 'Label sent to printer successfully'}
+            return {'message': 'Label sent to printer successfully', 'job_id': job_id}
         except ValueError as e:
             return {'error': str(e)}, 404
         except Exception as e:
-            logging.error(f"Error in PrintLabel: {str(e)}")
+            logging.error("Error in PrintLabel: %s", e)
             return {'error': str(e)}, 500
 
 
@@ -129,21 +570,21 @@ class PrintMsl(Resource, PrinterCommunicationMixin):
 
     def post(self):
         try:
-            errors = validate_msl_request(request.json)
+            errors = self.validate_payload(validate_msl_request, request.json)
             if errors:
                 return {'errors': errors}, 400
 
             data = request.json
             printer = self.get_printer_info(data['printer_id'])
             
-            print_msl_command = generate_msl_sticker(**data)
-            self.send_zpl_to_printer(printer['ip'], printer['port'], print_msl_command)
+            print_msl_command = self.render_label(generate_msl_sticker, data)
+            job_id = self.send_job(data['printer_id'], printer, 'msl', print_msl_command, data)
             
-            return {'message': 'MSL label sent to printer successfully'}
+            return {'message': 'MSL label sent to printer successfully', 'job_id': job_id}
         except ValueError as e:
             return {'error': str(e)}, 404
         except Exception as e:
-            logging.error(f"Error in PrintMsl: {str(e)}")
+            logging.error("Error in PrintMsl: %s", e)
             return {'error': str(e)}, 500
 
 
@@ -152,21 +593,21 @@ class PrintSpecialInstructions(Resource, PrinterCommunicationMixin):
 
     def post(self):
         try:
-            errors = validate_special_instructions_request(request.json)
+            errors = self.validate_payload(validate_special_instructions_request, request.json)
             if errors:
                 return {'errors': errors}, 400
 
             data = request.json
             printer = self.get_printer_info(data['printer_id'])
             
-            print_command = generate_special_instructions_label(**data)
-            self.send_zpl_to_printer(printer['ip'], printer['port'], print_command)
+            print_command = self.render_label(generate_special_instructions_label, data)
+            job_id = self.send_job(data['printer_id'], printer, 'special-instructions', print_command, data)
             
-            return {'message': 'Special Instructions label sent to printer successfully'}
+            return {'message': 'Special Instructions label sent to printer successfully', 'job_id': job_id}
         except ValueError as e:
             return {'error': str(e)}, 404
         except Exception as e:
-            logging.error(f"Error in PrintSpecialInstructions: {str(e)}")
+            logging.error("Error in PrintSpecialInstructions: %s", e)
             return {'error': str(e)}, 500
 
 
@@ -175,21 +616,21 @@ class PrintDry(Resource, PrinterCommunicationMixin):
 
     def post(self):
         try:
-            errors = validate_dry_request(request.json)
+            errors = self.validate_payload(validate_dry_request, request.json)
             if errors:
                 return {'errors': errors}, 400
 
             data = request.json
             printer = self.get_printer_info(data['printer_id'])
             
-            print_command = generate_dry_label(**data)
-            self.send_zpl_to_printer(printer['ip'], printer['port'], print_command)
+            print_command = self.render_label(generate_dry_label, data)
+            job_id = self.send_job(data['printer_id'], printer, 'dry', print_command, data)
             
-            return {'message': 'DRY label sent to printer successfully'}
+            return {'message': 'DRY label sent to printer successfully', 'job_id': job_id}
         except ValueError as e:
             return {'error': str(e)}, 404
         except Exception as e:
-            logging.error(f"Error in PrintDry: {str(e)}")
+            logging.error("Error in PrintDry: %s", e)
             return {'error': str(e)}, 500
 
 
@@ -198,21 +639,21 @@ class PrintTracescanLabel(Resource, PrinterCommunicationMixin):
 
     def post(self):
         try:
-            errors = validate_tracescan_request(request.json)
+            errors = self.validate_payload(validate_tracescan_request, request.json)
             if errors:
                 return {'errors': errors}, 400
 
             data = request.json
             printer = self.get_printer_info(data['printer_id'])
             
-            print_command = generate_tracescan_label(**data)
-            self.send_zpl_to_printer(printer['ip'], printer['port'], print_command)
+            print_command = self.render_label(generate_tracescan_label, data)
+            job_id = self.send_job(data['printer_id'], printer, 'tracescan', print_command, data)
             
-            return {'message': 'Tracescan label sent to printer successfully'}
+            return {'message': 'Tracescan label sent to printer successfully', 'job_id': job_id}
         except ValueError as e:
             return {'error': str(e)}, 404
         except Exception as e:
-            logging.error(f"Error in PrintTracescanLabel: {str(e)}")
+            logging.error("Error in PrintTracescanLabel: %s", e)
             return {'error': str(e)}, 500
 
 
@@ -221,21 +662,21 @@ class PrintSvtFortloxLabelOk(Resource, PrinterCommunicationMixin):
 
     def post(self):
         try:
-            errors = validate_svt_fortlox_request_ok(request.json)
+            errors = self.validate_payload(validate_svt_fortlox_request_ok, request.json)
             if errors:
                 return {'errors': errors}, 400
 
             data = request.json
             printer = self.get_printer_info(data['printer_id'])
             
-            print_command = generate_svt_fortlox_label_ok(**data)
-            self.send_zpl_to_printer(printer['ip'], printer['port'], print_command)
+            print_command = self.render_label(generate_svt_fortlox_label_ok, data)
+            job_id = self.send_job(data['printer_id'], printer, 'svt-fortlox-ok', print_command, data)
             
-            return {'message': 'SVT Fortlox OK label sent to printer successfully'}
+            return {'message': 'SVT Fortlox OK label sent to printer successfully', 'job_id': job_id}
         except ValueError as e:
             return {'error': str(e)}, 404
         except Exception as e:
-            logging.error(f"Error in PrintSvtFortloxLabelOk: {str(e)}")
+            logging.error("Error in PrintSvtFortloxLabelOk: %s", e)
             return {'error': str(e)}, 500
 
 
@@ -244,24 +685,262 @@ class PrintSvtFortloxLabelNok(Resource, PrinterCommunicationMixin):
 
     def post(self):
         try:
-            errors = validate_svt_fortlox_request_nok(request.json)
+            errors = self.validate_payload(validate_svt_fortlox_request_nok, request.json)
             if errors:
                 return {'errors': errors}, 400
 
             data = request.json
             printer = self.get_printer_info(data['printer_id'])
             
-            print_command = generate_svt_fortlox_label_nok(**data)
-            self.send_zpl_to_printer(printer['ip'], printer['port'], print_command)
+            print_command = self.render_label(generate_svt_fortlox_label_nok, data)
+            job_id = self.send_job(data['printer_id'], printer, 'svt-fortlox-nok', print_command, data)
             
-            return {'message': 'SVT Fortlox NOK label sent to printer successfully'}
+            return {'message': 'SVT Fortlox NOK label sent to printer successfully', 'job_id': job_id}
+        except ValueError as e:
+            return {'error': str(e)}, 404
+        except Exception as e:
+            logging.error("Error in PrintSvtFortloxLabelNok: %s", e)
+            return {'error': str(e)}, 500
+
+
+def _request_chunks(stream):
+    """The request body in chunks; a client that drops mid-upload raises ClientDisconnected"""
+    while True:
+        try:
+            chunk = stream.read(RAW_CHUNK_BYTES)
+        except (werkzeug.exceptions.ClientDisconnected, OSError) as e:
+            raise ClientDisconnected(f"Client disconnected before the body was complete: {e}") from e
+        if not chunk:
+            return
+        yield chunk
+
+
+class RawPrint(Resource, PrinterCommunicationMixin):
+    method_decorators = [require_apikey]
+
+    def post(self, printer_id):
+        """Stream the request body, finished ZPL, unchanged to the printer"""
+        try:
+            printer = self.get_printer_info(printer_id)
+            job_id, sent = self.stream_job(printer_id, printer, _request_chunks(request.stream))
+            tracing.annotate(zpl_bytes=sent)
+            return {'message': 'ZPL sent to printer successfully', 'job_id': job_id, 'bytes': sent}
+        except ValueError as e:
+            return {'error': str(e)}, 404
+        except ClientDisconnected as e:
+            logging.warning("RawPrint to %s: %s", printer_id, e, extra={'printer_id': printer_id})
+            return {'error': str(e)}, 400
+        except Exception as e:
+            logging.error("Error in RawPrint: %s", e)
+            return {'error': str(e)}, 500
+
+
+class RenderLabel(Resource):
+    method_decorators = [require_apikey]
+
+    def post(self, label_type):
+        """The ZPL a print request would send, without printing; honours If-None-Match"""
+        try:
+            status, body, headers = render_request(label_type, request.get_json(silent=True),
+                                                   request.headers.get('If-None-Match'))
+        except Exception as e:
+            logging.error("Error in RenderLabel: %s", e)
+            return {'error': str(e)}, 500
+        if isinstance(body, dict):
+            return body, status
+        return Response(body, status=status, headers=headers, content_type=render_cache.CONTENT_TYPE)
+
+
+def _history_or_404():
+    if history is None:
+        raise LookupError('Job history is disabled')
+    return history
+
+
+class JobList(Resource):
+    method_decorators = [require_apikey]
+
+    def get(self):
+        """Stored jobs filtered by batch, serial, printer_id, label_type, outcome and since/until, newest first"""
+        try:
+            jobs = _history_or_404().query(
+                batch=request.args.get('batch'),
+                serial=request.args.get('serial'),
+                printer_id=request.args.get('printer_id'),
+                label_type=request.args.get('label_type'),
+                outcome=request.args.get('outcome'),
+                since=job_history.parse_time(request.args.get('since')),
+                until=job_history.parse_time(request.args.get('until')),
+                limit=max(1, min(int(request.args.get('limit', 100)), 1000)),
+            )
+        except LookupError as e:
+            return {'error': str(e)}, 404
         except ValueError as e:
+            return {'error': f"Invalid query: {e}"}, 400
+        return {'jobs': jobs}
+
+
+class JobDetail(Resource):
+    method_decorators = [require_apikey]
+
+    def get(self, job_id):
+        try:
+            job = _history_or_404().get(job_id)
+        except LookupError as e:
+            return {'error': str(e)}, 404
+        if job is None:
+            return {'error': 'Job not found'}, 404
+        return job
+
+
+class JobReprint(Resource, PrinterCommunicationMixin):
+    method_decorators = [require_apikey]
+
+    def post(self, job_id):
+        """Send a stored job's ZPL again, to its printer or to {"printer_id": ...}, without re-rendering"""
+        try:
+            store = _history_or_404()
+            job = store.get(job_id)
+            zpl = store.zpl(job_id) if job else None
+            if zpl is None:
+                return {'error': 'Job not found' if job is None else 'Job has no stored ZPL'}, 404
+            body = request.get_json(silent=True) or {}
+            printer_id = body.get('printer_id') or job['printer_id']
+            printer = self.get_printer_info(printer_id)
+            tracing.annotate(label_type=job['label_type'], zpl_bytes=len(zpl))
+            new_job_id, _ = self.run_job(
+                printer_id, job['label_type'],
+                lambda: self.send_bytes_to_printer(printer['ip'], printer['port'], (zpl,), printer_id=printer_id),
+                zpl=zpl, refs={'batch': job['batch'], 'serial': job['serial']}, reprint_of=job_id, bytes=len(zpl))
+            return {'message': 'Job reprinted successfully', 'job_id': new_job_id, 'reprint_of': job_id}
+        except (LookupError, ValueError) as e:
             return {'error': str(e)}, 404
         except Exception as e:
-            logging.error(f"Error in PrintSvtFortloxLabelNok: {str(e)}")
+            logging.error("Error in JobReprint: %s", e)
             return {'error': str(e)}, 500
 
 
+def _cluster_or_404():
+    if node_cluster is None:
+        raise LookupError('Clustering is not enabled')
+    return node_cluster
+
+
+class ClusterStatus(Resource):
+    method_decorators = [require_apikey]
+
+    def get(self):
+        """This node's view of the cluster: live ring, members and the owner of every printer"""
+        try:
+            return _cluster_or_404().status(sorted(get_printers_snapshot()))
+        except LookupError as e:
+            return {'error': str(e)}, 404
+
+
+class ClusterHealth(Resource):
+    method_decorators = [require_apikey]
+
+    def get(self):
+        """Heartbeat target for the other nodes; replies with the known members"""
+        try:
+            node = _cluster_or_404()
+        except LookupError as e:
+            return {'error': str(e)}, 404
+        return {'node': node.node_id, 'members': node.members()}
+
+
+class ClusterMembership(Resource):
+    method_decorators = [require_apikey]
+
+    def post(self, action):
+        """{"node": ..., "url": ...} joining or leaving the cluster"""
+        try:
+            node = _cluster_or_404()
+        except LookupError as e:
+            return {'error': str(e)}, 404
+        body = request.get_json(silent=True) or {}
+        if not body.get('node') or (action == 'join' and not body.get('url')):
+            return {'error': 'node and url are required'}, 400
+        if action == 'join':
+            node.join(body['node'], body['url'])
+        else:
+            node.leave(body['node'])
+        return {'node': node.node_id, 'members': node.members()}
+
+
+class Events(Resource):
+    method_decorators = [require_apikey]
+
+    def get(self):
+        """Server-Sent Events stream of printer state changes and print job events"""
+        try:
+            last_event_id = int(request.headers.get('Last-Event-ID', ''))
+        except ValueError:
+            last_event_id = None
+        response = Response(sse_stream(event_bus, printer_states, last_event_id), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class Metrics(Resource):
+    method_decorators = [require_apikey]
+
+    def get(self):
+        """Prometheus text exposition of all recorded metrics"""
+        return Response(metrics.REGISTRY.expose(), content_type=metrics.CONTENT_TYPE)
+
+
+class SlowRequests(Resource):
+    method_decorators = [require_apikey]
+
+    def get(self):
+        """Requests slower than SLOW_REQUEST_SECONDS, newest first, with their phase breakdown"""
+        return {'threshold_seconds': slow_requests.threshold_seconds, 'requests': slow_requests.entries()}
+
+
+class ProfileSession(Resource):
+    method_decorators = [require_apikey]
+
+    def get(self):
+        status = profiler.status()
+        if status is None:
+            return {'error': 'No profiling session'}, 404
+        return status
+
+    def post(self):
+        """Start profiling: {"mode": "sample" or "cprofile", "seconds": ..., "requests": ..., "interval_ms": ...}"""
+        try:
+            return profiler.start_from_request(request.get_json(silent=True)), 202
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        except RuntimeError as e:
+            return {'error': str(e)}, 409
+
+    def delete(self):
+        status = profiler.stop()
+        if status is None:
+            return {'error': 'No profiling session'}, 404
+        return status
+
+
+class ProfileResult(Resource):
+    method_decorators = [require_apikey]
+
+    def get(self):
+        """Download of the last session: collapsed stacks, or ?format=pstats|text for cProfile"""
+        try:
+            body, content_type, filename = profiler.result(request.args.get('format'))
+        except LookupError as e:
+            return {'error': str(e)}, 404
+        except RuntimeError as e:
+            return {'error': str(e)}, 409
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        return Response(body, content_type=content_type,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
 class HelloWorld(Resource):
     def get(self):
         return {'message': 'miniprint api'}
@@ -277,6 +956,15 @@ api.add_resource(Ping, '/ping')
 api.add_resource(PrinterList, '/printers')
 api.add_resource(PrinterStatus, '/printers/status')
 api.add_resource(PrintersReload, '/printers/reload')
+api.add_resource(PrintersDiscover, '/printers/discover')
+api.add_resource(Events, '/events')
+api.add_resource(ClusterStatus, '/cluster')
+api.add_resource(ClusterHealth, '/cluster/health')
+api.add_resource(ClusterMembership, '/cluster/<any(join, leave):action>')
+api.add_resource(Metrics, '/metrics')
+api.add_resource(SlowRequests, '/debug/slow-requests')
+api.add_resource(ProfileSession, '/debug/profile')
+api.add_resource(ProfileResult, '/debug/profile/result')
 api.add_resource(PrintLabel, '/print')
 api.add_resource(PrintMsl, '/print/msl')
 api.add_resource(PrintSpecialInstructions, '/print/special-instructions')
@@ -284,32 +972,128 @@ api.add_resource(PrintDry, '/print/dry')
 api.add_resource(PrintTracescanLabel, '/print/tracescan')
 api.add_resource(PrintSvtFortloxLabelOk, '/print/svt-fortlox-ok')
 api.add_resource(PrintSvtFortloxLabelNok, '/print/svt-fortlox-nok')
+api.add_resource(RawPrint, '/raw/<string:printer_id>')
+api.add_resource(RenderLabel, '/render/<string:label_type>')
+api.add_resource(JobList, '/jobs')
+api.add_resource(JobDetail, '/jobs/<string:job_id>')
+api.add_resource(JobReprint, '/jobs/<string:job_id>/reprint')
 
-if __name__ == '__main__':
-    # Optional background auto-refresh of printers from ERP
-    debug_enabled = os.getenv('FLASK_DEBUG', 'false').lower() in ('1', 'true', 't', 'yes', 'y', 'on')
+
+def _auto_refresh_worker(interval_seconds: int, refresh_first: bool = False):
+    if refresh_first:
+        # A newly elected leader may have started from a registry published by a previous run
+        try:
+            refresh_printers_from_erp()
+        except Exception as e:
+            logging.error("Auto-refresh printers failed: %s", e)
+    if interval_seconds <= 0:
+        return
+    while True:
+        try:
+            time.sleep(interval_seconds)
+            refresh_printers_from_erp(full=False)
+        except Exception as e:
+            logging.error("Auto-refresh printers failed: %s", e)
+
+
+def _monitor_worker(interval_seconds: int):
+    while True:
+        try:
+            monitor_printers(printer_states, get_printers_snapshot, query_host_status)
+        except Exception as e:
+            logging.error("Printer monitor failed: %s", e)
+        time.sleep(interval_seconds)
+
+
+def _start_worker_threads(refresh_first: bool = False):
+    global _raw_ingress
     try:
         refresh_seconds = int(os.getenv('PRINTERS_REFRESH_SECONDS', '0'))
     except Exception:
         refresh_seconds = 0
+    try:
+        monitor_seconds = int(os.getenv('PRINTERS_MONITOR_SECONDS', '0'))
+    except Exception:
+        monitor_seconds = 0
 
-    def _auto_refresh_worker(interval_seconds: int):
-        while True:
-            try:
-                time.sleep(interval_seconds)
-                refresh_printers_from_erp()
-            except Exception as e:
-                logging.error(f"Auto-refresh printers failed: {e}")
-
-    if refresh_seconds > 0:
-        should_start_thread = (not debug_enabled) or (os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
-        if should_start_thread:
-            threading.Thread(
-                target=_auto_refresh_worker,
-                args=(refresh_seconds,),
-                name='PrintersAutoRefresh',
-                daemon=True,
-            ).start()
+    if refresh_seconds > 0 or refresh_first:
+        threading.Thread(
+            target=_auto_refresh_worker,
+            # Without periodic refresh, a new leader still refreshes once
+            args=(refresh_seconds, refresh_first),
+            name='PrintersAutoRefresh',
+            daemon=True,
+        ).start()
+    if monitor_seconds > 0:
+        threading.Thread(
+            target=_monitor_worker,
+            args=(monitor_seconds,),
+            name='PrintersMonitor',
+            daemon=True,
+        ).start()
+
+    # Ingress ports can only be bound once per host, so in multi-process mode the leader serves them
+    if _raw_ingress is None:
+        try:
+            _raw_ingress = raw_ingress.start_from_env(PrinterCommunicationMixin().stream_job)
+        except Exception as e:
+            logging.error("Raw ingress failed to start: %s", e)
+
+
+def _leader_election_worker(leader, retry_seconds: float = 5):
+    while not leader.try_acquire():
+        time.sleep(retry_seconds)
+    logging.info("Process %s is the printers leader for this host", os.getpid())
+    # The first leader makes the host's one ERP sync and publishes it; a leader that takes
+    # over from another one refreshes what that one published
+    took_over = initial_sync_done()
+    ensure_initial_sync()
+    _start_worker_threads(refresh_first=took_over)
+
+
+def start_background_workers():
+    """
+    Start the first ERP sync, the optional auto-refresh and monitor threads, the raw TCP
+    ingress and the cluster heartbeat.
+
+    With MINIPRINT_SHARED_DIR set (multi-process mode) every worker calls this, but the
+    threads only run in the one process holding the host leader lock; if that process
+    exits, another worker takes over within a few seconds.
+    """
+    global _host_leader, _cluster_started
+    elect = _shared_dir is not None and _host_leader is None
+    if elect:
+        # Before the initial sync, which asks ERP only in the leader
+        _host_leader = HostLeader(_shared_dir)
+        set_registry_leader(_host_leader)
+    # The first ERP sync runs while the server already answers; lookups wait for it
+    threading.Thread(target=ensure_initial_sync, name='PrintersInitialSync', daemon=True).start()
+    if node_cluster is not None and not _cluster_started:
+        # Every worker forwards requests, so every worker keeps its own view of the ring
+        _cluster_started = True
+        node_cluster.start()
+        if _shared_dir is None:
+            # A worker exiting in multi-process mode does not mean the node is leaving
+            atexit.register(node_cluster.stop)
+    if _shared_dir is None:
+        _start_worker_threads()
+        return
+    if elect:
+        threading.Thread(
+            target=_leader_election_worker,
+            args=(_host_leader,),
+            name='PrintersLeaderElection',
+            daemon=True,
+        ).start()
+
+
+if __name__ == '__main__':
+    debug_enabled = os.getenv('FLASK_DEBUG', 'false').lower() in ('1', 'true', 't', 'yes', 'y', 'on')
+
+    # Optional background auto-refresh of printers from ERP and printer monitoring
+    should_start_thread = (not debug_enabled) or (os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
+    if should_start_thread:
+        start_background_workers()
 
     app.run(
         debug=debug_enabled,
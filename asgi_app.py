@@ -0,0 +1,780 @@
+"""
+ASGI entry point serving the same API as app.py on asyncio.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5500
+
+Printer sends and status probes use asyncio streams, so thousands of concurrent print
+requests to slow printers wait on the event loop instead of holding one OS thread each.
+Validation and ZPL rendering reuse validation.py and zpl_generator.py unchanged (through
+labels.py), and printer state, events, metrics and the slow-request log are the same
+objects the Flask app uses. Only ERP reloads run in a worker thread.
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+import uuid
+from contextlib import nullcontext
+from urllib.parse import parse_qsl
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import app as flask_app
+import cluster
+import discovery
+import job_history
+import metrics
+import pacing
+import print_confirm
+import raw_ingress
+import render_cache
+import timeouts
+import tracing
+from events import publish_job
+from labels import LABEL_TYPES_BY_ROUTE, LabelType
+from printers import get_printers_snapshot, initial_sync_done, merge_printers
+from shared_state import printer_lock_async
+from singleflight import AsyncSingleFlight
+
+SEND_TIMEOUT_SECONDS = 10
+PROBE_TIMEOUT_SECONDS = 5
+# Upper bound on simultaneous probes during a status sweep
+PROBE_CONCURRENCY = 256
+MAX_BODY_BYTES = 1024 * 1024
+# Comment line sent on an idle /events stream, as sse_stream does
+SSE_KEEPALIVE_SECONDS = 15
+
+_single_flight = AsyncSingleFlight()
+
+
+class Request:
+    def __init__(self, scope: Dict[str, Any], body: bytes):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+        self.body = body
+        self.query = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        # Path parameters of a PATTERN_ROUTES match
+        self.params: Dict[str, str] = {}
+        # Cluster node that produced the response, when forwarded to a printer's owner
+        self.handled_by: Optional[str] = None
+
+    def json(self) -> Any:
+        return json.loads(self.body or b'null')
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, body: Dict[str, Any]):
+        super().__init__(body)
+        self.status = status
+        self.body = body
+
+
+# A handler returns (status, JSON body), (status, raw body, content type) or
+# (status, raw body, content type, extra headers)
+HandlerResult = Tuple[Any, ...]
+
+
+async def _single_chunk(payload: bytes) -> AsyncIterator[bytes]:
+    yield payload
+
+
+async def send_zpl_to_printer(printer_ip: str, printer_port: int, zpl_data: str, printer_id: Optional[str] = None) -> None:
+    await send_bytes_to_printer(printer_ip, printer_port, _single_chunk(zpl_data.encode('utf-8')), printer_id)
+
+
+async def send_bytes_to_printer(printer_ip: str, printer_port: int, chunks: AsyncIterator[bytes],
+                                printer_id: Optional[str] = None) -> int:
+    """
+    Send chunks over one connection and return the byte count. The next chunk is only
+    pulled once the previous one has drained, so a slow printer slows the sender down
+    instead of filling memory.
+    """
+    printer_label = printer_id or f"{printer_ip}:{printer_port}"
+    adaptive = flask_app.adaptive_timeouts
+    reader = writer = None
+    sent = 0
+    phase, winner = timeouts.CONNECT, printer_id
+    try:
+        started = time.perf_counter()
+        connect_timeout = adaptive.timeout(printer_id, timeouts.CONNECT, SEND_TIMEOUT_SECONDS)
+        hedge = flask_app._hedge_peer(printer_id)
+        with tracing.phase('connect'):
+            if hedge is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(printer_ip, printer_port),
+                                                        connect_timeout)
+            else:
+                delay = adaptive.hedge_delay(printer_id)
+                winner, reader, writer = await timeouts.hedged_open_connection(
+                    (printer_id, (printer_ip, printer_port), connect_timeout), hedge, delay)
+        connected = time.perf_counter()
+        if hedge is not None and connected - started >= delay:
+            timeouts.PRINTER_HEDGES.labels(printer=printer_id, winner=winner).inc()
+        if winner == printer_id:
+            adaptive.observe(printer_id, timeouts.CONNECT, connected - started, SEND_TIMEOUT_SECONDS)
+        else:
+            logging.warning("Connect to %s was slow, job sent to %s instead", printer_id, winner,
+                            extra={'printer_id': printer_id})
+            flask_app._printed_by.set(winner)
+            printer_label = winner
+        shared_dir = flask_app._shared_dir
+        # The hedge peer is not covered by run_job's printer lock
+        lock = printer_lock_async(shared_dir, winner) if shared_dir and winner != printer_id else nullcontext()
+        confirmation = flask_app.print_confirmation
+        policy = confirmation if confirmation and confirmation.applies(printer_id) else None
+        async with lock:
+            tally = None
+            if policy is not None:
+                before = await print_confirm.counter_before_async(reader, writer, winner, policy)
+                tally = print_confirm.LabelTally()
+            pacing_policy = flask_app.print_pacing
+            if pacing_policy is not None and pacing_policy.applies(winner):
+                chunks = pacing.paced_async(reader, writer, chunks, pacing.Pacer(pacing_policy, winner))
+            phase = timeouts.SEND
+            send_started = time.perf_counter()
+            with tracing.phase('send'):
+                async for chunk in chunks:
+                    chunk_started = time.perf_counter()
+                    writer.write(chunk)
+                    await asyncio.wait_for(writer.drain(), adaptive.timeout(winner, timeouts.SEND, SEND_TIMEOUT_SECONDS))
+                    adaptive.observe(winner, timeouts.SEND, time.perf_counter() - chunk_started, SEND_TIMEOUT_SECONDS)
+                    sent += len(chunk)
+                    if tally is not None:
+                        tally.feed(chunk)
+            metrics.PRINTER_CONNECT_LATENCY.labels(printer=printer_label).observe(connected - started)
+            metrics.PRINTER_SEND_LATENCY.labels(printer=printer_label).observe(time.perf_counter() - send_started)
+            metrics.PRINTER_BYTES_SENT.labels(printer=printer_label).inc(sent)
+            if tally is not None and tally.finish():
+                with tracing.phase('confirm'):
+                    flask_app._confirmation.set(await print_confirm.wait_printed_async(
+                        reader, writer, printer_label, before, tally.labels, send_started, policy))
+        return sent
+    except asyncio.TimeoutError as e:
+        adaptive.timed_out(winner, phase)
+        metrics.PRINTER_ERRORS.labels(printer=printer_label, type='timeout').inc()
+        logging.error("Connection timeout to printer at %s:%s", printer_ip, printer_port,
+                      extra={'printer_id': printer_id})
+        raise Exception("Printer connection timeout") from e
+    except OSError as e:
+        metrics.PRINTER_ERRORS.labels(printer=printer_label, type='socket').inc()
+        logging.error("Socket error while connecting to printer at %s:%s: %s", printer_ip, printer_port, e,
+                      extra={'printer_id': printer_id})
+        raise Exception(f"Printer connection error: {str(e)}") from e
+    except pacing.PrinterStalled as e:
+        metrics.PRINTER_ERRORS.labels(printer=printer_label, type='stalled').inc()
+        logging.error("%s after %d bytes", e, sent, extra={'printer_id': printer_id})
+        raise
+    finally:
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+async def send_job(printer_id: str, printer: Dict[str, Any], label_type: str, zpl_data: str,
+                   data: Optional[Dict[str, Any]] = None) -> str:
+    """Async counterpart of PrinterCommunicationMixin.send_job"""
+    tracing.annotate(label_type=label_type, zpl_bytes=len(zpl_data))
+    payload = zpl_data.encode('utf-8')
+    job_id, _ = await run_job(printer_id, label_type, lambda: send_bytes_to_printer(
+        printer['ip'], printer['port'], _single_chunk(payload), printer_id=printer_id),
+        zpl=payload, refs=job_history.references(data), bytes=len(zpl_data))
+    return job_id
+
+
+async def _printers() -> Dict[str, Dict[str, Any]]:
+    """get_printers_snapshot(); until the first ERP sync is done it waits in a thread, not on the loop"""
+    if initial_sync_done():
+        return get_printers_snapshot()
+    return await asyncio.to_thread(get_printers_snapshot)
+
+
+async def _keep_chunks(chunks: AsyncIterator[bytes], kept: List[bytes]) -> AsyncIterator[bytes]:
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if kept is not None and size <= job_history.MAX_STORED_BYTES:
+            kept.append(chunk)
+        elif kept:
+            kept.clear()
+            kept = None
+        yield chunk
+
+
+async def stream_job(printer_id: str, printer: Dict[str, Any], chunks: AsyncIterator[bytes]) -> Tuple[str, int]:
+    """Async counterpart of PrinterCommunicationMixin.stream_job"""
+    tracing.annotate(label_type='raw')
+    kept: List[bytes] = []
+    return await run_job(printer_id, 'raw', lambda: send_bytes_to_printer(
+        printer['ip'], printer['port'], _keep_chunks(raw_ingress.whole_formats_async(chunks), kept),
+        printer_id=printer_id), zpl=kept)
+
+
+async def _record_job(record: Dict[str, Any], outcome: str, error: Optional[str] = None) -> None:
+    if flask_app.history is not None:
+        await asyncio.to_thread(flask_app._record_job, record, outcome, error)
+
+
+async def run_job(printer_id: str, label_type: str, send: Callable[[], Awaitable[Any]], zpl: Any = None,
+                  refs: Optional[Dict[str, Any]] = None, reprint_of: Optional[str] = None,
+                  **details: Any) -> Tuple[str, Any]:
+    """Async counterpart of PrinterCommunicationMixin.run_job"""
+    job_id = uuid.uuid4().hex
+    tracing.annotate(job_id=job_id)
+    record = dict(job_id=job_id, printer_id=printer_id, label_type=label_type, created_at=time.time(),
+                  zpl=zpl, reprint_of=reprint_of, **(refs or {}))
+    if flask_app.printer_states.circuit_open(printer_id):
+        publish_job(flask_app.event_bus, job_id, 'failed', printer_id, label_type, error='circuit open')
+        await _record_job(record, 'failed', error='circuit open')
+        raise Exception(f"Printer {printer_id} is unavailable (circuit open)")
+
+    publish_job(flask_app.event_bus, job_id, 'sending', printer_id, label_type, **details)
+    flask_app._printed_by.set(None)
+    flask_app._confirmation.set(None)
+    shared_dir = flask_app._shared_dir
+    try:
+        lock = printer_lock_async(shared_dir, printer_id) if shared_dir else nullcontext()
+        async with lock:
+            result = await send()
+    except Exception as e:
+        failed = flask_app._printed_by.get() or printer_id
+        if not isinstance(e, raw_ingress.ClientDisconnected):
+            flask_app.printer_states.record_failure(failed, str(e))
+        publish_job(flask_app.event_bus, job_id, 'failed', failed, label_type, error=str(e))
+        await _record_job(dict(record, printer_id=failed), 'failed', error=str(e))
+        raise
+    printed_by = flask_app._printed_by.get() or printer_id
+    flask_app.printer_states.record_success(printed_by)
+    hedged = {'requested_printer_id': printer_id} if printed_by != printer_id else {}
+    publish_job(flask_app.event_bus, job_id, 'sent', printed_by, label_type, **hedged)
+    outcome = flask_app._publish_confirmation(job_id, printed_by, label_type)
+    await _record_job(dict(record, printer_id=printed_by), outcome)
+    return job_id, result
+
+
+async def check_printer_status(printer_ip: str, printer_port: int, printer_id: Optional[str] = None) -> bool:
+    adaptive = flask_app.adaptive_timeouts
+    started = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(printer_ip, printer_port),
+                                           adaptive.timeout(printer_id, timeouts.CONNECT, PROBE_TIMEOUT_SECONDS))
+    except (OSError, asyncio.TimeoutError) as e:
+        if isinstance(e, asyncio.TimeoutError):
+            adaptive.timed_out(printer_id, timeouts.CONNECT)
+        logging.warning("Failed to connect to %s:%s - %s", printer_ip, printer_port, e)
+        return False
+    adaptive.observe(printer_id, timeouts.CONNECT, time.perf_counter() - started, PROBE_TIMEOUT_SECONDS)
+    writer.close()
+    return True
+
+
+async def _probe_all() -> Dict[str, str]:
+    semaphore = asyncio.Semaphore(PROBE_CONCURRENCY)
+
+    async def probe(printer_id: str, printer_info: Dict[str, Any]) -> Tuple[str, str]:
+        async with semaphore:
+            try:
+                online = await check_printer_status(printer_info['ip'], printer_info['port'], printer_id)
+            except Exception as e:
+                logging.error("Error checking printer %s status: %s", printer_id, e, extra={'printer_id': printer_id})
+                return printer_id, 'Error'
+        if online:
+            flask_app.printer_states.record_success(printer_id)
+        else:
+            flask_app.printer_states.record_failure(printer_id)
+        return printer_id, 'Online' if online else 'Offline'
+
+    registry = await _printers()
+    results = await asyncio.gather(*(probe(pid, info) for pid, info in registry.items()))
+    return dict(results)
+
+
+async def _reload() -> int:
+    count = await asyncio.to_thread(flask_app.PrintersReload.reload)
+    _single_flight.forget('printers-status')
+    return count
+
+
+# Handlers
+
+async def hello_world(request: Request) -> HandlerResult:
+    return 200, {'message': 'miniprint api'}
+
+
+async def ping(request: Request) -> HandlerResult:
+    return 200, {'message': 'pong'}
+
+
+async def printer_list(request: Request) -> HandlerResult:
+    return 200, await _printers()
+
+
+async def printers_reload(request: Request) -> HandlerResult:
+    try:
+        count = await _single_flight.do('printers-reload', _reload, ttl=flask_app.PRINTERS_RELOAD_CACHE_SECONDS)
+        return 200, {'message': 'Printers reload triggered', 'count': count}
+    except Exception as e:
+        logging.error("Error reloading printers: %s", e)
+        return 500, {'error': str(e)}
+
+
+async def printers_discover(request: Request) -> HandlerResult:
+    try:
+        body = (request.json() if request.body else None) or {}
+        cidrs, ports = flask_app.discovery_request(body)
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    try:
+        key = f"printers-discover:{','.join(cidrs)}:{','.join(map(str, ports))}"
+        result = dict(await _single_flight.do(key, lambda: discovery.discover(cidrs, ports)))
+        if body.get('merge'):
+            result['merged'] = merge_printers(discovery.merge(result, bool(body.get('add_unregistered'))))
+            _single_flight.forget('printers-status')
+        return 200, result
+    except Exception as e:
+        logging.error("Error in printers_discover: %s", e)
+        return 500, {'error': str(e)}
+
+
+def _cluster() -> cluster.Cluster:
+    if flask_app.node_cluster is None:
+        raise HTTPError(404, {'error': 'Clustering is not enabled'})
+    return flask_app.node_cluster
+
+
+async def cluster_status(request: Request) -> HandlerResult:
+    return 200, _cluster().status(sorted(await _printers()))
+
+
+async def cluster_health(request: Request) -> HandlerResult:
+    node = _cluster()
+    return 200, {'node': node.node_id, 'members': node.members()}
+
+
+async def cluster_membership(request: Request) -> HandlerResult:
+    node = _cluster()
+    try:
+        body = request.json() or {}
+    except ValueError:
+        body = {}
+    action = request.path.rsplit('/', 1)[1]
+    if not body.get('node') or (action == 'join' and not body.get('url')):
+        return 400, {'error': 'node and url are required'}
+    if action == 'join':
+        node.join(body['node'], body['url'])
+    else:
+        node.leave(body['node'])
+    return 200, {'node': node.node_id, 'members': node.members()}
+
+
+async def _route_to_owner(request: Request) -> Optional[HandlerResult]:
+    """Counterpart of app._route_to_owner: forward a print request to its printer's owner"""
+    node = flask_app.node_cluster
+    if node is None or request.method != 'POST' or not request.path.startswith('/print'):
+        return None
+    if request.headers.get(cluster.FORWARDED_HEADER.lower()):
+        return None
+    try:
+        printer_id = cluster.printer_id_of(request.json())
+    except ValueError:
+        return None
+    owner = node.owner(printer_id) if printer_id else node.node_id
+    if owner == node.node_id:
+        return None
+    with tracing.phase('forward'):
+        forwarded = await asyncio.to_thread(node.forward, owner, request.path, request.body,
+                                            request.headers.get('apikey'))
+    if forwarded is None:
+        return None
+    status, body, content_type, request.handled_by = forwarded
+    return status, body, content_type
+
+
+async def printer_status(request: Request) -> HandlerResult:
+    status = await _single_flight.do('printers-status', _probe_all, ttl=flask_app.PRINTERS_STATUS_CACHE_SECONDS)
+    return 200, dict(status)
+
+
+async def metrics_endpoint(request: Request) -> HandlerResult:
+    return 200, metrics.REGISTRY.expose().encode('utf-8'), metrics.CONTENT_TYPE
+
+
+async def slow_requests(request: Request) -> HandlerResult:
+    log = flask_app.slow_requests
+    return 200, {'threshold_seconds': log.threshold_seconds, 'requests': log.entries()}
+
+
+async def profile_session(request: Request) -> HandlerResult:
+    profiler = flask_app.profiler
+    if request.method == 'POST':
+        try:
+            body = request.json() if request.body else None
+        except ValueError:
+            body = None
+        try:
+            # cProfile follows the event loop thread, where all handlers run
+            return 202, profiler.start_from_request(body, per_request=False)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        except RuntimeError as e:
+            return 409, {'error': str(e)}
+    status = profiler.stop() if request.method == 'DELETE' else profiler.status()
+    if status is None:
+        return 404, {'error': 'No profiling session'}
+    return 200, status
+
+
+async def profile_result(request: Request) -> HandlerResult:
+    try:
+        body, content_type, filename = flask_app.profiler.result(request.query.get('format'))
+    except LookupError as e:
+        return 404, {'error': str(e)}
+    except RuntimeError as e:
+        return 409, {'error': str(e)}
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    return 200, body, content_type, {'Content-Disposition': f'attachment; filename={filename}'}
+
+
+def print_handler(label: LabelType) -> Callable[[Request], Awaitable[HandlerResult]]:
+    async def handler(request: Request) -> HandlerResult:
+        try:
+            data = request.json()
+        except ValueError:
+            raise HTTPError(400, {'message': 'The browser (or proxy) sent a request that this server could not understand.'})
+        try:
+            with tracing.phase('validate'):
+                errors = label.validate(data)
+            if errors:
+                return 400, {'errors': errors}
+
+            printer_id = data['printer_id']
+            tracing.annotate(printer_id=printer_id)
+            with tracing.phase('lookup'):
+                printer = (await _printers()).get(printer_id)
+            if not printer:
+                raise ValueError('Printer ID not found')
+
+            with tracing.phase('render'), metrics.RENDER_LATENCY.labels(generator=label.generate.__name__).time():
+                zpl = label.generate(**data)
+            job_id = await send_job(printer_id, printer, label.name, zpl, data)
+            return 200, {'message': label.message, 'job_id': job_id}
+        except ValueError as e:
+            return 404, {'error': str(e)}
+        except Exception as e:
+            logging.error("Error in %s: %s", label.route, e)
+            return 500, {'error': str(e)}
+    return handler
+
+
+async def _body_chunks(receive) -> AsyncIterator[bytes]:
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise raw_ingress.ClientDisconnected("Client disconnected before the body was complete")
+        chunk = message.get('body', b'')
+        if chunk:
+            yield chunk
+        if not message.get('more_body', False):
+            return
+
+
+async def raw_print(request: Request) -> HandlerResult:
+    """POST /raw/<printer_id>: stream the body, finished ZPL, unchanged to the printer"""
+    printer_id = request.params['printer_id']
+    try:
+        tracing.annotate(printer_id=printer_id)
+        with tracing.phase('lookup'):
+            printer = (await _printers()).get(printer_id)
+        if not printer:
+            raise ValueError('Printer ID not found')
+        job_id, sent = await stream_job(printer_id, printer, _body_chunks(request.receive))
+        tracing.annotate(zpl_bytes=sent)
+        return 200, {'message': 'ZPL sent to printer successfully', 'job_id': job_id, 'bytes': sent}
+    except ValueError as e:
+        return 404, {'error': str(e)}
+    except raw_ingress.ClientDisconnected as e:
+        logging.warning("raw_print to %s: %s", printer_id, e, extra={'printer_id': printer_id})
+        return 400, {'error': str(e)}
+    except Exception as e:
+        logging.error("Error in raw_print: %s", e)
+        return 500, {'error': str(e)}
+
+
+async def render_label(request: Request) -> HandlerResult:
+    """POST /render/<label_type>: the ZPL a print request would send, without printing"""
+    try:
+        body = request.json()
+    except ValueError:
+        body = None
+    try:
+        status, body, headers = flask_app.render_request(request.params['label_type'], body,
+                                                         request.headers.get('if-none-match'))
+    except Exception as e:
+        logging.error("Error in render_label: %s", e)
+        return 500, {'error': str(e)}
+    if isinstance(body, dict):
+        return status, body
+    return status, body, render_cache.CONTENT_TYPE, headers
+
+
+def _history() -> job_history.JobHistory:
+    if flask_app.history is None:
+        raise HTTPError(404, {'error': 'Job history is disabled'})
+    return flask_app.history
+
+
+async def job_list(request: Request) -> HandlerResult:
+    store = _history()
+    args = request.query
+    try:
+        jobs = await asyncio.to_thread(
+            store.query,
+            batch=args.get('batch'), serial=args.get('serial'), printer_id=args.get('printer_id'),
+            label_type=args.get('label_type'), outcome=args.get('outcome'),
+            since=job_history.parse_time(args.get('since')), until=job_history.parse_time(args.get('until')),
+            limit=max(1, min(int(args.get('limit', 100)), 1000)),
+        )
+    except ValueError as e:
+        return 400, {'error': f"Invalid query: {e}"}
+    return 200, {'jobs': jobs}
+
+
+async def job_detail(request: Request) -> HandlerResult:
+    job = await asyncio.to_thread(_history().get, request.params['job_id'])
+    if job is None:
+        return 404, {'error': 'Job not found'}
+    return 200, job
+
+
+async def job_reprint(request: Request) -> HandlerResult:
+    store = _history()
+    job_id = request.params['job_id']
+    job = await asyncio.to_thread(store.get, job_id)
+    zpl = await asyncio.to_thread(store.zpl, job_id) if job else None
+    if zpl is None:
+        return 404, {'error': 'Job not found' if job is None else 'Job has no stored ZPL'}
+    try:
+        body = request.json() if request.body else {}
+    except ValueError:
+        body = {}
+    printer_id = (body or {}).get('printer_id') or job['printer_id']
+    printer = (await _printers()).get(printer_id)
+    if not printer:
+        return 404, {'error': 'Printer ID not found'}
+    try:
+        tracing.annotate(label_type=job['label_type'], zpl_bytes=len(zpl))
+        new_job_id, _ = await run_job(
+            printer_id, job['label_type'],
+            lambda: send_bytes_to_printer(printer['ip'], printer['port'], _single_chunk(zpl), printer_id=printer_id),
+            zpl=zpl, refs={'batch': job['batch'], 'serial': job['serial']}, reprint_of=job_id, bytes=len(zpl))
+    except Exception as e:
+        logging.error("Error in job_reprint: %s", e)
+        return 500, {'error': str(e)}
+    return 200, {'message': 'Job reprinted successfully', 'job_id': new_job_id, 'reprint_of': job_id}
+
+
+# (path) -> {method: (handler, requires_apikey)}
+ROUTES: Dict[str, Dict[str, Tuple[Callable[[Request], Awaitable[HandlerResult]], bool]]] = {
+    '/': {'GET': (hello_world, False)},
+    '/ping': {'GET': (ping, False)},
+    '/printers': {'GET': (printer_list, True)},
+    '/printers/status': {'GET': (printer_status, True)},
+    '/printers/reload': {'POST': (printers_reload, True)},
+    '/printers/discover': {'POST': (printers_discover, True)},
+    '/cluster': {'GET': (cluster_status, True)},
+    '/cluster/health': {'GET': (cluster_health, True)},
+    '/cluster/join': {'POST': (cluster_membership, True)},
+    '/cluster/leave': {'POST': (cluster_membership, True)},
+    '/metrics': {'GET': (metrics_endpoint, True)},
+    '/debug/slow-requests': {'GET': (slow_requests, True)},
+    '/debug/profile': {'GET': (profile_session, True), 'POST': (profile_session, True),
+                       'DELETE': (profile_session, True)},
+    '/debug/profile/result': {'GET': (profile_result, True)},
+    '/jobs': {'GET': (job_list, True)},
+}
+for _label in LABEL_TYPES_BY_ROUTE.values():
+    ROUTES[_label.route] = {'POST': (print_handler(_label), True)}
+
+# Routes with path parameters: (pattern, endpoint label as in app.py, {method: (handler, requires_apikey)})
+PATTERN_ROUTES = [
+    (re.compile(r'^/raw/(?P<printer_id>[^/]+)$'), '/raw/<string:printer_id>', {'POST': (raw_print, True)}),
+    (re.compile(r'^/render/(?P<label_type>[^/]+)$'), '/render/<string:label_type>', {'POST': (render_label, True)}),
+    (re.compile(r'^/jobs/(?P<job_id>[^/]+)$'), '/jobs/<string:job_id>', {'GET': (job_detail, True)}),
+    (re.compile(r'^/jobs/(?P<job_id>[^/]+)/reprint$'), '/jobs/<string:job_id>/reprint',
+     {'POST': (job_reprint, True)}),
+]
+# Handlers that read the request body themselves, as a stream
+STREAMING_HANDLERS = {raw_print}
+
+
+def _match_route(request: Request):
+    route = ROUTES.get(request.path)
+    if route is not None:
+        return route, request.path
+    for pattern, endpoint, methods in PATTERN_ROUTES:
+        match = pattern.match(request.path)
+        if match:
+            request.params = match.groupdict()
+            return methods, endpoint
+    return None, 'unmatched'
+
+
+def _check_apikey(request: Request) -> None:
+    apikey_received = request.headers.get('apikey')
+    if not apikey_received:
+        raise HTTPError(403, {'error': 'API key is missing'})
+    if apikey_received != flask_app.APIKEY:
+        raise HTTPError(403, {'error': 'Invalid API key'})
+
+
+async def _read_body(receive) -> bytes:
+    chunks: List[bytes] = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise HTTPError(413, {'message': 'Request body too large'})
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+
+async def _send_response(send, status: int, body: bytes, content_type: str, extra_headers: List[Tuple[bytes, bytes]]) -> None:
+    headers = [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())] + extra_headers
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _wait_disconnect(receive) -> None:
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _stream_events(request: Request, receive, send) -> None:
+    """SSE stream; events are awaited on the event loop, so no thread is held per client"""
+    try:
+        last_event_id = int(request.headers.get('last-event-id', ''))
+    except ValueError:
+        last_event_id = None
+    bus, tracker = flask_app.event_bus, flask_app.printer_states
+    q = bus.subscribe(last_event_id, loop=asyncio.get_running_loop())
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    next_event = None
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        snapshot = f"event: snapshot\ndata: {json.dumps(tracker.snapshot())}\n\n"
+        await send({'type': 'http.response.body', 'body': snapshot.encode(), 'more_body': True})
+        while True:
+            if next_event is None:
+                next_event = asyncio.ensure_future(q.get())
+            done, _ = await asyncio.wait([next_event, disconnected], timeout=SSE_KEEPALIVE_SECONDS,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                break
+            if not done:
+                await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                continue
+            event, next_event = next_event.result(), None
+            await send({'type': 'http.response.body', 'body': _format_event(event), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        if next_event is not None:
+            next_event.cancel()
+        bus.unsubscribe(q)
+
+
+def _format_event(event: Dict[str, Any]) -> bytes:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n".encode()
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            flask_app.start_background_workers()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    request = Request(scope, b'')
+    if request.path == '/events' and request.method == 'GET':
+        await _events_app(request, receive, send)
+        return
+
+    started = time.perf_counter()
+    trace = tracing.start_trace()
+    route, endpoint = _match_route(request)
+    content_type = 'application/json'
+    extra_headers: Dict[str, str] = {}
+    try:
+        if route is None:
+            raise HTTPError(404, {'message': 'The requested URL was not found on the server.'})
+        if request.method not in route:
+            raise HTTPError(405, {'message': 'The method is not allowed for the requested URL.'})
+        handler, requires_apikey = route[request.method]
+        if requires_apikey:
+            _check_apikey(request)
+        if handler in STREAMING_HANDLERS:
+            # Streamed to the printer as it arrives instead of being read into memory
+            request.receive = receive
+        else:
+            request.body = await _read_body(receive)
+        result = await _route_to_owner(request) or await handler(request)
+        status = result[0]
+        if len(result) >= 3:
+            body, content_type = result[1], result[2]
+            extra_headers = result[3] if len(result) == 4 else {}
+        else:
+            body = (json.dumps(result[1]) + '\n').encode('utf-8')
+    except HTTPError as e:
+        status, body = e.status, (json.dumps(e.body) + '\n').encode('utf-8')
+    except Exception as e:
+        logging.exception("Unhandled error in %s %s: %s", request.method, request.path, e)
+        status, body = 500, (json.dumps({'message': 'Internal Server Error'}) + '\n').encode('utf-8')
+    finally:
+        tracing.end_trace()
+        if flask_app.profiler.active and not request.path.startswith('/debug/profile'):
+            flask_app.profiler.request_finished()
+
+    flask_app.slow_requests.maybe_record(trace, method=request.method, path=request.path, status=status,
+                                         payload_bytes=len(request.body))
+    headers = [(b'server-timing', trace.server_timing().encode())]
+    headers += [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in extra_headers.items()]
+    if flask_app.node_cluster is not None:
+        node = request.handled_by or flask_app.node_cluster.node_id
+        headers.append((cluster.NODE_HEADER.lower().encode(), node.encode()))
+    await _send_response(send, status, body, content_type, headers)
+    metrics.HTTP_LATENCY.labels(endpoint=endpoint, method=request.method).observe(time.perf_counter() - started)
+    metrics.HTTP_REQUESTS.labels(endpoint=endpoint, method=request.method, status=str(status)).inc()
+
+
+async def _events_app(request: Request, receive, send) -> None:
+    try:
+        _check_apikey(request)
+    except HTTPError as e:
+        await _send_response(send, e.status, (json.dumps(e.body) + '\n').encode(), 'application/json', [])
+        return
+    metrics.HTTP_REQUESTS.labels(endpoint='/events', method='GET', status='200').inc()
+    await _stream_events(request, receive, send)
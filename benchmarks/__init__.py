@@ -0,0 +1,9 @@
+"""
+Performance benchmarks for MiniPrint.
+
+    python -m benchmarks                      # run everything, compare to baseline.json
+    python -m benchmarks --suite micro        # render/validate/registry only
+    python -m benchmarks --update-baseline    # accept the current numbers
+
+Results and the regression report are written as JSON to benchmarks/out/.
+"""
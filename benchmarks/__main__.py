@@ -0,0 +1,92 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+# Per-request debug logging would dominate the end-to-end numbers
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from benchmarks import compare, e2e, micro, startup  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(HERE, 'baseline.json')
+OUT_DIR = os.path.join(HERE, 'out')
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Run MiniPrint benchmarks')
+    parser.add_argument('--suite', choices=['all', 'micro', 'e2e', 'startup'], default='all')
+    parser.add_argument('-k', '--match', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5, help='timing samples per micro-benchmark')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per micro-benchmark sample')
+    parser.add_argument('--requests', type=int, default=500, help='requests per end-to-end scenario')
+    parser.add_argument('--starts', type=int, default=5, help='server starts and imports per startup benchmark')
+    parser.add_argument('--budget', default=startup.BUDGET_FILE, help='startup budget file')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown as a fraction of baseline')
+    parser.add_argument('--out', default=OUT_DIR, help='directory for results.json and report.json')
+    parser.add_argument('--update-baseline', action='store_true', help='write the results as the new baseline')
+    args = parser.parse_args(argv)
+
+    results = {}
+    if args.suite in ('all', 'micro'):
+        results['micro'] = micro.run(args.repeat, args.min_time, args.match)
+    if args.suite in ('all', 'e2e'):
+        results['e2e'] = e2e.run(args.requests, args.match)
+    budget = {}
+    if args.suite in ('all', 'startup'):
+        with open(args.budget) as f:
+            budget = json.load(f)
+        results['startup'] = startup.run(args.starts, args.match, budget)
+
+    document = {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'results': results,
+    }
+    _write_json(os.path.join(args.out, 'results.json'), document)
+
+    if args.update_baseline:
+        if os.path.exists(args.baseline) and (args.match or args.suite != 'all'):
+            # Partial runs only replace the benchmarks they ran
+            with open(args.baseline) as f:
+                merged = json.load(f)
+            for suite, benchmarks in results.items():
+                merged['results'].setdefault(suite, {}).update(benchmarks)
+            merged['meta'] = document['meta']
+            document = merged
+        _write_json(args.baseline, document)
+        logging.warning("Baseline written to %s", args.baseline)
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get('results', {})
+    report = compare.compare(baseline, results, args.tolerance)
+    report['baseline_file'] = args.baseline
+    report['over_budget'] = startup.over_budget(results.get('startup', {}), budget)
+    report['passed'] = report['passed'] and not report['over_budget']
+    _write_json(os.path.join(args.out, 'report.json'), report)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0 if report['passed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
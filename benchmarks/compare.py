@@ -0,0 +1,53 @@
+"""Compare benchmark results with a stored baseline and build a machine-readable report"""
+from typing import Any, Dict, List
+
+# metric -> (direction, tolerance multiplier). Tail latency is noisier, so it gets more room.
+METRICS = {
+    'median_us': ('lower', 1.0),
+    'throughput_rps': ('higher', 1.0),
+    'p50_ms': ('lower', 1.0),
+    'p99_ms': ('lower', 2.0),
+}
+
+Results = Dict[str, Dict[str, Dict[str, Any]]]   # suite -> benchmark -> metric -> value
+
+
+def compare(baseline: Results, current: Results, tolerance: float = 0.25) -> Dict[str, Any]:
+    """
+    A metric regresses when it is worse than the baseline by more than tolerance
+    (times the metric's multiplier), as a fraction of the baseline value. Any
+    request errors in an end-to-end scenario are always a regression.
+    """
+    regressions: List[Dict[str, Any]] = []
+    improvements: List[Dict[str, Any]] = []
+    new: List[str] = []
+
+    for suite, benchmarks in current.items():
+        for name, result in benchmarks.items():
+            key = f'{suite}/{name}'
+            if result.get('errors'):
+                regressions.append({'benchmark': key, 'metric': 'errors', 'baseline': 0,
+                                    'current': result['errors'], 'change': None})
+            base = baseline.get(suite, {}).get(name)
+            if base is None:
+                new.append(key)
+                continue
+            for metric, (direction, multiplier) in METRICS.items():
+                if metric not in result or not base.get(metric):
+                    continue
+                change = (result[metric] - base[metric]) / base[metric]
+                worse = change if direction == 'lower' else -change
+                entry = {'benchmark': key, 'metric': metric, 'baseline': base[metric],
+                         'current': result[metric], 'change': round(change, 4)}
+                if worse > tolerance * multiplier:
+                    regressions.append(entry)
+                elif worse < -tolerance * multiplier:
+                    improvements.append(entry)
+
+    return {
+        'tolerance': tolerance,
+        'passed': not regressions,
+        'regressions': regressions,
+        'improvements': improvements,
+        'new': new,
+    }
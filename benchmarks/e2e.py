@@ -0,0 +1,154 @@
+"""
+End-to-end print scenarios: HTTP request -> validate -> render -> TCP send to a
+printer_sim fleet, through the Flask app (threads) and the ASGI app (asyncio).
+"""
+import asyncio
+import itertools
+import json
+import math
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import printers
+from labels import LABEL_TYPES
+from printer_sim import VirtualPrinterFleet
+
+from benchmarks.payloads import payload
+
+Result = Dict[str, float]
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    server: str                   # 'flask' or 'asgi'
+    concurrency: int
+    label_types: Tuple[str, ...] = ('standard',)
+    printers: int = 4
+
+
+SCENARIOS: Tuple[Scenario, ...] = (
+    Scenario('print.flask.c1', 'flask', 1),
+    Scenario('print.flask.c16', 'flask', 16),
+    Scenario('print.flask.c16.mixed', 'flask', 16, tuple(LABEL_TYPES)),
+    Scenario('print.asgi.c16', 'asgi', 16),
+)
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values), math.ceil(q / 100 * len(sorted_values))) - 1)
+    return sorted_values[rank]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float, delivered: int) -> Result:
+    latencies = sorted(latencies)
+    ms = 1000.0
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'delivered': delivered,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        'mean_ms': round(statistics.mean(latencies) * ms, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * ms, 3),
+        'p99_ms': round(percentile(latencies, 99) * ms, 3),
+    }
+
+
+def _requests(scenario: Scenario, printer_ids: List[str], count: int) -> List[Tuple[str, Dict]]:
+    """(route, body) pairs cycling through printers and label types"""
+    pairs = zip(itertools.cycle(printer_ids), itertools.cycle(scenario.label_types))
+    return [(LABEL_TYPES[label].route, payload(label, printer_id=printer_id))
+            for printer_id, label in itertools.islice(pairs, count)]
+
+
+def _run_flask(scenario: Scenario, work: List[Tuple[str, Dict]], apikey: str) -> Tuple[List[float], int, float]:
+    import app as flask_app
+
+    local = threading.local()
+    headers = {'apikey': apikey}
+
+    def one(item):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = flask_app.app.test_client()
+        route, body = item
+        started = time.perf_counter()
+        response = client.post(route, json=body, headers=headers)
+        return time.perf_counter() - started, response.status_code == 200
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=scenario.concurrency) as pool:
+        outcomes = list(pool.map(one, work))
+    elapsed = time.perf_counter() - started
+    return [t for t, ok in outcomes if ok], sum(1 for _, ok in outcomes if not ok), elapsed
+
+
+def _run_asgi(scenario: Scenario, work: List[Tuple[str, Dict]], apikey: str) -> Tuple[List[float], int, float]:
+    import asgi_app
+
+    headers = [(b'apikey', apikey.encode()), (b'content-type', b'application/json')]
+
+    async def one(item, limit):
+        route, body = item
+        messages = [{'type': 'http.request', 'body': json.dumps(body).encode(), 'more_body': False}]
+        status = []
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        scope = {'type': 'http', 'method': 'POST', 'path': route, 'headers': headers}
+        async with limit:
+            started = time.perf_counter()
+            await asgi_app.app(scope, receive, send)
+            return time.perf_counter() - started, status == [200]
+
+    async def main():
+        limit = asyncio.Semaphore(scenario.concurrency)
+        return await asyncio.gather(*(one(item, limit) for item in work))
+
+    started = time.perf_counter()
+    outcomes = asyncio.run(main())
+    elapsed = time.perf_counter() - started
+    return [t for t, ok in outcomes if ok], sum(1 for _, ok in outcomes if not ok), elapsed
+
+
+def run_scenario(scenario: Scenario, requests: int = 500, apikey: Optional[str] = None) -> Result:
+    """Run one scenario; without apikey the app's key is used, set to 'benchmark' if it has none"""
+    if apikey is None:
+        import app as flask_app
+
+        # The apps compare against the key they read at import; benchmarks run in-process
+        apikey = flask_app.APIKEY = flask_app.APIKEY or 'benchmark'
+    with VirtualPrinterFleet(count=scenario.printers, prefix='prt-bench-') as fleet:
+        registry = fleet.registry()
+        with printers._PRINTERS_LOCK:
+            printers.printers.update(registry)
+        try:
+            work = _requests(scenario, list(registry), requests)
+            runner = _run_asgi if scenario.server == 'asgi' else _run_flask
+            latencies, errors, elapsed = runner(scenario, work, apikey)
+            # Sends complete once the kernel has the bytes; give the fleet a moment to read them
+            deadline = time.monotonic() + 2
+            while sum(s['labels'] for s in fleet.stats().values()) < len(latencies) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            delivered = sum(s['labels'] for s in fleet.stats().values())
+        finally:
+            with printers._PRINTERS_LOCK:
+                for printer_id in registry:
+                    printers.printers.pop(printer_id, None)
+    return summarize(latencies, errors, elapsed, delivered)
+
+
+def run(requests: int = 500, match: str = '') -> Dict[str, Result]:
+    return {s.name: run_scenario(s, requests) for s in SCENARIOS if match in s.name}
@@ -0,0 +1,109 @@
+"""
+Micro-benchmarks: every generator, every validator, the printer registry snapshot and,
+with numpy and Pillow installed, image to ^GFA conversion and label rasterizing
+"""
+import io
+import statistics
+import timeit
+from typing import Any, Callable, Dict, List, Tuple
+
+import printers
+import zpl_graphics
+import zpl_raster
+from labels import LABEL_TYPES
+
+from benchmarks.payloads import PAYLOADS
+
+Result = Dict[str, float]
+
+# Registry sizes for get_printers_snapshot; the larger one stands in for a big ERP DocType
+REGISTRY_SIZES = (10, 1000)
+
+
+def measure(func: Callable[[], Any], repeat: int = 5, min_time: float = 0.2) -> Result:
+    """
+    Time func() with timeit: calibrate the loop count to take at least min_time,
+    then take `repeat` samples. Per-call times are in microseconds.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    # autorange stops at 0.2s; scale up if a longer sample was asked for
+    if min_time > 0.2:
+        number = int(number * min_time / 0.2)
+    samples = [t / number * 1e6 for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'median_us': round(statistics.median(samples), 3),
+        'min_us': round(min(samples), 3),
+        'max_us': round(max(samples), 3),
+        'loops': number * repeat,
+    }
+
+
+def _cases() -> List[Tuple[str, Callable[[], Any]]]:
+    cases = []
+    for name, label in LABEL_TYPES.items():
+        data = PAYLOADS[name]
+        cases.append((f'generate.{label.generate.__name__}', lambda g=label.generate, d=data: g(**d)))
+        cases.append((f'validate.{label.validate.__name__}', lambda v=label.validate, d=data: v(d)))
+    return cases
+
+
+def label_image(width: int = 812, height: int = 406) -> bytes:
+    """A PNG with gradients and shapes, the size of a 4 x 2 inch label at 203 dpi"""
+    from PIL import Image, ImageDraw
+    image = Image.linear_gradient('L').resize((width, height)).convert('RGBA')
+    draw = ImageDraw.Draw(image)
+    for i in range(0, width, width // 10):
+        draw.ellipse((i, height // 8, i + width // 8, height // 2), fill=(0, 0, 0, 255 * i // width))
+    draw.rectangle((width // 10, height * 2 // 3, width * 9 // 10, height * 5 // 6), fill=(40, 40, 40, 255))
+    out = io.BytesIO()
+    image.save(out, 'PNG')
+    return out.getvalue()
+
+
+def _graphics_cases() -> List[Tuple[str, Callable[[], Any]]]:
+    try:
+        image = label_image()
+    except ImportError:
+        return []
+    cases = [(f'graphics.convert[{dither}]', lambda d=dither: zpl_graphics.convert(image, dither=d, cache=None))
+             for dither in zpl_graphics.DITHERS]
+    cache = zpl_graphics.GraphicCache()
+    cases.append(('graphics.convert[cached]', lambda: zpl_graphics.convert(image, cache=cache)))
+    return cases
+
+
+def _raster_cases() -> List[Tuple[str, Callable[[], Any]]]:
+    try:
+        zpl_raster.rasterize('^XA^XZ')
+    except ImportError:
+        return []
+    return [(f'raster.rasterize[{name}]', lambda z=label.generate(**PAYLOADS[name]): zpl_raster.rasterize(z))
+            for name, label in LABEL_TYPES.items()]
+
+
+def _with_registry(size: int, func: Callable[[], Result]) -> Result:
+    """Run func against a registry of `size` printers, restoring the real one afterwards"""
+    fake = {f'prt-bench-{i}': {'ip': f'10.0.{i // 250}.{i % 250 + 1}', 'port': 9100} for i in range(size)}
+    with printers._PRINTERS_LOCK:
+        saved = dict(printers.printers)
+        printers.printers.clear()
+        printers.printers.update(fake)
+    try:
+        return func()
+    finally:
+        with printers._PRINTERS_LOCK:
+            printers.printers.clear()
+            printers.printers.update(saved)
+
+
+def run(repeat: int = 5, min_time: float = 0.2, match: str = '') -> Dict[str, Result]:
+    results: Dict[str, Result] = {}
+    for name, func in _cases() + _graphics_cases() + _raster_cases():
+        if match in name:
+            results[name] = measure(func, repeat, min_time)
+    for size in REGISTRY_SIZES:
+        name = f'registry.get_printers_snapshot[{size}]'
+        if match in name:
+            results[name] = _with_registry(size, lambda: measure(printers.get_printers_snapshot, repeat, min_time))
+    return results
@@ -0,0 +1,74 @@
+"""Representative valid request bodies for every label type, keyed like labels.LABEL_TYPES"""
+from typing import Any, Dict
+
+PRINTER_ID = 'prt-bench-1'
+
+PAYLOADS: Dict[str, Dict[str, Any]] = {
+    'standard': {
+        'printer_id': PRINTER_ID,
+        'batch': 'B24-00123',
+        'item_code': 'ITM-0004711',
+        'description_line1': 'Keramikkondensator 100nF 50V',
+        'description_line2': 'X7R 0603 ±10%',
+        'manufacturer': 'Würth Elektronik',
+        'manufacturer_part_line1': '885012206095',
+        'manufacturer_part_line2': '',
+        'warehouse': 'Incoming Goods',
+        'parent_warehouse': 'All Warehouses',
+        'msl': '3',
+        'qty': '4000',
+        'date': '2024-05-17',
+        'user': 'mmustermann',
+    },
+    'msl': {
+        'printer_id': PRINTER_ID,
+        'msl': '3',
+    },
+    'special-instructions': dict(
+        {'printer_id': PRINTER_ID},
+        **{f'line_{i}': f'{i}. Nur mit ESD-Schutz handhaben' for i in range(1, 13)}
+    ),
+    'dry': {
+        'printer_id': PRINTER_ID,
+    },
+    'tracescan': {
+        'printer_id': PRINTER_ID,
+        'hw_version': '1.2',
+        'sw_version': '3.4.5',
+        'standard_indicator': 'A',
+        'wo_serial_number': '12345-67890123456',
+        'ginv_description': 'GINV Inverter Board',
+        'ginv_serial': 'GINV-000123',
+        'ioca_description': 'IOCA IO Controller',
+        'ioca_serial': 'IOCA-000456',
+        'mcua_description': 'MCUA Main Controller',
+        'mcua_serial': 'MCUA-000789',
+        'lcda_description': 'LCDA Display',
+        'lcda_serial': 'LCDA-000321',
+        'giof_description': 'GIOF Interface',
+        'giof_serial': 'GIOF-000654',
+    },
+    'svt-fortlox-ok': {
+        'printer_id': PRINTER_ID,
+        'sv_article_no': '123456',
+        'serial_no': 'SN0001234567',
+        'fw_version': '2.1.0',
+        'run_date': '2024-05-17',
+    },
+    'svt-fortlox-nok': {
+        'printer_id': PRINTER_ID,
+        'sv_article_no': '123456',
+        'error_code': 'E042',
+        'error_date': '2024-05-17',
+        'error_time': '13:37:00',
+        'error_message': 'Laser power below threshold',
+        'serial_no': 'SN0001234567',
+    },
+}
+
+
+def payload(label_type: str, **overrides: Any) -> Dict[str, Any]:
+    """A fresh copy of the sample payload, optionally with some fields replaced"""
+    data = dict(PAYLOADS[label_type])
+    data.update(overrides)
+    return data
@@ -0,0 +1,152 @@
+"""
+Cold start: time from launching app.py to the first answered /ping, and the import
+cost of every module `import app` loads directly (python -X importtime).
+
+Each measurement runs in a fresh interpreter without ERP, cluster or multi-process
+settings, after one discarded run that leaves the bytecode cache warm, as in a
+restarted container. Budgets in startup_budget.json cap any result metric; a module
+with a 0 ms budget must not be imported at startup at all.
+"""
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+Result = Dict[str, float]
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_budget.json')
+
+# Settings that would make startup measure something other than the server itself
+_UNSET = ('ERP_URL', 'ERP_API_KEY', 'ERP_API_SECRET', 'CLUSTER_NODE_ID', 'CLUSTER_NODES', 'MINIPRINT_SHARED_DIR',
+          'PRINTERS_REFRESH_SECONDS', 'PRINTERS_MONITOR_SECONDS', 'RAW_INGRESS_ROUTES', 'FLASK_DEBUG')
+
+
+def _env(**extra: str) -> Dict[str, str]:
+    env = {k: v for k, v in os.environ.items() if k not in _UNSET}
+    env.update(APIKEY=env.get('APIKEY') or 'benchmark', LOG_LEVEL='WARNING', **extra)
+    return env
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _ping(port: int) -> bool:
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+    try:
+        connection.request('GET', '/ping')
+        return connection.getresponse().status == 200
+    except OSError:
+        return False
+    finally:
+        connection.close()
+
+
+def _one_start(timeout: float = 30) -> float:
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = _env(FLASK_RUN_PORT=str(port), JOB_HISTORY_DB=os.path.join(tmp, 'jobs.db'))
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, 'app.py'], cwd=REPO, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while not _ping(port):
+                if process.poll() is not None:
+                    raise RuntimeError(f"app.py exited with {process.returncode} before answering /ping")
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"app.py did not answer /ping within {timeout} s")
+                time.sleep(0.005)
+            return time.perf_counter() - started
+        finally:
+            process.kill()
+            process.wait()
+
+
+def time_to_ping(runs: int = 5) -> Result:
+    _one_start()
+    samples = sorted(_one_start() for _ in range(runs))
+    return {
+        'runs': runs,
+        'median_ms': round(statistics.median(samples) * 1000, 1),
+        'max_ms': round(samples[-1] * 1000, 1),
+    }
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, str, float, float]]:
+    """(depth, module, self ms, cumulative ms) from python -X importtime output"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(own) / 1000, int(cumulative) / 1000))
+    return entries
+
+
+def _import_once(module: str) -> List[Tuple[int, str, float, float]]:
+    with tempfile.TemporaryDirectory() as tmp:
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=REPO,
+                                env=_env(JOB_HISTORY_DB=os.path.join(tmp, 'jobs.db')),
+                                capture_output=True, text=True, check=True)
+    return parse_importtime(result.stderr)
+
+
+def import_costs(runs: int = 5, module: str = 'app', watch: Sequence[str] = ()) -> Dict[str, Result]:
+    """
+    Cumulative and self import time of `module`, of every module it imports first hand
+    and of the `watch` modules wherever they are imported (medians over runs). Modules
+    loaded by the interpreter's own startup, before `module`, are not included.
+    """
+    _import_once(module)
+    samples: Dict[str, List[Tuple[float, float]]] = {}
+    for _ in range(runs):
+        entries = _import_once(module)
+        top = next(i for i, e in enumerate(entries) if e[0] == 0 and e[1] == module)
+        # importtime prints children before their parent; walk back to the previous top-level module
+        start = top
+        while start > 0 and entries[start - 1][0] > 0:
+            start -= 1
+        for depth, name, own, cumulative in entries[start:top + 1]:
+            if depth <= 1 or name in watch:
+                samples.setdefault(name, []).append((own, cumulative))
+    return {
+        f'import.{name}': {
+            'self_ms': round(statistics.median(s[0] for s in values), 2),
+            'cumulative_ms': round(statistics.median(s[1] for s in values), 2),
+        }
+        for name, values in samples.items() if len(values) == runs
+    }
+
+
+def run(runs: int = 5, match: str = '', budget: Optional[Dict[str, Any]] = None) -> Dict[str, Result]:
+    results: Dict[str, Result] = {}
+    if match in 'time_to_ping':
+        results['time_to_ping'] = time_to_ping(runs)
+    watch = [name[len('import.'):] for name in budget or {} if name.startswith('import.')]
+    results.update({name: r for name, r in import_costs(runs, watch=watch).items() if match in name})
+    return results
+
+
+def over_budget(results: Dict[str, Result], budget: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Budgeted metrics the results exceed. A module that was not imported costs 0 ms."""
+    violations = []
+    for name, limits in budget.items():
+        if name.startswith('_'):
+            continue
+        for metric, limit in limits.items():
+            if name not in results and not name.startswith('import.'):
+                continue
+            value = results.get(name, {}).get(metric, 0)
+            if value > limit:
+                violations.append({'benchmark': f'startup/{name}', 'metric': metric, 'budget': limit,
+                                   'current': value})
+    return violations
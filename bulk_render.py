@@ -0,0 +1,233 @@
+"""
+Render many labels offline, e.g. to relabel a whole warehouse after a location rename.
+
+    python bulk_render.py relabel.ndjson --label-type standard --output relabel.zpl
+    python bulk_render.py relabel.csv --label-type standard --printer prt-lager-1
+    cat records.ndjson | python bulk_render.py - --label-type msl --output -
+
+Records are NDJSON objects or CSV rows with the same fields as the print endpoint's
+JSON body; a `label_type` field overrides --label-type per record. Records are read,
+validated and rendered as a stream, so memory stays constant however large the input.
+Invalid records are reported on stderr and skipped. A JSON summary with labels per
+second is printed at the end.
+"""
+import argparse
+import csv
+import json
+import os
+import socket
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+import pacing
+from labels import get_label_type
+from validation import ValidationError
+
+
+class Rendered(NamedTuple):
+    line: int
+    label_type: str
+    zpl: Optional[str]
+    errors: List[str]
+
+
+def read_records(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """Yield (line number, record) lazily from an NDJSON or CSV stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, e
+
+
+def render_record(line: int, record: Any, default_label_type: Optional[str]) -> Rendered:
+    """Validate and render one record; runs in the worker processes"""
+    if isinstance(record, Exception):
+        return Rendered(line, '', None, [f"invalid JSON: {record}"])
+    if not isinstance(record, dict):
+        return Rendered(line, '', None, ["Input data must be a dictionary"])
+    data = dict(record)
+    name = data.pop('label_type', None) or default_label_type
+    if not name:
+        return Rendered(line, '', None, ["label_type: missing (pass --label-type or add the field)"])
+    try:
+        label = get_label_type(name)
+        errors = label.validate(data)
+        if errors:
+            return Rendered(line, name, None, errors)
+        return Rendered(line, name, label.generate(**data), [])
+    except (ValueError, ValidationError, TypeError, KeyError) as e:
+        return Rendered(line, name, None, [str(e)])
+
+
+def render_stream(records: Iterable[Tuple[int, Any]], default_label_type: Optional[str] = None,
+                  jobs: int = 1, window: int = 0) -> Iterator[Rendered]:
+    """
+    Render records in input order. With jobs > 1 rendering runs in a process pool, with
+    at most `window` records in flight so a slow consumer never makes the input pile up.
+    """
+    if jobs <= 1:
+        for line, record in records:
+            yield render_record(line, record, default_label_type)
+        return
+
+    window = window or jobs * 16
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for line, record in records:
+            pending.append(pool.submit(render_record, line, record, default_label_type))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class FileSink:
+    """Spool labels to path.part and move it into place once the run completes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._stdout = path == '-'
+        self._file = sys.stdout if self._stdout else open(f"{path}.part", 'w', encoding='utf-8')
+
+    def write(self, zpl: str) -> None:
+        self._file.write(zpl)
+
+    def close(self, complete: bool = True) -> None:
+        if self._stdout:
+            self._file.flush()
+            return
+        self._file.close()
+        if complete:
+            os.replace(f"{self.path}.part", self.path)
+
+
+class PrinterSink:
+    """
+    Stream labels to a printer over one connection per batch. In multi-process mode the
+    printer lock is held per batch, so jobs from the API are interleaved between batches
+    rather than waiting for the whole run.
+    """
+
+    def __init__(self, printer_id: str, ip: str, port: int, batch: int = 50, timeout: float = 10):
+        from shared_state import get_shared_dir, printer_lock
+
+        self.printer_id = printer_id
+        self.address = (ip, port)
+        self.batch = batch
+        self.timeout = timeout
+        self._shared_dir = get_shared_dir()
+        self._printer_lock = printer_lock
+        self._buffer: List[bytes] = []
+        # One pacer for the whole run: formats of the previous batch may still be in the printer
+        policy = pacing.from_env()
+        self._pacer = pacing.Pacer(policy, printer_id) if policy is not None and policy.applies(printer_id) else None
+
+    def write(self, zpl: str) -> None:
+        self._buffer.append(zpl.encode('utf-8'))
+        if len(self._buffer) >= self.batch:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        if self._shared_dir:
+            with self._printer_lock(self._shared_dir, self.printer_id):
+                self._send()
+        else:
+            self._send()
+        self._buffer = []
+
+    def _send(self) -> None:
+        with socket.create_connection(self.address, timeout=self.timeout) as sock:
+            chunks = self._buffer if self._pacer is None else pacing.paced(sock, self._buffer, self._pacer)
+            for payload in chunks:
+                sock.sendall(payload)
+
+    def close(self, complete: bool = True) -> None:
+        if complete:
+            self._flush()
+
+
+def run(records: Iterable[Tuple[int, Any]], sink, default_label_type: Optional[str] = None, jobs: int = 1,
+        progress_seconds: float = 5.0, errors_to: TextIO = sys.stderr) -> Dict[str, Any]:
+    """Render records into sink and return the summary"""
+    started = time.perf_counter()
+    next_progress = started + progress_seconds
+    rendered = invalid = 0
+    complete = False
+    try:
+        for result in render_stream(records, default_label_type, jobs):
+            if result.errors:
+                invalid += 1
+                errors_to.write(json.dumps({'line': result.line, 'label_type': result.label_type,
+                                            'errors': result.errors}) + '\n')
+                continue
+            sink.write(result.zpl)
+            rendered += 1
+            if progress_seconds and time.perf_counter() >= next_progress:
+                elapsed = time.perf_counter() - started
+                errors_to.write(f"{rendered} labels, {rendered / elapsed:.0f} labels/s\n")
+                next_progress += progress_seconds
+        complete = True
+    finally:
+        sink.close(complete)
+    elapsed = time.perf_counter() - started
+    return {
+        'rendered': rendered,
+        'invalid': invalid,
+        'seconds': round(elapsed, 3),
+        'labels_per_second': round(rendered / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Validate and render labels in bulk')
+    parser.add_argument('input', help="NDJSON or CSV file, '-' for stdin")
+    parser.add_argument('--format', choices=['ndjson', 'csv'], help='default: from the file extension')
+    parser.add_argument('--label-type', help='label type for records without a label_type field')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--output', help="ZPL file to write, '-' for stdout")
+    target.add_argument('--printer', help='printer id from the registry to stream to')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='render worker processes')
+    parser.add_argument('--batch', type=int, default=50, help='labels per printer connection')
+    parser.add_argument('--progress', type=float, default=5.0, help='seconds between progress lines, 0 = off')
+    args = parser.parse_args(argv)
+
+    if args.label_type:
+        get_label_type(args.label_type)  # fail on a typo before reading any input
+    fmt = args.format or ('csv' if args.input.lower().endswith('.csv') else 'ndjson')
+
+    if args.printer:
+        from printers import get_printers_snapshot
+
+        printer = get_printers_snapshot().get(args.printer)
+        if printer is None:
+            parser.error(f"Printer ID not found: {args.printer}")
+        sink = PrinterSink(args.printer, printer['ip'], printer['port'], args.batch)
+    else:
+        sink = FileSink(args.output)
+
+    stream = sys.stdin if args.input == '-' else open(args.input, newline='' if fmt == 'csv' else None,
+                                                      encoding='utf-8')
+    try:
+        summary = run(read_records(stream, fmt), sink, args.label_type, args.jobs, args.progress)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    sys.stderr.write(json.dumps(summary) + '\n')
+    return 1 if summary['invalid'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,324 @@
+"""
+Several miniprint nodes sharing the printers, each printer owned by one node.
+
+    CLUSTER_NODE_ID=a CLUSTER_NODES="a=http://10.1.0.5:5500,b=http://10.1.0.6:5500" python app.py
+
+Every node reads the same printer registry (ERP or PRINTERS_FILE). Printer ids are
+placed on a consistent-hash ring of the live nodes; a `/print*` request for a printer
+owned by another node is forwarded to that node over a pooled keep-alive HTTP
+connection, so one node serialises the jobs of each printer while any node can take
+requests. Responses carry the handling node in X-Miniprint-Node.
+
+Nodes check each other's /cluster/health every CLUSTER_HEARTBEAT_SECONDS and take a
+node out of the ring after CLUSTER_FAILURES missed checks, or when a forward to it
+fails to connect; it is added back as soon as it answers again. Health replies carry
+the sender's member list, so a node that joins with any existing member in its
+CLUSTER_NODES becomes known to all of them. With consistent hashing only the printers
+of the joining or leaving node change owner.
+"""
+import bisect
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+
+FORWARDED_HEADER = 'X-Miniprint-Forwarded-By'
+NODE_HEADER = 'X-Miniprint-Node'
+
+CLUSTER_FORWARDS = metrics.counter('miniprint_cluster_forwards_total', 'Print requests forwarded to the owning node',
+                                   ('node', 'result'))
+CLUSTER_MEMBERS = metrics.gauge('miniprint_cluster_live_nodes', 'Nodes currently in the hash ring')
+
+
+def _connect_failed(error: Exception) -> bool:
+    """Whether a requests error happened before a connection existed, so nothing was sent"""
+    import requests
+    from urllib3.exceptions import MaxRetryError, NewConnectionError
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, NewConnectionError)
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hashing with virtual nodes, so load spreads evenly and few keys move on a change"""
+
+    def __init__(self, nodes=(), vnodes: int = 128):
+        self.vnodes = vnodes
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self._nodes: set = set()
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(self._nodes)
+
+    def add(self, node: str) -> None:
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node: str) -> None:
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        kept = [(p, o) for p, o in zip(self._points, self._owners) if o != node]
+        self._points = [p for p, _ in kept]
+        self._owners = [o for _, o in kept]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[index]
+
+
+class _Member:
+    def __init__(self, url: str, alive: bool):
+        self.url = url.rstrip('/')
+        self.alive = alive
+        self.failures = 0
+        self.last_seen: Optional[float] = time.time() if alive else None
+
+
+def parse_nodes(spec: str) -> Dict[str, str]:
+    """Parse 'ID=URL,ID=URL' into {node_id: url}"""
+    nodes: Dict[str, str] = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        node_id, sep, url = item.partition('=')
+        if not sep or not url.strip():
+            raise ValueError(f"Invalid cluster node '{item}', expected ID=URL")
+        nodes[node_id.strip()] = url.strip()
+    return nodes
+
+
+class Cluster:
+    def __init__(self, node_id: str, nodes: Dict[str, str], apikey: Optional[str], heartbeat_seconds: float = 1.0,
+                 failures: int = 3, timeout: float = 2.0, forward_timeout: float = 30.0):
+        if node_id not in nodes:
+            raise ValueError(f"CLUSTER_NODES has no URL for this node ({node_id})")
+        self.node_id = node_id
+        self.apikey = apikey
+        self.heartbeat_seconds = heartbeat_seconds
+        self.failure_threshold = failures
+        self.timeout = timeout
+        self.forward_timeout = forward_timeout
+        self._lock = threading.Lock()
+        # Configured peers are assumed alive until they miss their first heartbeats
+        self._members = {n: _Member(url, alive=True) for n, url in nodes.items()}
+        self._ring = HashRing()
+        self._rebuild()
+        # Imported here so that servers without a cluster never load requests
+        import requests
+        import requests.adapters
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=len(nodes) + 4, pool_maxsize=32)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._stop = threading.Event()
+
+    # --- membership ---
+
+    def _rebuild(self) -> None:
+        """Recompute the ring from the live members. Caller holds the lock (or is __init__)."""
+        live = {n for n, m in self._members.items() if m.alive} | {self.node_id}
+        if live != set(self._ring.nodes):
+            self._ring = HashRing(sorted(live))
+            CLUSTER_MEMBERS.set(len(live))
+            logging.info("Cluster ring is now %s", ', '.join(sorted(live)))
+
+    def _set_alive(self, node_id: str, alive: bool) -> None:
+        member = self._members.get(node_id)
+        if member is None or node_id == self.node_id:
+            return
+        if alive:
+            member.failures = 0
+            member.last_seen = time.time()
+        else:
+            member.failures += 1
+            if member.failures < self.failure_threshold:
+                return
+        if member.alive != alive:
+            member.alive = alive
+            logging.warning("Cluster node %s is %s", node_id, 'back' if alive else 'down')
+            self._rebuild()
+
+    def join(self, node_id: str, url: str) -> None:
+        with self._lock:
+            member = self._members.get(node_id)
+            if member is None:
+                self._members[node_id] = _Member(url, alive=True)
+                logging.info("Cluster node %s joined from %s", node_id, url)
+            else:
+                member.url = url.rstrip('/')
+                member.failures = 0
+                member.alive = True
+                member.last_seen = time.time()
+            self._rebuild()
+
+    def leave(self, node_id: str) -> None:
+        with self._lock:
+            if node_id != self.node_id and self._members.pop(node_id, None) is not None:
+                logging.info("Cluster node %s left", node_id)
+                self._rebuild()
+
+    def members(self) -> Dict[str, str]:
+        with self._lock:
+            return {n: m.url for n, m in self._members.items()}
+
+    # --- ownership ---
+
+    def owner(self, printer_id: str) -> str:
+        with self._lock:
+            return self._ring.owner(printer_id) or self.node_id
+
+    def status(self, printer_ids=()) -> Dict[str, Any]:
+        with self._lock:
+            members = {n: {'url': m.url, 'alive': m.alive or n == self.node_id, 'last_seen': m.last_seen}
+                       for n, m in self._members.items()}
+            ring = self._ring
+        owners = {p: ring.owner(p) for p in printer_ids}
+        return {'node': self.node_id, 'ring': ring.nodes, 'members': members, 'owners': owners}
+
+    # --- internal channel ---
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {FORWARDED_HEADER: self.node_id}
+        if self.apikey:
+            headers['apikey'] = self.apikey
+        return headers
+
+    def forward(self, node_id: str, path: str, body: bytes,
+                apikey: Optional[str]) -> Optional[Tuple[int, bytes, str, str]]:
+        """
+        Send a print request to its owner. Returns (status, body, content type, node that
+        handled it), or None if no connection to the owner could be made and the caller
+        should handle the request itself. Once the request may have reached the owner, a
+        failure is answered 502 (504 on a read timeout) and never handled locally, since
+        the owner may already have printed the label.
+        """
+        import requests
+        with self._lock:
+            member = self._members.get(node_id)
+            url = member.url if member else None
+        if url is None:
+            return None
+        headers = {FORWARDED_HEADER: self.node_id, 'Content-Type': 'application/json'}
+        if apikey is not None:
+            headers['apikey'] = apikey
+        try:
+            response = self._session.post(f"{url}{path}", data=body, headers=headers,
+                                          timeout=(self.timeout, self.forward_timeout))
+        except requests.RequestException as e:
+            if not _connect_failed(e):
+                timed_out = isinstance(e, requests.Timeout)
+                CLUSTER_FORWARDS.labels(node=node_id, result='timeout' if timed_out else 'failed').inc()
+                logging.error("Forward to cluster node %s failed after sending: %s", node_id, e)
+                error = f"Cluster node {node_id} did not answer; the job may have been printed"
+                return (504 if timed_out else 502, json.dumps({'error': error}).encode(), 'application/json',
+                        self.node_id)
+            CLUSTER_FORWARDS.labels(node=node_id, result='unreachable').inc()
+            logging.warning("Cannot forward to cluster node %s, handling locally: %s", node_id, e)
+            with self._lock:
+                # A refused connection is as good as a failed heartbeat round
+                for _ in range(self.failure_threshold):
+                    self._set_alive(node_id, False)
+            return None
+        CLUSTER_FORWARDS.labels(node=node_id, result='forwarded').inc()
+        return (response.status_code, response.content, response.headers.get('Content-Type', 'application/json'),
+                response.headers.get(NODE_HEADER, node_id))
+
+    def heartbeat(self) -> None:
+        """Check every peer once, learning members from their replies"""
+        import requests
+        for node_id, url in self.members().items():
+            if node_id == self.node_id:
+                continue
+            try:
+                response = self._session.get(f"{url}/cluster/health", headers=self._headers(), timeout=self.timeout)
+                response.raise_for_status()
+                known = response.json().get('members', {})
+            except (requests.RequestException, ValueError):
+                with self._lock:
+                    self._set_alive(node_id, False)
+                continue
+            with self._lock:
+                self._set_alive(node_id, True)
+                for other, other_url in known.items():
+                    if other not in self._members:
+                        # Learned second hand: in the ring once it answers our own heartbeat
+                        self._members[other] = _Member(other_url, alive=False)
+
+    def announce(self, path: str = '/cluster/join') -> None:
+        """Tell every known peer about this node (path='/cluster/leave' on shutdown)"""
+        import requests
+        me = {'node': self.node_id, 'url': self.members()[self.node_id]}
+        for node_id, url in self.members().items():
+            if node_id == self.node_id:
+                continue
+            try:
+                self._session.post(f"{url}{path}", json=me, headers=self._headers(), timeout=self.timeout)
+            except requests.RequestException:
+                pass
+
+    def _run(self) -> None:
+        self.announce()
+        while not self._stop.wait(self.heartbeat_seconds):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logging.error("Cluster heartbeat failed: %s", e)
+
+    def start(self) -> 'Cluster':
+        threading.Thread(target=self._run, name='ClusterHeartbeat', daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.announce('/cluster/leave')
+
+
+def from_env(apikey: Optional[str]) -> Optional[Cluster]:
+    """Cluster configured from CLUSTER_NODE_ID and CLUSTER_NODES, or None when not clustered"""
+    node_id = os.getenv('CLUSTER_NODE_ID', '').strip()
+    spec = os.getenv('CLUSTER_NODES', '')
+    if not node_id or not spec.strip():
+        return None
+
+    def number(name, default):
+        try:
+            return float(os.getenv(name, default))
+        except ValueError:
+            return default
+
+    return Cluster(node_id, parse_nodes(spec), apikey,
+                   heartbeat_seconds=number('CLUSTER_HEARTBEAT_SECONDS', 1.0),
+                   failures=int(number('CLUSTER_FAILURES', 3)))
+
+
+def printer_id_of(body: Any) -> Optional[str]:
+    """printer_id of a print request's JSON body, if it has one"""
+    if isinstance(body, dict) and isinstance(body.get('printer_id'), str):
+        return body['printer_id']
+    return None
@@ -0,0 +1,350 @@
+"""
+Find Zebra printers on the network and reconcile them with the printer registry.
+
+    python discovery.py 10.1.0.0/16 192.168.120.0/24
+    python discovery.py 10.1.0.0/24 --merge --write-file discovered.json
+
+Every address in the given CIDR ranges is probed for an open raw port (9100) with
+thousands of concurrent non-blocking connects, paced by a connect rate limit. Open
+ports are asked `~HI`; whatever answers is a Zebra. A Zebra that answers is also asked
+for its `device.friendly_name`, which lets a registered printer be recognised at a new
+address. `~HI` is only sent once, and nothing else is sent to a port that did not
+answer it, so non-Zebra devices on 9100 at most print one short line.
+
+The result is a diff against get_printers_snapshot(): printers found where the
+registry expects them (ok), found at another address (moved), not answering (missing),
+Zebras the registry does not know (unregistered) and open ports that are not Zebras
+(unidentified). merge() applies moved printers, and optionally unregistered ones, to
+the running registry; the ERP remains the source of truth and its next refresh wins.
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import logging
+import resource
+import socket
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+HOST_IDENTIFICATION_QUERY = b'~HI'
+FRIENDLY_NAME_QUERY = b'! U1 getvar "device.friendly_name"\r\n'
+STX = b'\x02'
+ETX = b'\x03'
+
+DEFAULT_PORTS = (9100,)
+DEFAULT_CONCURRENCY = 4096
+DEFAULT_RATE = 20000            # connects per second
+DEFAULT_CONNECT_TIMEOUT = 0.3
+DEFAULT_QUERY_TIMEOUT = 1.0
+# File descriptors kept free for the rest of the process
+_RESERVED_FDS = 64
+
+
+@dataclass
+class Identity:
+    """A Zebra's ~HI reply, plus its friendly name if it has one"""
+    model: str
+    firmware: str = ''
+    dots_per_mm: int = 0
+    memory: str = ''
+    name: Optional[str] = None
+
+
+@dataclass
+class Found:
+    ip: str
+    port: int
+    identity: Optional[Identity] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {'ip': self.ip, 'port': self.port}
+        if self.identity is not None:
+            result.update({k: v for k, v in asdict(self.identity).items() if v not in (None, '')})
+        return result
+
+
+def parse_host_identification(data: bytes) -> Optional[Identity]:
+    """Parse '<STX>model,firmware,dpmm,memory[,options]<ETX>'"""
+    start = data.find(STX)
+    end = data.find(ETX, start + 1)
+    if start == -1 or end == -1:
+        return None
+    fields = [f.strip() for f in data[start + 1:end].decode('latin-1').split(',')]
+    if not fields[0]:
+        return None
+    try:
+        dpmm = int(fields[2]) if len(fields) > 2 else 0
+    except ValueError:
+        dpmm = 0
+    return Identity(model=fields[0], firmware=fields[1] if len(fields) > 1 else '', dots_per_mm=dpmm,
+                    memory=fields[3] if len(fields) > 3 else '')
+
+
+def parse_getvar(data: bytes) -> Optional[str]:
+    """Value of an SGD getvar reply, which is the value in double quotes"""
+    start = data.find(b'"')
+    end = data.find(b'"', start + 1)
+    if start == -1 or end == -1:
+        return None
+    value = data[start + 1:end].decode('latin-1').strip()
+    return value or None
+
+
+def addresses(cidrs: Iterable[str], ports: Sequence[int] = DEFAULT_PORTS) -> Iterator[Tuple[str, int]]:
+    """Every (host, port) in the ranges; lazily, so a /16 is never held in memory"""
+    for cidr in cidrs:
+        network = ipaddress.ip_network(cidr.strip(), strict=False)
+        hosts = network.hosts() if network.num_addresses > 2 else iter(network)
+        for host in hosts:
+            for port in ports:
+                yield str(host), port
+
+
+def count_addresses(cidrs: Iterable[str], ports: Sequence[int] = DEFAULT_PORTS) -> int:
+    total = 0
+    for cidr in cidrs:
+        network = ipaddress.ip_network(cidr.strip(), strict=False)
+        total += network.num_addresses - 2 if network.num_addresses > 2 else network.num_addresses
+    return total * len(ports)
+
+
+def outside(cidrs: Iterable[str], allowed: Iterable[str]) -> List[str]:
+    """The ranges in cidrs that are not contained in one of the allowed ranges"""
+    allowed_networks = [ipaddress.ip_network(a.strip(), strict=False) for a in allowed]
+    result = []
+    for cidr in cidrs:
+        network = ipaddress.ip_network(cidr.strip(), strict=False)
+        if not any(network.version == a.version and network.subnet_of(a) for a in allowed_networks):
+            result.append(cidr)
+    return result
+
+
+def _max_concurrency(requested: int) -> int:
+    """Concurrency the open file limit allows, raising the soft limit if the hard one permits"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = requested + _RESERVED_FDS
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):
+            pass
+    if soft == resource.RLIM_INFINITY:
+        return requested
+    return max(1, min(requested, soft - _RESERVED_FDS))
+
+
+class _RateLimiter:
+    """Spaces connects evenly at `rate` per second (0 = unlimited)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        # Sleeping for single connect intervals would cost more than the connects
+        if slot - now > 0.002:
+            await asyncio.sleep(slot - now)
+
+
+async def _read_until(reader: asyncio.StreamReader, done, timeout: float) -> bytes:
+    data = b''
+    deadline = time.monotonic() + timeout
+    try:
+        while not done(data):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            chunk = await asyncio.wait_for(reader.read(1024), remaining)
+            if not chunk:
+                break
+            data += chunk
+    except (asyncio.TimeoutError, OSError):
+        pass
+    return data
+
+
+async def identify(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                   timeout: float = DEFAULT_QUERY_TIMEOUT) -> Optional[Identity]:
+    """Ask an open connection ~HI, and a Zebra its friendly name"""
+    writer.write(HOST_IDENTIFICATION_QUERY)
+    await writer.drain()
+    identity = parse_host_identification(await _read_until(reader, lambda d: ETX in d, timeout))
+    if identity is None:
+        return None
+    writer.write(FRIENDLY_NAME_QUERY)
+    await writer.drain()
+    identity.name = parse_getvar(await _read_until(reader, lambda d: d.count(b'"') >= 2, timeout))
+    return identity
+
+
+async def _connect(ip: str, port: int, timeout: float) -> Optional[socket.socket]:
+    """Connected non-blocking socket, or None. Cheaper than open_connection for the many closed ports."""
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET6 if ':' in ip else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        if hasattr(asyncio, 'timeout'):
+            # Python 3.11+: no extra task per address, unlike wait_for
+            async with asyncio.timeout(timeout):
+                await loop.sock_connect(sock, (ip, port))
+        else:
+            await asyncio.wait_for(loop.sock_connect(sock, (ip, port)), timeout)
+        return sock
+    except (OSError, asyncio.TimeoutError):
+        sock.close()
+        return None
+
+
+async def probe(ip: str, port: int, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                query_timeout: float = DEFAULT_QUERY_TIMEOUT) -> Optional[Found]:
+    """Found if the port is open (identified if it is a Zebra), None otherwise"""
+    sock = await _connect(ip, port, connect_timeout)
+    if sock is None:
+        return None
+    try:
+        reader, writer = await asyncio.open_connection(sock=sock)
+    except OSError:
+        sock.close()
+        return Found(ip, port)
+    try:
+        return Found(ip, port, await identify(reader, writer, query_timeout))
+    except OSError:
+        return Found(ip, port)
+    finally:
+        writer.close()
+
+
+async def scan(cidrs: Iterable[str], ports: Sequence[int] = DEFAULT_PORTS, concurrency: int = DEFAULT_CONCURRENCY,
+               rate: float = DEFAULT_RATE, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+               query_timeout: float = DEFAULT_QUERY_TIMEOUT) -> List[Found]:
+    """Probe every address with up to `concurrency` connects in flight; open ports in address order"""
+    targets = addresses(cidrs, ports)
+    limiter = _RateLimiter(rate)
+    found: List[Found] = []
+
+    async def worker():
+        # Workers share one lazy iterator instead of one task per address
+        for ip, port in targets:
+            await limiter.wait()
+            result = await probe(ip, port, connect_timeout, query_timeout)
+            if result is not None:
+                found.append(result)
+
+    await asyncio.gather(*(worker() for _ in range(_max_concurrency(concurrency))))
+    found.sort(key=lambda f: (ipaddress.ip_address(f.ip), f.port))
+    return found
+
+
+def _in_scope(info: Dict[str, Any], networks, ports: Sequence[int]) -> bool:
+    try:
+        address = ipaddress.ip_address(info['ip'])
+    except ValueError:
+        return False
+    return int(info['port']) in ports and any(address in n for n in networks)
+
+
+def diff(found: Sequence[Found], registry: Dict[str, Dict[str, Any]], cidrs: Iterable[str],
+         ports: Sequence[int] = DEFAULT_PORTS) -> Dict[str, Any]:
+    """Compare scan results with the registry (see the module docstring for the categories)"""
+    networks = [ipaddress.ip_network(c.strip(), strict=False) for c in cidrs]
+    by_address = {(f.ip, f.port): f for f in found}
+    by_name = {f.identity.name: f for f in found if f.identity is not None and f.identity.name}
+    registered = {(info['ip'], int(info['port'])) for info in registry.values()}
+
+    result: Dict[str, Any] = {'ok': [], 'moved': {}, 'missing': [], 'unscanned': [], 'unregistered': [],
+                              'unidentified': []}
+    claimed = set()
+    for printer_id, info in sorted(registry.items()):
+        address = (info['ip'], int(info['port']))
+        here = by_address.get(address)
+        if here is not None and here.identity is not None:
+            result['ok'].append(printer_id)
+            claimed.add(address)
+            continue
+        elsewhere = by_name.get(printer_id)
+        if elsewhere is not None and (elsewhere.ip, elsewhere.port) not in registered:
+            result['moved'][printer_id] = {'from': {'ip': info['ip'], 'port': address[1]}, 'to': elsewhere.to_dict()}
+            claimed.add((elsewhere.ip, elsewhere.port))
+        elif here is not None:
+            # Something answers there, but not as a Zebra
+            result['missing'].append(printer_id)
+        elif _in_scope(info, networks, ports):
+            result['missing'].append(printer_id)
+        else:
+            result['unscanned'].append(printer_id)
+
+    for f in found:
+        if (f.ip, f.port) in claimed or (f.ip, f.port) in registered:
+            continue
+        result['unregistered' if f.identity is not None else 'unidentified'].append(f.to_dict())
+    return result
+
+
+def merge(changes: Dict[str, Any], add_unregistered: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Registry entries to upsert: moved printers at their new address, optionally new Zebras"""
+    updates = {printer_id: {'ip': move['to']['ip'], 'port': move['to']['port']}
+               for printer_id, move in changes['moved'].items()}
+    if add_unregistered:
+        for entry in changes['unregistered']:
+            printer_id = entry.get('name') or f"zebra-{entry['ip']}"
+            updates.setdefault(printer_id, {'ip': entry['ip'], 'port': entry['port']})
+    return updates
+
+
+async def discover(cidrs: Sequence[str], ports: Sequence[int] = DEFAULT_PORTS,
+                   registry: Optional[Dict[str, Dict[str, Any]]] = None, **scan_options: Any) -> Dict[str, Any]:
+    """Scan and diff against the registry (get_printers_snapshot() by default)"""
+    if registry is None:
+        from printers import get_printers_snapshot
+
+        registry = get_printers_snapshot()
+    started = time.perf_counter()
+    found = await scan(cidrs, ports, **scan_options)
+    result = diff(found, registry, cidrs, ports)
+    result['scanned'] = count_addresses(cidrs, ports)
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    logging.info("Discovery scanned %s addresses in %.1fs: %s ok, %s moved, %s missing, %s unregistered",
+                 result['scanned'], result['seconds'], len(result['ok']), len(result['moved']),
+                 len(result['missing']), len(result['unregistered']))
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Scan subnets for Zebra printers and diff against the registry')
+    parser.add_argument('cidrs', nargs='+', help='ranges to scan, e.g. 10.1.0.0/16')
+    parser.add_argument('--port', type=int, action='append', help='raw port to probe (repeatable, default 9100)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help='connects per second, 0 = unlimited')
+    parser.add_argument('--connect-timeout', type=float, default=DEFAULT_CONNECT_TIMEOUT)
+    parser.add_argument('--merge', action='store_true', help='apply moved printers to the registry')
+    parser.add_argument('--add-unregistered', action='store_true', help='with --merge, also add new Zebras')
+    parser.add_argument('--write-file', help='write the merged registry as a PRINTERS_FILE')
+    args = parser.parse_args(argv)
+
+    from printers import get_printers_snapshot, merge_printers
+
+    ports = tuple(args.port or DEFAULT_PORTS)
+    result = asyncio.run(discover(args.cidrs, ports, concurrency=args.concurrency, rate=args.rate,
+                                  connect_timeout=args.connect_timeout))
+    if args.merge:
+        result['merged'] = merge_printers(merge(result, args.add_unregistered))
+        if args.write_file:
+            with open(args.write_file, 'w') as f:
+                json.dump(get_printers_snapshot(), f, indent=2)
+    json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,12 @@
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import padding
 from base64 import b64encode
 import os
 
 def encrypt_aes(input_string, key):
+    # cryptography is only loaded when something is encrypted, never by the API server
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import padding
+
     # Convert key to bytes and ensure it's 32 bytes (256 bits) for AES-256
     key_bytes = key.encode('utf-8').ljust(32, b'\0')[:32]
     iv = os.urandom(16)  # Generate a random IV
@@ -20,6 +22,7 @@ def encrypt_aes(input_string, key):
     return b64encode(iv + ct).decode('utf-8')
 
 # Example usage
-key = "my_secret_key"
-encrypted_message = encrypt_aes("token dfd354ca965f0e4:2b0c64580af2ede", key)
-print("Encrypted:", encrypted_message)
\ No newline at end of file
+if __name__ == '__main__':
+    key = "my_secret_key"
+    encrypted_message = encrypt_aes("token dfd354ca965f0e4:2b0c64580af2ede", key)
+    print("Encrypted:", encrypted_message)
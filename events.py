@@ -0,0 +1,227 @@
+import asyncio
+import json
+import logging
+import queue
+import time
+from collections import deque
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+# States reported for a printer in events and snapshots
+ONLINE = 'online'
+OFFLINE = 'offline'
+CIRCUIT_OPEN = 'circuit_open'
+
+
+class LoopQueue:
+    """
+    Subscriber queue of a consumer on an asyncio event loop. Publishers on any thread hand
+    events to the loop, where they wait in an asyncio.Queue for `await get()`; when it is
+    full the oldest event is dropped, as for other subscribers.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    def full(self) -> bool:
+        # Puts land on the loop later; _put drops the oldest event instead
+        return False
+
+    def put_nowait(self, event: Dict[str, Any]) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # the loop has closed; the subscriber is going away
+
+    def _put(self, event: Dict[str, Any]) -> None:
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(event)
+
+    async def get(self) -> Dict[str, Any]:
+        return await self._queue.get()
+
+
+Subscriber = Union[queue.Queue, LoopQueue]
+
+
+class EventBus:
+    """
+    Fan-out of server events to any number of subscribers.
+
+    Publishing never blocks: each subscriber has a bounded queue, and a subscriber that
+    falls behind loses its oldest events. The most recent events are also kept in a
+    replay buffer so reconnecting clients can resume from their last event id.
+    """
+
+    def __init__(self, subscriber_queue_size: int = 256, replay_size: int = 256):
+        self._lock = Lock()
+        self._subscribers: List[Subscriber] = []
+        self._queue_size = subscriber_queue_size
+        self._replay: deque = deque(maxlen=replay_size)
+        self._next_id = 1
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Publish an event to all current subscribers and return it"""
+        with self._lock:
+            event = {'id': self._next_id, 'type': event_type, 'time': time.time(), 'data': data}
+            self._next_id += 1
+            self._replay.append(event)
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                    q.put_nowait(event)
+                except (queue.Empty, queue.Full):
+                    pass
+        return event
+
+    def subscribe(self, last_event_id: Optional[int] = None,
+                  loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscriber:
+        """
+        Register a subscriber, pre-filled with replayed events newer than last_event_id.
+        With a loop it is a LoopQueue to await on that loop, otherwise a queue.Queue.
+        """
+        q: Subscriber = LoopQueue(loop, self._queue_size) if loop else queue.Queue(maxsize=self._queue_size)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._replay:
+                    if event['id'] > last_event_id and not q.full():
+                        q.put_nowait(event)
+            self._subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q: Subscriber) -> None:
+        with self._lock:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+
+class PrinterStateTracker:
+    """
+    Last known state of every printer, fed by sends, status sweeps and the monitor.
+
+    A 'printer' event is published only when a printer's state changes. Optionally acts as
+    a circuit breaker: after `circuit_failures` consecutive failures the printer is reported
+    as circuit_open and sends fail fast until `circuit_reset_seconds` have passed.
+    """
+
+    def __init__(self, bus: EventBus, circuit_failures: int = 0, circuit_reset_seconds: float = 30):
+        self._bus = bus
+        self._lock = Lock()
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self.circuit_failures = circuit_failures
+        self.circuit_reset_seconds = circuit_reset_seconds
+
+    def _set_state(self, printer_id: str, state: str, detail: Optional[Dict[str, Any]] = None) -> None:
+        """Caller holds self._lock"""
+        entry = self._states.setdefault(printer_id, {'state': None, 'since': 0.0, 'failures': 0, 'open_until': 0.0})
+        if entry['state'] == state:
+            return
+        previous = entry['state']
+        entry['state'] = state
+        entry['since'] = time.time()
+        data = {'printer_id': printer_id, 'state': state, 'previous': previous}
+        if detail:
+            data['detail'] = detail
+        self._bus.publish('printer', data)
+
+    def record_success(self, printer_id: str, state: Optional[str] = None, detail: Optional[Dict[str, Any]] = None) -> None:
+        """
+        A printer answered. `state` comes from ~HS (online, paper_out, paused, ...); without it
+        the printer is only known to be reachable, so a previously reported condition such as
+        paper_out is kept and only offline/circuit_open turn back to online.
+        """
+        with self._lock:
+            entry = self._states.get(printer_id)
+            if entry is not None:
+                entry['failures'] = 0
+                entry['open_until'] = 0.0
+            if state is None:
+                current = entry['state'] if entry is not None else None
+                state = ONLINE if current in (None, OFFLINE, CIRCUIT_OPEN) else current
+            self._set_state(printer_id, state, detail)
+
+    def record_failure(self, printer_id: str, error: Optional[str] = None) -> None:
+        """A printer could not be reached"""
+        with self._lock:
+            entry = self._states.setdefault(printer_id, {'state': None, 'since': 0.0, 'failures': 0, 'open_until': 0.0})
+            entry['failures'] += 1
+            detail = {'error': error} if error else None
+            if self.circuit_failures > 0 and entry['failures'] >= self.circuit_failures:
+                entry['open_until'] = time.monotonic() + self.circuit_reset_seconds
+                self._set_state(printer_id, CIRCUIT_OPEN, detail)
+            else:
+                self._set_state(printer_id, OFFLINE, detail)
+
+    def circuit_open(self, printer_id: str) -> bool:
+        """True while sends to the printer should fail fast. After the reset window one attempt is let through."""
+        with self._lock:
+            entry = self._states.get(printer_id)
+            return entry is not None and entry['state'] == CIRCUIT_OPEN and time.monotonic() < entry['open_until']
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {pid: {'state': e['state'], 'since': e['since']} for pid, e in self._states.items() if e['state']}
+
+
+def publish_job(bus: EventBus, job_id: str, status: str, printer_id: str, label_type: str, **extra: Any) -> None:
+    """Publish a print job lifecycle event (sending, sent, failed)"""
+    data = {'job_id': job_id, 'status': status, 'printer_id': printer_id, 'label_type': label_type}
+    data.update(extra)
+    bus.publish('job', data)
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Encode an event in Server-Sent Events wire format"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def sse_stream(bus: EventBus, tracker: PrinterStateTracker, last_event_id: Optional[int] = None,
+               heartbeat_seconds: float = 15) -> Iterator[str]:
+    """
+    Generate an SSE stream: a snapshot of all known printer states, then live events.
+    A comment line is sent when idle so proxies keep the connection open.
+    """
+    q = bus.subscribe(last_event_id)
+    try:
+        yield f"event: snapshot\ndata: {json.dumps(tracker.snapshot())}\n\n"
+        while True:
+            try:
+                event = q.get(timeout=heartbeat_seconds)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+    finally:
+        bus.unsubscribe(q)
+
+
+def monitor_printers(tracker: PrinterStateTracker, get_printers, probe) -> None:
+    """
+    Probe every registered printer once and feed the results to the tracker.
+
+    Args:
+        get_printers: Callable returning the printer mapping (printer_id -> {'ip', 'port'}).
+        probe: Callable (ip, port) returning a HostStatus, or None if the printer is
+               reachable but did not answer the status query. Raises if unreachable.
+    """
+    for printer_id, printer_info in get_printers().items():
+        try:
+            host_status = probe(printer_info['ip'], printer_info['port'])
+        except Exception as e:
+            logging.debug(f"Monitor could not reach printer {printer_id}: {e}")
+            tracker.record_failure(printer_id, str(e))
+            continue
+        if host_status is None:
+            tracker.record_success(printer_id, ONLINE)
+        else:
+            tracker.record_success(printer_id, host_status.state, host_status.to_dict())
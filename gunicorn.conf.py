@@ -0,0 +1,28 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+# Workers coordinate through this directory (registry file, leader and printer locks).
+# Without one, a fresh private directory: a fixed path in /tmp could be prepared by
+# another local user to feed the workers a printer registry.
+if not os.getenv('MINIPRINT_SHARED_DIR'):
+    os.environ['MINIPRINT_SHARED_DIR'] = tempfile.mkdtemp(prefix='miniprint-')
+# A registry file written before this master started belongs to an earlier server
+os.environ['MINIPRINT_STARTED_AT'] = str(time.time())
+
+bind = f"0.0.0.0:{os.getenv('FLASK_RUN_PORT', '5500')}"
+workers = int(os.getenv('MINIPRINT_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# Threads keep long printer sends and /events streams from blocking a whole worker
+threads = int(os.getenv('MINIPRINT_THREADS', '8'))
+worker_class = 'gthread'
+timeout = 60
+
+# Import the app once in the master; ERP is queried once per host, by the leader worker,
+# and the other workers load the registry it publishes
+preload_app = True
+
+
+def post_fork(server, worker):
+    from app import start_background_workers
+    start_background_workers()
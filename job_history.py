@@ -0,0 +1,206 @@
+"""
+Local history of print jobs in SQLite.
+
+Every job is stored with its final ZPL bytes (zlib-compressed) and metadata: printer,
+label type, batch or serial number, timestamps and outcome. Lookups by batch, serial
+and printer are indexed, and a stored job can be sent again without re-rendering.
+
+JOB_HISTORY_DB sets the file; without it only multi-process mode keeps a history, in
+the shared directory, and an empty value disables it. JOB_HISTORY_RETENTION_DAYS and
+JOB_HISTORY_MAX_JOBS bound its size.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id      TEXT PRIMARY KEY,
+    created_at  REAL NOT NULL,
+    finished_at REAL,
+    printer_id  TEXT NOT NULL,
+    label_type  TEXT NOT NULL,
+    batch       TEXT,
+    serial      TEXT,
+    outcome     TEXT NOT NULL,
+    error       TEXT,
+    bytes       INTEGER,
+    reprint_of  TEXT,
+    zpl         BLOB
+);
+CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch, created_at);
+CREATE INDEX IF NOT EXISTS jobs_serial ON jobs (serial, created_at);
+CREATE INDEX IF NOT EXISTS jobs_printer ON jobs (printer_id, created_at);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created_at);
+"""
+
+_COLUMNS = ('job_id', 'created_at', 'finished_at', 'printer_id', 'label_type', 'batch', 'serial', 'outcome',
+            'error', 'bytes', 'reprint_of')
+
+# Payload fields identifying what a label was printed for
+_SERIAL_FIELDS = ('serial_no', 'wo_serial_number')
+
+# Raw jobs larger than this are recorded without their bytes (and cannot be reprinted)
+MAX_STORED_BYTES = 4 * 1024 * 1024
+
+
+def references(data: Optional[Dict[str, Any]]) -> Dict[str, Optional[str]]:
+    """Batch and serial number of a print payload, for indexing"""
+    if not data:
+        return {'batch': None, 'serial': None}
+    serial = next((data[f] for f in _SERIAL_FIELDS if data.get(f)), None)
+    batch = data.get('batch')
+    return {'batch': str(batch).strip() if batch else None, 'serial': str(serial).strip() if serial else None}
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec='milliseconds')
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """Query parameter as epoch seconds: a number or an ISO 8601 date/time (UTC if no offset)"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class JobHistory:
+    def __init__(self, path: str, retention_days: float = 30, max_jobs: int = 0, prune_every: int = 500):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_jobs = max_jobs
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._since_prune = 0
+        with self._lock:
+            self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # A forked worker must not share its parent's connection
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            # WAL lets readers and the worker processes of one host write concurrently
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def record(self, job_id: str, printer_id: str, label_type: str, outcome: str, created_at: float,
+               finished_at: Optional[float] = None, zpl: Optional[bytes] = None, error: Optional[str] = None,
+               batch: Optional[str] = None, serial: Optional[str] = None, reprint_of: Optional[str] = None) -> None:
+        size = len(zpl) if zpl is not None else None
+        blob = zlib.compress(zpl, 1) if zpl is not None and size <= MAX_STORED_BYTES else None
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO jobs (job_id, created_at, finished_at, printer_id, label_type, batch, serial,'
+                ' outcome, error, bytes, reprint_of, zpl) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, created_at, finished_at, printer_id, label_type, batch, serial, outcome, error, size,
+                 reprint_of, blob),
+            )
+            self._since_prune += 1
+            if self._since_prune >= self.prune_every:
+                self._prune_locked(time.time())
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection().execute(
+                f"SELECT {', '.join(_COLUMNS)}, zpl IS NOT NULL FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def zpl(self, job_id: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection().execute('SELECT zpl FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return zlib.decompress(row[0])
+
+    def query(self, batch: Optional[str] = None, serial: Optional[str] = None, printer_id: Optional[str] = None,
+              label_type: Optional[str] = None, outcome: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Jobs matching all given filters, newest first"""
+        clauses, params = [], []
+        for column, value in (('batch', batch), ('serial', serial), ('printer_id', printer_id),
+                              ('label_type', label_type), ('outcome', outcome)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if since is not None:
+            clauses.append('created_at >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('created_at < ?')
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        params.append(limit)
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT {', '.join(_COLUMNS)}, zpl IS NOT NULL FROM jobs {where} ORDER BY created_at DESC LIMIT ?",
+                params,
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Apply the retention policy; returns the number of jobs removed"""
+        with self._lock:
+            return self._prune_locked(time.time() if now is None else now)
+
+    def _prune_locked(self, now: float) -> int:
+        self._since_prune = 0
+        conn = self._connection()
+        removed = 0
+        if self.retention_days > 0:
+            removed += conn.execute('DELETE FROM jobs WHERE created_at < ?',
+                                    (now - self.retention_days * 86400,)).rowcount
+        if self.max_jobs > 0:
+            removed += conn.execute(
+                'DELETE FROM jobs WHERE created_at < (SELECT created_at FROM jobs ORDER BY created_at DESC'
+                ' LIMIT 1 OFFSET ?)', (self.max_jobs - 1,)).rowcount
+        if removed:
+            logging.info("Job history pruned %s jobs", removed)
+        return removed
+
+    @staticmethod
+    def _to_dict(row) -> Dict[str, Any]:
+        job = dict(zip(_COLUMNS, row))
+        job['created_at'] = _iso(job['created_at'])
+        job['finished_at'] = _iso(job['finished_at'])
+        job['reprintable'] = bool(row[len(_COLUMNS)])
+        return job
+
+
+def open_from_env(shared_dir: Optional[str] = None) -> Optional[JobHistory]:
+    """JobHistory configured from the environment, or None if disabled"""
+    # Without JOB_HISTORY_DB only multi-process mode keeps a history, in its shared directory;
+    # a file in the working directory would land wherever the server or a test was started
+    default = os.path.join(shared_dir, 'job_history.db') if shared_dir else ''
+    path = os.getenv('JOB_HISTORY_DB', default)
+    if not path:
+        return None
+    try:
+        retention_days = float(os.getenv('JOB_HISTORY_RETENTION_DAYS', 30))
+        max_jobs = int(os.getenv('JOB_HISTORY_MAX_JOBS', 0))
+    except ValueError:
+        retention_days, max_jobs = 30, 0
+    try:
+        return JobHistory(path, retention_days, max_jobs)
+    except sqlite3.Error as e:
+        logging.error("Job history disabled, cannot open %s: %s", path, e)
+        return None
@@ -0,0 +1,49 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
+
+from zpl_generator import generate_zpl, generate_msl_sticker, generate_special_instructions_label, generate_dry_label, generate_tracescan_label, generate_svt_fortlox_label_ok, generate_svt_fortlox_label_nok
+from validation import validate_request, validate_msl_request, validate_special_instructions_request, validate_dry_request, validate_tracescan_request, validate_svt_fortlox_request_ok, validate_svt_fortlox_request_nok
+from validation import (STANDARD_VALIDATOR, MSL_VALIDATOR, SPECIAL_INSTRUCTIONS_VALIDATOR, DRY_VALIDATOR, TRACESCAN_VALIDATOR,
+                        SVT_FORTLOX_OK_VALIDATOR, SVT_FORTLOX_NOK_VALIDATOR)
+
+
+@dataclass(frozen=True)
+class LabelType:
+    """A printable label: its API route, validator, ZPL generator and success message"""
+    name: str
+    route: str
+    validate: Callable[[Dict[str, Any]], List[str]]
+    generate: Callable[..., str]
+    message: str
+    # Payload as the generator prints it, so equivalent payloads share a render cache key
+    normalize: Callable[[Dict[str, Any]], Dict[str, Any]] = dict
+
+
+# Keyed by label type name, in the order the print endpoints are registered in app.py
+LABEL_TYPES: Dict[str, LabelType] = {label.name: label for label in [
+    LabelType('standard', '/print', validate_request, generate_zpl,
+              'Label sent to printer successfully', STANDARD_VALIDATOR.normalize),
+    LabelType('msl', '/print/msl', validate_msl_request, generate_msl_sticker,
+              'MSL label sent to printer successfully', MSL_VALIDATOR.normalize),
+    LabelType('special-instructions', '/print/special-instructions', validate_special_instructions_request,
+              generate_special_instructions_label, 'Special Instructions label sent to printer successfully',
+              SPECIAL_INSTRUCTIONS_VALIDATOR.normalize),
+    LabelType('dry', '/print/dry', validate_dry_request, generate_dry_label,
+              'DRY label sent to printer successfully', DRY_VALIDATOR.normalize),
+    LabelType('tracescan', '/print/tracescan', validate_tracescan_request, generate_tracescan_label,
+              'Tracescan label sent to printer successfully', TRACESCAN_VALIDATOR.normalize),
+    LabelType('svt-fortlox-ok', '/print/svt-fortlox-ok', validate_svt_fortlox_request_ok, generate_svt_fortlox_label_ok,
+              'SVT Fortlox OK label sent to printer successfully', SVT_FORTLOX_OK_VALIDATOR.normalize),
+    LabelType('svt-fortlox-nok', '/print/svt-fortlox-nok', validate_svt_fortlox_request_nok,
+              generate_svt_fortlox_label_nok, 'SVT Fortlox NOK label sent to printer successfully',
+              SVT_FORTLOX_NOK_VALIDATOR.normalize),
+]}
+
+LABEL_TYPES_BY_ROUTE: Dict[str, LabelType] = {label.route: label for label in LABEL_TYPES.values()}
+
+
+def get_label_type(name: str) -> LabelType:
+    label = LABEL_TYPES.get(name)
+    if label is None:
+        raise ValueError(f"Unknown label type '{name}'. Known types: {', '.join(LABEL_TYPES)}")
+    return label
@@ -0,0 +1,175 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+import tracing
+
+# Record attributes copied into structured output when present (set via `extra=` or the trace)
+CONTEXT_FIELDS = ('printer_id', 'job_id', 'label_type')
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the request context fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Attach printer_id / job_id / label_type of the request being handled, if any"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = tracing.current_trace()
+        if trace is not None:
+            for field in CONTEXT_FIELDS:
+                if field in trace.annotations and getattr(record, field, None) is None:
+                    setattr(record, field, trace.annotations[field])
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through the first occurrence of a message per window and drop repeats.
+
+    Messages are keyed by logger, level, format string and arguments, so a flapping
+    printer's "Failed to connect to 10.1.0.25:9100" is limited independently of other
+    printers. The first message after a window carries the number of dropped repeats.
+    """
+
+    def __init__(self, window_seconds: float, max_keys: int = 4096):
+        super().__init__()
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._lock = Lock()
+        self._seen: Dict[Tuple, list] = {}
+
+    def _key(self, record: logging.LogRecord) -> Tuple:
+        try:
+            args = tuple(str(a) for a in record.args) if isinstance(record.args, tuple) else str(record.args)
+        except Exception:
+            args = ()
+        return record.name, record.levelno, str(record.msg), args
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.window_seconds <= 0:
+            return True
+        key = self._key(record)
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is not None and now - seen[0] < self.window_seconds:
+                seen[1] += 1
+                return False
+            suppressed = seen[1] if seen is not None else 0
+            if seen is None and len(self._seen) >= self.max_keys:
+                # Forget windows that have expired; if none have, forget everything
+                expired = [k for k, v in self._seen.items() if now - v[0] >= self.window_seconds]
+                for k in expired or list(self._seen):
+                    del self._seen[k]
+            self._seen[key] = [now, 0]
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """basicConfig's layout, plus a note when repeats were suppressed"""
+
+    def __init__(self):
+        super().__init__(logging.BASIC_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f"{text} (suppressed {suppressed} similar messages)" if suppressed else text
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue the record untouched; message formatting happens on the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ('1', 'true', 't', 'yes', 'y', 'on')
+
+
+def configure_logging() -> None:
+    """
+    Configure the root logger from the environment.
+
+    LOG_LEVEL             level name, default DEBUG
+    LOG_FORMAT            'text' (default) or 'json'
+    LOG_ASYNC             when true, records are queued and written by a background thread
+    LOG_RATE_LIMIT_SECONDS  drop identical messages repeated within this window (default 0, off)
+    """
+    global _listener
+    level = getattr(logging, os.getenv('LOG_LEVEL', 'DEBUG').upper(), logging.DEBUG)
+    formatter = JsonFormatter() if os.getenv('LOG_FORMAT', 'text').lower() == 'json' else TextFormatter()
+    try:
+        window = float(os.getenv('LOG_RATE_LIMIT_SECONDS', '0'))
+    except ValueError:
+        window = 0
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(formatter)
+
+    if _env_flag('LOG_ASYNC', 'false'):
+        if _listener is not None:
+            _listener.stop()
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        handler: logging.Handler = _DeferredQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+    else:
+        handler = stream_handler
+
+    # Filters run on the calling thread, before the record is queued
+    handler.addFilter(ContextFilter())
+    if window > 0:
+        handler.addFilter(RateLimitFilter(window))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def _restart_listener_after_fork() -> None:
+    """Pre-fork servers fork after import; the writer thread does not survive the fork"""
+    global _listener
+    if _listener is not None:
+        _listener = logging.handlers.QueueListener(_listener.queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listener_after_fork)
@@ -0,0 +1,228 @@
+"""
+Printer-buffer-aware pacing for large jobs on one connection.
+
+A Zebra reads formats into its receive buffer only as fast as it prints them. Thousands
+of labels written down one socket fill the buffer, the connection stalls, and a send
+timeout can kill the job halfway. Pacing splits the outgoing stream at ^XZ format
+boundaries and keeps at most `window` formats in the printer: once that many are
+unprinted, it polls ~HS on the same connection until formats_in_buffer has fallen to
+half the window, then sends the next half. Polls are spaced by the print rate measured
+from earlier polls, so the buffer never runs dry and long runs print at full speed.
+
+Jobs with fewer formats than the window are sent as before, without a single ~HS. A
+printer that does not answer ~HS is sent to unpaced from then on. If the printer
+prints nothing for PRINT_PACING_STALL_SECONDS while formats are buffered (paper out,
+paused, head open), the job fails with PrinterStalled naming the printer's state.
+
+PRINT_PACING is 'all' by default, a comma separated list of printer ids, or 'off'.
+"""
+import asyncio
+import os
+import socket
+import time
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Set
+
+import metrics
+from zebra_status import HostStatus, read_host_status, read_host_status_async
+
+FORMAT_END = b'^XZ'
+# Wait for one ~HS reply
+REPLY_TIMEOUT_SECONDS = 2
+# Longest sleep between polls, however slowly the printer prints
+MAX_POLL_INTERVAL_SECONDS = 1.0
+
+PACING_WAIT = metrics.counter('miniprint_print_pacing_wait_seconds_total',
+                              "Time sends waited for room in the printer's buffer", ('printer',))
+PACING_POLLS = metrics.counter('miniprint_print_pacing_polls_total', '~HS polls made while pacing', ('printer',))
+
+
+class PrinterStalled(Exception):
+    """The printer stopped printing while a paced job waited for buffer room"""
+
+    def __init__(self, printer: str, status: HostStatus, seconds: float):
+        self.printer = printer
+        self.status = status
+        super().__init__(f"Printer {printer} printed nothing for {seconds:.0f}s with "
+                         f"{status.formats_in_buffer} formats buffered ({status.state})")
+
+
+class PacingPolicy:
+    """Which printers are paced, how many formats to keep in flight, and when to give up"""
+
+    def __init__(self, printers: Optional[Set[str]] = None, window: int = 16, poll_interval: float = 0.05,
+                 stall_timeout: float = 120):
+        self.printers = printers  # None: every printer
+        self.window = max(window, 2)
+        self.poll_interval = poll_interval
+        self.stall_timeout = stall_timeout
+        # Printers that did not answer ~HS; they are sent to unpaced
+        self._no_status: Set[str] = set()
+
+    def applies(self, printer_id: Optional[str]) -> bool:
+        return (printer_id is not None and (self.printers is None or printer_id in self.printers)
+                and printer_id not in self._no_status)
+
+    def status_missing(self, printer_id: str) -> None:
+        self._no_status.add(printer_id)
+
+
+def from_env() -> Optional[PacingPolicy]:
+    value = os.getenv('PRINT_PACING', 'all').strip()
+    if value.lower() in ('', '0', 'false', 'no', 'off'):
+        return None
+
+    def number(name, default):
+        try:
+            return float(os.getenv(name, default))
+        except ValueError:
+            return default
+
+    printers = None if value.lower() in ('1', 'true', 'yes', 'all') else {
+        p.strip() for p in value.split(',') if p.strip()}
+    return PacingPolicy(printers, window=int(number('PRINT_PACING_WINDOW', 16)),
+                        poll_interval=number('PRINT_PACING_POLL_SECONDS', 0.05),
+                        stall_timeout=number('PRINT_PACING_STALL_SECONDS', 120))
+
+
+class Pacer:
+    """Format boundaries and in-flight count of one paced connection"""
+
+    def __init__(self, policy: PacingPolicy, printer: str):
+        self.policy = policy
+        self.printer = printer
+        self.in_flight = 0  # formats sent and not known to be printed
+        self.rate = 0.0  # formats printed per second, measured while waiting; kept across waits
+        self.enabled = True
+        self._pending = b''
+        self._boundary = True  # the next non-blank byte starts a new format
+
+    def split(self, chunk: bytes) -> List[bytes]:
+        """chunk cut after each ^XZ; a ^ or ^X at its end is held for the next chunk"""
+        data = self._pending + chunk
+        held = 2 if data.endswith(b'^X') else 1 if data.endswith(b'^') else 0
+        self._pending = data[len(data) - held:] if held else b''
+        data = data[:len(data) - held]
+        pieces, start = [], 0
+        while True:
+            end = data.find(FORMAT_END, start)
+            if end == -1:
+                break
+            pieces.append(data[start:end + len(FORMAT_END)])
+            start = end + len(FORMAT_END)
+        if start < len(data):
+            pieces.append(data[start:])
+        return pieces
+
+    def finish(self) -> bytes:
+        pending, self._pending = self._pending, b''
+        return pending
+
+    def needs_room(self, piece: bytes) -> bool:
+        """Whether the window is full and piece starts a new format"""
+        return self.enabled and self._boundary and self.in_flight >= self.policy.window and bool(piece.strip())
+
+    def sent(self, piece: bytes) -> None:
+        if piece.endswith(FORMAT_END):
+            self.in_flight += 1
+            self._boundary = True
+        elif piece.strip():
+            self._boundary = False
+
+
+class _Wait:
+    """One wait for room: decides from successive ~HS replies how long to sleep next"""
+
+    def __init__(self, pacer: Pacer):
+        self.pacer = pacer
+        self.started = self._progress_at = time.perf_counter()
+        self._previous: Optional[HostStatus] = None
+        self._previous_at = self.started
+
+    def next_delay(self, status: Optional[HostStatus]) -> Optional[float]:
+        """Seconds to sleep before polling again, or None once there is room"""
+        pacer, policy = self.pacer, self.pacer.policy
+        PACING_POLLS.labels(printer=pacer.printer).inc()
+        if status is None:
+            policy.status_missing(pacer.printer)
+            pacer.enabled = False
+            return None
+        now = time.perf_counter()
+        pacer.in_flight = status.formats_in_buffer
+        progressed = self._previous is not None and status.formats_in_buffer < self._previous.formats_in_buffer
+        # After an emptied buffer this is a lower bound; the next wait then measures it exactly
+        if progressed:
+            printed = self._previous.formats_in_buffer - status.formats_in_buffer
+            pacer.rate = printed / max(now - self._previous_at, 1e-6)
+        low_water = policy.window // 2
+        if pacer.in_flight <= low_water:
+            return None
+        if progressed:
+            self._progress_at = now
+        elif now - self._progress_at >= policy.stall_timeout:
+            raise PrinterStalled(pacer.printer, status, now - self._progress_at)
+        self._previous, self._previous_at = status, now
+        if not pacer.rate:
+            return policy.poll_interval
+        # About when the buffer reaches the low water mark at the measured rate
+        return min((pacer.in_flight - low_water) / pacer.rate, MAX_POLL_INTERVAL_SECONDS)
+
+    def done(self) -> None:
+        PACING_WAIT.labels(printer=self.pacer.printer).inc(time.perf_counter() - self.started)
+
+
+def make_room(sock: socket.socket, pacer: Pacer) -> None:
+    """Poll ~HS on an open connection until the printer's buffer has room for the next formats"""
+    timeout = sock.gettimeout()
+    wait = _Wait(pacer)
+    try:
+        # Otherwise Nagle holds the 3 byte query back until the last formats are acknowledged
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(REPLY_TIMEOUT_SECONDS)
+        while True:
+            delay = wait.next_delay(read_host_status(sock))
+            if delay is None:
+                return
+            time.sleep(delay)
+    finally:
+        sock.settimeout(timeout)
+        wait.done()
+
+
+def paced(sock: socket.socket, chunks: Iterable[bytes], pacer: Pacer) -> Iterator[bytes]:
+    """chunks re-cut at format boundaries, held back while the printer's buffer is full"""
+    for chunk in chunks:
+        for piece in pacer.split(chunk):
+            if pacer.needs_room(piece):
+                make_room(sock, pacer)
+            yield piece
+            pacer.sent(piece)
+    tail = pacer.finish()
+    if tail:
+        yield tail
+
+
+async def make_room_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, pacer: Pacer) -> None:
+    """Async counterpart of make_room"""
+    wait = _Wait(pacer)
+    try:
+        while True:
+            delay = wait.next_delay(await read_host_status_async(reader, writer, REPLY_TIMEOUT_SECONDS))
+            if delay is None:
+                return
+            await asyncio.sleep(delay)
+    finally:
+        wait.done()
+
+
+async def paced_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, chunks: AsyncIterator[bytes],
+                      pacer: Pacer) -> AsyncIterator[bytes]:
+    """Async counterpart of paced"""
+    async for chunk in chunks:
+        for piece in pacer.split(chunk):
+            if pacer.needs_room(piece):
+                await make_room_async(reader, writer, pacer)
+            yield piece
+            pacer.sent(piece)
+    tail = pacer.finish()
+    if tail:
+        yield tail
@@ -0,0 +1,228 @@
+"""
+End-to-end print confirmation: a job counts as printed when the printer says so, not
+when its bytes were accepted.
+
+With PRINT_CONFIRM set ('all', or a comma separated list of printer ids) a job's
+connection stays open after the last byte. The printer's label odometer (the
+odometer.total_label_count variable; ~HQOD reports the same odometer as media length,
+not labels) is read before the job and polled after it until it has advanced by the
+job's labels: one per ^XA..^XZ format, or its ^PQ quantity. Printers without the
+odometer are polled with ~HS until no formats are buffered and no labels remain in
+the batch. A job that is not confirmed within PRINT_CONFIRM_TIMEOUT_SECONDS is
+reported unconfirmed, with the printer's state (paper_out, head_open, ...) as the
+reason; it is never failed, since its label may still come out.
+
+Odometer deltas assume one job at a time per printer, as run_job's printer lock
+provides in multi-process mode; a concurrent job to the same printer can confirm an
+earlier job a little early. Print latency (first byte sent to label out) and labels
+printed are exported per printer, so rate(miniprint_labels_printed_total[5m]) * 60 is
+a measured labels-per-minute figure for sizing.
+"""
+import asyncio
+import os
+import re
+import socket
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Set
+
+import metrics
+from zebra_status import (HostStatus, read_host_status, read_host_status_async, read_label_counter,
+                          read_label_counter_async)
+
+# Wait for one reply to a counter or status query
+REPLY_TIMEOUT_SECONDS = 2
+
+PRINT_LATENCY = metrics.histogram('miniprint_print_confirm_duration_seconds',
+                                  'Time from sending a job to its labels being printed', ('printer',),
+                                  buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+LABELS_PRINTED = metrics.counter('miniprint_labels_printed_total', 'Labels confirmed printed by the printer',
+                                 ('printer',))
+PRINT_UNCONFIRMED = metrics.counter('miniprint_print_unconfirmed_total', 'Jobs whose printing was not confirmed',
+                                    ('printer', 'reason'))
+
+_TOKENS = re.compile(rb'\^XA|\^XZ|\^PQ(\d+)')
+# Bytes kept back between chunks so a token split across them is still seen whole
+_LOOKAHEAD = 12
+
+
+class LabelTally:
+    """Counts the labels a ZPL stream will print as it passes, chunk by chunk"""
+
+    def __init__(self):
+        self.labels = 0
+        self._quantity = 0  # of the open format, 0 outside one
+        self._pending = b''
+
+    def feed(self, chunk: bytes) -> None:
+        data = self._pending + chunk
+        cut = max(len(data) - _LOOKAHEAD, 0)
+        end = self._scan(data, cut)
+        self._pending = data[max(cut, end):]
+
+    def finish(self) -> int:
+        self._scan(self._pending, len(self._pending))
+        self._pending = b''
+        return self.labels
+
+    def _scan(self, data: bytes, limit: int) -> int:
+        end = 0
+        for match in _TOKENS.finditer(data):
+            if match.start() >= limit:
+                break
+            token = match.group(0)[:3]
+            if token == b'^XA':
+                self._quantity = 1
+            elif token == b'^XZ':
+                self.labels += self._quantity
+                self._quantity = 0
+            elif self._quantity:
+                self._quantity = max(int(match.group(1)), 1)
+            end = match.end()
+        return end
+
+
+def count_labels(zpl: bytes) -> int:
+    tally = LabelTally()
+    tally.feed(zpl)
+    return tally.finish()
+
+
+@dataclass
+class Confirmation:
+    printed: bool
+    labels: int
+    seconds: float
+    method: Optional[str] = None  # 'counter' or 'status'
+    reason: Optional[str] = None  # why printed is False
+
+    def details(self) -> Dict[str, Any]:
+        """Fields added to the job's printed/unconfirmed event"""
+        details: Dict[str, Any] = {'labels': self.labels, 'print_latency_ms': round(self.seconds * 1000, 1)}
+        if self.method:
+            details['confirmed_by'] = self.method
+        if self.reason:
+            details['reason'] = self.reason
+        return details
+
+
+class ConfirmPolicy:
+    """Which printers' jobs are confirmed, and how long to wait for them"""
+
+    def __init__(self, printers: Optional[Set[str]] = None, timeout: float = 60, poll_interval: float = 0.25):
+        self.printers = printers  # None: every printer
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        # Printers that did not answer the odometer query; they are polled with ~HS only
+        self._no_counter: Set[str] = set()
+
+    def applies(self, printer_id: Optional[str]) -> bool:
+        return printer_id is not None and (self.printers is None or printer_id in self.printers)
+
+    def counter_supported(self, printer_id: str) -> bool:
+        return printer_id not in self._no_counter
+
+    def counter_missing(self, printer_id: str) -> None:
+        self._no_counter.add(printer_id)
+
+
+def from_env() -> Optional[ConfirmPolicy]:
+    value = os.getenv('PRINT_CONFIRM', '').strip()
+    if value.lower() in ('', '0', 'false', 'no'):
+        return None
+
+    def number(name, default):
+        try:
+            return float(os.getenv(name, default))
+        except ValueError:
+            return default
+
+    printers = None if value.lower() in ('1', 'true', 'yes', 'all') else {
+        p.strip() for p in value.split(',') if p.strip()}
+    return ConfirmPolicy(printers, timeout=number('PRINT_CONFIRM_TIMEOUT_SECONDS', 60),
+                         poll_interval=number('PRINT_CONFIRM_POLL_SECONDS', 0.25))
+
+
+def _progress(before: Optional[int], labels: int, counter: Optional[int], status: Optional[HostStatus]) -> bool:
+    if before is not None:
+        return counter is not None and counter - before >= labels
+    return status is not None and status.formats_in_buffer == 0 and status.labels_remaining == 0
+
+
+def _finish(printer: str, labels: int, started: float, method: Optional[str],
+            reason: Optional[str] = None) -> Confirmation:
+    seconds = time.perf_counter() - started
+    if reason is None:
+        PRINT_LATENCY.labels(printer=printer).observe(seconds)
+        LABELS_PRINTED.labels(printer=printer).inc(labels)
+        return Confirmation(True, labels, seconds, method)
+    PRINT_UNCONFIRMED.labels(printer=printer, reason=reason).inc()
+    return Confirmation(False, labels, seconds, method, reason)
+
+
+def counter_before(sock: socket.socket, printer_id: str, policy: ConfirmPolicy) -> Optional[int]:
+    """The odometer before a job, or None if the printer has none (then ~HS is polled)"""
+    if not policy.counter_supported(printer_id):
+        return None
+    sock.settimeout(REPLY_TIMEOUT_SECONDS)
+    counter = read_label_counter(sock)
+    if counter is None:
+        policy.counter_missing(printer_id)
+    return counter
+
+
+def wait_printed(sock: socket.socket, printer: str, before: Optional[int], labels: int, started: float,
+                 policy: ConfirmPolicy) -> Confirmation:
+    """Poll an open connection until the job's labels are printed or the policy's timeout passes"""
+    method = 'counter' if before is not None else 'status'
+    deadline = started + policy.timeout
+    try:
+        sock.settimeout(REPLY_TIMEOUT_SECONDS)
+        while True:
+            counter = read_label_counter(sock) if before is not None else None
+            status = read_host_status(sock) if before is None else None
+            if before is None and status is None:
+                return _finish(printer, labels, started, None, 'unsupported')
+            if _progress(before, labels, counter, status):
+                return _finish(printer, labels, started, method)
+            if time.perf_counter() >= deadline:
+                status = status or read_host_status(sock)
+                state = status.state if status is not None else 'online'
+                return _finish(printer, labels, started, method, 'timeout' if state == 'online' else state)
+            time.sleep(policy.poll_interval)
+    except OSError:
+        return _finish(printer, labels, started, method, 'disconnected')
+
+
+async def counter_before_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, printer_id: str,
+                               policy: ConfirmPolicy) -> Optional[int]:
+    """Async counterpart of counter_before"""
+    if not policy.counter_supported(printer_id):
+        return None
+    counter = await read_label_counter_async(reader, writer, REPLY_TIMEOUT_SECONDS)
+    if counter is None:
+        policy.counter_missing(printer_id)
+    return counter
+
+
+async def wait_printed_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, printer: str,
+                             before: Optional[int], labels: int, started: float,
+                             policy: ConfirmPolicy) -> Confirmation:
+    """Async counterpart of wait_printed"""
+    method = 'counter' if before is not None else 'status'
+    deadline = started + policy.timeout
+    try:
+        while True:
+            counter = await read_label_counter_async(reader, writer, REPLY_TIMEOUT_SECONDS) if before is not None else None
+            status = await read_host_status_async(reader, writer, REPLY_TIMEOUT_SECONDS) if before is None else None
+            if before is None and status is None:
+                return _finish(printer, labels, started, None, 'unsupported')
+            if _progress(before, labels, counter, status):
+                return _finish(printer, labels, started, method)
+            if time.perf_counter() >= deadline:
+                status = status or await read_host_status_async(reader, writer, REPLY_TIMEOUT_SECONDS)
+                state = status.state if status is not None else 'online'
+                return _finish(printer, labels, started, method, 'timeout' if state == 'online' else state)
+            await asyncio.sleep(policy.poll_interval)
+    except OSError:
+        return _finish(printer, labels, started, method, 'disconnected')
@@ -0,0 +1,326 @@
+"""
+Virtual Zebra printers for local load and failure testing.
+
+    python printer_sim.py --count 10 --base-port 19100 --registry-file sim_printers.json
+    PRINTERS_FILE=sim_printers.json python app.py
+
+Each virtual printer listens on localhost, accepts raw ZPL like port 9100 on a real
+Zebra, counts and checksums the labels it receives, answers ~HS host status and ~HI
+identification queries, the device.friendly_name getvar (its printer id) and the
+odometer.total_label_count getvar (labels printed so far), and can inject latency, a
+throughput limit, connection resets and blackholes. With --buffer-formats it stops
+reading a connection while that many formats wait to print, like a full receive buffer.
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+LABEL_START = b'^XA'
+LABEL_END = b'^XZ'
+HOST_STATUS_QUERY = b'~HS'
+HOST_IDENTIFICATION_QUERY = b'~HI'
+GETVAR = b'! U1 getvar "'
+
+
+@dataclass
+class PrinterBehavior:
+    """Fault and performance knobs of a virtual printer"""
+    latency: float = 0.0          # seconds before a new connection is served
+    label_time: float = 0.0       # seconds to "print" one label (formats queue up meanwhile)
+    throughput: float = 0.0       # max bytes per second read from a connection (0 = unlimited)
+    reset_rate: float = 0.0       # probability a connection is reset after its first read
+    blackhole: bool = False       # accept connections but never read or answer
+    answer_status: bool = True    # answer ~HS queries
+    odometer: bool = True         # answer the odometer.total_label_count getvar ("?" otherwise)
+    buffer_formats: int = 0       # stop reading while this many formats are unprinted (0 = unlimited)
+    paper_out: bool = False       # reported in ~HS; nothing prints meanwhile
+    model: str = 'ZT410-203dpi'   # reported in ~HI
+
+
+@dataclass
+class PrinterStats:
+    connections: int = 0
+    resets: int = 0
+    status_queries: int = 0
+    bytes_received: int = 0
+    labels: int = 0
+    printed: int = 0
+    peak_buffered: int = 0  # most formats waiting to print at once
+    # CRC32 chained over every label in arrival order; equal values mean identical label streams
+    checksum: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            'connections': self.connections,
+            'resets': self.resets,
+            'status_queries': self.status_queries,
+            'bytes_received': self.bytes_received,
+            'labels': self.labels,
+            'printed': self.printed,
+            'peak_buffered': self.peak_buffered,
+            'checksum': self.checksum,
+        }
+
+
+class VirtualPrinter:
+    """One simulated printer; runs on the fleet's event loop"""
+
+    def __init__(self, printer_id: str, port: int = 0, behavior: Optional[PrinterBehavior] = None,
+                 host: str = '127.0.0.1'):
+        self.printer_id = printer_id
+        self.host = host
+        self.port = port
+        self.behavior = behavior or PrinterBehavior()
+        self.stats = PrinterStats()
+        self._queued = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._printing: Optional[asyncio.Task] = None
+        self._connections: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        for task in list(self._connections):
+            task.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._printing is not None:
+            self._printing.cancel()
+
+    def host_status(self) -> bytes:
+        """~HS reply: three <STX>...<ETX> frames (see zebra_status.parse_host_status)"""
+        b = self.behavior
+        first = f"030,{int(b.paper_out)},0,1245,{self._queued:03d},0,0,0,000,0,0,0"
+        second = f"001,0,0,0,1,2,6,0,{self._queued:08d},1,000"
+        third = "1234,0"
+        return b''.join(b'\x02' + frame.encode() + b'\x03\r\n' for frame in (first, second, third))
+
+    def host_identification(self) -> bytes:
+        """~HI reply: model, firmware, dots per mm, memory"""
+        return f"\x02{self.behavior.model},V75.20.01Z,8,8192KB\x03\r\n".encode()
+
+    def getvar(self, name: str) -> bytes:
+        values = {'device.friendly_name': self.printer_id}
+        if self.behavior.odometer:
+            values['odometer.total_label_count'] = str(self.stats.printed)
+        return f'"{values.get(name, "?")}"\r\n'.encode()
+
+    def _accept_labels(self, labels: List[bytes]) -> None:
+        for label in labels:
+            self.stats.labels += 1
+            self.stats.checksum = zlib.crc32(label, self.stats.checksum)
+        if self.behavior.label_time <= 0:
+            self.stats.printed += len(labels)
+            return
+        self._queued += len(labels)
+        self.stats.peak_buffered = max(self.stats.peak_buffered, self._queued)
+        if self._printing is None or self._printing.done():
+            self._printing = asyncio.ensure_future(self._print_queue())
+
+    async def _print_queue(self) -> None:
+        while self._queued > 0:
+            await asyncio.sleep(self.behavior.label_time)
+            if self.behavior.paper_out:
+                continue
+            self._queued -= 1
+            self.stats.printed += 1
+
+    def _reset(self, writer: asyncio.StreamWriter) -> None:
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            # Linger 0 makes close() send RST instead of FIN
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        writer.transport.abort()
+        self.stats.resets += 1
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        behavior = self.behavior
+        self.stats.connections += 1
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            if behavior.blackhole:
+                # Hold the connection without reading; the sender's buffers fill and it stalls
+                await asyncio.sleep(3600)
+                return
+            if behavior.latency > 0:
+                await asyncio.sleep(behavior.latency)
+
+            buffer = b''
+            first_read = True
+            while True:
+                while behavior.buffer_formats and self._queued >= behavior.buffer_formats:
+                    await asyncio.sleep(behavior.label_time / 4)
+                chunk = await reader.read(4096)
+                if not chunk:
+                    break
+                self.stats.bytes_received += len(chunk)
+                if first_read and behavior.reset_rate > 0 and random.random() < behavior.reset_rate:
+                    self._reset(writer)
+                    return
+                first_read = False
+                if behavior.throughput > 0:
+                    await asyncio.sleep(len(chunk) / behavior.throughput)
+
+                buffer += chunk
+                buffer = await self._consume(buffer, writer)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            if not writer.is_closing():
+                writer.close()
+
+    async def _consume(self, buffer: bytes, writer: asyncio.StreamWriter) -> bytes:
+        """Process complete commands in buffer and return the unprocessed tail"""
+        while True:
+            start = buffer.find(LABEL_START)
+            # Commands outside a format are executed immediately
+            reply, consumed = self._command(buffer, start)
+            if consumed:
+                if reply:
+                    writer.write(reply)
+                    await writer.drain()
+                buffer = buffer[consumed:]
+                continue
+            if start == -1:
+                # Keep a possible partial command at the end
+                return buffer[-(len(GETVAR) + 64):] if GETVAR[:2] in buffer else buffer[-2:]
+            end = buffer.find(LABEL_END, start)
+            if end == -1:
+                return buffer[start:]
+            self._accept_labels([buffer[start:end + len(LABEL_END)]])
+            buffer = buffer[end + len(LABEL_END):]
+
+    def _command(self, buffer: bytes, start: int):
+        """(reply, bytes consumed) for the first query before start, or (None, 0)"""
+        limit = len(buffer) if start == -1 else start
+        positions = [(buffer.find(c, 0, limit), c) for c in (HOST_STATUS_QUERY, HOST_IDENTIFICATION_QUERY, GETVAR)]
+        positions = [(i, c) for i, c in positions if i != -1]
+        if not positions:
+            return None, 0
+        index, command = min(positions)
+        if command == HOST_STATUS_QUERY:
+            self.stats.status_queries += 1
+            return (self.host_status() if self.behavior.answer_status else None), index + len(command)
+        if command == HOST_IDENTIFICATION_QUERY:
+            return self.host_identification(), index + len(command)
+        name_end = buffer.find(b'"', index + len(GETVAR))
+        line_end = buffer.find(b'\n', name_end)
+        if name_end == -1 or line_end == -1:
+            return None, 0
+        return self.getvar(buffer[index + len(GETVAR):name_end].decode('latin-1')), line_end + 1
+
+
+class VirtualPrinterFleet:
+    """
+    N virtual printers served from one background event loop thread.
+
+        with VirtualPrinterFleet(count=3) as fleet:
+            printers.printers.update(fleet.registry())
+    """
+
+    def __init__(self, count: int = 1, base_port: int = 0, behavior: Optional[PrinterBehavior] = None,
+                 prefix: str = 'prt-sim-', host: str = '127.0.0.1'):
+        self.printers: List[VirtualPrinter] = [
+            VirtualPrinter(f"{prefix}{i + 1}", base_port + i if base_port else 0,
+                           PrinterBehavior(**vars(behavior)) if behavior else None, host)
+            for i in range(count)
+        ]
+        self._loop = asyncio.new_event_loop()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def start(self) -> 'VirtualPrinterFleet':
+        self._thread = threading.Thread(target=self._loop.run_forever, name='VirtualPrinterFleet', daemon=True)
+        self._thread.start()
+        for printer in self.printers:
+            self._run(printer.start())
+        return self
+
+    def stop(self) -> None:
+        for printer in self.printers:
+            self._run(printer.stop())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._loop.close()
+
+    def __enter__(self) -> 'VirtualPrinterFleet':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def __getitem__(self, printer_id: str) -> VirtualPrinter:
+        for printer in self.printers:
+            if printer.printer_id == printer_id:
+                return printer
+        raise KeyError(printer_id)
+
+    def registry(self) -> Dict[str, Dict[str, object]]:
+        """Mapping in the printers.py registry format"""
+        return {p.printer_id: {'ip': p.host, 'port': p.port} for p in self.printers}
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {p.printer_id: p.stats.to_dict() for p in self.printers}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run a fleet of virtual Zebra printers')
+    parser.add_argument('--count', type=int, default=5)
+    parser.add_argument('--base-port', type=int, default=19100, help='first port; 0 picks free ports')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--prefix', default='prt-sim-')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before serving each connection')
+    parser.add_argument('--label-time', type=float, default=0.0, help='seconds to print one label')
+    parser.add_argument('--buffer-formats', type=int, default=0,
+                        help='formats the receive buffer holds before reading stops (0 = unlimited)')
+    parser.add_argument('--throughput', type=float, default=0.0, help='bytes per second per connection')
+    parser.add_argument('--reset-rate', type=float, default=0.0, help='probability of resetting a connection')
+    parser.add_argument('--blackhole', type=int, default=0, help='number of printers that never read')
+    parser.add_argument('--no-status', action='store_true', help='do not answer ~HS')
+    parser.add_argument('--registry-file', help='write the fleet as a PRINTERS_FILE for printers.py')
+    parser.add_argument('--stats-interval', type=float, default=10.0)
+    args = parser.parse_args()
+
+    behavior = PrinterBehavior(latency=args.latency, label_time=args.label_time, throughput=args.throughput,
+                               reset_rate=args.reset_rate, answer_status=not args.no_status,
+                               buffer_formats=args.buffer_formats)
+    fleet = VirtualPrinterFleet(args.count, args.base_port, behavior, args.prefix, args.host)
+    for printer in fleet.printers[len(fleet.printers) - args.blackhole:] if args.blackhole else []:
+        printer.behavior.blackhole = True
+    fleet.start()
+
+    if args.registry_file:
+        with open(args.registry_file, 'w') as f:
+            json.dump(fleet.registry(), f, indent=2)
+    for printer_id, info in fleet.registry().items():
+        print(f"{printer_id} listening on {info['ip']}:{info['port']}")
+
+    try:
+        while True:
+            time.sleep(args.stats_interval)
+            print(json.dumps(fleet.stats()), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fleet.stop()
+        print(json.dumps(fleet.stats()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,13 @@
 import json
 import logging
 import os
-import requests
+import time
 from dotenv import load_dotenv
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from urllib.parse import quote
-from threading import RLock
+from threading import Event, Lock, RLock
+from metrics import REGISTRY_RELOAD_LATENCY, REGISTRY_RELOADS, REGISTRY_SIZE
+from shared_state import HostLeader, SharedRegistryFile, get_shared_dir, get_started_at
 
 _LOCAL_FALLBACK_PRINTERS: Dict[str, Dict[str, Any]] = {
     'prt-batch-TWR1': {'ip': '10.1.0.48', 'port': 9100},
@@ -27,8 +29,39 @@ def _get_env(name: str, default: str = "") -> str:
     return value if value is not None and value != "" else default
 
 
-def _load_printers_from_erp() -> Dict[str, Dict[str, Any]]:
-    """Get list of printers from ERPNext"""
+_ERP_SESSION = None
+_ERP_SESSION_LOCK = Lock()
+
+
+def _get_erp_session():
+    """Return the pooled HTTP session used for all ERP calls."""
+    global _ERP_SESSION
+    with _ERP_SESSION_LOCK:
+        if _ERP_SESSION is None:
+            # Imported on first use: requests costs more at startup than the whole API server
+            import requests
+            import requests.adapters
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _ERP_SESSION = session
+        return _ERP_SESSION
+
+
+def _reset_erp_session_after_fork() -> None:
+    """Forked workers must not share pooled connections with their parent"""
+    global _ERP_SESSION, _ERP_SESSION_LOCK
+    _ERP_SESSION = None
+    _ERP_SESSION_LOCK = Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_erp_session_after_fork)
+
+
+def _get_erp_config() -> Optional[Dict[str, str]]:
+    """Read ERP connection settings; None if ERP is not configured"""
     try:
         load_dotenv()
     except Exception:
@@ -39,81 +72,424 @@ def _load_printers_from_erp() -> Dict[str, Dict[str, Any]]:
     doctype = _get_env('ERP_PRINTER_DOCTYPE', 'NPrint Printer')
 
     if not (erp_url and api_key and api_secret):
-        logging.info("ERP config not found; using local fallback printers")
-        return {}
+        return None
+
+    try:
+        page_size = int(_get_env('ERP_PAGE_SIZE', '500'))
+    except Exception:
+        page_size = 500
+
+    return {
+        'url': erp_url.rstrip('/') + "/api/resource/" + quote(doctype, safe=''),
+        'doctype': doctype,
+        'authorization': f"token {api_key}:{api_secret}",
+        'page_size': max(1, page_size),
+    }
 
-    url = erp_url.rstrip('/') + "/api/resource/" + quote(doctype, safe='')
 
-    requested_fields = ['printer_name', 'server_ip', 'port']
+def _fetch_erp_rows(config: Dict[str, Any], since: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Fetch printer rows from ERPNext, paging until the result set is exhausted.
+
+    Args:
+        config: ERP settings from _get_erp_config.
+        since: Only fetch rows whose `modified` timestamp is at or after this value.
+
+    Returns:
+        List of raw rows. Raises on HTTP or decoding errors.
+    """
+    session = _get_erp_session()
+    headers = {'Authorization': config['authorization']}
+    page_size = config['page_size']
 
     params = {
-        'fields': json.dumps(requested_fields),
-        'limit_page_length': 1000,
+        'fields': json.dumps(['name', 'printer_name', 'server_ip', 'port', 'modified']),
+        'order_by': 'modified asc, name asc',
+        'limit_page_length': page_size,
     }
+    if since:
+        # Inclusive bound: rows sharing the last seen timestamp are re-read, upserts are idempotent
+        params['filters'] = json.dumps([['modified', '>=', since]])
 
-    headers = {
-        'Authorization': f"token {api_key}:{api_secret}"
-    }
+    rows: List[Dict[str, Any]] = []
+    start = 0
+    while True:
+        params['limit_start'] = start
+        response = session.get(config['url'], params=params, headers=headers, timeout=10)
+        response.raise_for_status()
+        page = response.json().get('data', [])
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        start += page_size
+
+
+def _parse_printer_row(row: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Convert an ERP row into (printer_id, {'ip', 'port'}); None if the row is unusable"""
+    printer_id = row.get('printer_name')
+    server_ip = row.get('server_ip')
+    if not printer_id or not server_ip:
+        return None
 
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        rows = response.json().get('data', [])
-    except Exception as exc:
-        logging.warning(f"Failed to load printers from ERP ({doctype}): {exc}")
-        return {}
+        port = int(row.get('port')) if row.get('port') is not None else 9100
+    except Exception:
+        port = 9100
 
-    result: Dict[str, Dict[str, Any]] = {}
+    if not (1 <= port <= 65535):
+        logging.warning(f"Invalid port '{port}' for printer '{printer_id}', defaulting to 9100")
+        port = 9100
+
+    return str(printer_id), {'ip': str(server_ip), 'port': port}
+
+
+# Public mapping used by the app
+printers: Dict[str, Dict[str, Any]] = {}
+_PRINTERS_LOCK = RLock()
+
+# Set in multi-process mode: the registry published for all workers on the host
+_shared_registry: Optional[SharedRegistryFile] = None
+# Only the process holding this lock publishes; others apply their changes locally
+_registry_leader: Optional[HostLeader] = None
+
+# Incremental sync state: ERP document name -> printer_id, and the newest `modified` seen.
+# Only meaningful once a full sync from ERP has populated the mapping.
+_sync_state: Dict[str, Any] = {
+    'doc_names': {},
+    'last_modified': None,
+    'last_full_sync': 0.0,
+}
+
+
+def _apply_full_sync(rows: List[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    """
+    Replace the mapping with a complete ERP result set. Caller holds _PRINTERS_LOCK.
+    Returns None and leaves the mapping untouched if no row is usable.
+    """
+    doc_names: Dict[str, str] = {}
+    mapping: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        parsed = _parse_printer_row(row)
+        if parsed:
+            mapping[parsed[0]] = parsed[1]
+            if row.get('name'):
+                doc_names[str(row['name'])] = parsed[0]
+    if not mapping:
+        return None
+
+    added = sum(1 for pid in mapping if pid not in printers)
+    updated = sum(1 for pid, info in mapping.items() if pid in printers and printers[pid] != info)
+    removed = sum(1 for pid in printers if pid not in mapping)
+
+    printers.clear()
+    printers.update(mapping)
+    _sync_state['doc_names'] = doc_names
+    _sync_state['last_full_sync'] = time.monotonic()
+    return {'added': added, 'updated': updated, 'removed': removed}
+
+
+def _apply_incremental_sync(rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Upsert changed ERP rows into the mapping. Caller holds _PRINTERS_LOCK."""
+    doc_names = _sync_state['doc_names']
+    added = updated = removed = 0
     for row in rows:
-        printer_id = row.get('printer_name')
-        server_ip = row.get('server_ip')
-        if not printer_id or not server_ip:
+        doc_name = str(row.get('name') or row.get('printer_name') or '')
+        parsed = _parse_printer_row(row)
+        previous_id = doc_names.get(doc_name)
+
+        # Printer renamed or made unusable in ERP: drop the entry it used to own
+        if previous_id is not None and (parsed is None or parsed[0] != previous_id):
+            if printers.pop(previous_id, None) is not None:
+                removed += 1
+            doc_names.pop(doc_name, None)
+
+        if parsed is None:
+            continue
+
+        printer_id, info = parsed
+        if printer_id not in printers:
+            added += 1
+        elif printers[printer_id] != info:
+            updated += 1
+        else:
             continue
+        printers[printer_id] = info
+        if doc_name:
+            doc_names[doc_name] = printer_id
+    return {'added': added, 'updated': updated, 'removed': removed}
+
+
+def _newest_modified(rows: List[Dict[str, Any]], current: Optional[str]) -> Optional[str]:
+    """Return the latest `modified` value among rows (ERP timestamps sort lexicographically)"""
+    stamps = [str(row['modified']) for row in rows if row.get('modified')]
+    if current:
+        stamps.append(current)
+    return max(stamps) if stamps else None
+
+
+def _record_reload(mode: str, result: str, started: float) -> None:
+    REGISTRY_RELOAD_LATENCY.labels(mode=mode).observe(time.perf_counter() - started)
+    REGISTRY_RELOADS.labels(mode=mode, result=result).inc()
+
+
+def refresh_printers_from_erp(full: bool = True) -> bool:
+    """
+    Reload printers from ERP into the global mapping. Keeps fallback if ERP yields nothing.
+
+    Args:
+        full: Re-read the whole DocType. When False, only rows modified since the last sync
+              are fetched and merged. Deletions in ERP are only picked up by a full sync, so an
+              incremental refresh escalates to a full one every PRINTERS_FULL_SYNC_SECONDS
+              (default 86400) and whenever no full sync from ERP has happened yet.
+
+    Returns:
+        True if ERP data was applied, False if the existing mapping was kept.
+    """
+    started = time.perf_counter()
+    config = _get_erp_config()
+    if config is None:
+        logging.info("ERP config not found; keeping existing printers mapping")
+        return False
+
+    try:
+        full_interval = int(_get_env('PRINTERS_FULL_SYNC_SECONDS', '86400'))
+    except Exception:
+        full_interval = 86400
+
+    with _PRINTERS_LOCK:
+        since = _sync_state['last_modified']
+        last_full = _sync_state['last_full_sync']
+    if since is None or not last_full or (full_interval > 0 and time.monotonic() - last_full >= full_interval):
+        full = True
+    mode = 'full' if full else 'incremental'
+
+    try:
+        rows = _fetch_erp_rows(config, since=None if full else since)
+    except Exception as exc:
+        logging.warning(f"Failed to load printers from ERP ({config['doctype']}): {exc}")
+        logging.info("ERP refresh returned no data; keeping existing printers mapping")
+        _record_reload(mode, 'error', started)
+        return False
+
+    with _PRINTERS_LOCK:
+        diff = _apply_full_sync(rows) if full else _apply_incremental_sync(rows)
+        if diff is not None:
+            _sync_state['last_modified'] = _newest_modified(rows, None if full else since)
+        count = len(printers)
+
+    if diff is None:
+        logging.info("ERP refresh returned no data; keeping existing printers mapping")
+        _record_reload(mode, 'empty', started)
+        return False
+
+    REGISTRY_SIZE.set(count)
+    _record_reload(mode, 'applied', started)
+    with _PRINTERS_LOCK:
+        published = dict(printers)
+    _publish(published)
+    logging.info(
+        f"Refreshed printers from ERP ({mode}, {len(rows)} rows): "
+        f"{count} entries, +{diff['added']} ~{diff['updated']} -{diff['removed']}"
+    )
+    return True
+
+
+def _replace_mapping(mapping: Dict[str, Dict[str, Any]]) -> None:
+    with _PRINTERS_LOCK:
+        printers.clear()
+        printers.update(mapping)
+        REGISTRY_SIZE.set(len(printers))
+
+
+def _merge_into(mapping: Dict[str, Dict[str, Any]], updates: Dict[str, Dict[str, Any]]) -> int:
+    changed = 0
+    for printer_id, info in updates.items():
+        parsed = _parse_printer_row({'printer_name': printer_id, 'server_ip': info.get('ip'),
+                                     'port': info.get('port')})
+        if parsed and mapping.get(parsed[0]) != parsed[1]:
+            mapping[parsed[0]] = parsed[1]
+            changed += 1
+    return changed
+
+
+def merge_printers(updates: Dict[str, Dict[str, Any]]) -> int:
+    """
+    Upsert printers (e.g. found by discovery.py) into the mapping. In multi-process mode
+    they are merged into the published registry by whichever process handles the merge,
+    so every worker on the host gets them. The next full ERP refresh replaces them again
+    unless the change was also made in ERP. Returns the number of entries changed.
+    """
+    changed = None
+    if _shared_registry is not None:
+        counted = []
+
+        def merge(published):
+            if published is None:
+                with _PRINTERS_LOCK:
+                    published = dict(printers)
+            counted.append(_merge_into(published, updates))
+            return published if counted[0] else None
 
         try:
-            port = int(row.get('port')) if row.get('port') is not None else 9100
-        except Exception:
-            port = 9100
+            merged = _shared_registry.update(merge)
+            changed = counted[0]
+            if merged is not None:
+                _replace_mapping(merged)
+        except Exception as exc:
+            logging.warning(f"Failed to publish shared printers registry: {exc}")
+    if changed is None:
+        # Single process, or the shared file could not be written: this process only
+        with _PRINTERS_LOCK:
+            changed = _merge_into(printers, updates)
+            REGISTRY_SIZE.set(len(printers))
+    if changed:
+        logging.info(f"Merged {changed} discovered printers into the registry")
+    return changed
+
 
-        if not (1 <= port <= 65535):
-            logging.warning(f"Invalid port '{port}' for printer '{printer_id}', defaulting to 9100")
-            port = 9100
+def _publish(mapping: Dict[str, Dict[str, Any]]) -> None:
+    if _shared_registry is None or _registry_leader is None or not _registry_leader.is_leader:
+        return
+    try:
+        _shared_registry.publish(mapping)
+    except Exception as exc:
+        logging.warning(f"Failed to publish shared printers registry: {exc}")
+
+
+def set_registry_leader(leader: HostLeader) -> None:
+    """Publish the shared registry only while this process holds the host leader lock"""
+    global _registry_leader
+    _registry_leader = leader
 
-        result[str(printer_id)] = {'ip': str(server_ip), 'port': port}
 
+def enable_shared_registry(shared_dir: str) -> bool:
+    """
+    Share the mapping with the other worker processes on this host through a file in
+    shared_dir. Successful refreshes in the leader process publish it (see
+    set_registry_leader); the other processes read it. A file older than the server's
+    start is ignored. Returns True if a published registry was loaded.
+    """
+    global _shared_registry
+    _shared_registry = SharedRegistryFile(shared_dir, not_before=get_started_at())
+    mapping = _shared_registry.read_if_changed(force=True)
+    if mapping:
+        _replace_mapping(mapping)
+        logging.info(f"Loaded {len(mapping)} printers from shared registry")
+        return True
+    return False
+
+
+def _load_printers_file(path: str) -> Dict[str, Dict[str, Any]]:
+    """Read a printers mapping ({printer_id: {'ip', 'port'}}) from a JSON file"""
+    with open(path) as f:
+        data = json.load(f)
+    result: Dict[str, Dict[str, Any]] = {}
+    for printer_id, info in data.items():
+        parsed = _parse_printer_row({'printer_name': printer_id, 'server_ip': info.get('ip'), 'port': info.get('port')})
+        if parsed:
+            result[parsed[0]] = parsed[1]
     return result
 
 
-def _build_printers_mapping() -> Dict[str, Dict[str, Any]]:
-    """Build printers mapping from ERP"""
-    erp_printers = _load_printers_from_erp()
-    if erp_printers:
-        logging.info(f"Loaded {len(erp_printers)} printers from ERP")
-        return erp_printers
+# Set once the first ERP sync has run, or when there is none to run
+_initial_sync = Event()
+_INITIAL_SYNC_LOCK = Lock()
+# How long a worker waits for the leader to publish the registry before using the fallback
+SHARED_REGISTRY_WAIT_SECONDS = 60
 
-    logging.info("Using local fallback printers configuration")
-    return _LOCAL_FALLBACK_PRINTERS
 
-# Public mapping used by the app
-printers: Dict[str, Dict[str, Any]] = {}
-_PRINTERS_LOCK = RLock()
-with _PRINTERS_LOCK:
-    printers.update(_build_printers_mapping())
+def _is_leader() -> bool:
+    return _registry_leader is not None and _registry_leader.is_leader
 
 
-def refresh_printers_from_erp() -> None:
-    """Reload printers from ERP into the global mapping. Keeps fallback if ERP yields nothing."""
-    erp_printers = _load_printers_from_erp()
-    if erp_printers:
-        with _PRINTERS_LOCK:
-            printers.clear()
-            printers.update(erp_printers)
-        logging.info(f"Refreshed printers from ERP: {len(printers)} entries")
-    else:
-        logging.info("ERP refresh returned no data; keeping existing printers mapping")
+def _wait_for_shared_registry() -> bool:
+    """
+    Load the registry the leader publishes instead of asking ERP. Returns False if this
+    process became the leader meanwhile, so it has to run the sync itself.
+    """
+    deadline = time.monotonic() + SHARED_REGISTRY_WAIT_SECONDS
+    while not _is_leader():
+        mapping = _shared_registry.read_if_changed(force=True)
+        if mapping:
+            _replace_mapping(mapping)
+            logging.info(f"Loaded {len(mapping)} printers from shared registry")
+            return True
+        if time.monotonic() >= deadline:
+            logging.warning("No shared printers registry published yet; using local fallback printers")
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def initial_sync_done() -> bool:
+    """Whether lookups can be served without waiting for the first sync"""
+    return _initial_sync.is_set()
+
+
+def ensure_initial_sync() -> None:
+    """
+    Run the first ERP sync unless it has happened; concurrent callers wait for it. In
+    multi-process mode only the leader asks ERP and publishes the result, and the other
+    workers wait for it.
+    """
+    if _initial_sync.is_set():
+        return
+    with _INITIAL_SYNC_LOCK:
+        if _initial_sync.is_set():
+            return
+        try:
+            if _shared_registry is not None and _wait_for_shared_registry():
+                return
+            if not refresh_printers_from_erp(full=True):
+                logging.info("Using local fallback printers configuration")
+                # Workers waiting for the leader's registry get the fallback
+                with _PRINTERS_LOCK:
+                    published = dict(printers)
+                _publish(published)
+        finally:
+            _initial_sync.set()
+
+
+def _build_printers_mapping() -> None:
+    """
+    Populate the mapping at import from the local fallback. ERP is not contacted here:
+    the first sync runs on the first lookup (or earlier, from ensure_initial_sync in a
+    background thread), so the server starts answering without waiting for it.
+    """
+    fallback = _LOCAL_FALLBACK_PRINTERS
+    # PRINTERS_FILE replaces the built-in fallback, e.g. with a printer_sim.py fleet
+    printers_file = _get_env('PRINTERS_FILE')
+    if printers_file:
+        try:
+            fallback = _load_printers_file(printers_file)
+            logging.info(f"Loaded {len(fallback)} printers from {printers_file}")
+        except Exception as exc:
+            logging.warning(f"Failed to load printers from {printers_file}: {exc}")
+
+    with _PRINTERS_LOCK:
+        printers.update(fallback)
+        REGISTRY_SIZE.set(len(printers))
+
+    # In multi-process mode only the leader asks ERP (see ensure_initial_sync); a registry
+    # already published since the server started is used as is
+    shared_dir = get_shared_dir()
+    if shared_dir and enable_shared_registry(shared_dir):
+        _initial_sync.set()
+    elif _get_erp_config() is None:
+        logging.info("ERP config not found; using local fallback printers configuration")
+        _initial_sync.set()
+
+
+_build_printers_mapping()
 
 
 def get_printers_snapshot() -> Dict[str, Dict[str, Any]]:
     """Thread-safe snapshot for readers to iterate without races."""
+    if not _initial_sync.is_set():
+        ensure_initial_sync()
+    if _shared_registry is not None:
+        mapping = _shared_registry.read_if_changed()
+        if mapping is not None:
+            _replace_mapping(mapping)
     with _PRINTERS_LOCK:
         return dict(printers)
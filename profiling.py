@@ -0,0 +1,265 @@
+"""
+On-demand profiling of a running server, for GET/POST/DELETE /debug/profile.
+
+Two modes, each running for a number of seconds or requests, whichever comes first:
+
+- `sample`: a background thread reads every thread's stack with sys._current_frames()
+  at a fixed interval and counts identical stacks. Request threads, the auto-refresh
+  and monitor threads and the raw ingress servers are all included, each stack rooted
+  at its thread's name (numbered pool threads are grouped). Samples are wall clock, so
+  a thread waiting on a printer shows up in its wait. The result is in collapsed-stack
+  format, ready for flamegraph.pl or speedscope.
+- `cprofile`: deterministic profiling with cProfile, per request in threaded servers
+  or on the event loop thread under ASGI. The result is a pstats file (or its text
+  report). Overhead is much higher than sampling; keep sessions short.
+
+Nothing runs while no session is active; request hooks only check `active`.
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+SAMPLE = 'sample'
+CPROFILE = 'cprofile'
+MODES = (SAMPLE, CPROFILE)
+
+MAX_SECONDS = 600
+DEFAULT_SECONDS = 30
+DEFAULT_INTERVAL_MS = 10
+
+_POOL_THREAD = re.compile(r'^Thread-\d+ \((.+)\)$')
+
+
+def thread_label(name: str) -> str:
+    """Thread name without its number, so stacks of pool threads are aggregated"""
+    match = _POOL_THREAD.match(name)
+    if match:
+        return match.group(1)
+    return re.sub(r'[-_]?\d+', '', name) or name
+
+
+class _Session:
+    def __init__(self, mode: str, seconds: float, requests: Optional[int], interval: float):
+        self.mode = mode
+        self.seconds = seconds
+        self.max_requests = requests
+        self.interval = interval
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.requests = 0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self.stats: Optional[pstats.Stats] = None
+        self.stopped = threading.Event()
+
+    def expired(self, now: float) -> bool:
+        return now - self.started >= self.seconds or (
+            self.max_requests is not None and self.requests >= self.max_requests)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'mode': self.mode,
+            'running': self.finished is None,
+            'started': self.started,
+            'finished': self.finished,
+            'seconds': self.seconds,
+            'max_requests': self.max_requests,
+            'requests': self.requests,
+            'samples': self.samples if self.mode == SAMPLE else None,
+        }
+
+
+class Profiler:
+    """At most one profiling session at a time, plus the result of the last one"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._session: Optional[_Session] = None
+        self._loop_profile: Optional[cProfile.Profile] = None
+        # Checked on every request; the only cost while profiling is off
+        self.active = False
+
+    # --- session control ---
+
+    def start(self, mode: str = SAMPLE, seconds: Optional[float] = None, requests: Optional[int] = None,
+              interval_ms: Optional[float] = None, per_request: bool = True) -> Dict[str, Any]:
+        """
+        Begin a session. cProfile sessions with per_request=False profile the calling
+        thread (the ASGI event loop) and must be stopped from it.
+
+        Raises:
+            ValueError: Invalid mode or limits.
+            RuntimeError: A session is already running.
+        """
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        seconds = float(seconds if seconds is not None else DEFAULT_SECONDS)
+        if not 0 < seconds <= MAX_SECONDS:
+            raise ValueError(f"seconds must be between 0 and {MAX_SECONDS}")
+        if requests is not None and int(requests) < 1:
+            raise ValueError('requests must be at least 1')
+        interval = float(interval_ms if interval_ms is not None else DEFAULT_INTERVAL_MS) / 1000
+        if not 0.001 <= interval <= 1:
+            raise ValueError('interval_ms must be between 1 and 1000')
+        with self._lock:
+            if self.active:
+                raise RuntimeError('A profiling session is already running')
+            session = _Session(mode, seconds, int(requests) if requests is not None else None, interval)
+            self._session = session
+            if mode == SAMPLE:
+                threading.Thread(target=self._sample, args=(session,), name='Profiler', daemon=True).start()
+            elif not per_request:
+                self._loop_profile = cProfile.Profile()
+                self._loop_profile.enable()
+            self.active = True
+        return session.describe()
+
+    def start_from_request(self, body: Any, per_request: bool = True) -> Dict[str, Any]:
+        """Start a session from a POST /debug/profile body"""
+        body = body if isinstance(body, dict) else {}
+        try:
+            return self.start(mode=body.get('mode', SAMPLE), seconds=body.get('seconds'),
+                              requests=body.get('requests'), interval_ms=body.get('interval_ms'),
+                              per_request=per_request)
+        except TypeError as e:
+            raise ValueError(str(e))
+
+    def stop(self) -> Optional[Dict[str, Any]]:
+        """End the running session early; returns the session, or None if there was none"""
+        with self._lock:
+            session = self._session
+            if session is None:
+                return None
+            if self.active:
+                self._finish(session)
+        return session.describe()
+
+    def _finish(self, session: _Session) -> None:
+        """Caller holds the lock"""
+        self.active = False
+        session.stopped.set()
+        if self._loop_profile is not None:
+            self._loop_profile.disable()
+            self._merge(session, self._loop_profile)
+            self._loop_profile = None
+        session.finished = time.time()
+
+    def status(self) -> Optional[Dict[str, Any]]:
+        self.check_expired()
+        session = self._session
+        return session.describe() if session is not None else None
+
+    def check_expired(self) -> None:
+        """End a cProfile session whose time is up (sampling sessions end themselves)"""
+        if not self.active:
+            return
+        with self._lock:
+            session = self._session
+            if self.active and session.mode == CPROFILE and session.expired(time.time()):
+                self._finish(session)
+
+    # --- request hooks ---
+
+    def request_started(self) -> Optional[cProfile.Profile]:
+        """A per-request cProfile to enable around the handler, or None"""
+        session = self._session
+        if not self.active or session.mode != CPROFILE or self._loop_profile is not None:
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def request_finished(self, profile: Optional[cProfile.Profile] = None) -> None:
+        if profile is not None:
+            profile.disable()
+        with self._lock:
+            session = self._session
+            if not self.active:
+                return
+            session.requests += 1
+            if profile is not None:
+                self._merge(session, profile)
+            if session.expired(time.time()):
+                self._finish(session)
+
+    @staticmethod
+    def _merge(session: _Session, profile: cProfile.Profile) -> None:
+        try:
+            if session.stats is None:
+                session.stats = pstats.Stats(profile)
+            else:
+                session.stats.add(profile)
+        except TypeError:
+            # Nothing was recorded
+            pass
+
+    # --- sampling ---
+
+    def _sample(self, session: _Session) -> None:
+        me = threading.get_ident()
+        labels: Dict[Any, str] = {}
+        stacks = session.stacks
+        while not session.stopped.wait(session.interval):
+            names = {t.ident: thread_label(t.name) for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)})"
+                    frames.append(label)
+                    frame = frame.f_back
+                frames.append(names.get(ident, 'unknown'))
+                stacks[';'.join(reversed(frames))] += 1
+            session.samples += 1
+            if session.expired(time.time()):
+                with self._lock:
+                    if self._session is session and self.active:
+                        self._finish(session)
+                return
+
+    # --- results ---
+
+    def result(self, fmt: Optional[str] = None) -> Tuple[bytes, str, str]:
+        """
+        (body, content type, file name) of the last finished session: collapsed stacks
+        for sampling, pstats ('pstats', default) or a text report ('text') for cProfile.
+
+        Raises:
+            LookupError: There is no session.
+            RuntimeError: The session is still running.
+            ValueError: Unknown format for the session's mode.
+        """
+        self.check_expired()
+        session = self._session
+        if session is None:
+            raise LookupError('No profiling session')
+        if session.finished is None:
+            raise RuntimeError('Profiling is still running')
+        if session.mode == SAMPLE:
+            if fmt not in (None, 'collapsed'):
+                raise ValueError('Sampling sessions are available as collapsed stacks only')
+            body = ''.join(f"{stack} {count}\n" for stack, count in session.stacks.most_common())
+            return body.encode('utf-8'), 'text/plain; charset=utf-8', 'profile.collapsed'
+        if fmt not in (None, 'pstats', 'text'):
+            raise ValueError('format must be pstats or text')
+        if session.stats is None:
+            raise LookupError('The session profiled no requests')
+        if fmt == 'text':
+            out = io.StringIO()
+            report = pstats.Stats(stream=out)
+            report.add(session.stats)
+            report.sort_stats('cumulative').print_stats(100)
+            return out.getvalue().encode('utf-8'), 'text/plain; charset=utf-8', 'profile.txt'
+        return marshal.dumps(session.stats.stats), 'application/octet-stream', 'profile.pstats'
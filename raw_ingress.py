@@ -0,0 +1,164 @@
+"""
+Raw ZPL ingress over TCP.
+
+Stations that already produce finished ZPL (test rigs, legacy software) send it to a
+miniprint port exactly as they would to a printer's port 9100. Each listening port
+routes to one printer id from the registry:
+
+    RAW_INGRESS_ROUTES="9101=prt-lager-1,9102=prt-label-SVT"
+
+Every connection becomes one print job (circuit breaker, printer lock, job events and
+metrics as for the HTTP endpoints). Bytes are forwarded unchanged in chunks of at most
+RAW_CHUNK_BYTES: the next chunk is only read from the station once the previous one has
+been written to the printer, so a slow printer pushes back on the sender through TCP.
+The ports are unauthenticated and listen on 127.0.0.1 unless RAW_INGRESS_HOST says
+otherwise.
+
+Raw jobs are sent up to their last complete ^XZ; the start of a format is held back
+until its end arrives. When the sender goes away mid-body (ClientDisconnected), the
+formats already complete have been printed and the partial one is dropped, so the
+printer never receives a truncated format, and the failure is not held against the
+printer's circuit breaker.
+"""
+import asyncio
+import logging
+import os
+import socket
+import socketserver
+import threading
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from printers import get_printers_snapshot
+
+RAW_CHUNK_BYTES = 64 * 1024
+FORMAT_END = b'^XZ'
+DEFAULT_HOST = '127.0.0.1'
+
+# (printer_id, printer, chunks) -> (job_id, bytes sent); PrinterCommunicationMixin.stream_job
+StreamJob = Callable[[str, Dict, Iterator[bytes]], Tuple[str, int]]
+
+
+class ClientDisconnected(Exception):
+    """The sender of a raw job went away before its body was complete"""
+
+
+def _cut(data: bytes) -> int:
+    """Length of data up to and including its last ^XZ"""
+    end = data.rfind(FORMAT_END)
+    return 0 if end == -1 else end + len(FORMAT_END)
+
+
+def whole_formats(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """chunks up to their last complete format; the rest follows once the body ends normally"""
+    held = b''
+    for chunk in chunks:
+        data = held + chunk
+        cut = _cut(data)
+        if cut:
+            yield data[:cut]
+        held = data[cut:]
+    if held:
+        yield held
+
+
+async def whole_formats_async(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Async counterpart of whole_formats"""
+    held = b''
+    async for chunk in chunks:
+        data = held + chunk
+        cut = _cut(data)
+        if cut:
+            yield data[:cut]
+        held = data[cut:]
+    if held:
+        yield held
+
+
+def parse_routes(spec: str) -> Dict[int, str]:
+    """Parse 'PORT=PRINTER_ID,PORT=PRINTER_ID' into {port: printer_id}"""
+    routes: Dict[int, str] = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        port, sep, printer_id = item.partition('=')
+        if not sep or not printer_id.strip():
+            raise ValueError(f"Invalid raw ingress route '{item}', expected PORT=PRINTER_ID")
+        routes[int(port)] = printer_id.strip()
+    return routes
+
+
+def _recv_chunks(sock: socket.socket) -> Iterator[bytes]:
+    while True:
+        try:
+            chunk = sock.recv(RAW_CHUNK_BYTES)
+        except OSError as e:
+            raise ClientDisconnected(f"Station disconnected: {e}") from e
+        if not chunk:
+            return
+        yield chunk
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, printer_id: str, stream_job: StreamJob):
+        self.printer_id = printer_id
+        self.stream_job = stream_job
+        super().__init__(address, _Handler)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        server: _Server = self.server
+        printer_id = server.printer_id
+        printer = get_printers_snapshot().get(printer_id)
+        if printer is None:
+            logging.error("Raw ingress on port %s: printer %s not found", server.server_address[1], printer_id,
+                          extra={'printer_id': printer_id})
+            return
+        try:
+            job_id, sent = server.stream_job(printer_id, printer, _recv_chunks(self.request))
+            logging.info("Raw job %s: %s bytes from %s to %s", job_id, sent, self.client_address[0], printer_id,
+                         extra={'printer_id': printer_id, 'job_id': job_id})
+        except Exception as e:
+            # Closing the connection without reading the rest tells the station it failed
+            logging.error("Raw ingress to %s failed: %s", printer_id, e, extra={'printer_id': printer_id})
+
+
+class RawIngress:
+    """One listening socket per route, each served by its own thread"""
+
+    def __init__(self, routes: Dict[int, str], stream_job: StreamJob, host: str = DEFAULT_HOST):
+        self.routes = routes
+        self.stream_job = stream_job
+        self.host = host
+        self.servers: List[_Server] = []
+
+    def start(self) -> 'RawIngress':
+        for port, printer_id in self.routes.items():
+            server = _Server((self.host, port), printer_id, self.stream_job)
+            self.servers.append(server)
+            threading.Thread(target=server.serve_forever, name=f'RawIngress-{port}', daemon=True).start()
+            logging.info("Raw ingress listening on %s:%s for %s", self.host, server.server_address[1], printer_id)
+        return self
+
+    def stop(self) -> None:
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.servers = []
+
+    @property
+    def ports(self) -> Dict[str, int]:
+        """printer_id -> bound port (useful when routes use port 0)"""
+        return {server.printer_id: server.server_address[1] for server in self.servers}
+
+
+def start_from_env(stream_job: StreamJob) -> Optional[RawIngress]:
+    """Start the ingress if RAW_INGRESS_ROUTES is set"""
+    spec = os.getenv('RAW_INGRESS_ROUTES', '')
+    if not spec.strip():
+        return None
+    return RawIngress(parse_routes(spec), stream_job, os.getenv('RAW_INGRESS_HOST', DEFAULT_HOST)).start()
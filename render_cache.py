@@ -0,0 +1,132 @@
+"""
+Rendered labels addressed by content, for POST /render/<label_type>.
+
+A label's ZPL depends only on the generator code and the payload, so both are hashed
+into the render key: the template version (a digest of zpl_generator.py and
+text_fit.py) and the normalized payload, i.e. the validated fields rewritten the way
+the generator prints them, with sorted keys. The key is the response's ETag. A client
+sending it back in If-None-Match gets 304 without anything being rendered, and other
+repeats are answered from a bounded LRU cache; a deploy that changes a template
+changes every key, so stale ZPL is never served.
+
+RENDER_CACHE_SIZE bounds the number of cached labels (0 disables the cache) and
+RENDER_CACHE_MAX_BYTES their total size.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+
+import metrics
+import text_fit
+import zpl_generator
+from labels import LabelType
+
+CONTENT_TYPE = 'text/plain; charset=utf-8'
+
+RENDER_CACHE = metrics.counter('miniprint_render_cache_total', 'Render requests by cache outcome',
+                               ('label_type', 'result'))
+
+
+def _template_version() -> str:
+    digest = hashlib.sha256()
+    for module in (zpl_generator, text_fit):
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+TEMPLATE_VERSION = _template_version()
+
+
+def render_key(label: LabelType, data: Dict[str, Any]) -> str:
+    """Content hash of a validated payload's ZPL, computed without rendering it"""
+    normalized = label.normalize(data)
+    # The printer is not printed on any label; a preview for one is valid for all
+    normalized.pop('printer_id', None)
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(f"{TEMPLATE_VERSION}\0{label.name}\0{payload}".encode('utf-8')).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names this (strong) ETag"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+class Rendered(NamedTuple):
+    etag: str
+    zpl: Optional[bytes]  # None when the client's copy is current (304)
+    cached: bool
+
+
+class RenderCache:
+    """Thread-safe LRU of rendered ZPL, bounded by entry count and total bytes"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            zpl = self._entries.get(key)
+            if zpl is not None:
+                self._entries.move_to_end(key)
+            return zpl
+
+    def put(self, key: str, zpl: bytes) -> None:
+        if self.max_entries <= 0 or len(zpl) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = zpl
+            self._bytes += len(zpl)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def render(self, label: LabelType, data: Dict[str, Any], if_none_match: Optional[str] = None) -> Rendered:
+        """
+        ZPL of a validated payload under its ETag. Rendered only if the client does not
+        have it already and it is not cached.
+        """
+        key = render_key(label, data)
+        etag = f'"{key}"'
+        if etag_matches(if_none_match, etag):
+            RENDER_CACHE.labels(label_type=label.name, result='not_modified').inc()
+            return Rendered(etag, None, True)
+        zpl = self.get(key)
+        if zpl is not None:
+            RENDER_CACHE.labels(label_type=label.name, result='hit').inc()
+            return Rendered(etag, zpl, True)
+        with metrics.RENDER_LATENCY.labels(generator=label.generate.__name__).time():
+            zpl = label.generate(**data).encode('utf-8')
+        self.put(key, zpl)
+        RENDER_CACHE.labels(label_type=label.name, result='miss').inc()
+        return Rendered(etag, zpl, False)
+
+
+def from_env() -> RenderCache:
+    def number(name, default):
+        try:
+            return int(os.getenv(name, default))
+        except ValueError:
+            return default
+
+    return RenderCache(max_entries=number('RENDER_CACHE_SIZE', 1024),
+                       max_bytes=number('RENDER_CACHE_MAX_BYTES', 16 * 1024 * 1024))
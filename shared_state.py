@@ -0,0 +1,225 @@
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+from contextlib import asynccontextmanager, contextmanager
+from threading import Lock
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: multi-process mode is not available
+    fcntl = None
+
+# Coordination between miniprint worker processes on one host (POSIX file locks).
+# Enabled by setting MINIPRINT_SHARED_DIR; every process started with the same directory
+# shares one printer registry, one leader and one lock per printer. MINIPRINT_STARTED_AT
+# (epoch seconds, set by gunicorn.conf.py in the master) marks older files as stale.
+
+
+def get_shared_dir() -> Optional[str]:
+    """Directory used for cross-process state, or None when running single-process"""
+    path = os.getenv('MINIPRINT_SHARED_DIR', '')
+    if not path:
+        return None
+    if fcntl is None:
+        raise RuntimeError("MINIPRINT_SHARED_DIR requires POSIX file locking (fcntl)")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_started_at() -> float:
+    """When the current server was started, or 0 if unknown"""
+    try:
+        return float(os.getenv('MINIPRINT_STARTED_AT', 0))
+    except ValueError:
+        return 0.0
+
+
+class HostLeader:
+    """
+    Elects one process per host by holding an exclusive lock on `leader.lock`.
+
+    The lock is released by the kernel when the holder exits, so another process can
+    take over by calling try_acquire() again.
+    """
+
+    def __init__(self, shared_dir: str):
+        self.path = os.path.join(shared_dir, 'leader.lock')
+        self._fd: Optional[int] = None
+        self._lock = Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._fd is not None:
+                return True
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            os.ftruncate(fd, 0)
+            os.write(fd, str(os.getpid()).encode())
+            self._fd = fd
+            return True
+
+    @property
+    def is_leader(self) -> bool:
+        return self._fd is not None
+
+    def release(self) -> None:
+        with self._lock:
+            if self._fd is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                os.close(self._fd)
+                self._fd = None
+
+
+def _lock_name(printer_id: str) -> str:
+    return 'printer-' + re.sub(r'[^A-Za-z0-9_.-]', '_', printer_id) + '.lock'
+
+
+@contextmanager
+def printer_lock(shared_dir: str, printer_id: str, timeout: float = 30):
+    """
+    Hold an exclusive lock for one printer across all processes (and threads) on the host,
+    so jobs to the same printer are sent one after another and never interleave.
+    Raises TimeoutError if the lock cannot be taken within timeout seconds.
+    """
+    fd = os.open(os.path.join(shared_dir, _lock_name(printer_id)), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out waiting for printer {printer_id} to become free")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+@asynccontextmanager
+async def printer_lock_async(shared_dir: str, printer_id: str, timeout: float = 30):
+    """printer_lock for coroutines: waits by sleeping on the event loop instead of blocking a thread"""
+    fd = os.open(os.path.join(shared_dir, _lock_name(printer_id)), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out waiting for printer {printer_id} to become free")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.05)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+class SharedRegistryFile:
+    """
+    Printer registry published as a JSON file. Writers replace it atomically; readers
+    re-read it only when its modification time changes, checked at most once per
+    `check_interval` seconds. A file last written before `not_before` (epoch seconds),
+    left over from an earlier server, is ignored. Writes are serialized by a lock file,
+    so update() can change the published mapping from any process without losing a
+    concurrent write.
+    """
+
+    def __init__(self, shared_dir: str, check_interval: float = 1.0, not_before: float = 0.0):
+        self.path = os.path.join(shared_dir, 'printers.json')
+        self.check_interval = check_interval
+        self.not_before_ns = int(not_before * 1e9)
+        self._lock = Lock()
+        self._last_check = 0.0
+        self._mtime_ns = 0
+
+    @contextmanager
+    def _write_lock(self):
+        fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def publish(self, mapping: Dict[str, Dict[str, Any]]) -> None:
+        with self._write_lock():
+            self._write(mapping)
+
+    def update(self, change: Callable[[Optional[Dict[str, Dict[str, Any]]]], Optional[Dict[str, Dict[str, Any]]]]
+               ) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Publish change(current), where current is the published mapping (None if there is
+        none), with no other write in between. Nothing is written if change returns None.
+        """
+        with self._write_lock():
+            mapping = change(self._read())
+            if mapping is not None:
+                self._write(mapping)
+            return mapping
+
+    def _read(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        try:
+            if os.stat(self.path).st_mtime_ns < self.not_before_ns:
+                return None
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, mapping: Dict[str, Dict[str, Any]]) -> None:
+        directory = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(prefix='.printers-', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(mapping, f)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self._mtime_ns = os.stat(self.path).st_mtime_ns
+
+    def read_if_changed(self, force: bool = False) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Return the published mapping if it changed since the last read, else None"""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_check < self.check_interval:
+                return None
+            self._last_check = now
+            try:
+                mtime_ns = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                return None
+            if mtime_ns == self._mtime_ns or mtime_ns < self.not_before_ns:
+                return None
+            try:
+                with open(self.path) as f:
+                    mapping = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self._mtime_ns = mtime_ns
+            return mapping
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    """An in-flight (or recently finished) invocation shared by all callers of a key"""
+
+    def __init__(self):
+        self.done = Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.finished_at = 0.0
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one execution.
+
+    The first caller runs the function; callers arriving while it is in flight block
+    until it finishes and receive the same result (or the same exception). With a
+    ttl > 0, a successful result keeps being served for that many seconds after it
+    finished, so pollers arriving back to back do not trigger a new run either.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], ttl: float = 0) -> Any:
+        """
+        Run fn for key, or join the execution already in flight.
+
+        Args:
+            key: Identifies the operation being coalesced.
+            fn: Zero-argument callable doing the work.
+            ttl: Seconds a successful result may be reused after it finished.
+
+        Returns:
+            The result of fn. Exceptions raised by fn are re-raised in every caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set():
+                if call.error is None and ttl > 0 and time.monotonic() - call.finished_at < ttl:
+                    return call.result
+                call = None
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.finished_at = time.monotonic()
+            with self._lock:
+                if call.error is not None or ttl <= 0:
+                    # Nothing to reuse; the next caller starts a fresh run
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def forget(self, key: Hashable) -> None:
+        """Drop a cached result so the next call for key runs again"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set():
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: concurrent awaiters of a key share one task's result"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Any] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Any], ttl: float = 0) -> Any:
+        """
+        Await fn() for key, or join the run already in flight.
+
+        Args:
+            key: Identifies the operation being coalesced.
+            fn: Zero-argument coroutine function doing the work.
+            ttl: Seconds a successful result may be reused after it finished.
+        """
+        entry = self._calls.get(key)
+        if entry is not None:
+            future, finished_at = entry
+            if not future.done():
+                return await asyncio.shield(future)
+            if (not future.cancelled() and future.exception() is None
+                    and ttl > 0 and time.monotonic() - finished_at < ttl):
+                return future.result()
+
+        future = asyncio.ensure_future(fn())
+        self._calls[key] = (future, 0.0)
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                if future.cancelled() or future.exception() is not None or ttl <= 0:
+                    if self._calls.get(key, (None,))[0] is future:
+                        del self._calls[key]
+                else:
+                    self._calls[key] = (future, time.monotonic())
+
+    def forget(self, key: Hashable) -> None:
+        entry = self._calls.get(key)
+        if entry is not None and entry[0].done():
+            del self._calls[key]
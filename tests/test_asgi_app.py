@@ -0,0 +1,157 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+import app as flask_app
+import asgi_app
+import printers
+
+
+async def call(method, path, body=None, headers=None):
+    """Drive the ASGI app with a single request and collect the response"""
+    raw = json.dumps(body).encode() if body is not None else b''
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'headers': [(k.encode(), v.encode()) for k, v in (headers or {}).items()],
+    }
+    received = [{'type': 'http.request', 'body': raw, 'more_body': False}]
+    messages = []
+
+    async def receive():
+        return received.pop(0) if received else {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi_app.app(scope, receive, send)
+    start = messages[0]
+    body = b''.join(m.get('body', b'') for m in messages[1:])
+    return start['status'], dict(start['headers']), body
+
+
+class FakePrinter:
+    """asyncio TCP listener that records everything sent to it"""
+
+    def __init__(self):
+        self.received = []
+
+    async def handle(self, reader, writer):
+        self.received.append(await reader.read())
+        writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class TestAsgiApp(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.patches = [mock.patch.object(flask_app, 'APIKEY', 'test')]
+        for p in self.patches:
+            p.start()
+        self.auth = {'apikey': 'test'}
+
+    async def asyncTearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    async def test_ping(self):
+        status, headers, body = await call('GET', '/ping')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {'message': 'pong'})
+
+    async def test_apikey_required(self):
+        status, _, body = await call('GET', '/printers')
+        self.assertEqual(status, 403)
+        self.assertEqual(json.loads(body), {'error': 'API key is missing'})
+
+    async def test_unknown_route_and_method(self):
+        self.assertEqual((await call('GET', '/nope'))[0], 404)
+        self.assertEqual((await call('GET', '/print/dry', headers=self.auth))[0], 405)
+
+    async def test_validation_errors(self):
+        status, _, body = await call('POST', '/print/msl', {'printer_id': 'x'}, self.auth)
+        self.assertEqual(status, 400)
+        self.assertIn('msl', json.loads(body)['errors'])
+
+    async def test_print_reaches_printer_concurrently(self):
+        async with FakePrinter() as printer:
+            registry = {'fake': {'ip': '127.0.0.1', 'port': printer.port}}
+            with mock.patch.object(asgi_app, 'get_printers_snapshot', return_value=registry):
+                results = await asyncio.gather(*(
+                    call('POST', '/print/dry', {'printer_id': 'fake'}, self.auth) for _ in range(20)
+                ))
+            await asyncio.sleep(0.05)
+        self.assertEqual({status for status, _, _ in results}, {200})
+        self.assertIn(b'server-timing', results[0][1])
+        self.assertEqual(len(printer.received), 20)
+        self.assertTrue(all(b'^FDDRY^FS' in data for data in printer.received))
+
+    async def test_status_probes_printers(self):
+        async with FakePrinter() as printer:
+            registry = {
+                'up': {'ip': '127.0.0.1', 'port': printer.port},
+                'down': {'ip': '127.0.0.1', 'port': 1},
+            }
+            with mock.patch.object(asgi_app, 'get_printers_snapshot', return_value=registry):
+                status, _, body = await call('GET', '/printers/status', headers=self.auth)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {'up': 'Online', 'down': 'Offline'})
+
+    async def test_slow_initial_sync_does_not_stall_the_loop(self):
+        def slow_erp_sync(full=False):
+            time.sleep(0.5)
+            return False
+
+        with mock.patch.object(printers, '_initial_sync', threading.Event()), \
+                mock.patch.object(printers, 'refresh_printers_from_erp', side_effect=slow_erp_sync):
+            lookup = asyncio.ensure_future(call('GET', '/printers', headers=self.auth))
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            status, _, _ = await call('GET', '/ping')
+            self.assertEqual(status, 200)
+            self.assertLess(time.perf_counter() - started, 0.2)
+            self.assertFalse(lookup.done())
+            self.assertEqual((await lookup)[0], 200)
+
+    async def test_events_are_pushed_until_disconnect(self):
+        bus = flask_app.event_bus
+        disconnect = asyncio.Event()
+        received = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        messages = []
+
+        async def receive():
+            if received:
+                return received.pop(0)
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/events', 'headers': [(b'apikey', b'test')]}
+        stream = asyncio.ensure_future(asgi_app.app(scope, receive, send))
+        await asyncio.sleep(0.05)
+        # Published from another thread, as printer sends do
+        await asyncio.to_thread(bus.publish, 'job', {'job_id': 'j1'})
+        await asyncio.sleep(0.05)
+        self.assertIn(b'"job_id": "j1"', messages[-1]['body'])
+        disconnect.set()
+        await asyncio.wait_for(stream, 1)
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertFalse(messages[-1].get('more_body', False))
+        self.assertEqual(bus.subscriber_count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
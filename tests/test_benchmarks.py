@@ -0,0 +1,78 @@
+import unittest
+from unittest import mock
+
+from labels import LABEL_TYPES
+
+from benchmarks import compare, e2e, startup
+from benchmarks.payloads import PAYLOADS
+
+
+class TestBenchmarkPayloads(unittest.TestCase):
+    def test_every_label_type_has_a_valid_payload(self):
+        self.assertEqual(set(PAYLOADS), set(LABEL_TYPES))
+        for name, label in LABEL_TYPES.items():
+            self.assertEqual(label.validate(PAYLOADS[name]), [], name)
+            self.assertIn('^XA', label.generate(**PAYLOADS[name]))
+
+
+class TestCompare(unittest.TestCase):
+    baseline = {'micro': {'generate.x': {'median_us': 10.0}},
+                'e2e': {'print': {'throughput_rps': 100.0, 'p50_ms': 2.0, 'p99_ms': 10.0}}}
+
+    def test_flags_slowdowns_beyond_tolerance(self):
+        current = {'micro': {'generate.x': {'median_us': 13.0}},
+                   'e2e': {'print': {'throughput_rps': 70.0, 'p50_ms': 2.1, 'p99_ms': 14.0, 'errors': 0}}}
+        report = compare.compare(self.baseline, current, tolerance=0.25)
+        self.assertFalse(report['passed'])
+        flagged = {(r['benchmark'], r['metric']) for r in report['regressions']}
+        # p99 is allowed twice the tolerance, so +40% passes
+        self.assertEqual(flagged, {('micro/generate.x', 'median_us'), ('e2e/print', 'throughput_rps')})
+
+    def test_errors_always_regress_and_new_benchmarks_are_listed(self):
+        current = {'e2e': {'print': {'throughput_rps': 100.0, 'errors': 3}, 'other': {'p50_ms': 1.0}}}
+        report = compare.compare(self.baseline, current)
+        self.assertEqual(report['regressions'][0]['metric'], 'errors')
+        self.assertEqual(report['new'], ['e2e/other'])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(e2e.percentile(values, 50), 50)
+        self.assertEqual(e2e.percentile(values, 99), 99)
+        self.assertEqual(e2e.percentile([], 99), 0.0)
+
+
+class TestStartup(unittest.TestCase):
+    def test_parse_importtime(self):
+        stderr = ('import time: self [us] | cumulative | imported package\n'
+                  'import time:       120 |        120 |     json.decoder\n'
+                  'import time:       300 |        420 |   json\n'
+                  'import time:      1000 |       1420 | app\n')
+        self.assertEqual(startup.parse_importtime(stderr),
+                         [(2, 'json.decoder', 0.12, 0.12), (1, 'json', 0.3, 0.42), (0, 'app', 1.0, 1.42)])
+
+    def test_over_budget(self):
+        budget = {'_comment': '', 'time_to_ping': {'median_ms': 500},
+                  'import.requests': {'cumulative_ms': 0}, 'import.cryptography': {'cumulative_ms': 0}}
+        results = {'time_to_ping': {'median_ms': 650.0}, 'import.requests': {'cumulative_ms': 41.2}}
+        self.assertEqual([(v['benchmark'], v['current']) for v in startup.over_budget(results, budget)],
+                         [('startup/time_to_ping', 650.0), ('startup/import.requests', 41.2)])
+
+    def test_heavy_modules_are_not_imported_at_startup(self):
+        costs = startup.import_costs(runs=1, watch=['requests', 'cryptography'])
+        self.assertIn('import.app', costs)
+        self.assertNotIn('import.requests', costs)
+        self.assertNotIn('import.cryptography', costs)
+
+
+class TestEndToEnd(unittest.TestCase):
+    def test_asgi_scenario_delivers_every_label(self):
+        import app as flask_app
+        scenario = e2e.Scenario('test', 'asgi', 4, ('standard', 'msl'), printers=2)
+        with mock.patch.object(flask_app, 'APIKEY', 'test'):
+            result = e2e.run_scenario(scenario, requests=10, apikey='test')
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(result['delivered'], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
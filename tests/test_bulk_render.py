@@ -0,0 +1,67 @@
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import bulk_render
+from printer_sim import VirtualPrinterFleet
+
+from benchmarks.payloads import payload
+
+
+def ndjson(records):
+    return io.StringIO(''.join(json.dumps(r) + '\n' for r in records))
+
+
+class TestBulkRender(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_ndjson_to_file_skips_invalid_records(self):
+        records = [payload('standard'), payload('standard', qty=5), dict(payload('msl'), label_type='msl')]
+        stream = io.StringIO(ndjson(records).getvalue() + 'not json\n')
+        out = os.path.join(self.tmp.name, 'labels.zpl')
+        errors = io.StringIO()
+
+        summary = bulk_render.run(bulk_render.read_records(stream, 'ndjson'), bulk_render.FileSink(out),
+                                  'standard', jobs=2, errors_to=errors)
+
+        self.assertEqual((summary['rendered'], summary['invalid']), (2, 2))
+        with open(out) as f:
+            self.assertEqual(f.read().count('^XZ'), 2)
+        reported = [json.loads(line) for line in errors.getvalue().splitlines()]
+        self.assertEqual([r['line'] for r in reported], [2, 4])
+        self.assertEqual(reported[0]['errors'], ['qty: must be a string'])
+        self.assertFalse(os.path.exists(out + '.part'))
+
+    def test_csv_keeps_input_order(self):
+        path = os.path.join(self.tmp.name, 'msl.csv')
+        with open(path, 'w') as f:
+            f.write('printer_id,msl\n' + ''.join(f'p,{level}\n' for level in ['1', '2A', '5A', '6']))
+        out = os.path.join(self.tmp.name, 'msl.zpl')
+        self.assertEqual(bulk_render.main([path, '--label-type', 'msl', '--output', out, '--jobs', '2']), 0)
+        with open(out) as f:
+            zpl = f.read()
+        positions = [zpl.index(text) for text in ['Unlimited', '4 weeks', '24 hours', 'Bake before use']]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_streams_to_printer_in_batches(self):
+        with VirtualPrinterFleet(count=1) as fleet:
+            info = fleet.registry()['prt-sim-1']
+            sink = bulk_render.PrinterSink('prt-sim-1', info['ip'], info['port'], batch=4)
+            records = ((i, payload('dry')) for i in range(10))
+            summary = bulk_render.run(records, sink, 'dry', jobs=1, errors_to=io.StringIO())
+            printer = fleet['prt-sim-1']
+            deadline = time.monotonic() + 2
+            while printer.stats.labels < 10 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(summary['rendered'], 10)
+        self.assertEqual(printer.stats.labels, 10)
+        self.assertEqual(printer.stats.connections, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import requests
+
+import cluster
+from printer_sim import VirtualPrinterFleet
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestHashRing(unittest.TestCase):
+    def test_keys_spread_over_nodes(self):
+        ring = cluster.HashRing(['a', 'b', 'c'])
+        owners = [ring.owner(f"prt-{i}") for i in range(3000)]
+        for node in 'abc':
+            self.assertGreater(owners.count(node), 700)
+
+    def test_only_the_changed_nodes_keys_move(self):
+        keys = [f"prt-{i}" for i in range(2000)]
+        before = cluster.HashRing(['a', 'b', 'c'])
+        after = cluster.HashRing(['a', 'b', 'c', 'd'])
+        moved = [k for k in keys if before.owner(k) != after.owner(k)]
+        self.assertTrue(all(after.owner(k) == 'd' for k in moved))
+        self.assertLess(len(moved), len(keys) / 2)
+
+        after.remove('d')
+        self.assertEqual([after.owner(k) for k in keys], [before.owner(k) for k in keys])
+
+    def test_parse_nodes(self):
+        self.assertEqual(cluster.parse_nodes('a=http://h:1, b=http://h:2'), {'a': 'http://h:1', 'b': 'http://h:2'})
+        with self.assertRaises(ValueError):
+            cluster.parse_nodes('a')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class TestForwardFailures(unittest.TestCase):
+    def forward_to(self, port, **timeouts):
+        node = cluster.Cluster('a', {'a': 'http://127.0.0.1:1', 'b': f'http://127.0.0.1:{port}'}, None, **timeouts)
+        return node.forward('b', '/print/msl', b'{}', 'test')
+
+    def test_local_fallback_only_when_nothing_was_sent(self):
+        self.assertIsNone(self.forward_to(free_port()))
+
+        with socket.socket() as server:
+            server.bind(('127.0.0.1', 0))
+            server.listen()
+            port = server.getsockname()[1]
+            # Accepted by the kernel but never answered: the owner may be printing
+            status, body, _, handled_by = self.forward_to(port, forward_timeout=0.3)
+            self.assertEqual((status, handled_by), (504, 'a'))
+            self.assertIn('may have been printed', json.loads(body)['error'])
+
+        with socket.socket() as server:
+            server.bind(('127.0.0.1', 0))
+            server.listen()
+
+            def read_and_hang_up():
+                client, _ = server.accept()
+                client.recv(4096)
+                client.close()
+
+            threading.Thread(target=read_and_hang_up, daemon=True).start()
+            self.assertEqual(self.forward_to(server.getsockname()[1])[0], 502)
+
+
+class TestClusterProcesses(unittest.TestCase):
+    """Three app.py processes sharing one virtual printer fleet"""
+
+    def setUp(self):
+        self.fleet = VirtualPrinterFleet(count=6).start()
+        self.addCleanup(self.fleet.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        printers_file = os.path.join(tmp.name, 'printers.json')
+        with open(printers_file, 'w') as f:
+            json.dump(self.fleet.registry(), f)
+
+        self.ports = {node: free_port() for node in 'abc'}
+        nodes = ','.join(f"{n}=http://127.0.0.1:{p}" for n, p in self.ports.items())
+        self.processes = {}
+        for node, port in self.ports.items():
+            env = dict(os.environ, APIKEY='test', FLASK_RUN_PORT=str(port), PRINTERS_FILE=printers_file,
+                       CLUSTER_NODE_ID=node, CLUSTER_NODES=nodes, CLUSTER_HEARTBEAT_SECONDS='0.2',
+                       CLUSTER_FAILURES='2', JOB_HISTORY_DB='', LOG_LEVEL='WARNING', ERP_URL='')
+            env.pop('MINIPRINT_SHARED_DIR', None)
+            process = subprocess.Popen([sys.executable, 'app.py'], cwd=REPO, env=env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.processes[node] = process
+            self.addCleanup(self.stop, node)
+        for port in self.ports.values():
+            self.wait_until(lambda: self.get(port, '/ping') is not None)
+
+    def stop(self, node):
+        process = self.processes[node]
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+    def get(self, port, path):
+        try:
+            return requests.get(f"http://127.0.0.1:{port}{path}", headers={'apikey': 'test'}, timeout=2).json()
+        except requests.RequestException:
+            return None
+
+    def wait_until(self, condition, timeout=15):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return
+            time.sleep(0.05)
+        self.fail('condition not reached')
+
+    def print_msl(self, port, printer_id):
+        response = requests.post(f"http://127.0.0.1:{port}/print/msl", json={'printer_id': printer_id, 'msl': '3'},
+                                 headers={'apikey': 'test'}, timeout=10)
+        self.assertEqual(response.status_code, 200, response.text)
+        return response.headers[cluster.NODE_HEADER]
+
+    def test_requests_are_forwarded_to_the_owner_and_rebalanced(self):
+        owners = self.get(self.ports['a'], '/cluster')['owners']
+        for printer_id, owner in owners.items():
+            self.assertEqual(self.print_msl(self.ports['a'], printer_id), owner)
+        self.assertEqual(sum(p.stats.labels for p in self.fleet.printers), len(owners))
+
+        self.stop('c')
+        self.wait_until(lambda: self.get(self.ports['a'], '/cluster')['ring'] == ['a', 'b'])
+        for printer_id in owners:
+            self.assertIn(self.print_msl(self.ports['b'], printer_id), ('a', 'b'))
+        self.assertEqual(sum(p.stats.labels for p in self.fleet.printers), 2 * len(owners))
@@ -0,0 +1,84 @@
+import asyncio
+import socket
+import os
+import unittest
+from unittest import mock
+
+import app as flask_app
+import discovery
+from printer_sim import VirtualPrinterFleet
+
+
+class TestParsing(unittest.TestCase):
+    def test_host_identification(self):
+        identity = discovery.parse_host_identification(b'\x02ZT410-203dpi,V75.20.01Z,8,8192KB\x03\r\n')
+        self.assertEqual((identity.model, identity.firmware, identity.dots_per_mm, identity.memory),
+                         ('ZT410-203dpi', 'V75.20.01Z', 8, '8192KB'))
+        self.assertIsNone(discovery.parse_host_identification(b'HTTP/1.1 400 Bad Request\r\n'))
+
+    def test_getvar(self):
+        self.assertEqual(discovery.parse_getvar(b'"prt-lager-1"'), 'prt-lager-1')
+        self.assertIsNone(discovery.parse_getvar(b'""'))
+
+    def test_addresses(self):
+        self.assertEqual(list(discovery.addresses(['10.0.0.0/30'], (9100, 9101))),
+                         [('10.0.0.1', 9100), ('10.0.0.1', 9101), ('10.0.0.2', 9100), ('10.0.0.2', 9101)])
+        self.assertEqual(discovery.count_addresses(['10.1.0.0/16', '10.2.0.5/32']), 65535)
+
+
+class TestDiscoveryRequest(unittest.TestCase):
+    def test_ranges_must_lie_within_discovery_cidrs(self):
+        self.assertEqual(discovery.outside(['10.1.2.0/24', '10.2.0.0/16', '::1/128'], ['10.1.0.0/16']),
+                         ['10.2.0.0/16', '::1/128'])
+        with mock.patch.dict(os.environ, {'DISCOVERY_CIDRS': '10.1.0.0/16', 'DISCOVERY_MAX_ADDRESSES': '1024'}):
+            self.assertEqual(flask_app.discovery_request({'cidrs': ['10.1.2.0/24']}), (['10.1.2.0/24'], [9100]))
+            for body in ({'cidrs': ['10.2.0.0/24']}, {'cidrs': ['10.1.0.0/20']}, {}, {'ports': [22]},
+                         {'cidrs': [1]}):
+                with self.subTest(body=body), self.assertRaises(ValueError):
+                    flask_app.discovery_request(body)
+        with mock.patch.dict(os.environ, {'DISCOVERY_CIDRS': ''}), self.assertRaises(ValueError):
+            flask_app.discovery_request({'cidrs': ['127.0.0.1/32']})
+
+
+class TestScanAndDiff(unittest.TestCase):
+    def setUp(self):
+        self.fleet = VirtualPrinterFleet(count=3).start()
+        self.addCleanup(self.fleet.stop)
+        # Open port that never answers ~HI
+        self.silent = socket.socket()
+        self.silent.bind(('127.0.0.1', 0))
+        self.silent.listen(8)
+        self.addCleanup(self.silent.close)
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        self.closed_port = closed.getsockname()[1]
+        closed.close()
+        self.ports = [p.port for p in self.fleet.printers] + [self.silent.getsockname()[1], self.closed_port]
+
+    def scan(self):
+        return asyncio.run(discovery.scan(['127.0.0.1/32'], self.ports, query_timeout=0.2))
+
+    def test_scan_identifies_zebras(self):
+        found = {f.port: f for f in self.scan()}
+        self.assertEqual(len(found), 4)
+        sim = found[self.fleet['prt-sim-1'].port].identity
+        self.assertEqual((sim.model, sim.name), ('ZT410-203dpi', 'prt-sim-1'))
+        self.assertIsNone(found[self.silent.getsockname()[1]].identity)
+
+    def test_diff_and_merge(self):
+        registry = {
+            'prt-sim-1': {'ip': '127.0.0.1', 'port': self.fleet['prt-sim-1'].port},
+            'prt-sim-2': {'ip': '127.0.0.1', 'port': self.closed_port},
+            'prt-gone': {'ip': '127.0.0.1', 'port': self.closed_port},
+            'prt-remote': {'ip': '192.168.120.9', 'port': 9100},
+        }
+        changes = discovery.diff(self.scan(), registry, ['127.0.0.1/32'], self.ports)
+        self.assertEqual(changes['ok'], ['prt-sim-1'])
+        self.assertEqual(changes['moved']['prt-sim-2']['to']['port'], self.fleet['prt-sim-2'].port)
+        self.assertEqual(changes['missing'], ['prt-gone'])
+        self.assertEqual(changes['unscanned'], ['prt-remote'])
+        self.assertEqual([e['name'] for e in changes['unregistered']], ['prt-sim-3'])
+        self.assertEqual([e['port'] for e in changes['unidentified']], [self.silent.getsockname()[1]])
+
+        self.assertEqual(list(discovery.merge(changes)), ['prt-sim-2'])
+        self.assertEqual(sorted(discovery.merge(changes, add_unregistered=True)), ['prt-sim-2', 'prt-sim-3'])
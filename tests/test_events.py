@@ -0,0 +1,114 @@
+import json
+import unittest
+
+from events import EventBus, PrinterStateTracker, sse_stream, monitor_printers
+from zebra_status import HostStatus, parse_host_status
+
+# ~HS reply of a printer that is out of paper with two formats queued
+HS_PAPER_OUT = (
+    b'\x02030,1,0,1245,002,0,0,0,000,0,0,0\x03\r\n'
+    b'\x02001,0,0,0,1,2,6,0,00000001,1,000\x03\r\n'
+    b'\x021234,0\x03\r\n'
+)
+
+
+class TestHostStatus(unittest.TestCase):
+    def test_parse_host_status(self):
+        status = parse_host_status(HS_PAPER_OUT)
+        self.assertTrue(status.paper_out)
+        self.assertEqual(status.formats_in_buffer, 2)
+        self.assertEqual(status.labels_remaining, 1)
+        self.assertEqual(status.state, 'paper_out')
+
+    def test_incomplete_reply(self):
+        self.assertIsNone(parse_host_status(b''))
+        self.assertIsNone(parse_host_status(b'\x02030,0,0\x03'))
+
+
+class TestPrinterStateTracker(unittest.TestCase):
+    def setUp(self):
+        self.bus = EventBus()
+        self.queue = self.bus.subscribe()
+
+    def drain(self):
+        events = []
+        while not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        return events
+
+    def test_only_state_changes_are_published(self):
+        tracker = PrinterStateTracker(self.bus)
+        tracker.record_success('p1')
+        tracker.record_success('p1')
+        tracker.record_failure('p1', 'timeout')
+        tracker.record_failure('p1', 'timeout')
+        states = [e['data']['state'] for e in self.drain()]
+        self.assertEqual(states, ['online', 'offline'])
+
+    def test_reachable_does_not_clear_reported_condition(self):
+        tracker = PrinterStateTracker(self.bus)
+        tracker.record_success('p1', 'paper_out')
+        tracker.record_success('p1')
+        self.assertEqual(tracker.snapshot()['p1']['state'], 'paper_out')
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        tracker = PrinterStateTracker(self.bus, circuit_failures=2, circuit_reset_seconds=60)
+        tracker.record_failure('p1')
+        self.assertFalse(tracker.circuit_open('p1'))
+        tracker.record_failure('p1')
+        self.assertTrue(tracker.circuit_open('p1'))
+        tracker.record_success('p1')
+        self.assertFalse(tracker.circuit_open('p1'))
+        self.assertEqual([e['data']['state'] for e in self.drain()], ['offline', 'circuit_open', 'online'])
+
+    def test_monitor_feeds_tracker(self):
+        tracker = PrinterStateTracker(self.bus)
+        replies = {'10.0.0.1': HostStatus(paper_out=True), '10.0.0.2': None}
+
+        def probe(ip, port):
+            if ip not in replies:
+                raise OSError('unreachable')
+            return replies[ip]
+
+        printers = {
+            'a': {'ip': '10.0.0.1', 'port': 9100},
+            'b': {'ip': '10.0.0.2', 'port': 9100},
+            'c': {'ip': '10.0.0.3', 'port': 9100},
+        }
+        monitor_printers(tracker, lambda: printers, probe)
+        snapshot = tracker.snapshot()
+        self.assertEqual({pid: s['state'] for pid, s in snapshot.items()},
+                         {'a': 'paper_out', 'b': 'online', 'c': 'offline'})
+
+
+class TestSseStream(unittest.TestCase):
+    def test_stream_starts_with_snapshot_then_events(self):
+        bus = EventBus()
+        tracker = PrinterStateTracker(bus)
+        tracker.record_success('p1')
+        stream = sse_stream(bus, tracker, heartbeat_seconds=0.05)
+
+        snapshot = next(stream)
+        self.assertTrue(snapshot.startswith('event: snapshot\n'))
+        self.assertEqual(json.loads(snapshot.split('data: ', 1)[1])['p1']['state'], 'online')
+
+        self.assertEqual(next(stream), ': keepalive\n\n')
+        tracker.record_failure('p1')
+        event = next(stream)
+        self.assertIn('event: printer\n', event)
+        self.assertIn('"state": "offline"', event)
+
+        stream.close()
+        self.assertEqual(bus.subscriber_count(), 0)
+
+    def test_replay_from_last_event_id(self):
+        bus = EventBus()
+        first = bus.publish('job', {'n': 1})
+        bus.publish('job', {'n': 2})
+        q = bus.subscribe(last_event_id=first['id'])
+        self.assertEqual(q.get_nowait()['data'], {'n': 2})
+        self.assertTrue(q.empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import app as flask_app
+import asgi_app
+import job_history
+from benchmarks.payloads import payload
+from printer_sim import VirtualPrinterFleet
+
+
+class TestJobHistoryStore(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = job_history.JobHistory(os.path.join(tmp.name, 'jobs.db'))
+
+    def test_record_and_query(self):
+        now = time.time()
+        self.store.record('a', 'prt-1', 'standard', 'sent', now - 10, zpl=b'^XA^XZ', batch='B1')
+        self.store.record('b', 'prt-2', 'tracescan', 'failed', now - 5, error='refused', serial='S1')
+        self.store.record('c', 'prt-1', 'standard', 'sent', now, zpl=b'^XA^FDx^XZ', batch='B1')
+
+        self.assertEqual([j['job_id'] for j in self.store.query(batch='B1')], ['c', 'a'])
+        self.assertEqual([j['job_id'] for j in self.store.query(serial='S1')], ['b'])
+        self.assertEqual([j['job_id'] for j in self.store.query(printer_id='prt-1', since=now - 1)], ['c'])
+        self.assertEqual(self.store.zpl('a'), b'^XA^XZ')
+        failed = self.store.get('b')
+        self.assertEqual((failed['outcome'], failed['error'], failed['reprintable']), ('failed', 'refused', False))
+
+    def test_prune_by_age_and_count(self):
+        store = self.store
+        store.retention_days, store.max_jobs = 1, 2
+        now = time.time()
+        store.record('old', 'prt-1', 'msl', 'sent', now - 2 * 86400)
+        for i in range(3):
+            store.record(f'new{i}', 'prt-1', 'msl', 'sent', now + i)
+        self.assertEqual(store.prune(now), 2)
+        self.assertEqual([j['job_id'] for j in store.query()], ['new2', 'new1'])
+
+    def test_references(self):
+        self.assertEqual(job_history.references({'batch': ' B24 '}), {'batch': 'B24', 'serial': None})
+        self.assertEqual(job_history.references({'wo_serial_number': 'W-1'}), {'batch': None, 'serial': 'W-1'})
+
+    def test_history_defaults_to_the_shared_dir_only(self):
+        with mock.patch.dict(os.environ), tempfile.TemporaryDirectory() as shared:
+            os.environ.pop('JOB_HISTORY_DB', None)
+            self.assertIsNone(job_history.open_from_env(None))
+            self.assertEqual(job_history.open_from_env(shared).path, os.path.join(shared, 'job_history.db'))
+
+
+class TestJobHistoryEndpoints(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.fleet = VirtualPrinterFleet(count=2).start()
+        self.addCleanup(self.fleet.stop)
+        registry = self.fleet.registry()
+        patches = [
+            mock.patch.object(flask_app, 'history', job_history.JobHistory(os.path.join(tmp.name, 'jobs.db'))),
+            mock.patch.object(flask_app, 'APIKEY', 'test'),
+            mock.patch.object(flask_app, 'get_printers_snapshot', return_value=registry),
+            mock.patch.object(asgi_app, 'get_printers_snapshot', return_value=registry),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = flask_app.app.test_client()
+        self.headers = {'apikey': 'test'}
+
+    def wait_for_labels(self, printer_id, count):
+        printer = self.fleet[printer_id]
+        deadline = time.monotonic() + 2
+        while printer.stats.labels < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return printer.stats.labels
+
+    def test_print_query_and_reprint(self):
+        response = self.client.post('/print', json=payload('standard', printer_id='prt-sim-1'), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        job_id = response.get_json()['job_id']
+
+        jobs = self.client.get('/jobs?batch=B24-00123', headers=self.headers).get_json()['jobs']
+        self.assertEqual([j['job_id'] for j in jobs], [job_id])
+        self.assertTrue(jobs[0]['reprintable'])
+        for limit in (0, -5):
+            jobs = self.client.get(f'/jobs?limit={limit}', headers=self.headers).get_json()['jobs']
+            self.assertEqual(len(jobs), 1, limit)
+
+        response = self.client.post(f'/jobs/{job_id}/reprint', json={'printer_id': 'prt-sim-2'},
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.wait_for_labels('prt-sim-2', 1), 1)
+        self.assertEqual(self.fleet['prt-sim-2'].stats.checksum, self.fleet['prt-sim-1'].stats.checksum)
+
+        reprint = self.client.get(f"/jobs/{response.get_json()['job_id']}", headers=self.headers).get_json()
+        self.assertEqual((reprint['reprint_of'], reprint['batch']), (job_id, 'B24-00123'))
+        self.assertEqual(self.client.get('/jobs/nope', headers=self.headers).status_code, 404)
+
+    def test_asgi_records_jobs(self):
+        sent = []
+        body = json.dumps(payload('standard', printer_id='prt-sim-1')).encode()
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        async def request(method, path, query=b''):
+            scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+                     'headers': [(b'apikey', b'test')]}
+            await asgi_app.app(scope, receive, send)
+            return sent[-2]['status'], json.loads(sent[-1]['body'])
+
+        status, result = asyncio.run(request('POST', '/print'))
+        self.assertEqual(status, 200)
+        status, result = asyncio.run(request('GET', '/jobs', b'batch=B24-00123&printer_id=prt-sim-1'))
+        self.assertEqual(status, 200)
+        self.assertEqual(len(result['jobs']), 1)
+        self.assertEqual(result['jobs'][0]['outcome'], 'sent')
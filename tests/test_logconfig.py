@@ -0,0 +1,51 @@
+import json
+import logging
+import time
+import unittest
+
+import tracing
+from logconfig import ContextFilter, JsonFormatter, RateLimitFilter
+
+
+def make_record(msg, *args, level=logging.WARNING):
+    return logging.LogRecord('miniprint', level, __file__, 1, msg, args, None)
+
+
+class TestRateLimitFilter(unittest.TestCase):
+    def test_repeats_dropped_per_key(self):
+        limiter = RateLimitFilter(window_seconds=60)
+        msg = "Failed to connect to %s:%s - %s"
+        self.assertTrue(limiter.filter(make_record(msg, '10.1.0.25', 9100, 'timed out')))
+        self.assertFalse(limiter.filter(make_record(msg, '10.1.0.25', 9100, 'timed out')))
+        self.assertTrue(limiter.filter(make_record(msg, '10.1.0.26', 9100, 'timed out')))
+
+    def test_suppressed_count_reported_after_window(self):
+        limiter = RateLimitFilter(window_seconds=60)
+        limiter.filter(make_record('flap'))
+        limiter.filter(make_record('flap'))
+        limiter.filter(make_record('flap'))
+        limiter.window_seconds = 0.001
+        time.sleep(0.01)
+        record = make_record('flap')
+        self.assertTrue(limiter.filter(record))
+        self.assertEqual(record.suppressed, 2)
+
+
+class TestJsonFormatter(unittest.TestCase):
+    def test_context_fields_from_trace(self):
+        trace = tracing.start_trace()
+        trace.annotate(printer_id='prt-batch-WE1', job_id='abc')
+        try:
+            record = make_record("Socket error: %s", 'refused')
+            ContextFilter().filter(record)
+        finally:
+            tracing.end_trace()
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry['msg'], 'Socket error: refused')
+        self.assertEqual(entry['printer_id'], 'prt-batch-WE1')
+        self.assertEqual(entry['job_id'], 'abc')
+        self.assertEqual(entry['level'], 'WARNING')
+
+
+if __name__ == '__main__':
+    unittest.main()
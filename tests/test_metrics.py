@@ -0,0 +1,45 @@
+import unittest
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counter_with_labels(self):
+        registry = Registry()
+        requests = registry.register(Counter('requests_total', 'Requests', ('endpoint',)))
+        requests.labels(endpoint='/ping').inc()
+        requests.labels(endpoint='/ping').inc(2)
+        text = registry.expose()
+        self.assertIn('# TYPE requests_total counter', text)
+        self.assertIn('requests_total{endpoint="/ping"} 3', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        latency = registry.register(Histogram('latency_seconds', 'Latency', ('printer',), buckets=(0.1, 1.0)))
+        for value in (0.05, 0.5, 5.0):
+            latency.labels(printer='p1').observe(value)
+        text = registry.expose()
+        self.assertIn('latency_seconds_bucket{printer="p1",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{printer="p1",le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{printer="p1",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_count{printer="p1"} 3', text)
+        self.assertIn('latency_seconds_sum{printer="p1"} 5.55', text)
+
+    def test_gauge_and_label_escaping(self):
+        registry = Registry()
+        size = registry.register(Gauge('size', 'Size'))
+        size.set(7)
+        errors = registry.register(Counter('errors_total', 'Errors', ('printer',)))
+        errors.labels(printer='a"b').inc()
+        text = registry.expose()
+        self.assertIn('size 7', text)
+        self.assertIn('errors_total{printer="a\\"b"} 1', text)
+
+    def test_register_returns_existing_metric(self):
+        registry = Registry()
+        first = registry.register(Counter('c_total', 'C'))
+        self.assertIs(registry.register(Counter('c_total', 'C')), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
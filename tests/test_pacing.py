@@ -0,0 +1,98 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+import app as flask_app
+import asgi_app
+import pacing
+from printer_sim import PrinterBehavior, VirtualPrinterFleet
+
+LABEL = b'^XA^FO20,20^FDhello^FS^XZ\n'
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestPacer(unittest.TestCase):
+    def test_split_at_format_ends_across_chunks(self):
+        zpl = LABEL * 5 + b'~HS'
+        for size in (1, 2, 5, 64):
+            pacer = pacing.Pacer(pacing.PacingPolicy(window=2), 'prt-1')
+            pieces = [p for chunk in chunked(zpl, size) for p in pacer.split(chunk)] + [pacer.finish()]
+            self.assertEqual(b''.join(pieces), zpl, size)
+            self.assertEqual(sum(p.endswith(pacing.FORMAT_END) for p in pieces), 5, size)
+
+    def test_room_is_needed_only_before_a_new_format(self):
+        pacer = pacing.Pacer(pacing.PacingPolicy(window=2), 'prt-1')
+        for piece in pacer.split(LABEL * 2):
+            self.assertFalse(pacer.needs_room(piece))
+            pacer.sent(piece)
+        self.assertFalse(pacer.needs_room(b'\n'))
+        self.assertTrue(pacer.needs_room(b'\n^XA'))
+
+
+class TestPacedSend(unittest.TestCase):
+    def start_fleet(self, **behavior):
+        fleet = VirtualPrinterFleet(count=1, behavior=PrinterBehavior(**behavior)).start()
+        self.addCleanup(fleet.stop)
+        return fleet['prt-sim-1'], fleet.registry()['prt-sim-1']
+
+    def wait_printed(self, printer, labels, timeout=5):
+        deadline = time.monotonic() + timeout
+        while printer.stats.printed < labels and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def test_window_keeps_the_printer_busy_without_overfilling_it(self):
+        printer, address = self.start_fleet(label_time=0.01)
+        policy = pacing.PacingPolicy(window=8, poll_interval=0.005)
+        started = time.perf_counter()
+        with mock.patch.object(flask_app, 'print_pacing', policy):
+            sent = flask_app.PrinterCommunicationMixin().send_bytes_to_printer(
+                address['ip'], address['port'], chunked(LABEL * 60, 1000), 'prt-sim-1')
+        self.wait_printed(printer, 60)
+        self.assertEqual(sent, len(LABEL) * 60)
+        self.assertEqual((printer.stats.labels, printer.stats.printed), (60, 60))
+        self.assertLessEqual(printer.stats.peak_buffered, 8)
+        self.assertGreater(printer.stats.status_queries, 0)
+        # 60 labels at 10 ms each; the buffer never ran dry for long
+        self.assertLess(time.perf_counter() - started, 1.2)
+
+    def test_stalled_printer_fails_the_job(self):
+        printer, address = self.start_fleet(label_time=0.01, paper_out=True)
+        policy = pacing.PacingPolicy(window=4, poll_interval=0.01, stall_timeout=0.3)
+        with mock.patch.object(flask_app, 'print_pacing', policy), self.assertRaises(pacing.PrinterStalled) as e:
+            flask_app.PrinterCommunicationMixin().send_bytes_to_printer(
+                address['ip'], address['port'], [LABEL * 20], 'prt-sim-1')
+        self.assertIn('paper_out', str(e.exception))
+        self.assertEqual(printer.stats.labels, 4)
+
+    def test_printer_without_status_is_sent_to_unpaced(self):
+        printer, address = self.start_fleet(answer_status=False)
+        policy = pacing.PacingPolicy(window=4)
+        with mock.patch.object(flask_app, 'print_pacing', policy), \
+                mock.patch.object(pacing, 'REPLY_TIMEOUT_SECONDS', 0.1):
+            flask_app.PrinterCommunicationMixin().send_bytes_to_printer(
+                address['ip'], address['port'], [LABEL * 20], 'prt-sim-1')
+        self.wait_printed(printer, 20)
+        self.assertEqual(printer.stats.labels, 20)
+        self.assertFalse(policy.applies('prt-sim-1'))
+
+    def test_asgi_paces_on_the_event_loop(self):
+        printer, address = self.start_fleet(label_time=0.005)
+        policy = pacing.PacingPolicy(window=6, poll_interval=0.005)
+
+        async def chunks():
+            for chunk in chunked(LABEL * 40, 300):
+                yield chunk
+
+        with mock.patch.object(flask_app, 'print_pacing', policy):
+            asyncio.run(asgi_app.send_bytes_to_printer(address['ip'], address['port'], chunks(), 'prt-sim-1'))
+        self.wait_printed(printer, 40)
+        self.assertEqual(printer.stats.printed, 40)
+        self.assertLessEqual(printer.stats.peak_buffered, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import app as flask_app
+import asgi_app
+import print_confirm
+from printer_sim import PrinterBehavior, VirtualPrinterFleet
+
+LABEL = '^XA^FO20,20^FDhello^FS^XZ'
+
+
+class TestLabelTally(unittest.TestCase):
+    def test_formats_and_quantities_across_chunks(self):
+        zpl = (LABEL * 2 + '^XA^FDx^FS^PQ12,0,1,Y^XZ').encode()
+        self.assertEqual(print_confirm.count_labels(zpl), 14)
+        for size in (1, 3, 7):
+            tally = print_confirm.LabelTally()
+            for i in range(0, len(zpl), size):
+                tally.feed(zpl[i:i + size])
+            self.assertEqual(tally.finish(), 14, size)
+        self.assertEqual(print_confirm.count_labels(b'~JA^XA^FDunterminated'), 0)
+
+
+class TestPrintConfirmation(unittest.TestCase):
+    def start_fleet(self, **behavior):
+        fleet = VirtualPrinterFleet(count=1, behavior=PrinterBehavior(**behavior)).start()
+        self.addCleanup(fleet.stop)
+        return fleet, fleet.registry()['prt-sim-1']
+
+    def send(self, printer, timeout=5):
+        policy = print_confirm.ConfirmPolicy(timeout=timeout, poll_interval=0.02)
+        with mock.patch.object(flask_app, 'print_confirmation', policy), \
+                mock.patch.object(flask_app, 'history', None), \
+                mock.patch.object(flask_app, 'publish_job') as publish:
+            flask_app.PrinterCommunicationMixin().send_job('prt-sim-1', printer, 'standard', LABEL * 2)
+        return publish.call_args_list[-1]
+
+    def test_odometer_confirms_after_the_labels_printed(self):
+        fleet, printer = self.start_fleet(label_time=0.1)
+        event = self.send(printer)
+        self.assertEqual(fleet['prt-sim-1'].stats.printed, 2)
+        self.assertEqual(event.args[2], 'printed')
+        self.assertEqual((event.kwargs['labels'], event.kwargs['confirmed_by']), (2, 'counter'))
+        self.assertGreaterEqual(event.kwargs['print_latency_ms'], 190)
+
+    def test_host_status_fallback_and_timeout(self):
+        fleet, printer = self.start_fleet(label_time=0.05, odometer=False)
+        event = self.send(printer)
+        self.assertEqual((event.args[2], event.kwargs['confirmed_by']), ('printed', 'status'))
+        self.assertEqual(fleet['prt-sim-1'].stats.printed, 2)
+
+        fleet, printer = self.start_fleet(label_time=10, paper_out=True)
+        event = self.send(printer, timeout=0.2)
+        self.assertEqual((event.args[2], event.kwargs['reason']), ('unconfirmed', 'paper_out'))
+
+    def test_asgi_confirms_on_the_event_loop(self):
+        fleet, printer = self.start_fleet(label_time=0.05)
+        policy = print_confirm.ConfirmPolicy(printers={'prt-sim-1'}, timeout=5, poll_interval=0.02)
+        with mock.patch.object(flask_app, 'print_confirmation', policy), \
+                mock.patch.object(flask_app, 'history', None), \
+                mock.patch.object(flask_app, 'publish_job') as publish:
+            asyncio.run(asgi_app.send_job('prt-sim-1', printer, 'standard', LABEL * 3))
+        event = publish.call_args_list[-1]
+        self.assertEqual((event.args[2], event.kwargs['labels']), ('printed', 3))
+        self.assertEqual(fleet['prt-sim-1'].stats.printed, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import socket
+import time
+import unittest
+import zlib
+
+from printer_sim import PrinterBehavior, VirtualPrinterFleet
+from zebra_status import query_host_status
+
+LABEL = b'^XA^FO20,20^FDhello^FS^XZ'
+
+
+def send(port, data, timeout=2):
+    with socket.create_connection(('127.0.0.1', port), timeout=timeout) as sock:
+        sock.sendall(data)
+
+
+def wait_for(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestVirtualPrinterFleet(unittest.TestCase):
+    def test_counts_and_checksums_labels(self):
+        with VirtualPrinterFleet(count=2) as fleet:
+            registry = fleet.registry()
+            self.assertEqual(set(registry), {'prt-sim-1', 'prt-sim-2'})
+            send(registry['prt-sim-1']['port'], LABEL * 3)
+            printer = fleet['prt-sim-1']
+            self.assertTrue(wait_for(lambda: printer.stats.labels == 3))
+            expected = 0
+            for _ in range(3):
+                expected = zlib.crc32(LABEL, expected)
+            self.assertEqual(printer.stats.checksum, expected)
+            self.assertEqual(fleet['prt-sim-2'].stats.labels, 0)
+
+    def test_labels_split_across_reads(self):
+        with VirtualPrinterFleet(count=1) as fleet:
+            port = fleet.registry()['prt-sim-1']['port']
+            with socket.create_connection(('127.0.0.1', port)) as sock:
+                sock.sendall(LABEL[:10])
+                time.sleep(0.05)
+                sock.sendall(LABEL[10:])
+            self.assertTrue(wait_for(lambda: fleet['prt-sim-1'].stats.labels == 1))
+
+    def test_answers_host_status_with_queued_formats(self):
+        behavior = PrinterBehavior(label_time=10, paper_out=True)
+        with VirtualPrinterFleet(count=1, behavior=behavior) as fleet:
+            port = fleet.registry()['prt-sim-1']['port']
+            send(port, LABEL * 2)
+            self.assertTrue(wait_for(lambda: fleet['prt-sim-1'].stats.labels == 2))
+            status = query_host_status('127.0.0.1', port, timeout=2)
+        self.assertTrue(status.paper_out)
+        self.assertEqual(status.formats_in_buffer, 2)
+
+    def test_reset_injection(self):
+        with VirtualPrinterFleet(count=1, behavior=PrinterBehavior(reset_rate=1.0)) as fleet:
+            port = fleet.registry()['prt-sim-1']['port']
+            with socket.create_connection(('127.0.0.1', port), timeout=2) as sock:
+                sock.sendall(LABEL)
+                with self.assertRaises(ConnectionResetError):
+                    while sock.recv(1024):
+                        pass
+            self.assertEqual(fleet['prt-sim-1'].stats.resets, 1)
+            self.assertEqual(fleet['prt-sim-1'].stats.labels, 0)
+
+    def test_blackhole_never_answers(self):
+        with VirtualPrinterFleet(count=1, behavior=PrinterBehavior(blackhole=True)) as fleet:
+            port = fleet.registry()['prt-sim-1']['port']
+            self.assertIsNone(query_host_status('127.0.0.1', port, timeout=0.2))
+
+
+if __name__ == '__main__':
+    unittest.main()
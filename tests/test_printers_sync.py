@@ -0,0 +1,135 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import printers
+from shared_state import HostLeader, SharedRegistryFile
+
+
+class FakeResponse:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {'data': self._rows}
+
+
+class FakeSession:
+    """Serves rows from a list, honouring paging and the `modified >=` filter."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.calls.append(dict(params))
+        rows = sorted(self.rows, key=lambda r: (r['modified'], r['name']))
+        if 'filters' in params:
+            since = printers.json.loads(params['filters'])[0][2]
+            rows = [r for r in rows if r['modified'] >= since]
+        start = params['limit_start']
+        return FakeResponse(rows[start:start + params['limit_page_length']])
+
+
+def row(name, printer_name, ip, modified, port=9100):
+    return {'name': name, 'printer_name': printer_name, 'server_ip': ip, 'port': port, 'modified': modified}
+
+
+class TestPrintersSync(unittest.TestCase):
+    def setUp(self):
+        self.env = mock.patch.dict('os.environ', {
+            'ERP_URL': 'https://erp.example',
+            'ERP_API_KEY': 'key',
+            'ERP_API_SECRET': 'secret',
+            'ERP_PAGE_SIZE': '2',
+        })
+        self.env.start()
+        self.saved = printers.get_printers_snapshot()
+        printers._sync_state.update({'doc_names': {}, 'last_modified': None, 'last_full_sync': 0.0})
+
+    def tearDown(self):
+        self.env.stop()
+        with printers._PRINTERS_LOCK:
+            printers.printers.clear()
+            printers.printers.update(self.saved)
+        printers._sync_state.update({'doc_names': {}, 'last_modified': None, 'last_full_sync': 0.0})
+
+    def test_full_sync_pages_through_all_rows(self):
+        session = FakeSession([row(f'P{i}', f'prt-{i}', f'10.0.0.{i}', f'2024-01-0{i} 00:00:00') for i in range(1, 6)])
+        with mock.patch.object(printers, '_get_erp_session', return_value=session):
+            self.assertTrue(printers.refresh_printers_from_erp())
+
+        self.assertEqual(len(printers.get_printers_snapshot()), 5)
+        self.assertEqual([c['limit_start'] for c in session.calls], [0, 2, 4])
+        self.assertEqual(printers._sync_state['last_modified'], '2024-01-05 00:00:00')
+
+    def test_incremental_sync_fetches_only_changed_rows(self):
+        session = FakeSession([
+            row('P1', 'prt-a', '10.0.0.1', '2024-01-01 00:00:00'),
+            row('P2', 'prt-b', '10.0.0.2', '2024-01-02 00:00:00'),
+        ])
+        with mock.patch.object(printers, '_get_erp_session', return_value=session):
+            printers.refresh_printers_from_erp()
+            session.rows[1] = row('P2', 'prt-b', '10.0.0.22', '2024-01-03 00:00:00')
+            session.rows.append(row('P3', 'prt-c', '10.0.0.3', '2024-01-03 00:00:00'))
+            session.calls.clear()
+            self.assertTrue(printers.refresh_printers_from_erp(full=False))
+
+        self.assertEqual(printers.json.loads(session.calls[0]['filters']), [['modified', '>=', '2024-01-02 00:00:00']])
+        snapshot = printers.get_printers_snapshot()
+        self.assertEqual(snapshot['prt-b'], {'ip': '10.0.0.22', 'port': 9100})
+        self.assertIn('prt-c', snapshot)
+        self.assertIn('prt-a', snapshot)
+
+    def test_incremental_sync_handles_rename(self):
+        session = FakeSession([row('P1', 'prt-old', '10.0.0.1', '2024-01-01 00:00:00')])
+        with mock.patch.object(printers, '_get_erp_session', return_value=session):
+            printers.refresh_printers_from_erp()
+            session.rows[0] = row('P1', 'prt-new', '10.0.0.1', '2024-01-02 00:00:00')
+            printers.refresh_printers_from_erp(full=False)
+
+        self.assertEqual(list(printers.get_printers_snapshot()), ['prt-new'])
+
+    def test_failed_sync_keeps_existing_mapping(self):
+        before = printers.get_printers_snapshot()
+        session = mock.Mock()
+        session.get.side_effect = ConnectionError('ERP down')
+        with mock.patch.object(printers, '_get_erp_session', return_value=session):
+            self.assertFalse(printers.refresh_printers_from_erp())
+        self.assertEqual(printers.get_printers_snapshot(), before)
+
+    def test_first_lookup_runs_the_initial_sync_once(self):
+        session = FakeSession([row('P1', 'prt-a', '10.0.0.1', '2024-01-01 00:00:00')])
+        with mock.patch.object(printers, '_initial_sync', printers.Event()), \
+                mock.patch.object(printers, '_get_erp_session', return_value=session):
+            self.assertIn('prt-a', printers.get_printers_snapshot())
+            printers.get_printers_snapshot()
+        self.assertEqual(len(session.calls), 1)
+
+    def test_only_the_leader_asks_erp_in_multi_process_mode(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        leader, worker = HostLeader(tmp.name), HostLeader(tmp.name)
+        self.addCleanup(leader.release)
+        self.assertTrue(leader.try_acquire())
+        session = FakeSession([row('P1', 'prt-a', '10.0.0.1', '2024-01-01 00:00:00')])
+        with mock.patch.object(printers, '_get_erp_session', return_value=session), \
+                mock.patch.object(printers, '_shared_registry', SharedRegistryFile(tmp.name)):
+            with mock.patch.object(printers, '_initial_sync', printers.Event()), \
+                    mock.patch.object(printers, '_registry_leader', leader):
+                printers.ensure_initial_sync()
+            self.assertEqual(len(session.calls), 1)
+            with mock.patch.object(printers, '_initial_sync', printers.Event()), \
+                    mock.patch.object(printers, '_registry_leader', worker), \
+                    mock.patch.object(printers, '_shared_registry', SharedRegistryFile(tmp.name)), \
+                    mock.patch.dict(printers.printers, clear=True):
+                printers.ensure_initial_sync()
+                self.assertIn('prt-a', printers.printers)
+            self.assertEqual(len(session.calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio
+import marshal
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+import app as flask_app
+import asgi_app
+import profiling
+
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestProfileEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.profiler = profiling.Profiler()
+        for patcher in (mock.patch.object(flask_app, 'APIKEY', 'test'),
+                        mock.patch.object(flask_app, 'profiler', self.profiler)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.profiler.stop)
+        self.client = flask_app.app.test_client()
+        self.headers = {'apikey': 'test'}
+
+    def wait_finished(self):
+        deadline = time.monotonic() + 5
+        while self.profiler.active and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(self.profiler.active)
+
+    def test_sampling_covers_background_threads(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=_busy_loop, args=(stop,), name='PrintersMonitor', daemon=True)
+        worker.start()
+        self.addCleanup(stop.set)
+
+        response = self.client.post('/debug/profile', json={'seconds': 0.3, 'interval_ms': 2}, headers=self.headers)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.post('/debug/profile', json={}, headers=self.headers).status_code, 409)
+        self.wait_finished()
+
+        response = self.client.get('/debug/profile/result', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertTrue(any(line.startswith('PrintersMonitor;') and '_busy_loop (test_profiling.py)' in line
+                            for line in lines))
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in lines))
+        self.assertGreater(self.client.get('/debug/profile', headers=self.headers).get_json()['samples'], 10)
+
+    def test_cprofile_for_a_number_of_requests(self):
+        self.assertEqual(self.client.get('/debug/profile/result', headers=self.headers).status_code, 404)
+        response = self.client.post('/debug/profile', json={'mode': 'cprofile', 'requests': 2}, headers=self.headers)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.get('/debug/profile/result', headers=self.headers).status_code, 409)
+        self.client.get('/ping')
+        self.client.get('/printers', headers=self.headers)
+        status = self.client.get('/debug/profile', headers=self.headers).get_json()
+        self.assertEqual((status['running'], status['requests']), (False, 2))
+
+        stats = marshal.loads(self.client.get('/debug/profile/result', headers=self.headers).data)
+        self.assertIn('get', {name for _, _, name in stats})
+        text = self.client.get('/debug/profile/result?format=text', headers=self.headers).get_data(as_text=True)
+        self.assertIn('function calls', text)
+
+    def test_cprofile_is_disabled_when_the_view_raises(self):
+        self.client.post('/debug/profile', json={'mode': 'cprofile', 'requests': 1}, headers=self.headers)
+        with mock.patch.object(flask_app, 'get_printers_snapshot', side_effect=RuntimeError('boom')), \
+                mock.patch.dict(flask_app.app.config, PROPAGATE_EXCEPTIONS=True), self.assertRaises(RuntimeError):
+            self.client.get('/printers', headers=self.headers)
+        self.assertIsNone(sys.getprofile())
+        self.assertFalse(self.profiler.active)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.post('/debug/profile', json={'mode': 'perf'}, headers=self.headers).status_code, 400)
+        self.assertEqual(self.client.post('/debug/profile', json={'seconds': 0}, headers=self.headers).status_code, 400)
+        self.assertEqual(self.client.delete('/debug/profile', headers=self.headers).status_code, 404)
+        self.assertEqual(self.client.post('/debug/profile', json={}).status_code, 403)
+
+    def test_asgi_profiles_the_event_loop(self):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'{"mode": "cprofile", "requests": 1}', 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        async def request(method, path):
+            scope = {'type': 'http', 'method': method, 'path': path, 'headers': [(b'apikey', b'test')]}
+            await asgi_app.app(scope, receive, send)
+            return sent[-2]['status'], sent[-1]['body']
+
+        async def session():
+            statuses = [(await request('POST', '/debug/profile'))[0], (await request('GET', '/printers'))[0]]
+            return statuses, await request('GET', '/debug/profile/result')
+
+        statuses, (status, body) = asyncio.run(session())
+        self.assertEqual(statuses, [202, 200])
+        self.assertEqual(status, 200)
+        self.assertIn('printer_list', {name for _, _, name in marshal.loads(body)})
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import socket
+import time
+import unittest
+from unittest import mock
+
+import app as flask_app
+import asgi_app
+import raw_ingress
+from printer_sim import VirtualPrinterFleet
+
+LABEL = b'^XA^FO20,20^FDraw^FS^XZ'
+
+
+def wait_for_labels(printer, count, timeout=2):
+    deadline = time.monotonic() + timeout
+    while printer.stats.labels < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return printer.stats.labels
+
+
+class TestRawPassThrough(unittest.TestCase):
+    def setUp(self):
+        self.fleet = VirtualPrinterFleet(count=1).start()
+        self.addCleanup(self.fleet.stop)
+        self.registry = self.fleet.registry()
+        self.printer = self.fleet['prt-sim-1']
+        for target in (flask_app, asgi_app, raw_ingress):
+            patcher = mock.patch.object(target, 'get_printers_snapshot', return_value=self.registry)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(flask_app, 'APIKEY', 'test')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_flask_endpoint_forwards_body_unchanged(self):
+        client = flask_app.app.test_client()
+        response = client.post('/raw/prt-sim-1', data=LABEL * 3, headers={'apikey': 'test'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['bytes'], len(LABEL) * 3)
+        self.assertEqual(wait_for_labels(self.printer, 3), 3)
+
+        response = client.post('/raw/nope', data=LABEL, headers={'apikey': 'test'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_asgi_endpoint_streams_chunks(self):
+        chunks = [LABEL[:7], LABEL[7:], LABEL]
+        messages = [{'type': 'http.request', 'body': c, 'more_body': i < len(chunks) - 1}
+                    for i, c in enumerate(chunks)]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': '/raw/prt-sim-1', 'headers': [(b'apikey', b'test')]}
+        asyncio.run(asgi_app.app(scope, receive, send))
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(json.loads(sent[1]['body'])['bytes'], len(LABEL) * 2)
+        self.assertEqual(wait_for_labels(self.printer, 2), 2)
+
+    def test_client_disconnect_sends_only_complete_formats(self):
+        messages = [{'type': 'http.request', 'body': LABEL + LABEL[:9], 'more_body': True},
+                    {'type': 'http.disconnect'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': '/raw/prt-sim-1', 'headers': [(b'apikey', b'test')]}
+        with mock.patch.object(flask_app.printer_states, 'record_failure') as record_failure:
+            asyncio.run(asgi_app.app(scope, receive, send))
+        self.assertEqual(sent[0]['status'], 400)
+        record_failure.assert_not_called()
+        self.assertEqual(wait_for_labels(self.printer, 1), 1)
+        time.sleep(0.05)
+        self.assertEqual(self.printer.stats.bytes_received, len(LABEL))
+
+    def test_tcp_ingress_routes_port_to_printer(self):
+        ingress = raw_ingress.RawIngress({0: 'prt-sim-1'}, flask_app.PrinterCommunicationMixin().stream_job,
+                                         host='127.0.0.1').start()
+        self.addCleanup(ingress.stop)
+        with socket.create_connection(('127.0.0.1', ingress.ports['prt-sim-1'])) as sock:
+            for _ in range(5):
+                sock.sendall(LABEL)
+        self.assertEqual(wait_for_labels(self.printer, 5), 5)
+        self.assertEqual(self.printer.stats.connections, 1)
+
+
+class TestWholeFormats(unittest.TestCase):
+    def test_holds_partial_format_until_it_ends(self):
+        chunks = [LABEL[:5], LABEL[5:] + LABEL[:3], LABEL[3:] + b'\n']
+        self.assertEqual(list(raw_ingress.whole_formats(chunks)), [LABEL, LABEL, b'\n'])
+
+        def dropped():
+            yield LABEL + LABEL[:9]
+            raise raw_ingress.ClientDisconnected('gone')
+
+        pieces = raw_ingress.whole_formats(dropped())
+        self.assertEqual(next(pieces), LABEL)
+        with self.assertRaises(raw_ingress.ClientDisconnected):
+            next(pieces)
+
+
+class TestParseRoutes(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(raw_ingress.parse_routes('9101=prt-a, 9102=prt-b,'), {9101: 'prt-a', 9102: 'prt-b'})
+        with self.assertRaises(ValueError):
+            raw_ingress.parse_routes('9101')
+
+
+if __name__ == '__main__':
+    unittest.main()
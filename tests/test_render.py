@@ -0,0 +1,105 @@
+import asyncio
+import dataclasses
+import json
+import unittest
+from unittest import mock
+
+import app as flask_app
+import asgi_app
+import render_cache
+from benchmarks.payloads import PAYLOADS, payload
+from labels import LABEL_TYPES, get_label_type
+
+
+class TestRenderCache(unittest.TestCase):
+    def test_equivalent_payloads_share_a_key(self):
+        label = get_label_type('standard')
+        data = payload('standard')
+        padded = dict(data, batch=f"  {data['batch']} ", printer_id='prt-other', warehouse='Incoming')
+        self.assertEqual(render_cache.render_key(label, data), render_cache.render_key(label, padded))
+        self.assertEqual(label.generate(**data), label.generate(**padded))
+        self.assertNotEqual(render_cache.render_key(label, data),
+                            render_cache.render_key(label, dict(data, qty='4001')))
+        self.assertNotEqual(render_cache.render_key(label, data),
+                            render_cache.render_key(get_label_type('msl'), data))
+
+    def test_lru_bounds(self):
+        cache = render_cache.RenderCache(max_entries=2, max_bytes=10)
+        cache.put('a', b'1234')
+        cache.put('b', b'1234')
+        cache.get('a')
+        cache.put('c', b'1234')
+        self.assertEqual((cache.get('a'), cache.get('b')), (b'1234', None))
+        cache.put('d', b'12345678')
+        self.assertEqual(len(cache), 1)
+        cache.put('huge', b'x' * 11)
+        self.assertIsNone(cache.get('huge'))
+
+    def test_etag_matches(self):
+        self.assertTrue(render_cache.etag_matches('"x", W/"abc"', '"abc"'))
+        self.assertTrue(render_cache.etag_matches('*', '"abc"'))
+        self.assertFalse(render_cache.etag_matches('"abcd"', '"abc"'))
+        self.assertFalse(render_cache.etag_matches(None, '"abc"'))
+
+
+class TestRenderEndpoint(unittest.TestCase):
+    def setUp(self):
+        for patcher in (mock.patch.object(flask_app, 'APIKEY', 'test'),
+                        mock.patch.object(flask_app, 'renders', render_cache.RenderCache())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = flask_app.app.test_client()
+        self.headers = {'apikey': 'test'}
+
+    def test_every_label_type_renders_without_a_printer(self):
+        for name in LABEL_TYPES:
+            data = dict(PAYLOADS[name])
+            del data['printer_id']
+            response = self.client.post(f'/render/{name}', json=data, headers=self.headers)
+            self.assertEqual(response.status_code, 200, name)
+            self.assertIn(b'^XA', response.data, name)
+            self.assertEqual(response.headers['X-Render-Cache'], 'miss')
+
+    def test_cache_and_conditional_requests(self):
+        data = payload('msl')
+        first = self.client.post('/render/msl', json=data, headers=self.headers)
+        etag = first.headers['ETag']
+        second = self.client.post('/render/msl', json=dict(data, msl='MSL 3'), headers=self.headers)
+        self.assertEqual((second.headers['ETag'], second.headers['X-Render-Cache']), (etag, 'hit'))
+        self.assertEqual(second.data, first.data)
+
+        generate = mock.Mock(side_effect=AssertionError)
+        with mock.patch.dict(LABEL_TYPES, msl=dataclasses.replace(LABEL_TYPES['msl'], generate=generate)):
+            response = self.client.post('/render/msl', json=data, headers=dict(self.headers, **{'If-None-Match': etag}))
+        self.assertEqual((response.status_code, response.data), (304, b''))
+        self.assertFalse(generate.called)
+
+    def test_errors(self):
+        self.assertEqual(self.client.post('/render/nope', json={}, headers=self.headers).status_code, 404)
+        response = self.client.post('/render/msl', json={'msl': '9'}, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.get_json()['errors'][0].startswith('msl: must be one of'))
+        self.assertEqual(self.client.post('/render/msl', json={'msl': '3'}).status_code, 403)
+
+    def test_asgi_matches_flask(self):
+        data = payload('tracescan')
+        expected = self.client.post('/render/tracescan', json=data, headers=self.headers)
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': json.dumps(data).encode(), 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        async def request(headers):
+            scope = {'type': 'http', 'method': 'POST', 'path': '/render/tracescan',
+                     'headers': [(k.encode(), v.encode()) for k, v in headers.items()]}
+            await asgi_app.app(scope, receive, send)
+            return sent[-2]['status'], dict(sent[-2]['headers']), sent[-1]['body']
+
+        status, headers, body = asyncio.run(request(self.headers))
+        self.assertEqual((status, body), (200, expected.data))
+        self.assertEqual(headers[b'etag'].decode(), expected.headers['ETag'])
+        status, _, body = asyncio.run(request(dict(self.headers, **{'if-none-match': expected.headers['ETag']})))
+        self.assertEqual((status, body), (304, b''))
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import printers
+from shared_state import HostLeader, SharedRegistryFile, printer_lock
+
+
+class TestSharedState(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_single_leader(self):
+        first, second = HostLeader(self.dir), HostLeader(self.dir)
+        self.assertTrue(first.try_acquire())
+        self.assertFalse(second.try_acquire())
+        first.release()
+        self.assertTrue(second.try_acquire())
+        second.release()
+
+    def test_printer_lock_serializes_sends(self):
+        active = []
+        overlaps = []
+
+        def send():
+            with printer_lock(self.dir, 'prt-batch-WE1'):
+                active.append(1)
+                overlaps.append(len(active))
+                time.sleep(0.02)
+                active.pop()
+
+        threads = [threading.Thread(target=send) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(overlaps, [1] * 5)
+
+    def test_printer_lock_timeout(self):
+        with printer_lock(self.dir, 'prt/odd name'):
+            with self.assertRaises(TimeoutError):
+                with printer_lock(self.dir, 'prt/odd name', timeout=0.05):
+                    pass
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'printer-prt_odd_name.lock')))
+
+    def test_registry_file_change_detection(self):
+        writer = SharedRegistryFile(self.dir)
+        reader = SharedRegistryFile(self.dir, check_interval=0)
+        self.assertIsNone(reader.read_if_changed())
+        writer.publish({'p1': {'ip': '10.0.0.1', 'port': 9100}})
+        self.assertEqual(reader.read_if_changed(), {'p1': {'ip': '10.0.0.1', 'port': 9100}})
+        self.assertIsNone(reader.read_if_changed())
+        # Writers do not re-read their own publication
+        self.assertIsNone(writer.read_if_changed(force=True))
+
+    def test_registry_file_from_before_the_start_is_ignored(self):
+        SharedRegistryFile(self.dir).publish({'p1': {'ip': '10.0.0.1', 'port': 9100}})
+        stale = SharedRegistryFile(self.dir, not_before=time.time() + 60)
+        self.assertIsNone(stale.read_if_changed(force=True))
+        fresh = SharedRegistryFile(self.dir, not_before=time.time() - 60)
+        self.assertEqual(fresh.read_if_changed(force=True), {'p1': {'ip': '10.0.0.1', 'port': 9100}})
+
+    def test_only_the_leader_publishes_the_registry(self):
+        leader = HostLeader(self.dir)
+        self.addCleanup(leader.release)
+        path = os.path.join(self.dir, 'printers.json')
+        with mock.patch.object(printers, '_shared_registry', SharedRegistryFile(self.dir)), \
+                mock.patch.object(printers, '_registry_leader', leader):
+            printers._publish({'p1': {'ip': '10.0.0.1', 'port': 9100}})
+            self.assertFalse(os.path.exists(path))
+            self.assertTrue(leader.try_acquire())
+            printers._publish({'p1': {'ip': '10.0.0.1', 'port': 9100}})
+            self.assertTrue(os.path.exists(path))
+
+    def test_any_worker_merges_into_the_published_registry(self):
+        SharedRegistryFile(self.dir).publish({'p1': {'ip': '10.0.0.1', 'port': 9100}})
+        other_worker = SharedRegistryFile(self.dir, check_interval=0)
+        with mock.patch.object(printers, '_shared_registry', SharedRegistryFile(self.dir)), \
+                mock.patch.object(printers, '_registry_leader', HostLeader(self.dir)), \
+                mock.patch.dict(printers.printers, {'stale': {'ip': '10.0.0.9', 'port': 9100}}, clear=True):
+            self.assertEqual(printers.merge_printers({'p2': {'ip': '10.0.0.2', 'port': 9100}}), 1)
+            self.assertEqual(sorted(printers.printers), ['p1', 'p2'])
+            self.assertEqual(printers.merge_printers({'p2': {'ip': '10.0.0.2', 'port': 9100}}), 0)
+        self.assertEqual(sorted(other_worker.read_if_changed()), ['p1', 'p2'])
+
+if __name__ == '__main__':
+    unittest.main()
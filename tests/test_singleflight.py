@@ -0,0 +1,63 @@
+import threading
+import time
+import unittest
+
+from singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_callers_share_one_run(self):
+        flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def work():
+            calls.append(1)
+            release.wait(2)
+            return 'result'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('k', work))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['result'] * 8)
+
+    def test_without_ttl_each_sequential_call_runs(self):
+        flight = SingleFlight()
+        calls = []
+        flight.do('k', lambda: calls.append(1))
+        flight.do('k', lambda: calls.append(1))
+        self.assertEqual(len(calls), 2)
+
+    def test_ttl_reuses_result_until_forgotten(self):
+        flight = SingleFlight()
+        calls = []
+
+        def work():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(flight.do('k', work, ttl=60), 1)
+        self.assertEqual(flight.do('k', work, ttl=60), 1)
+        flight.forget('k')
+        self.assertEqual(flight.do('k', work, ttl=60), 2)
+
+    def test_errors_propagate_and_are_not_cached(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise RuntimeError('boom')
+
+        with self.assertRaises(RuntimeError):
+            flight.do('k', fail, ttl=60)
+        self.assertEqual(flight.do('k', lambda: 'ok', ttl=60), 'ok')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+from text_fit import ARIAL, ARIAL_BOLD, FONT_0, TextBox, text_width, truncate, wrap
+from zpl_generator import generate_zpl, generate_svt_fortlox_label_nok
+
+from benchmarks.payloads import payload
+
+
+class TestMetrics(unittest.TestCase):
+    def test_widths(self):
+        # Helvetica 'i' is 222/1000 em, 'W' 944/1000 em
+        self.assertAlmostEqual(text_width('i', ARIAL, 100), 22.2)
+        self.assertAlmostEqual(text_width('W', ARIAL_BOLD, 100), 94.4)
+        self.assertAlmostEqual(text_width('W', FONT_0, 100), 94.4 * 0.82)
+        # Accented letters measure like their base letter
+        self.assertEqual(text_width('Ärger', FONT_0, 20), text_width('Arger', FONT_0, 20))
+
+    def test_truncate_and_wrap(self):
+        self.assertEqual(truncate('MMMMMMMMMM', ARIAL, 10, 42), 'MMMMM')
+        lines = wrap('one two three four', ARIAL, 10, 45)
+        self.assertEqual(lines, ['one two', 'three four'])
+        self.assertTrue(all(text_width(line, ARIAL, 10) <= 45 for line in lines))
+
+
+class TestTextBox(unittest.TestCase):
+    box = TextBox(170, 40, 20)
+
+    def test_picks_largest_fitting_size(self):
+        self.assertEqual(self.box.fit('Stores').height, 40)
+        fitted = self.box.fit('Zwischenlager')
+        self.assertLess(fitted.height, 40)
+        self.assertGreaterEqual(fitted.height, 20)
+        self.assertLessEqual(text_width('Zwischenlager', FONT_0, fitted.height), 170)
+        self.assertTrue(self.box.fits('Zwischenlager'))
+
+    def test_truncates_below_min_size(self):
+        fitted = self.box.fit('Zwischenlager Halle 2 Regal 7')
+        self.assertEqual(fitted.height, 20)
+        self.assertTrue('Zwischenlager Halle 2 Regal 7'.startswith(fitted.text))
+        self.assertFalse(self.box.fits('Zwischenlager Halle 2 Regal 7'))
+
+    def test_prefix_and_wrapping(self):
+        box = TextBox(100, 20, 10, ARIAL, prefix='FW: ', max_lines=2)
+        self.assertEqual(box.fit('v1.2.3').height, 20)
+        fitted = box.fit('a much longer firmware string than fits')
+        self.assertEqual(fitted.height, 10)
+        self.assertEqual(len(fitted.lines), 2)
+
+
+class TestGenerators(unittest.TestCase):
+    def test_standard_label_fits_warehouse(self):
+        zpl = generate_zpl(**payload('standard', warehouse='Stores', parent_warehouse='Zwischenlager Halle 2'))
+        self.assertIn('^CF0,40^FO280,200^FDStores^FS', zpl)
+        self.assertIn('^FO280,240^FDZwischenlager Halle 2^FS', zpl)
+
+    def test_long_error_message_wraps(self):
+        zpl = generate_svt_fortlox_label_nok(**payload('svt-fortlox-nok', error_message='Frequency Tolerance ' * 6))
+        self.assertIn('^FB582,2,0,L,0', zpl)
+        self.assertIn('\\&', zpl)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import asyncio
+import socket
+import time
+import unittest
+from unittest import mock
+
+import app as flask_app
+import timeouts
+from printer_sim import VirtualPrinterFleet
+
+
+def stalled_listener(test):
+    """Address whose accept backlog is full, so new connects hang in SYN_SENT"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(0)
+    test.addCleanup(server.close)
+    for _ in range(3):
+        filler = socket.socket()
+        filler.setblocking(False)
+        filler.connect_ex(server.getsockname())
+        test.addCleanup(filler.close)
+    time.sleep(0.05)
+    return server.getsockname()
+
+
+class TestLatencyEstimate(unittest.TestCase):
+    def test_uses_ceiling_until_warm(self):
+        estimate = timeouts.LatencyEstimate()
+        for _ in range(timeouts.WARMUP_SAMPLES - 1):
+            estimate.observe(0.001)
+        self.assertEqual(estimate.timeout(0.25, 10), 10)
+        estimate.observe(0.001)
+        self.assertEqual(estimate.timeout(0.25, 10), 0.25)
+
+    def test_slow_link_keeps_a_fitting_timeout(self):
+        estimate = timeouts.LatencyEstimate()
+        for seconds in (0.4, 0.6, 0.5, 0.7, 0.4, 0.6):
+            estimate.observe(seconds)
+        self.assertGreater(estimate.timeout(0.25, 10), 0.7)
+        self.assertLess(estimate.timeout(0.25, 10), 2)
+
+    def test_backoff_after_timeout(self):
+        estimate = timeouts.LatencyEstimate()
+        for _ in range(timeouts.WARMUP_SAMPLES):
+            estimate.observe(0.001)
+        estimate.timed_out()
+        estimate.timed_out()
+        self.assertEqual(estimate.timeout(0.25, 10), 1.0)
+        estimate.observe(0.001)
+        self.assertEqual(estimate.timeout(0.25, 10), 0.25)
+
+    def test_connect_floor_outlasts_a_lost_syn(self):
+        adaptive = timeouts.AdaptiveTimeouts()
+        for _ in range(timeouts.WARMUP_SAMPLES):
+            adaptive.observe('prt-1', timeouts.CONNECT, 0.001, 10)
+        self.assertGreater(adaptive.timeout('prt-1', timeouts.CONNECT, 10), 1.0)
+
+    def test_parse_groups(self):
+        self.assertEqual(timeouts.parse_groups('a, b;c,d,e;'),
+                         {'a': ['b'], 'b': ['a'], 'c': ['d', 'e'], 'd': ['c', 'e'], 'e': ['c', 'd']})
+
+
+class TestHedgedConnect(unittest.TestCase):
+    def setUp(self):
+        self.fleet = VirtualPrinterFleet(count=1).start()
+        self.addCleanup(self.fleet.stop)
+        self.fast = ('127.0.0.1', self.fleet['prt-sim-1'].port)
+        self.slow = stalled_listener(self)
+
+    def test_fast_primary_wins_without_hedge(self):
+        key, sock = timeouts.hedged_connect(('a', self.fast, 1), ('b', self.slow, 1), 0.5)
+        sock.close()
+        self.assertEqual(key, 'a')
+
+    def test_slow_primary_is_hedged(self):
+        started = time.monotonic()
+        key, sock = timeouts.hedged_connect(('a', self.slow, 2), ('b', self.fast, 2), 0.05)
+        sock.close()
+        self.assertEqual(key, 'b')
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_timeout_without_hedge(self):
+        with self.assertRaises(socket.timeout):
+            timeouts.hedged_connect(('a', self.slow, 0.1), None, 0)
+
+    def test_async_slow_primary_is_hedged(self):
+        async def connect():
+            key, _, writer = await timeouts.hedged_open_connection(('a', self.slow, 2), ('b', self.fast, 2), 0.05)
+            writer.close()
+            return key
+
+        self.assertEqual(asyncio.run(connect()), 'b')
+
+
+class TestHedgedJob(unittest.TestCase):
+    def test_job_is_accounted_to_the_printer_that_won(self):
+        fleet = VirtualPrinterFleet(count=1).start()
+        self.addCleanup(fleet.stop)
+        host, port = stalled_listener(self)
+        registry = {'prt-slow': {'ip': host, 'port': port}, **fleet.registry()}
+        patches = [
+            mock.patch.object(flask_app, 'get_printers_snapshot', return_value=registry),
+            mock.patch.object(flask_app, 'hedge_groups', timeouts.parse_groups('prt-slow,prt-sim-1')),
+            mock.patch.object(flask_app, 'adaptive_timeouts', timeouts.AdaptiveTimeouts(hedge_delay=0.05)),
+            mock.patch.object(flask_app, 'history', None),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        events = flask_app.event_bus.subscribe()
+        self.addCleanup(flask_app.event_bus.unsubscribe, events)
+
+        sender = flask_app.PrinterCommunicationMixin()
+        sender.send_job('prt-slow', registry['prt-slow'], 'msl', '^XA^FDhedged^FS^XZ')
+        sent = []
+        while not events.empty():
+            event = events.get_nowait()
+            if event['type'] == 'job' and event['data']['status'] == 'sent':
+                sent.append(event['data'])
+        self.assertEqual(sent[0]['printer_id'], 'prt-sim-1')
+        self.assertEqual(sent[0]['requested_printer_id'], 'prt-slow')
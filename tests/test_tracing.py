@@ -0,0 +1,60 @@
+import unittest
+from unittest import mock
+
+import app as miniprint
+import tracing
+
+
+class TestTracing(unittest.TestCase):
+    def test_phases_recorded_into_current_trace(self):
+        trace = tracing.start_trace()
+        with tracing.phase('render'):
+            pass
+        tracing.annotate(printer_id='p1')
+        self.assertIs(tracing.end_trace(), trace)
+        self.assertEqual([name for name, _ in trace.phases], ['render'])
+        self.assertEqual(trace.annotations, {'printer_id': 'p1'})
+        self.assertRegex(trace.server_timing(), r'^render;dur=\d+\.\d\d, total;dur=\d+\.\d\d$')
+
+    def test_phase_without_trace_is_noop(self):
+        tracing.end_trace()
+        with tracing.phase('render'):
+            pass
+        self.assertIsNone(tracing.current_trace())
+
+    def test_slow_request_log_is_bounded(self):
+        log = tracing.SlowRequestLog(threshold_seconds=0.001, size=2)
+        fast = tracing.RequestTrace()
+        self.assertFalse(log.maybe_record(fast))
+        for i in range(3):
+            trace = tracing.RequestTrace()
+            trace.started -= 1
+            self.assertTrue(log.maybe_record(trace, path=f'/print/{i}'))
+        self.assertEqual([e['path'] for e in log.entries()], ['/print/2', '/print/1'])
+
+
+class TestServerTimingHeader(unittest.TestCase):
+    def setUp(self):
+        self.client = miniprint.app.test_client()
+        self.apikey = mock.patch.object(miniprint, 'APIKEY', 'test')
+        self.apikey.start()
+
+    def tearDown(self):
+        self.apikey.stop()
+
+    def test_print_request_reports_phases(self):
+        with mock.patch.object(miniprint, 'slow_requests', tracing.SlowRequestLog(threshold_seconds=1e-9)):
+            response = self.client.post('/print/dry', json={'printer_id': 'no-such-printer'}, headers={'apikey': 'test'})
+            self.assertEqual(response.status_code, 404)
+            timing = response.headers['Server-Timing']
+            self.assertIn('validate;dur=', timing)
+            self.assertIn('lookup;dur=', timing)
+
+            slow = self.client.get('/debug/slow-requests', headers={'apikey': 'test'}).get_json()
+            entry = next(e for e in slow['requests'] if e['path'] == '/print/dry')
+            self.assertEqual(entry['printer_id'], 'no-such-printer')
+            self.assertIn('validate', entry['phases_ms'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from benchmarks.payloads import payload
+from validation import (STANDARD_VALIDATOR, ValidationError, validate_msl_request, validate_request,
+                        validate_svt_fortlox_request_nok, validate_tracescan_request)
+
+
+class TestCompiledValidation(unittest.TestCase):
+    def test_valid_payload(self):
+        self.assertEqual(validate_request(payload('standard')), [])
+
+    def test_reports_all_errors_in_one_pass(self):
+        data = payload('standard', item_code='X' * 60, qty=5)
+        del data['batch']
+        self.assertEqual(validate_request(data), [
+            'batch',
+            'item_code: too long to fit on the label',
+            'qty: must be a string',
+        ])
+
+    def test_limits_apply_to_printed_form(self):
+        # 'Incoming Goods' is printed as 'Incoming'; other long names are not shortened
+        self.assertEqual(validate_request(payload('standard', warehouse='Incoming Goods')), [])
+        self.assertEqual(validate_request(payload('standard', warehouse='Zwischenlager Halle 2 Regal 7')),
+                         ['warehouse: too long to fit on the label'])
+
+    def test_msl_levels(self):
+        self.assertEqual(validate_msl_request({'printer_id': 'p', 'msl': 'MSL 2A'}), [])
+        self.assertEqual(validate_msl_request({'printer_id': 'p', 'msl': '7'}),
+                         ['msl: must be one of 1, 2, 2A, 3, 4, 5, 5A, 6'])
+
+    def test_serial_pattern_and_optional_none(self):
+        data = payload('tracescan', wo_serial_number='1234-5', giof_description=None, giof_serial=None)
+        self.assertEqual(validate_tracescan_request(data),
+                         ['wo_serial_number: must match format XXXXX-XXXXXXXXXXX'])
+
+    def test_oversized_error_message(self):
+        errors = validate_svt_fortlox_request_nok(payload('svt-fortlox-nok', error_message='Frequency ' * 30))
+        self.assertEqual(errors, ['error_message: too long to fit on the label'])
+
+    def test_non_dict_raises(self):
+        with self.assertRaises(ValidationError):
+            validate_request(['not', 'a', 'dict'])
+
+    def test_validate_many(self):
+        batch = [payload('standard'), payload('standard', user=None), 'garbage']
+        expected = [[], ['user: must be a string'], ['Input data must be a dictionary']]
+        self.assertEqual(STANDARD_VALIDATOR.validate_many(batch), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import base64
+import io
+import re
+import tempfile
+import unittest
+import zlib
+from unittest import mock
+
+import zpl_generator
+import zpl_graphics
+from benchmarks.payloads import payload
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = Image = None
+
+
+def png(image):
+    out = io.BytesIO()
+    image.save(out, 'PNG')
+    return out.getvalue()
+
+
+class TestDecode(unittest.TestCase):
+    def test_compressed_and_z64(self):
+        self.assertEqual(zpl_graphics.decode('^FO0,0^GFA,6,6,2,!:F,^FS'), (2, b'\xff\xff' * 2 + b'\xf0\x00'))
+        raw = bytes(range(12))
+        z64 = ':Z64:' + base64.b64encode(zlib.compress(raw)).decode() + ':1a2b'
+        self.assertEqual(zpl_graphics.decode(f'^GFA,12,12,3,{z64}'), (3, raw))
+        with self.assertRaises(ValueError):
+            zpl_graphics.decode('^XA^XZ')
+
+
+@unittest.skipIf(np is None, 'needs numpy and Pillow')
+class TestConvert(unittest.TestCase):
+    def test_ascii_compression(self):
+        bits = np.zeros((4, 400), dtype=bool)
+        bits[:2] = True
+        bits[2, :200] = True
+        self.assertEqual(zpl_graphics.compress(zpl_graphics.pack(bits)), '!:hPF,,')
+        noise = np.random.default_rng(7).random((50, 123)) < 0.3
+        packed = zpl_graphics.pack(noise)
+        data = zpl_graphics.compress(packed)
+        self.assertEqual(zpl_graphics.decompress(data, packed.shape[1], packed.size), packed.tobytes())
+
+    def test_existing_logos_round_trip(self):
+        zpl = zpl_generator.generate_svt_fortlox_label_ok(**payload('svt-fortlox-ok'))
+        for field in re.findall(r'\^GFA[^\^]*', zpl):
+            bytes_per_row, raw = zpl_graphics.decode(field)
+            data = zpl_graphics.compress(np.frombuffer(raw, dtype=np.uint8).reshape(-1, bytes_per_row))
+            self.assertEqual(zpl_graphics.decompress(data, bytes_per_row, len(raw)), raw)
+            self.assertLessEqual(len(data), len(''.join(field.split(',', 4)[4].split())))
+
+    def test_transparency_scaling_and_dithering(self):
+        image = Image.new('RGBA', (100, 40), (0, 0, 0, 0))
+        image.paste((0, 0, 0, 255), (0, 0, 50, 40))
+        graphic = zpl_graphics.convert(png(image), width=200, cache=None)
+        self.assertEqual((graphic.width, graphic.height, graphic.bytes_per_row), (200, 80, 25))
+        _, raw = zpl_graphics.decode(graphic.command())
+        dots = np.unpackbits(np.frombuffer(raw, dtype=np.uint8).reshape(80, 25), axis=1)
+        self.assertTrue(dots[:, :95].all())
+        self.assertFalse(dots[:, 105:].any())
+
+        gray = png(Image.new('L', (64, 64), 128))
+        for dither in (zpl_graphics.ORDERED, zpl_graphics.FLOYD_STEINBERG):
+            _, raw = zpl_graphics.decode(zpl_graphics.convert(gray, dither=dither, cache=None).command())
+            self.assertAlmostEqual(np.unpackbits(np.frombuffer(raw, dtype=np.uint8)).mean(), 0.5, delta=0.05)
+        with self.assertRaises(ValueError):
+            zpl_graphics.convert(gray, dither='halftone', cache=None)
+        with self.assertRaises(ValueError):
+            zpl_graphics.convert(b'not an image', cache=None)
+
+    def test_disk_cache(self):
+        image = png(Image.new('L', (30, 10), 0))
+        with tempfile.TemporaryDirectory() as directory:
+            first = zpl_graphics.convert(image, cache=zpl_graphics.GraphicCache(directory))
+            with mock.patch.object(zpl_graphics, 'load_gray', side_effect=AssertionError):
+                again = zpl_graphics.convert(image, cache=zpl_graphics.GraphicCache(directory))
+            self.assertEqual(again, first)
+            self.assertNotEqual(zpl_graphics.convert(image, invert=True, cache=None), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
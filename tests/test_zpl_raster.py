@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+import zpl_raster
+from benchmarks.payloads import payload
+from labels import LABEL_TYPES
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# UPDATE_SNAPSHOTS=1 python -m pytest tests/test_zpl_raster.py rewrites them after an intended change
+SNAPSHOTS = os.path.join(os.path.dirname(__file__), 'snapshots')
+
+
+@unittest.skipIf(np is None, 'needs numpy')
+class TestRasterize(unittest.TestCase):
+    def test_boxes_reverse_and_graphics(self):
+        dots = zpl_raster.rasterize('^XA^PW40^LL30^LH2,2^FO0,0^GB20,10,2^FS'
+                                    '^LRY^FO0,0^GB10,10,10^FS^LRN^FO30,20^GFA,2,2,1,F0F0^FS^XZ')
+        self.assertEqual(dots.shape, (30, 40))
+        # The reversed square inverts the box's corner: its edges turn white, the inside black
+        self.assertFalse(dots[2:4, 2:12].any())
+        self.assertTrue(dots[4:10, 4:12].all())
+        self.assertTrue(dots[2:4, 12:22].all())
+        self.assertFalse(dots[4:10, 12:20].any())
+        self.assertTrue(dots[22:24, 32:36].all())
+        self.assertFalse(dots[22:24, 36:40].any())
+
+    def test_field_block_and_rotation(self):
+        text = zpl_raster.draw_text('ABC', '0', 20, 20)
+        self.assertEqual(text.shape[0], 20)
+        block = zpl_raster.rasterize('^XA^FO0,0^A0N,20,20^FB100,2,4,C^FDABC\\&ABC^FS^XZ')
+        offset = (100 - text.shape[1]) // 2
+        self.assertTrue((block[:20, offset:offset + text.shape[1]] == text).all())
+        self.assertTrue((block[24:44, offset:offset + text.shape[1]] == text).all())
+        rotated = zpl_raster.rasterize('^XA^FO0,0^A0B,20,20^FDABC^FS^XZ')
+        self.assertTrue((rotated == np.rot90(text)).all())
+
+    def test_png_round_trip_and_cache(self):
+        zpl = LABEL_TYPES['dry'].generate(**payload('dry'))
+        png = zpl_raster.render_png(zpl)
+        self.assertTrue((zpl_raster.read_png(png) == zpl_raster.rasterize(zpl)).all())
+        self.assertIs(zpl_raster.render_png(zpl), png)
+
+    def test_label_snapshots(self):
+        update = os.environ.get('UPDATE_SNAPSHOTS') == '1'
+        for name, png in zpl_raster.render_label_types().items():
+            with self.subTest(label=name):
+                path = os.path.join(SNAPSHOTS, f'{name}.png')
+                if update:
+                    os.makedirs(SNAPSHOTS, exist_ok=True)
+                    with open(path, 'wb') as f:
+                        f.write(png)
+                    continue
+                with open(path, 'rb') as f:
+                    expected = zpl_raster.read_png(f.read())
+                actual = zpl_raster.read_png(png)
+                if actual.shape != expected.shape or (actual != expected).any():
+                    out = os.path.join(tempfile.gettempdir(), f'{name}.actual.png')
+                    with open(out, 'wb') as f:
+                        f.write(png)
+                    differing = (actual != expected).sum() if actual.shape == expected.shape else 'all'
+                    self.fail(f'{name} differs from its snapshot ({differing} dots), see {out}')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+"""
+Width-aware text fitting for label fields.
+
+Widths come from precomputed per-character advance tables in 1/1000 em:
+Helvetica for the Arial TTF (85620388.TTF), Helvetica-Bold for Arial Bold
+(71028264.TTF). Arial was designed metric-compatible with Helvetica. Zebra font 0
+(CG Triumvirate Bold Condensed) is Helvetica-Bold condensed to about 82 %.
+
+    box = TextBox(width=170, height=40, min_height=20)
+    fitted = box.fit('Zwischenlager')   # Fitted(text='Zwischenlager', height=29)
+"""
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+FONT_0 = '0'
+ARIAL_BOLD = 'E:71028264.TTF'
+ARIAL = 'E:85620388.TTF'
+
+_ASCII = ''.join(chr(c) for c in range(32, 127))
+
+# Advance widths for ' ' .. '~'
+_HELVETICA = dict(zip(_ASCII, [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,   # ' ' .. '/'
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556,                                 # '0' .. '9'
+    278, 278, 584, 584, 584, 556, 1015,                                               # ':' .. '@'
+    667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833,                  # 'A' .. 'M'
+    722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611,                  # 'N' .. 'Z'
+    278, 278, 278, 469, 556, 333,                                                     # '[' .. '`'
+    556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833,                  # 'a' .. 'm'
+    556, 556, 556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500,                  # 'n' .. 'z'
+    334, 260, 334, 584,                                                               # '{' .. '~'
+]))
+_HELVETICA_BOLD = dict(zip(_ASCII, [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556,
+    333, 333, 584, 584, 584, 611, 975,
+    722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833,
+    722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611,
+    333, 278, 333, 584, 556, 333,
+    556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889,
+    611, 611, 611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500,
+    389, 280, 389, 584,
+]))
+# Latin-1 characters that are not an accented form of an ASCII letter
+_HELVETICA.update({'ß': 611, '°': 400, '±': 584, 'µ': 556, '€': 556, '§': 556, '×': 584})
+_HELVETICA_BOLD.update({'ß': 611, '°': 400, '±': 584, 'µ': 611, '€': 556, '§': 556, '×': 584})
+
+# font -> (width table, scale applied to the table)
+FONT_METRICS = {
+    FONT_0: (_HELVETICA_BOLD, 0.82),
+    ARIAL_BOLD: (_HELVETICA_BOLD, 1.0),
+    ARIAL: (_HELVETICA, 1.0),
+}
+
+_DEFAULT_WIDTH = 556
+
+
+def _char_width(char: str, table: Dict[str, int]) -> int:
+    width = table.get(char)
+    if width is None:
+        # Accented letters (ä, é, Ö...) are as wide as their base letter
+        base = unicodedata.normalize('NFD', char)[:1]
+        width = table.get(base, _DEFAULT_WIDTH)
+    return width
+
+
+@lru_cache(maxsize=8192)
+def em_units(text: str, font: str = FONT_0) -> float:
+    """Width of text in 1/1000 of the font height"""
+    table, scale = FONT_METRICS[font]
+    return sum(_char_width(c, table) for c in text) * scale
+
+
+def text_width(text: str, font: str = FONT_0, height: int = 20) -> float:
+    """Printed width of text in dots at the given font height"""
+    return em_units(text, font) * height / 1000
+
+
+def truncate(text: str, font: str, height: int, width: float) -> str:
+    """Longest prefix of text that fits width dots at height"""
+    table, scale = FONT_METRICS[font]
+    limit = width * 1000 / (height * scale)
+    used = 0
+    for i, char in enumerate(text):
+        used += _char_width(char, table)
+        if used > limit:
+            return text[:i].rstrip()
+    return text
+
+
+def wrap(text: str, font: str, height: int, width: float) -> List[str]:
+    """Greedy word wrap; words wider than a whole line are split"""
+    lines: List[str] = []
+    line = ''
+    for word in text.split():
+        candidate = f"{line} {word}" if line else word
+        if text_width(candidate, font, height) <= width:
+            line = candidate
+            continue
+        if line:
+            lines.append(line)
+        while text_width(word, font, height) > width:
+            head = truncate(word, font, height, width) or word[0]
+            lines.append(head)
+            word = word[len(head):]
+        line = word
+    if line:
+        lines.append(line)
+    return lines
+
+
+@dataclass(frozen=True)
+class Fitted:
+    text: str
+    height: int
+    lines: tuple = ()
+
+    def __post_init__(self):
+        if not self.lines:
+            object.__setattr__(self, 'lines', (self.text,))
+
+
+@lru_cache(maxsize=4096)
+def fit(text: str, width: int, height: int, min_height: int, font: str = FONT_0, prefix: str = '',
+        max_lines: int = 1) -> Fitted:
+    """
+    Largest font height in [min_height, height] at which prefix + text fits width dots
+    on one line. Text that does not fit even at min_height is wrapped onto up to
+    max_lines lines at min_height, and whatever is left over is truncated.
+    """
+    prefix_units = em_units(prefix, font)
+    units = prefix_units + em_units(text, font)
+    best = int(width * 1000 / units) if units else height
+    if best >= min_height:
+        return Fitted(text, min(height, best))
+    available = width - prefix_units * min_height / 1000
+    if max_lines > 1:
+        lines = wrap(text, font, min_height, available)[:max_lines]
+        return Fitted(' '.join(lines), min_height, tuple(lines))
+    return Fitted(truncate(text, font, min_height, available), min_height)
+
+
+@dataclass(frozen=True)
+class TextBox:
+    """The space a field has on a label: width in dots, preferred and smallest font height"""
+    width: int
+    height: int
+    min_height: Optional[int] = None
+    font: str = FONT_0
+    prefix: str = ''  # fixed text printed in front of the value, e.g. 'FW: '
+    max_lines: int = 1
+
+    def fit(self, text: str) -> Fitted:
+        return fit(text, self.width, self.height, self.min_height or self.height, self.font, self.prefix,
+                   self.max_lines)
+
+    def fits(self, text: str) -> bool:
+        """True if text can be printed without truncation"""
+        fitted = self.fit(text).text
+        if self.max_lines > 1:
+            # Wrapping collapses runs of whitespace
+            return fitted == ' '.join(text.split())
+        return fitted == text
@@ -0,0 +1,269 @@
+"""
+Per-printer timeouts derived from observed latency, and hedged connects.
+
+Each printer keeps a smoothed latency and mean deviation per phase ('connect', 'send'),
+updated like TCP's retransmission timer (RFC 6298): the timeout is
+srtt + 4 * rttvar, clamped to [floor, ceiling], and doubled after every timeout until
+the next success. A printer on the local LAN that stops answering is given up on after
+CONNECT_FLOOR_SECONDS rather than the full ceiling; a printer behind a slow link keeps a
+timeout that fits it. The connect floor stays above the 1 s initial SYN retransmission
+timeout, so a single lost SYN is retried by the kernel instead of failing the job.
+Until a printer has WARMUP_SAMPLES observations the fixed ceiling applies.
+
+Printers that can stand in for each other (PRINTER_HEDGE_GROUPS) get hedged connects:
+if the connect to the requested printer takes longer than its p99, a second connect
+to a healthy peer is started and whichever completes first takes the job. Nothing is
+sent before a connection has won, so a label is never printed twice.
+"""
+import asyncio
+import errno
+import math
+import os
+import selectors
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+CONNECT = 'connect'
+SEND = 'send'
+# Above the kernel's 1 s initial SYN retransmission (RFC 6298), with room for the round trip
+CONNECT_FLOOR_SECONDS = 1.5
+
+WARMUP_SAMPLES = 5
+# Multiples of the base timeout a printer can back off to after repeated timeouts
+MAX_BACKOFF = 64
+
+PRINTER_TIMEOUT = metrics.gauge('miniprint_printer_timeout_seconds', 'Current adaptive timeout per printer',
+                                ('printer', 'phase'))
+PRINTER_HEDGES = metrics.counter('miniprint_printer_hedged_connects_total',
+                                 'Hedged connects started, by requested printer and winner', ('printer', 'winner'))
+
+Address = Tuple[str, int]
+
+
+class LatencyEstimate:
+    """Smoothed latency and mean deviation of one printer phase"""
+
+    def __init__(self, alpha: float = 1 / 8, beta: float = 1 / 4):
+        self.alpha = alpha
+        self.beta = beta
+        self.srtt = 0.0
+        self.rttvar = 0.0
+        self.samples = 0
+        self.backoff = 1
+
+    def observe(self, seconds: float) -> None:
+        if self.samples == 0:
+            self.srtt, self.rttvar = seconds, seconds / 2
+        else:
+            self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - seconds)
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * seconds
+        self.samples += 1
+        self.backoff = 1
+
+    def timed_out(self) -> None:
+        self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+
+    @property
+    def warm(self) -> bool:
+        return self.samples >= WARMUP_SAMPLES
+
+    def timeout(self, floor: float, ceiling: float) -> float:
+        if not self.warm:
+            return ceiling
+        return min(ceiling, max(floor, self.srtt + 4 * self.rttvar) * self.backoff)
+
+    def p99(self) -> Optional[float]:
+        """Rough 99th percentile, assuming a normal distribution (mean deviation ~ 0.8 sigma)"""
+        if not self.warm:
+            return None
+        return self.srtt + 2.33 * self.rttvar / 0.8
+
+
+class AdaptiveTimeouts:
+    """Latency estimates for every printer and phase, safe to share between threads"""
+
+    def __init__(self, connect_floor: float = CONNECT_FLOOR_SECONDS, send_floor: float = 2.0, enabled: bool = True,
+                 hedge_delay: float = 1.0):
+        self.floors = {CONNECT: connect_floor, SEND: send_floor}
+        self.enabled = enabled
+        # Used as the hedge delay until the requested printer has a p99
+        self.default_hedge_delay = hedge_delay
+        self._estimates: Dict[Tuple[str, str], LatencyEstimate] = {}
+        self._lock = threading.Lock()
+
+    def _estimate(self, printer_id: str, phase: str) -> LatencyEstimate:
+        key = (printer_id, phase)
+        estimate = self._estimates.get(key)
+        if estimate is None:
+            estimate = self._estimates[key] = LatencyEstimate()
+        return estimate
+
+    def timeout(self, printer_id: Optional[str], phase: str, ceiling: float) -> float:
+        if not self.enabled or printer_id is None:
+            return ceiling
+        with self._lock:
+            return self._estimate(printer_id, phase).timeout(self.floors[phase], ceiling)
+
+    def observe(self, printer_id: Optional[str], phase: str, seconds: float, ceiling: float) -> None:
+        if printer_id is None:
+            return
+        with self._lock:
+            estimate = self._estimate(printer_id, phase)
+            estimate.observe(seconds)
+            current = estimate.timeout(self.floors[phase], ceiling)
+        PRINTER_TIMEOUT.labels(printer=printer_id, phase=phase).set(current if self.enabled else ceiling)
+
+    def timed_out(self, printer_id: Optional[str], phase: str) -> None:
+        if printer_id is None:
+            return
+        with self._lock:
+            self._estimate(printer_id, phase).timed_out()
+
+    def hedge_delay(self, printer_id: str) -> float:
+        with self._lock:
+            p99 = self._estimate(printer_id, CONNECT).p99()
+        if p99 is None:
+            return self.default_hedge_delay
+        return max(p99, self.floors[CONNECT] / 4)
+
+    def srtt(self, printer_id: str) -> float:
+        """Smoothed connect latency, infinite for printers without a warm estimate"""
+        with self._lock:
+            estimate = self._estimate(printer_id, CONNECT)
+            return estimate.srtt if estimate.warm else math.inf
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        with self._lock:
+            items = list(self._estimates.items())
+        result: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for (printer_id, phase), e in items:
+            result.setdefault(printer_id, {})[phase] = {
+                'srtt': round(e.srtt, 6), 'rttvar': round(e.rttvar, 6), 'samples': e.samples, 'backoff': e.backoff}
+        return result
+
+
+def parse_groups(spec: str) -> Dict[str, List[str]]:
+    """Parse 'a,b,c;d,e' into {printer_id: [peers...]}"""
+    groups: Dict[str, List[str]] = {}
+    for group in spec.split(';'):
+        members = [m.strip() for m in group.split(',') if m.strip()]
+        for member in members:
+            groups[member] = [m for m in members if m != member]
+    return groups
+
+
+def from_env() -> Tuple[AdaptiveTimeouts, Dict[str, List[str]]]:
+    """AdaptiveTimeouts and hedge groups configured from the environment"""
+    def number(name, default):
+        try:
+            return float(os.getenv(name, default))
+        except ValueError:
+            return default
+
+    timeouts = AdaptiveTimeouts(
+        connect_floor=number('PRINTER_CONNECT_TIMEOUT_MIN_SECONDS', CONNECT_FLOOR_SECONDS),
+        send_floor=number('PRINTER_SEND_TIMEOUT_MIN_SECONDS', 2.0),
+        enabled=os.getenv('PRINTER_ADAPTIVE_TIMEOUTS', 'true').lower() in ('1', 'true', 'yes'),
+        hedge_delay=number('PRINTER_HEDGE_DELAY_SECONDS', 1.0),
+    )
+    return timeouts, parse_groups(os.getenv('PRINTER_HEDGE_GROUPS', ''))
+
+
+def _start_connect(address: Address) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    err = sock.connect_ex(address)
+    if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+        sock.close()
+        raise OSError(err, os.strerror(err))
+    return sock
+
+
+def hedged_connect(primary: Tuple[str, Address, float], hedge: Optional[Tuple[str, Address, float]],
+                   delay: float) -> Tuple[str, socket.socket]:
+    """
+    Connect to primary = (key, address, timeout); if that takes longer than delay, also
+    connect to hedge. Returns (key, blocking socket) of the first connection to complete.
+    Raises socket.timeout, or the primary's error when it fails before a hedge started.
+    """
+    key, address, timeout = primary
+    started = time.monotonic()
+    attempts: Dict[socket.socket, Tuple[str, float]] = {}
+    errors: Dict[str, OSError] = {}
+    selector = selectors.DefaultSelector()
+
+    def start(attempt_key, attempt_address, attempt_timeout):
+        try:
+            sock = _start_connect(attempt_address)
+        except OSError as e:
+            errors[attempt_key] = e
+            return
+        attempts[sock] = (attempt_key, time.monotonic() + attempt_timeout)
+        selector.register(sock, selectors.EVENT_WRITE)
+
+    try:
+        start(key, address, timeout)
+        hedge_at = started + delay if hedge is not None else None
+        while True:
+            if hedge_at is not None and time.monotonic() >= hedge_at:
+                start(*hedge)
+                hedge_at = None
+            if not attempts:
+                raise errors.get(key) or next(iter(errors.values()))
+            wake = min(d for _, d in attempts.values())
+            if hedge_at is not None:
+                wake = min(wake, hedge_at)
+            for selected, _ in selector.select(max(wake - time.monotonic(), 0)):
+                sock = selected.fileobj
+                attempt_key, _ = attempts.pop(sock)
+                selector.unregister(sock)
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err == 0:
+                    sock.setblocking(True)
+                    return attempt_key, sock
+                sock.close()
+                errors[attempt_key] = OSError(err, os.strerror(err))
+            now = time.monotonic()
+            for sock, (attempt_key, attempt_deadline) in list(attempts.items()):
+                if now >= attempt_deadline:
+                    selector.unregister(sock)
+                    sock.close()
+                    del attempts[sock]
+                    errors[attempt_key] = socket.timeout('timed out')
+    finally:
+        for sock in attempts:
+            sock.close()
+        selector.close()
+
+
+async def hedged_open_connection(primary: Tuple[str, Address, float], hedge: Optional[Tuple[str, Address, float]],
+                                 delay: float) -> Tuple[str, asyncio.StreamReader, asyncio.StreamWriter]:
+    """Async counterpart of hedged_connect; returns (key, reader, writer)"""
+    def connect(address, timeout):
+        return asyncio.ensure_future(asyncio.wait_for(asyncio.open_connection(*address), timeout))
+
+    key, address, timeout = primary
+    tasks = {connect(address, timeout): key}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay if hedge is not None else None)
+        if not done:
+            tasks[connect(hedge[1], hedge[2])] = hedge[0]
+        pending = set(tasks)
+        errors: Dict[str, BaseException] = {}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return (tasks.pop(task), *task.result())
+                errors[tasks.pop(task)] = task.exception()
+        raise errors.get(key) or next(iter(errors.values()))
+    finally:
+        for task in tasks:
+            task.cancel()
+            if task.done() and not task.cancelled() and task.exception() is None:
+                # Both completed in the same iteration: close the loser
+                task.result()[1].close()
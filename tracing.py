@@ -0,0 +1,105 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class RequestTrace:
+    """Phase timings and annotations collected while handling one request"""
+
+    __slots__ = ('started', 'phases', 'annotations')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self.annotations: Dict[str, Any] = {}
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        self.phases.append((name, seconds))
+
+    def annotate(self, **values: Any) -> None:
+        self.annotations.update(values)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Render phases as a Server-Timing header value (durations in milliseconds)"""
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.phases]
+        parts.append(f"total;dur={self.elapsed() * 1000:.2f}")
+        return ', '.join(parts)
+
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar('miniprint_trace', default=None)
+
+
+def start_trace() -> RequestTrace:
+    """Begin tracing the request handled by the current thread or task"""
+    trace = RequestTrace()
+    _current.set(trace)
+    return trace
+
+
+def end_trace() -> Optional[RequestTrace]:
+    trace = _current.get()
+    _current.set(None)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+def record_phase(name: str, seconds: float) -> None:
+    """Add an already measured phase to the current trace, if any"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add_phase(name, seconds)
+
+
+def annotate(**values: Any) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.annotate(**values)
+
+
+@contextmanager
+def phase(name: str):
+    """Time the enclosed block as a phase of the current trace"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - started)
+
+
+class SlowRequestLog:
+    """Bounded ring buffer of requests that exceeded a latency threshold"""
+
+    def __init__(self, threshold_seconds: float, size: int = 100):
+        self.threshold_seconds = threshold_seconds
+        self._lock = Lock()
+        self._entries: deque = deque(maxlen=max(1, size))
+
+    def maybe_record(self, trace: RequestTrace, **details: Any) -> bool:
+        """Store the trace if it was slower than the threshold; returns True if stored"""
+        total = trace.elapsed()
+        if self.threshold_seconds <= 0 or total < self.threshold_seconds:
+            return False
+        entry = {
+            'time': time.time(),
+            'total_ms': round(total * 1000, 2),
+            'phases_ms': {name: round(seconds * 1000, 2) for name, seconds in trace.phases},
+        }
+        entry.update(trace.annotations)
+        entry.update(details)
+        with self._lock:
+            self._entries.append(entry)
+        return True
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Slow requests, newest first"""
+        with self._lock:
+            return list(reversed(self._entries))
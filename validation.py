@@ -1,7 +1,15 @@
-from typing import List, Dict, Any
+import re
+from typing import List, Dict, Any, Callable, Iterable, Optional, Sequence, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
+from text_fit import TextBox
+from zpl_generator import (MSL_MOUNTING_TIMES, PARENT_WAREHOUSE_ALIASES, SERIAL_NUMBER_PATTERN, WAREHOUSE_ALIASES,
+                           BATCH_BOX, ITEM_CODE_BOX, STANDARD_LINE_BOX, WAREHOUSE_BOX, PARENT_WAREHOUSE_BOX, QTY_BOX,
+                           DATE_BOX, MSL_BOX, USER_BOX, SPECIAL_INSTRUCTIONS_LINE_BOX, TRACESCAN_SERIAL_BOX,
+                           TRACESCAN_DESCRIPTION_BOX, SVT_ARTICLE_BOX, SVT_FW_BOX, SVT_DATE_BOX, SVT_NOK_ARTICLE_BOX,
+                           SVT_NOK_ERROR_CODE_BOX, SVT_NOK_MESSAGE_BOX, SVT_NOK_SERIAL_BOX)
+
 class ValidationError(Exception):
     """Custom exception for validation errors"""
     pass
@@ -16,6 +24,47 @@ class ValidationRule:
     """Validation rule for a field"""
     name: str
     requirement: FieldRequirement = FieldRequirement.REQUIRED
+    max_length: Optional[int] = None
+    box: Optional[TextBox] = None  # the field's box on the label; the value must fit at its smallest font
+    pattern: Optional[str] = None
+    pattern_hint: Optional[str] = None
+    choices: Optional[Sequence[str]] = None
+    normalize: Optional[Callable[[str], str]] = None  # the generator's rewrite before printing
+
+
+Check = Callable[[Any], Optional[str]]
+
+
+def _compile_rule(rule: ValidationRule) -> Check:
+    """Turn a rule into a single function returning an error reason or None"""
+    max_length = rule.max_length
+    fits = rule.box.fits if rule.box is not None else None
+    match = re.compile(rule.pattern).match if rule.pattern else None
+    pattern_error = f"must match format {rule.pattern_hint or rule.pattern}"
+    choices = frozenset(rule.choices) if rule.choices else None
+    choices_error = f"must be one of {', '.join(rule.choices)}" if rule.choices else ''
+    normalize = rule.normalize
+    optional = rule.requirement == FieldRequirement.OPTIONAL
+
+    def check(value: Any) -> Optional[str]:
+        if value is None and optional:
+            return None
+        if not isinstance(value, str):
+            return "must be a string"
+        if normalize is not None:
+            value = normalize(value)
+        if choices is not None and value not in choices:
+            return choices_error
+        if match is not None and not match(value):
+            return pattern_error
+        if max_length is not None and len(value) > max_length:
+            return f"longer than {max_length} characters"
+        if fits is not None and not fits(value):
+            return "too long to fit on the label"
+        return None
+
+    return check
+
 
 class RequestValidator:
     """Base validator class for all request types"""
@@ -24,6 +73,9 @@ class RequestValidator:
         self.rules = rules
         self._required_fields = [rule.name for rule in rules 
                                if rule.requirement == FieldRequirement.REQUIRED]
+        self._compiled: List[Tuple[str, bool, Check]] = [
+            (rule.name, rule.requirement == FieldRequirement.REQUIRED, _compile_rule(rule)) for rule in rules
+        ]
 
     def validate(self, data: Dict[str, Any]) -> List[str]:
         """
@@ -33,79 +85,143 @@ class RequestValidator:
             data: Dictionary containing the request data
             
         Returns:
-            List of missing required fields
+            All errors in rule order: missing required fields by name, invalid
+            values as "field: reason"
         """
         if not isinstance(data, dict):
             raise ValidationError("Input data must be a dictionary")
-            
-        return [field for field in self._required_fields if field not in data]
 
-# Predefined validators for different request types
+        errors = []
+        for name, required, check in self._compiled:
+            if name not in data:
+                if required:
+                    errors.append(name)
+                continue
+            reason = check(data[name])
+            if reason is not None:
+                errors.append(f"{name}: {reason}")
+        return errors
+
+    def normalize(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """The rule fields of a valid payload, rewritten the way the generator prints them"""
+        normalized = {}
+        for rule in self.rules:
+            if rule.name not in data:
+                continue
+            value = data[rule.name]
+            if rule.normalize is not None and isinstance(value, str):
+                value = rule.normalize(value)
+            normalized[rule.name] = value
+        return normalized
+
+    def validate_many(self, payloads: Iterable[Any]) -> List[List[str]]:
+        """Validate a batch; a non-dict payload yields an error list instead of raising"""
+        validate = self.validate
+        results = []
+        for data in payloads:
+            try:
+                results.append(validate(data))
+            except ValidationError as e:
+                results.append([str(e)])
+        return results
+
+
+def _strip(value: str) -> str:
+    return value.strip()
+
+
+def _warehouse(value: str) -> str:
+    value = value.strip()
+    return WAREHOUSE_ALIASES.get(value, value)
+
+
+def _parent_warehouse(value: str) -> str:
+    value = value.strip()
+    return PARENT_WAREHOUSE_ALIASES.get(value, value)
+
+
+def _msl_level(value: str) -> str:
+    return value.replace('MSL ', '')
+
+
+def _description(value: str) -> str:
+    # Tracescan descriptions are printed upper-case with dashes as spaces
+    return value.strip().replace("-", " ").upper()
+
+
+def _ginv_description(value: str) -> str:
+    return _description(value.replace("GaN Inverter", "GINV"))
+
+# Predefined validators for different request types. Boxes are shared with zpl_generator,
+# which shrinks text down to the box's smallest font; anything longer would be truncated.
 STANDARD_VALIDATOR = RequestValidator([
     ValidationRule("printer_id"),
-    ValidationRule("batch"),
-    ValidationRule("item_code"),
-    ValidationRule("description_line1"),
-    ValidationRule("description_line2"),
-    ValidationRule("manufacturer"),
-    ValidationRule("manufacturer_part_line1"),
-    ValidationRule("manufacturer_part_line2"),
-    ValidationRule("warehouse"),
-    ValidationRule("parent_warehouse"),
-    ValidationRule("msl"),
-    ValidationRule("qty"),
-    ValidationRule("date"),
-    ValidationRule("user"),
+    ValidationRule("batch", box=BATCH_BOX, normalize=_strip),
+    ValidationRule("item_code", box=ITEM_CODE_BOX, normalize=_strip),
+    ValidationRule("description_line1", box=STANDARD_LINE_BOX, normalize=_strip),
+    ValidationRule("description_line2", box=STANDARD_LINE_BOX, normalize=_strip),
+    ValidationRule("manufacturer", box=STANDARD_LINE_BOX, normalize=_strip),
+    ValidationRule("manufacturer_part_line1", box=STANDARD_LINE_BOX, normalize=_strip),
+    ValidationRule("manufacturer_part_line2", box=STANDARD_LINE_BOX, normalize=_strip),
+    ValidationRule("warehouse", box=WAREHOUSE_BOX, normalize=_warehouse),
+    ValidationRule("parent_warehouse", box=PARENT_WAREHOUSE_BOX, normalize=_parent_warehouse),
+    ValidationRule("msl", box=MSL_BOX, normalize=_strip),
+    ValidationRule("qty", box=QTY_BOX),
+    ValidationRule("date", box=DATE_BOX),
+    ValidationRule("user", box=USER_BOX, normalize=_strip),
 ])
 
 MSL_VALIDATOR = RequestValidator([
     ValidationRule("printer_id"),
-    ValidationRule("msl"),
+    ValidationRule("msl", choices=list(MSL_MOUNTING_TIMES), normalize=_msl_level),
 ])
 
 SPECIAL_INSTRUCTIONS_VALIDATOR = RequestValidator([
     ValidationRule("printer_id")] + 
-    [ValidationRule(f"line_{i}") for i in range(1, 13)]
+    [ValidationRule(f"line_{i}", box=SPECIAL_INSTRUCTIONS_LINE_BOX) for i in range(1, 13)]
 )
 
 DRY_VALIDATOR = RequestValidator([
     ValidationRule("printer_id"),
 ])
 
+# The title "Assembly CND<std> (HW <hw>, SW <sw>)" shares one 559 dot line
 TRACESCAN_VALIDATOR = RequestValidator([
     ValidationRule("printer_id"),
-    ValidationRule("hw_version"),
-    ValidationRule("sw_version"),
-    ValidationRule("standard_indicator"),
-    ValidationRule("wo_serial_number"),
-    ValidationRule("ginv_description"),
-    ValidationRule("ginv_serial"),
-    ValidationRule("ioca_description"),
-    ValidationRule("ioca_serial"),
-    ValidationRule("mcua_description"),
-    ValidationRule("mcua_serial"),
-    ValidationRule("lcda_description"),
-    ValidationRule("lcda_serial"),
-    ValidationRule("giof_description", FieldRequirement.OPTIONAL),
-    ValidationRule("giof_serial", FieldRequirement.OPTIONAL),
+    ValidationRule("hw_version", max_length=8),
+    ValidationRule("sw_version", max_length=8),
+    ValidationRule("standard_indicator", max_length=4),
+    ValidationRule("wo_serial_number", pattern=SERIAL_NUMBER_PATTERN, pattern_hint="XXXXX-XXXXXXXXXXX"),
+    ValidationRule("ginv_description", box=TRACESCAN_DESCRIPTION_BOX, normalize=_ginv_description),
+    ValidationRule("ginv_serial", box=TRACESCAN_SERIAL_BOX),
+    ValidationRule("ioca_description", box=TRACESCAN_DESCRIPTION_BOX, normalize=_description),
+    ValidationRule("ioca_serial", box=TRACESCAN_SERIAL_BOX),
+    ValidationRule("mcua_description", box=TRACESCAN_DESCRIPTION_BOX, normalize=_description),
+    ValidationRule("mcua_serial", box=TRACESCAN_SERIAL_BOX),
+    ValidationRule("lcda_description", box=TRACESCAN_DESCRIPTION_BOX, normalize=_description),
+    ValidationRule("lcda_serial", box=TRACESCAN_SERIAL_BOX),
+    ValidationRule("giof_description", FieldRequirement.OPTIONAL, box=TRACESCAN_DESCRIPTION_BOX,
+                   normalize=_description),
+    ValidationRule("giof_serial", FieldRequirement.OPTIONAL, box=TRACESCAN_SERIAL_BOX),
 ])
 
 SVT_FORTLOX_OK_VALIDATOR = RequestValidator([
     ValidationRule("printer_id"),
-    ValidationRule("sv_article_no"),
-    ValidationRule("serial_no"),
-    ValidationRule("fw_version"),
-    ValidationRule("run_date"),
+    ValidationRule("sv_article_no", box=SVT_ARTICLE_BOX),
+    ValidationRule("serial_no", max_length=64),
+    ValidationRule("fw_version", box=SVT_FW_BOX),
+    ValidationRule("run_date", box=SVT_DATE_BOX),
 ])
 
+# Error date and time share the line right of "Date (Time):"; 2 x 20 characters fit its 432 dots
 SVT_FORTLOX_NOK_VALIDATOR = RequestValidator([
     ValidationRule("printer_id"),
-    ValidationRule("sv_article_no"),
-    ValidationRule("error_code"),
-    ValidationRule("error_date"),
-    ValidationRule("error_time"),
-    ValidationRule("error_message"),
-    ValidationRule("serial_no"),
+    ValidationRule("sv_article_no", box=SVT_NOK_ARTICLE_BOX),
+    ValidationRule("error_code", box=SVT_NOK_ERROR_CODE_BOX),
+    ValidationRule("error_date", max_length=20),
+    ValidationRule("error_time", max_length=20),
+    ValidationRule("error_message", box=SVT_NOK_MESSAGE_BOX),
+    ValidationRule("serial_no", box=SVT_NOK_SERIAL_BOX),
 ])
 
 
@@ -141,4 +257,4 @@ def validate_svt_fortlox_request_ok(data: Dict[str, Any]) -> List[str]:
 
 def validate_svt_fortlox_request_nok(data: Dict[str, Any]) -> List[str]:
     """Validate SVT Fortlox NOK print request"""
-    return SVT_FORTLOX_NOK_VALIDATOR.validate(data)
\ No newline at end of file
+    return SVT_FORTLOX_NOK_VALIDATOR.validate(data)
@@ -0,0 +1,11 @@
+"""
+WSGI entry point for running miniprint under a pre-fork server.
+
+    MINIPRINT_SHARED_DIR=/run/miniprint gunicorn -c gunicorn.conf.py wsgi:app
+
+With MINIPRINT_SHARED_DIR set, all workers on the host share one printer registry file,
+serialize sends per printer with file locks, and elect a single leader that runs the
+ERP auto-refresh and printer monitor. Servers other than gunicorn must call
+start_background_workers() once in every worker after it has been forked.
+"""
+from app import app, start_background_workers  # noqa: F401
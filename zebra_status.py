@@ -0,0 +1,172 @@
+import asyncio
+import socket
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Optional
+
+STX = b'\x02'
+ETX = b'\x03'
+
+# Host status query; the printer answers with three <STX>...<ETX> framed strings
+HOST_STATUS_QUERY = b'~HS'
+# Labels printed over the printer's lifetime (SGD odometer); answered as a quoted number
+LABEL_COUNTER_QUERY = b'! U1 getvar "odometer.total_label_count"\r\n'
+
+
+@dataclass
+class HostStatus:
+    """Fields of interest from a Zebra ~HS (host status) response"""
+    paper_out: bool = False
+    paused: bool = False
+    formats_in_buffer: int = 0
+    buffer_full: bool = False
+    partial_format: bool = False
+    head_up: bool = False
+    ribbon_out: bool = False
+    labels_remaining: int = 0
+
+    @property
+    def state(self) -> str:
+        """Collapse the flags into the single state reported to clients"""
+        if self.paper_out:
+            return 'paper_out'
+        if self.head_up:
+            return 'head_open'
+        if self.ribbon_out:
+            return 'ribbon_out'
+        if self.paused:
+            return 'paused'
+        return 'online'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _split_frames(data: bytes) -> List[List[str]]:
+    """Return the comma separated fields of each <STX>...<ETX> frame"""
+    frames = []
+    for chunk in data.split(STX)[1:]:
+        body = chunk.split(ETX, 1)[0]
+        frames.append(body.decode('ascii', errors='replace').split(','))
+    return frames
+
+
+def _flag(fields: List[str], index: int) -> bool:
+    return len(fields) > index and fields[index].strip() == '1'
+
+
+def _number(fields: List[str], index: int) -> int:
+    try:
+        return int(fields[index])
+    except (IndexError, ValueError):
+        return 0
+
+
+def parse_host_status(data: bytes) -> Optional[HostStatus]:
+    """
+    Parse a ~HS response.
+
+    String 1: aaa,b,c,dddd,eee,f,g,h,iii,j,k,l
+        b = paper out, c = pause, eee = formats in receive buffer, f = buffer full, h = partial format
+    String 2: mmm,n,o,p,q,r,s,t,uuuuuuuu,v,www
+        o = head up, p = ribbon out, uuuuuuuu = labels remaining in batch
+
+    Returns:
+        HostStatus, or None if the response does not contain the first two strings.
+    """
+    frames = _split_frames(data)
+    if len(frames) < 2:
+        return None
+    first, second = frames[0], frames[1]
+    return HostStatus(
+        paper_out=_flag(first, 1),
+        paused=_flag(first, 2),
+        formats_in_buffer=_number(first, 4),
+        buffer_full=_flag(first, 5),
+        partial_format=_flag(first, 7),
+        head_up=_flag(second, 2),
+        ribbon_out=_flag(second, 3),
+        labels_remaining=_number(second, 8),
+    )
+
+
+def read_host_status(sock: socket.socket) -> Optional[HostStatus]:
+    """Send ~HS on an open printer connection and read the reply (uses the socket's timeout)"""
+    sock.sendall(HOST_STATUS_QUERY)
+    data = b''
+    try:
+        while data.count(ETX) < 3:
+            chunk = sock.recv(1024)
+            if not chunk:
+                break
+            data += chunk
+    except socket.timeout:
+        pass
+    return parse_host_status(data)
+
+
+def parse_label_counter(data: bytes) -> Optional[int]:
+    """The count in a getvar reply ("1234"), or None for "?" (not supported) or a partial reply"""
+    parts = data.split(b'"')
+    if len(parts) < 3:
+        return None
+    try:
+        return int(parts[1])
+    except ValueError:
+        return None
+
+
+def read_label_counter(sock: socket.socket) -> Optional[int]:
+    """Ask an open printer connection for its label odometer (uses the socket's timeout)"""
+    sock.sendall(LABEL_COUNTER_QUERY)
+    data = b''
+    try:
+        while data.count(b'"') < 2:
+            chunk = sock.recv(256)
+            if not chunk:
+                break
+            data += chunk
+    except socket.timeout:
+        pass
+    return parse_label_counter(data)
+
+
+async def _query_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, query: bytes,
+                       complete: Callable[[bytes], bool], timeout: float) -> bytes:
+    writer.write(query)
+    await writer.drain()
+    data = b''
+    try:
+        while not complete(data):
+            chunk = await asyncio.wait_for(reader.read(1024), timeout)
+            if not chunk:
+                break
+            data += chunk
+    except asyncio.TimeoutError:
+        pass
+    return data
+
+
+async def read_host_status_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                 timeout: float) -> Optional[HostStatus]:
+    """Async counterpart of read_host_status, waiting up to timeout for each part of the reply"""
+    return parse_host_status(await _query_async(reader, writer, HOST_STATUS_QUERY, lambda d: d.count(ETX) >= 3,
+                                                timeout))
+
+
+async def read_label_counter_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                   timeout: float) -> Optional[int]:
+    """Async counterpart of read_label_counter"""
+    return parse_label_counter(await _query_async(reader, writer, LABEL_COUNTER_QUERY, lambda d: d.count(b'"') >= 2,
+                                                  timeout))
+
+
+def query_host_status(printer_ip: str, printer_port: int, timeout: float = 5) -> Optional[HostStatus]:
+    """
+    Connect to a printer and ask for its host status.
+
+    Returns:
+        HostStatus, or None if the printer accepted the connection but did not answer ~HS.
+        Connection errors are raised to the caller.
+    """
+    with socket.create_connection((printer_ip, printer_port), timeout=timeout) as sock:
+        return read_host_status(sock)
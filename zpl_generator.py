@@ -1,5 +1,63 @@
 import re
 
+from text_fit import ARIAL_BOLD, TextBox
+
+# Long warehouse names printed in a shorter form on the standard label
+WAREHOUSE_ALIASES = {
+    'Incoming Goods': 'Incoming',
+}
+PARENT_WAREHOUSE_ALIASES = {
+    'All Warehouses': 'All WH',
+    'Kommissioniert-RO': 'Kommissioniert',
+    'Kommissioniert-DE': 'Kommissioniert',
+}
+
+# MSL level -> floor life after opening the bag, printed on the MSL sticker
+MSL_MOUNTING_TIMES = {
+    '1': 'Unlimited',
+    '2': '1 year',
+    '2A': '4 weeks',
+    '3': '168 hours (7 days)',
+    '4': '72 hours (3 days)',
+    '5': '48 hours (2 days)',
+    '5A': '24 hours (1 day)',
+    '6': 'Bake before use',
+}
+
+# Work order serial numbers on the Tracescan label: 5 digits-11 digits
+SERIAL_NUMBER_PATTERN = r'^\d{5}-\d{11}$'
+
+# Boxes of the variable text fields: width in dots up to the next element or the edge of
+# the label, the preferred font height and the smallest one before text is truncated.
+BATCH_BOX = TextBox(260, 60, 30)
+ITEM_CODE_BOX = TextBox(260, 40, 24)
+STANDARD_LINE_BOX = TextBox(260, 20, 16)      # description and manufacturer lines
+WAREHOUSE_BOX = TextBox(170, 40, 20)
+PARENT_WAREHOUSE_BOX = TextBox(170, 30, 16)
+QTY_BOX = TextBox(65, 20, 14)
+DATE_BOX = TextBox(115, 20, 14)
+MSL_BOX = TextBox(115, 30, prefix='MSL ')     # framed, below the warehouse names
+USER_BOX = TextBox(240, 20, 14)
+SPECIAL_INSTRUCTIONS_LINE_BOX = TextBox(360, 25, 18)
+TRACESCAN_TITLE_BOX = TextBox(559, 30, 20)
+TRACESCAN_SERIAL_BOX = TextBox(150, 20, 14)
+TRACESCAN_DESCRIPTION_BOX = TextBox(284, 20, 14)
+# SVT media at 12 dots/mm (300 dpi): the OK label is 60x30 mm, the NOK label 51x25 mm.
+# Fields at the right of a label run from their ^FO x to its edge; the rotated FW and
+# date fields on the OK label run from their ^FO y to its bottom.
+SVT_OK_LABEL_WIDTH, SVT_OK_LABEL_HEIGHT = 60 * 12, 30 * 12
+SVT_NOK_LABEL_WIDTH = 51 * 12
+SVT_ARTICLE_BOX = TextBox(SVT_OK_LABEL_WIDTH - 30, 30, 20, ARIAL_BOLD)
+SVT_FW_BOX = TextBox(SVT_OK_LABEL_HEIGHT - 120, 26, 18, ARIAL_BOLD, prefix='FW: ')
+SVT_DATE_BOX = TextBox(SVT_OK_LABEL_HEIGHT - 120, 26, 18, ARIAL_BOLD, prefix='DATE: ')
+SVT_NOK_ARTICLE_BOX = TextBox(SVT_NOK_LABEL_WIDTH - 30, 21, 16, ARIAL_BOLD)
+SVT_NOK_ERROR_CODE_BOX = TextBox(SVT_NOK_LABEL_WIDTH - 180, 21, 16, ARIAL_BOLD)
+SVT_NOK_DATE_BOX = TextBox(SVT_NOK_LABEL_WIDTH - 180, 21, 16, ARIAL_BOLD)
+# Two lines of 14 dots still end above the serial number 30 dots further down
+SVT_NOK_MESSAGE_BOX = TextBox(SVT_NOK_LABEL_WIDTH - 30, 21, 14, ARIAL_BOLD, max_lines=2)
+SVT_NOK_SERIAL_BOX = TextBox(SVT_NOK_LABEL_WIDTH - 130, 21, 16, ARIAL_BOLD)
+
+
 def strip_or_empty(value: str) -> str:
     """Return stripped value or empty string if None.
     
@@ -71,29 +129,17 @@ def generate_zpl(
     else:
         box = "^FO280,280^GB110,68,5,B,0^FS"
     
-    # Shorten warehouse name for Incoming Goods
-    if warehouse == 'Incoming Goods':
-        warehouse = 'Incoming'
-
-    # Shorten parent warehouse name for All Warehouses and Kommissioniert
-    if parent_warehouse == 'All Warehouses':
-        parent_warehouse = 'All WH'
-    elif (parent_warehouse == 'Kommissioniert-RO' or parent_warehouse == 'Kommissioniert-DE'):
-        parent_warehouse = 'Kommissioniert'
-    
-    # Check if warehouse is long and adjust the font size accordingly
-    if len(warehouse) > 7:
-        warehouse = f"^CF0,30^FO280,200^FD{warehouse}^FS"
-        parent_warehouse_yposition = '230'
-    else:
-        warehouse = f"^CF0,40^FO280,200^FD{warehouse}^FS"
-        parent_warehouse_yposition = '240'
+    # Shorten warehouse names like Incoming Goods, All Warehouses and Kommissioniert
+    warehouse = WAREHOUSE_ALIASES.get(warehouse, warehouse)
+    parent_warehouse = PARENT_WAREHOUSE_ALIASES.get(parent_warehouse, parent_warehouse)
     
-    # Check if parent warehouse is long and adjust the font size accordingly
-    if len(parent_warehouse) > 9:
-        parent_warehouse = f"^CF0,20^FO280,{parent_warehouse_yposition}^FD{parent_warehouse}^FS"
-    else:
-        parent_warehouse = f"^CF0,30^FO280,{parent_warehouse_yposition}^FD{parent_warehouse}^FS"
+    # Use the largest font at which the warehouse names fit the column; the parent warehouse goes below
+    warehouse_fit = WAREHOUSE_BOX.fit(warehouse)
+    parent_warehouse_fit = PARENT_WAREHOUSE_BOX.fit(parent_warehouse)
+    warehouse = f"^CF0,{warehouse_fit.height}^FO280,200^FD{warehouse_fit.text}^FS"
+    parent_warehouse_yposition = 200 + warehouse_fit.height
+    parent_warehouse = (f"^CF0,{parent_warehouse_fit.height}^FO280,{parent_warehouse_yposition}"
+                        f"^FD{parent_warehouse_fit.text}^FS")
     
     # If manufacturer and manufacturer part number are empty, print as "None" instead of "empty"
     if manufacturer == '' and manufacturer_part_line1 == '' and manufacturer_part_line2 == '':
@@ -101,6 +147,17 @@ def generate_zpl(
         manufacturer_part_line1 = '' # Leave empty to avoid printing "None" multiple times (will look redundant)
         manufacturer_part_line2 = '' # Leave empty to avoid printing "None" multiple times (will look redundant)
 
+    # Shrink, then truncate, text that would run into the neighbouring field
+    batch_fit = BATCH_BOX.fit(batch)
+    item_code_fit = ITEM_CODE_BOX.fit(item_code)
+    description_line1, description_line2, manufacturer, manufacturer_part_line1, manufacturer_part_line2 = (
+        STANDARD_LINE_BOX.fit(line) for line in (description_line1, description_line2, manufacturer,
+                                                 manufacturer_part_line1, manufacturer_part_line2))
+    qty_fit = QTY_BOX.fit(str(qty))
+    date_fit = DATE_BOX.fit(str(date))
+    user_fit = USER_BOX.fit(user)
+    msl_fit = MSL_BOX.fit(msl)
+
     # Return the ZPL command
     return f"""
     ^XA
@@ -112,50 +169,53 @@ def generate_zpl(
 
     ^CF0,20
     ^FO20,20^FDBatch^FS
-    ^CF0,60
-    ^FO20,45^FD{batch}^FS
+    ^CF0,{batch_fit.height}
+    ^FO20,45^FD{batch_fit.text}^FS
 
     ^CF0,20
     ^FO20,105^FDItem Code^FS
-    ^CF0,40
-    ^FO20,130^FD{item_code}^FS
+    ^CF0,{item_code_fit.height}
+    ^FO20,130^FD{item_code_fit.text}^FS
 
     ^CF0,20
     ^FO20,175^FDDescription^FS
-    ^CF0,20
-    ^FO20,200^FD{description_line1}^FS
-    ^FO20,220^FD{description_line2}^FS
+    ^CF0,{description_line1.height}
+    ^FO20,200^FD{description_line1.text}^FS
+    ^CF0,{description_line2.height}
+    ^FO20,220^FD{description_line2.text}^FS
 
     ^CF0,20
     ^FO20,250^FDManufacturer^FS
-    ^CF0,20
-    ^FO20,275^FD{manufacturer}^FS
-    ^FO20,295^FD{manufacturer_part_line1}^FS
-    ^FO20,315^FD{manufacturer_part_line2}^FS
+    ^CF0,{manufacturer.height}
+    ^FO20,275^FD{manufacturer.text}^FS
+    ^CF0,{manufacturer_part_line1.height}
+    ^FO20,295^FD{manufacturer_part_line1.text}^FS
+    ^CF0,{manufacturer_part_line2.height}
+    ^FO20,315^FD{manufacturer_part_line2.text}^FS
 
     ^CF0,20
     ^FO280,175^FDIncoming^FS
     {warehouse}
     {parent_warehouse}
 
-    ^CF0,30
+    ^CF0,{msl_fit.height}
     {box}
-    ^FO295,300^FDMSL {msl}^FS
+    ^FO295,300^FDMSL {msl_fit.text}^FS
 
     ^CF0,20
     ^FO20,370^FDQty^FS
-    ^CF0,20
-    ^FO20,395^FD{qty}^FS
+    ^CF0,{qty_fit.height}
+    ^FO20,395^FD{qty_fit.text}^FS
 
     ^CF0,20
     ^FO90,370^FDDate^FS
-    ^CF0,20
-    ^FO90,395^FD{date}^FS
+    ^CF0,{date_fit.height}
+    ^FO90,395^FD{date_fit.text}^FS
 
     ^CF0,20
     ^FO210,370^FDUser^FS
-    ^CF0,20
-    ^FO210,395^FD{user}^FS
+    ^CF0,{user_fit.height}
+    ^FO210,395^FD{user_fit.text}^FS
 
     ^XZ
     """
@@ -181,22 +241,7 @@ def generate_msl_sticker(
     msl = msl.replace('MSL ', '')
 
     # Update the mounting time based on the MSL level
-    if msl == '1':
-        mounting_time = 'Unlimited'
-    elif msl == '2':
-        mounting_time = '1 year'
-    elif msl == '2A':
-        mounting_time = '4 weeks'
-    elif msl == '3':
-        mounting_time = '168 hours (7 days)'
-    elif msl == '4':
-        mounting_time = '72 hours (3 days)'
-    elif msl == '5':
-        mounting_time = '48 hours (2 days)'
-    elif msl == '5A':
-        mounting_time = '24 hours (1 day)'
-    elif msl == '6':
-        mounting_time = 'Bake before use'
+    mounting_time = MSL_MOUNTING_TIMES[msl]
 
     # Check if msl is a single digit or double digit and adjust the position accordingly
     if len(msl) == 2:
@@ -295,6 +340,13 @@ def generate_special_instructions_label(
         str: The ZPL command for printing the special instructions label.
     """
 
+    # One 25 dot row per line; long lines are printed smaller, then truncated at the box
+    lines = (line_1, line_2, line_3, line_4, line_5, line_6, line_7, line_8, line_9, line_10, line_11, line_12)
+    instructions = "\n    ".join(
+        f"^CF0,{fitted.height}^FO25,{90 + 25 * row}^FD{fitted.text}^FS"
+        for row, fitted in enumerate(SPECIAL_INSTRUCTIONS_LINE_BOX.fit(line) for line in lines)
+    )
+
     return f"""
     ^XA
     ^CI28
@@ -307,18 +359,7 @@ def generate_special_instructions_label(
     ^FO23,25^FDSpecial Instructions^FS
 
     ^FX Special Instructions Text
-    ^CF0,25^FO25,90^FD{line_1}^FS
-    ^CF0,25^FO25,115^FD{line_2}^FS
-    ^CF0,25^FO25,140^FD{line_3}^FS
-    ^CF0,25^FO25,165^FD{line_4}^FS
-    ^CF0,25^FO25,190^FD{line_5}^FS
-    ^CF0,25^FO25,215^FD{line_6}^FS
-    ^CF0,25^FO25,240^FD{line_7}^FS
-    ^CF0,25^FO25,265^FD{line_8}^FS
-    ^CF0,25^FO25,290^FD{line_9}^FS
-    ^CF0,25^FO25,315^FD{line_10}^FS
-    ^CF0,25^FO25,340^FD{line_11}^FS
-    ^CF0,25^FO25,365^FD{line_12}^FS
+    {instructions}
 
     ^FX Black Box Negative for Cell
     ^LRY
@@ -388,7 +429,7 @@ def validate_serial_number(serial: str) -> bool:
         bool: True if the serial number is valid, False otherwise.
     """
     # Check format matches pattern: 5 digits-11 digits
-    if not re.match(r'^\d{5}-\d{11}$', serial):
+    if not re.match(SERIAL_NUMBER_PATTERN, serial):
         raise ValueError("Serial number must be in format: XXXXX-XXXXXXXXXXX")
     
     # Code128 has practical length limits for reliable scanning
@@ -458,6 +499,13 @@ def generate_tracescan_label(
         giof_description = ""
         giof_serial = ""
 
+    title = TRACESCAN_TITLE_BOX.fit(f"Assembly CND{standard_indicator} (HW {hw_version}, SW {sw_version})")
+    ginv_serial, mcua_serial, ioca_serial, lcda_serial, giof_serial = (
+        TRACESCAN_SERIAL_BOX.fit(serial) for serial in (ginv_serial, mcua_serial, ioca_serial, lcda_serial, giof_serial))
+    ginv_description, mcua_description, ioca_description, lcda_description, giof_description = (
+        TRACESCAN_DESCRIPTION_BOX.fit(description) for description in
+        (ginv_description, mcua_description, ioca_description, lcda_description, giof_description))
+
     return f"""
     ^XA
     ^CI28
@@ -467,8 +515,8 @@ def generate_tracescan_label(
     ^LH0,0
 
     ^FX ===== Title / Item Description =====
-    ^A0N,30,30
-    ^FO0,20^FB559,1,0,C,0^FDAssembly CND{standard_indicator} (HW {hw_version}, SW {sw_version})\&^FS
+    ^A0N,{title.height},{title.height}
+    ^FO0,20^FB559,1,0,C,0^FD{title.text}\\&^FS
 
     ^FX ===== Barcode (Code128) =====
     ^BY2,3,10
@@ -480,34 +528,34 @@ def generate_tracescan_label(
     ^FX Serial column X=120, Description column X=275
 
     ^FX Row 1 (GINV details)
-    ^A0N,20,20
-    ^FO120,165^FD{ginv_serial}^FS
-    ^A0N,20,20
-    ^FO275,165^FD{ginv_description}^FS
+    ^A0N,{ginv_serial.height},{ginv_serial.height}
+    ^FO120,165^FD{ginv_serial.text}^FS
+    ^A0N,{ginv_description.height},{ginv_description.height}
+    ^FO275,165^FD{ginv_description.text}^FS
 
     ^FX Row 2 (MCUA details)
-    ^A0N,20,20
-    ^FO120,185^FD{mcua_serial}^FS
-    ^A0N,20,20
-    ^FO275,185^FD{mcua_description}^FS
+    ^A0N,{mcua_serial.height},{mcua_serial.height}
+    ^FO120,185^FD{mcua_serial.text}^FS
+    ^A0N,{mcua_description.height},{mcua_description.height}
+    ^FO275,185^FD{mcua_description.text}^FS
 
     ^FX Row 3 (IOCA details)
-    ^A0N,20,20
-    ^FO120,205^FD{ioca_serial}^FS
-    ^A0N,20,20
-    ^FO275,205^FD{ioca_description}^FS
+    ^A0N,{ioca_serial.height},{ioca_serial.height}
+    ^FO120,205^FD{ioca_serial.text}^FS
+    ^A0N,{ioca_description.height},{ioca_description.height}
+    ^FO275,205^FD{ioca_description.text}^FS
 
     ^FX Row 4 (LCDA details)
-    ^A0N,20,20
-    ^FO120,225^FD{lcda_serial}^FS
-    ^A0N,20,20
-    ^FO275,225^FD{lcda_description}^FS
+    ^A0N,{lcda_serial.height},{lcda_serial.height}
+    ^FO120,225^FD{lcda_serial.text}^FS
+    ^A0N,{lcda_description.height},{lcda_description.height}
+    ^FO275,225^FD{lcda_description.text}^FS
 
     ^FX Row 5 (GIOF details)
-    ^A0N,20,20
-    ^FO120,245^FD{giof_serial}^FS
-    ^A0N,20,20
-    ^FO275,245^FD{giof_description}^FS
+    ^A0N,{giof_serial.height},{giof_serial.height}
+    ^FO120,245^FD{giof_serial.text}^FS
+    ^A0N,{giof_description.height},{giof_description.height}
+    ^FO275,245^FD{giof_description.text}^FS
 
     ^XZ
     """
@@ -540,14 +588,19 @@ def generate_svt_fortlox_label_ok(
     phii = "PHII"
     datamatrix_data = f"{sv_article_no}|{phib}|{serial_no}|{fw_version}|{phia}|||{phii}|||"
 
+    # The DataMatrix keeps the full values; the printed text is fitted to its box
+    article = SVT_ARTICLE_BOX.fit(sv_article_no)
+    fw = SVT_FW_BOX.fit(fw_version)
+    date = SVT_DATE_BOX.fit(run_date)
+
     return f"""
     ^XA
     ^CI28
 
     ^FX SV-ArtikelNr (Arial Bold)
     ^FO30,50
-    ^A@N,30,30,E:71028264.TTF
-    ^FD{sv_article_no}^FS
+    ^A@N,{article.height},{article.height},E:71028264.TTF
+    ^FD{article.text}^FS
 
     ^FX FORTLOX Key Text (Arial Bold)
     ^FO30,90
@@ -569,13 +622,13 @@ def generate_svt_fortlox_label_ok(
 
     ^FX FW-Version (rotated Arial Bold)
     ^FO595,120
-    ^A@B,26,26,E:71028264.TTF
-    ^FDFW: {fw_version}^FS
+    ^A@B,{fw.height},{fw.height},E:71028264.TTF
+    ^FDFW: {fw.text}^FS
 
     ^FX Run Date (rotated Arial Bold)
     ^FO655,120
-    ^A@B,26,26,E:71028264.TTF
-    ^FDDATE: {run_date}^FS
+    ^A@B,{date.height},{date.height},E:71028264.TTF
+    ^FDDATE: {date.text}^FS
 
     ^FX SV Logo at bottom
     ^FO30,308
@@ -611,14 +664,23 @@ def generate_svt_fortlox_label_nok(
         str: The ZPL command for printing the error codes for the SVT Fortlox label.
     """
 
+    article = SVT_NOK_ARTICLE_BOX.fit(sv_article_no)
+    code = SVT_NOK_ERROR_CODE_BOX.fit(error_code)
+    when = SVT_NOK_DATE_BOX.fit(f"{error_date} ({error_time})")
+    message = SVT_NOK_MESSAGE_BOX.fit(error_message)
+    serial = SVT_NOK_SERIAL_BOX.fit(serial_no)
+    # Long messages wrap onto a second line inside a field block
+    message_block = f"^FB{SVT_NOK_MESSAGE_BOX.width},{len(message.lines)},0,L,0" if len(message.lines) > 1 else ""
+    message_text = "\\&".join(message.lines)
+
     return f"""
     ^XA
     ^CI28
 
     ^FX SV ARTICLE NUMBER (Arial Bold)
     ^FO30,10
-    ^A@N,21,21,E:71028264.TTF
-    ^FD{sv_article_no}^FS
+    ^A@N,{article.height},{article.height},E:71028264.TTF
+    ^FD{article.text}^FS
 
     ^FX ERROR CODE (Arial)
     ^FO30,40
@@ -627,8 +689,8 @@ def generate_svt_fortlox_label_nok(
 
     ^FX ERROR CODE VALUE(Arial Bold)
     ^FO180,40
-    ^A@N,21,21,E:71028264.TTF
-    ^FD{error_code}^FS
+    ^A@N,{code.height},{code.height},E:71028264.TTF
+    ^FD{code.text}^FS
 
     ^FX DATE AND TIME (Arial)
     ^FO30,80
@@ -637,13 +699,13 @@ def generate_svt_fortlox_label_nok(
 
     ^FX DATE AND TIME VALUE (Arial Bold)
     ^FO180,80
-    ^A@N,21,21,E:71028264.TTF
-    ^FD{error_date} ({error_time})^FS
+    ^A@N,{when.height},{when.height},E:71028264.TTF
+    ^FD{when.text}^FS
 
     ^FX ERROR MESSAGE (Arial Bold)
     ^FO30,110
-    ^A@N,21,21,E:71028264.TTF
-    ^FD{error_message}^FS
+    ^A@N,{message.height},{message.height},E:71028264.TTF{message_block}
+    ^FD{message_text}^FS
 
     ^FX SERIAL NUMBER (Arial)
     ^FO30,140
@@ -652,8 +714,8 @@ def generate_svt_fortlox_label_nok(
 
     ^FX SERIAL NUMBER VALUE (Arial Bold)
     ^FO130,140
-    ^A@N,21,21,E:71028264.TTF
-    ^FD{serial_no}^FS
+    ^A@N,{serial.height},{serial.height},E:71028264.TTF
+    ^FD{serial.text}^FS
 
     ^XZ
     """
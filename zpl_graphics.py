@@ -0,0 +1,353 @@
+"""
+PNG/BMP images to ZPL ^GFA graphic fields, and back.
+
+    python zpl_graphics.py logo.png --width 200 --dither ordered > logo.zpl
+
+An image is flattened onto white, optionally scaled to a size in printer dots, and
+reduced to one bit per dot with NumPy: a plain threshold, ordered (Bayer) dithering,
+or Pillow's Floyd-Steinberg error diffusion. Rows are bit-packed and written in ZPL's
+ASCII compression: runs of a hex digit become a count letter (G-Y = 1-19, g-z =
+20-400) and the digit, trailing zeros or ones of a row become ',' or '!', and a row
+equal to the one above becomes ':'. Run detection and token building are vectorized
+over the whole image, so a label-sized image converts in milliseconds.
+
+Conversions are cached by a hash of the image bytes and options: in memory, and as
+files under ZPL_GRAPHICS_CACHE_DIR (default ~/.cache/miniprint/graphics; empty keeps
+the memory cache only), so a bulk run or a restarted server converts each image once.
+
+numpy and Pillow are only needed for converting (pip install numpy Pillow); decoding
+an existing ^GFA field needs neither.
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Union
+
+# Part of every cache key; bump when the output for the same input changes
+ENCODER_VERSION = '1'
+
+THRESHOLD = 'none'
+ORDERED = 'ordered'
+FLOYD_STEINBERG = 'floyd-steinberg'
+DITHERS = (THRESHOLD, ORDERED, FLOYD_STEINBERG)
+
+_HEX_DIGITS = '0123456789ABCDEF'
+_FIELD = re.compile(r'\^GFA,(\d+),(\d+),(\d+),([^\^~]*)')
+
+
+def _require():
+    try:
+        import numpy
+        from PIL import Image
+    except ImportError as e:
+        raise ImportError('Converting images needs numpy and Pillow: pip install numpy Pillow') from e
+    return numpy, Image
+
+
+class Graphic(NamedTuple):
+    width: int  # dots; rows are padded to whole bytes
+    height: int
+    bytes_per_row: int
+    data: str  # ASCII compressed hex
+
+    @property
+    def total_bytes(self) -> int:
+        return self.bytes_per_row * self.height
+
+    def command(self) -> str:
+        """The ^GFA command, to place after a ^FO"""
+        return f"^GFA,{self.total_bytes},{self.total_bytes},{self.bytes_per_row},{self.data}"
+
+
+# --- image to bits ---
+
+def _bayer(n: int):
+    np, _ = _require()
+    matrix = np.zeros((1, 1), dtype=np.int32)
+    while matrix.shape[0] < n:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])
+    return matrix
+
+
+def load_gray(image: Union[bytes, str, os.PathLike], width: Optional[int] = None, height: Optional[int] = None):
+    """An image as 8-bit grayscale, transparent parts on white, scaled to width x height dots"""
+    np, Image = _require()
+    with Image.open(io.BytesIO(image) if isinstance(image, bytes) else image) as img:
+        if img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info:
+            # Blend onto white: gray * alpha + 255 * (1 - alpha), in integers
+            la = np.asarray(img.convert('LA'), dtype=np.uint16)
+            gray, alpha = la[..., 0], la[..., 1]
+            gray = Image.fromarray(((gray * alpha + 255 * (255 - alpha) + 127) // 255).astype(np.uint8), 'L')
+        else:
+            gray = img.convert('L')
+    if width or height:
+        scale_w = width / gray.width if width else height / gray.height
+        scale_h = height / gray.height if height else scale_w
+        size = (max(1, round(gray.width * scale_w)), max(1, round(gray.height * scale_h)))
+        gray = gray.resize(size, Image.Resampling.LANCZOS)
+    return gray
+
+
+def to_bits(gray, threshold: int = 128, dither: str = THRESHOLD, invert: bool = False):
+    """Boolean dots (True = black) of a grayscale image"""
+    np, Image = _require()
+    if dither not in DITHERS:
+        raise ValueError(f"dither must be one of {', '.join(DITHERS)}")
+    if dither == FLOYD_STEINBERG:
+        bits = ~np.asarray(gray.convert('1', dither=Image.Dither.FLOYDSTEINBERG), dtype=bool)
+    else:
+        pixels = np.asarray(gray, dtype=np.uint8)
+        if dither == ORDERED:
+            bayer = _bayer(8)
+            # Thresholds spread around `threshold` in 64 steps, tiled over the image
+            levels = (bayer.astype(np.float32) + 0.5) / 64 * 2 * threshold
+            h, w = pixels.shape
+            bits = pixels < levels[np.arange(h)[:, None] % 8, np.arange(w)[None, :] % 8]
+        else:
+            bits = pixels < threshold
+    return ~bits if invert else bits
+
+
+def pack(bits):
+    """Rows of dots packed 8 to a byte, most significant bit first, as ^GF expects"""
+    np, _ = _require()
+    return np.packbits(bits, axis=1)
+
+
+# --- ASCII compression ---
+
+def _repeat(count: int) -> str:
+    """Count letters for a run of `count` identical digits (none for a single digit)"""
+    if count < 2:
+        return ''
+    letters = 'z' * (count // 400)
+    count %= 400
+    if count >= 20:
+        letters += chr(ord('g') + count // 20 - 1)
+        count %= 20
+    if count:
+        letters += chr(ord('G') + count - 1)
+    return letters
+
+
+@lru_cache(maxsize=32)
+def _repeat_table(longest: int):
+    np, _ = _require()
+    return np.array([_repeat(n) for n in range(longest + 1)])
+
+
+def compress(packed) -> str:
+    """ZPL ASCII compression of packed rows (a 2-D uint8 array)"""
+    np, _ = _require()
+    height, row_bytes = packed.shape
+    width = row_bytes * 2
+    nibbles = np.empty((height, width), dtype=np.uint8)
+    nibbles[:, 0::2] = packed >> 4
+    nibbles[:, 1::2] = packed & 0x0F
+
+    repeated = np.zeros(height, dtype=bool)
+    repeated[1:] = (packed[1:] == packed[:-1]).all(axis=1)
+
+    def kept(fill: int):
+        """Length of each row without its trailing `fill` digits"""
+        other = nibbles != fill
+        return np.where(other.any(axis=1), width - np.argmax(other[:, ::-1], axis=1), 0)
+
+    zeros_end, ones_end = kept(0x0), kept(0xF)
+    ones = ones_end < zeros_end
+    end = np.where(ones, ones_end, zeros_end)
+    end[repeated] = 0
+    suffix = np.where(repeated, ':', np.where(end == width, '', np.where(ones, '!', ',')))
+
+    # Runs of equal digits within the kept part of each row
+    columns = np.arange(width)
+    inside = columns[None, :] < end[:, None]
+    starts = np.ones((height, width), dtype=bool)
+    starts[:, 1:] = nibbles[:, 1:] != nibbles[:, :-1]
+    flat = np.flatnonzero(starts & inside)
+    rows = flat // width
+    following = np.append(flat[1:], height * width)
+    lengths = np.minimum(following, rows * width + end[rows]) - flat
+    tokens = np.char.add(_repeat_table(width)[lengths], np.array(list(_HEX_DIGITS))[nibbles.ravel()[flat]])
+
+    # Each row's suffix goes after its runs
+    out = np.empty(flat.size + height, dtype=object)
+    per_row = np.bincount(rows, minlength=height)
+    out[np.cumsum(per_row) + np.arange(height)] = suffix
+    out[np.arange(flat.size) + rows] = tokens
+    return ''.join(out.tolist())
+
+
+def decompress(data: str, bytes_per_row: int, total_bytes: int) -> bytes:
+    """Packed rows of ^GFA data: ASCII hex (compressed or not), :Z64: or :B64:"""
+    if data.startswith((':Z64:', ':B64:')):
+        raw = base64.b64decode(data[5:].split(':', 1)[0])
+        raw = zlib.decompress(raw) if data.startswith(':Z64:') else raw
+        return raw[:total_bytes].ljust(total_bytes, b'\0')
+    width = bytes_per_row * 2
+    rows = []
+    current = ''
+    count = 0
+    for ch in data:
+        if 'G' <= ch <= 'Y':
+            count += ord(ch) - ord('G') + 1
+        elif 'g' <= ch <= 'z':
+            count += (ord(ch) - ord('g') + 1) * 20
+        elif ch in _HEX_DIGITS or ch in 'abcdef':
+            current += ch.upper() * (count or 1)
+            count = 0
+            while len(current) >= width:
+                rows.append(current[:width])
+                current = current[width:]
+        elif ch in ',!':
+            rows.append(current.ljust(width, '0' if ch == ',' else 'F'))
+            current = ''
+        elif ch == ':':
+            rows.append(rows[-1] if rows else '0' * width)
+    if current:
+        rows.append(current.ljust(width, '0'))
+    return bytes.fromhex(''.join(rows))[:total_bytes].ljust(total_bytes, b'\0')
+
+
+def decode(command: str) -> Tuple[int, bytes]:
+    """(bytes per row, packed rows) of the first ^GFA field in a ZPL string"""
+    match = _FIELD.search(command)
+    if match is None:
+        raise ValueError('No ^GFA field found')
+    total, _, bytes_per_row, data = match.groups()
+    data = ''.join(data.split())
+    return int(bytes_per_row), decompress(data, int(bytes_per_row), int(total))
+
+
+# --- caching ---
+
+class GraphicCache:
+    """Converted graphics by key, in a bounded memory LRU and optionally as files in a directory"""
+
+    def __init__(self, directory: Optional[str] = None, max_entries: int = 256):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._memory: 'OrderedDict[str, Graphic]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Graphic]:
+        with self._lock:
+            graphic = self._memory.get(key)
+            if graphic is not None:
+                self._memory.move_to_end(key)
+                return graphic
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                graphic = Graphic(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+        self._remember(key, graphic)
+        return graphic
+
+    def put(self, key: str, graphic: Graphic) -> None:
+        self._remember(key, graphic)
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written under a temporary name so concurrent readers never see a partial file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(graphic._asdict(), f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def _remember(self, key: str, graphic: Graphic) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = graphic
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+
+def from_env() -> GraphicCache:
+    default = os.path.join(os.getenv('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'miniprint', 'graphics')
+    return GraphicCache(os.getenv('ZPL_GRAPHICS_CACHE_DIR', default) or None)
+
+
+DEFAULT_CACHE = from_env()
+
+
+def cache_key(image: bytes, options: Dict[str, Any]) -> str:
+    digest = hashlib.sha256(ENCODER_VERSION.encode())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    digest.update(image)
+    return digest.hexdigest()
+
+
+def convert(image: Union[bytes, str, os.PathLike], threshold: int = 128, dither: str = THRESHOLD,
+            invert: bool = False, width: Optional[int] = None, height: Optional[int] = None,
+            cache: Optional[GraphicCache] = DEFAULT_CACHE) -> Graphic:
+    """
+    Convert a PNG/BMP (bytes or a path) to a ZPL graphic. width and height are in
+    dots; give one to keep the aspect ratio, none to keep the image's size.
+
+    Raises:
+        ImportError: numpy or Pillow is not installed.
+        ValueError: Unknown dither, or the data is not an image.
+    """
+    if not isinstance(image, bytes):
+        with open(image, 'rb') as f:
+            image = f.read()
+    if dither not in DITHERS:
+        raise ValueError(f"dither must be one of {', '.join(DITHERS)}")
+    key = cache_key(image, {'threshold': threshold, 'dither': dither, 'invert': invert,
+                            'width': width, 'height': height})
+    graphic = cache.get(key) if cache is not None else None
+    if graphic is not None:
+        return graphic
+    _, Image = _require()
+    try:
+        gray = load_gray(image, width, height)
+    except Image.UnidentifiedImageError as e:
+        raise ValueError(f"Not a supported image: {e}") from e
+    packed = pack(to_bits(gray, threshold, dither, invert))
+    graphic = Graphic(gray.width, gray.height, packed.shape[1], compress(packed))
+    if cache is not None:
+        cache.put(key, graphic)
+    return graphic
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Convert an image to a ZPL ^GFA graphic field')
+    parser.add_argument('image', help='PNG or BMP file')
+    parser.add_argument('--width', type=int, help='width in dots (keeps the aspect ratio without --height)')
+    parser.add_argument('--height', type=int, help='height in dots')
+    parser.add_argument('--threshold', type=int, default=128, help='gray level below which a dot is black')
+    parser.add_argument('--dither', choices=DITHERS, default=THRESHOLD)
+    parser.add_argument('--invert', action='store_true', help='print light parts instead of dark ones')
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args()
+    graphic = convert(args.image, args.threshold, args.dither, args.invert, args.width, args.height,
+                      cache=None if args.no_cache else DEFAULT_CACHE)
+    sys.stdout.write(graphic.command() + '\n')
+    sys.stderr.write(f"{graphic.width}x{graphic.height} dots, {graphic.total_bytes} bytes, "
+                     f"{len(graphic.data)} characters compressed\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,477 @@
+"""
+Rasterize the ZPL our generators emit, for label previews and snapshot tests.
+
+    python zpl_raster.py label.zpl --output label.png
+    python zpl_raster.py --all --output-dir previews/
+
+One dot per pixel, so a PNG is at the printer's resolution (--dpmm, default 8 = 203
+dpi, is written into the file). Supported: ^FO, ^LH, ^PW/^LL, ^CF and ^A (font 0 and
+the Arial TTFs, all four orientations), ^FD/^FS, ^FB (width, lines, spacing,
+justification, \\& line breaks), ^GB, ^GFA (any encoding zpl_graphics.decode reads),
+^LR and ^FR. ^BC, ^BQ and ^BX are drawn as placeholders of about the symbol's size
+with a pattern derived from the data; they do not scan. Other commands are ignored.
+Without ^PW/^LL the image is as large as the label's content.
+
+Text uses a built-in 5x7 dot font stretched to each character's advance width from
+text_fit, so a field covers the space the label fitting assumed. It is legible but not
+the printer's typeface, and it is the same on every machine: rasters can be compared
+dot for dot. Identical ZPL is served from a bounded in-memory cache.
+
+Needs numpy (pip install numpy); PNGs are written without Pillow.
+"""
+import argparse
+import hashlib
+import os
+import re
+import struct
+import sys
+import unicodedata
+import zlib
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import text_fit
+import zpl_graphics
+from render_cache import RenderCache
+
+# Part of every cache key; bump when the raster for the same ZPL changes
+RASTER_VERSION = '1'
+DEFAULT_DPMM = 8
+
+# 5x7 font for ' ' .. '~': five columns per character, least significant bit at the top,
+# bit 7 for descenders
+_FONT = (
+    '0000000000' '00005F0000' '0007000700' '147F147F14' '242A7F2A12' '2313086462' '3649562050' '0008070300'
+    '001C224100' '0041221C00' '2A1C7F1C2A' '08083E0808' '0080703000' '0808080808' '0000606000' '2010080402'
+    '3E5149453E' '00427F4000' '7249494946' '2141494D33' '1814127F10' '2745454539' '3C4A494931' '4121110907'
+    '3649494936' '464949291E' '0000140000' '0040340000' '0008142241' '1414141414' '0041221408' '0201590906'
+    '3E415D594E' '7C1211127C' '7F49494936' '3E41414122' '7F4141413E' '7F49494941' '7F09090901' '3E41415173'
+    '7F0808087F' '00417F4100' '2040413F01' '7F08142241' '7F40404040' '7F021C027F' '7F0408107F' '3E4141413E'
+    '7F09090906' '3E4151215E' '7F09192946' '2649494932' '03017F0103' '3F4040403F' '1F2040201F' '3F4038403F'
+    '6314081463' '0304780403' '6159494D43' '007F414141' '0204081020' '004141417F' '0402010204' '4040404040'
+    '0003070800' '2054547840' '7F28444438' '3844444428' '384444287F' '3854545418' '00087E0902' '18A4A49C78'
+    '7F08040478' '00447D4000' '2040403D00' '7F10284400' '00417F4000' '7C0478047C' '7C08040478' '3844444438'
+    'FC18242418' '18242418FC' '7C08040408' '4854545424' '04043F4424' '3C4040207C' '1C2040201C' '3C4030403C'
+    '4428102844' '4C9090907C' '4464544C44' '0008364100' '0000770000' '0041360800' '0201020402'
+)
+_FIRST_CHAR = 32
+_FALLBACK = '?'
+
+# Square ECC 200 Data Matrix sizes and their data codewords
+_DATAMATRIX_SIZES = ((10, 3), (12, 5), (14, 8), (16, 12), (18, 18), (20, 22), (22, 30), (24, 36), (26, 44),
+                     (32, 62), (36, 86), (40, 114), (44, 144), (48, 174), (52, 204), (64, 280), (72, 368),
+                     (80, 456), (88, 576), (96, 696), (104, 816), (120, 1050), (132, 1304), (144, 1558))
+# QR byte mode capacity of versions 1-10 per error correction level
+_QR_CAPACITY = {
+    'L': (17, 32, 53, 78, 106, 134, 154, 192, 230, 271),
+    'M': (14, 26, 42, 62, 84, 106, 122, 152, 180, 213),
+    'Q': (11, 20, 32, 46, 60, 74, 86, 108, 130, 151),
+    'H': (7, 14, 24, 34, 44, 58, 64, 84, 98, 119),
+}
+_TTF_FONTS = {text_fit.ARIAL_BOLD, text_fit.ARIAL}
+_ROTATIONS = {'N': 0, 'R': -1, 'I': 2, 'B': 1}  # np.rot90 quarter turns
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError('Rasterizing ZPL needs numpy: pip install numpy') from e
+    return numpy
+
+
+@lru_cache(maxsize=1)
+def _glyphs():
+    """(characters + fallback, 8 rows, 6 columns) with the sixth column as spacing"""
+    np = _numpy()
+    columns = np.frombuffer(bytes.fromhex(_FONT), dtype=np.uint8).reshape(-1, 5)
+    bits = (columns[:, None, :] >> np.arange(8)[None, :, None]) & 1
+    glyphs = np.zeros((len(columns), 8, 6), dtype=bool)
+    glyphs[:, :, :5] = bits.astype(bool)
+    return glyphs
+
+
+def _glyph_index(char: str) -> int:
+    code = ord(char)
+    if not _FIRST_CHAR <= code < _FIRST_CHAR + len(_FONT) // 10:
+        # Accented letters use their base letter
+        char = unicodedata.normalize('NFD', char)[:1]
+        code = ord(char) if char else 0
+        if not _FIRST_CHAR <= code < _FIRST_CHAR + len(_FONT) // 10:
+            code = ord(_FALLBACK)
+    return code - _FIRST_CHAR
+
+
+def _advances(text: str, font: str, width: int):
+    np = _numpy()
+    table, scale = text_fit.FONT_METRICS.get(font, text_fit.FONT_METRICS[text_fit.FONT_0])
+    return np.array([text_fit._char_width(c, table) for c in text], dtype=float) * scale * width / 1000
+
+
+def text_width(text: str, font: str, width: int) -> int:
+    """Dots a line of text covers"""
+    return int(round(float(_advances(text, font, width).sum()))) if text else 0
+
+
+def draw_text(text: str, font: str, height: int, width: int):
+    """A line of text as dots (True = black), height x its advance width"""
+    np = _numpy()
+    if not text or height <= 0 or width <= 0:
+        return np.zeros((max(height, 0), 0), dtype=bool)
+    edges = np.round(np.concatenate(([0.0], np.cumsum(_advances(text, font, width))))).astype(int)
+    x = np.arange(edges[-1])
+    char = np.searchsorted(edges, x, side='right') - 1
+    cell = np.maximum(edges[char + 1] - edges[char], 1)
+    # Each dot covers a span of glyph columns and is black if any of them is, so narrow
+    # cells keep the stems of i, l and :
+    first = (x - edges[char]) * 6 // cell
+    last = np.maximum(-(-(x - edges[char] + 1) * 6 // cell), first + 1)
+    columns = np.arange(6)
+    covered = (columns[None, :] >= first[:, None]) & (columns[None, :] < last[:, None])
+    row = np.arange(height) * 8 // height
+    glyph = np.array([_glyph_index(c) for c in text])[char]
+    return (_glyphs()[glyph[None, :], row[:, None], :] & covered[None, :, :]).any(axis=2)
+
+
+def _wrap(text: str, font: str, width: int, block: int) -> List[str]:
+    lines: List[str] = []
+    for paragraph in text.split('\\&'):
+        line = ''
+        for word in paragraph.split(' '):
+            candidate = f"{line} {word}" if line else word
+            if line and text_width(candidate, font, width) > block:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def _pattern(data: str, rows: int, columns: int):
+    """Deterministic pseudo-random dots standing in for a symbol's data modules"""
+    np = _numpy()
+    digest = hashlib.shake_256(data.encode('utf-8')).digest((rows * columns + 7) // 8)
+    return np.unpackbits(np.frombuffer(digest, dtype=np.uint8))[:rows * columns].reshape(rows, columns).astype(bool)
+
+
+def _scale(modules, size: int):
+    np = _numpy()
+    return np.kron(modules, np.ones((size, size), dtype=bool))
+
+
+def qr_placeholder(data: str, magnification: int, ecc: str = 'Q'):
+    np = _numpy()
+    capacity = _QR_CAPACITY.get(ecc, _QR_CAPACITY['Q'])
+    version = next((v for v, c in enumerate(capacity, 1) if len(data.encode('utf-8')) <= c), len(capacity))
+    n = 17 + 4 * version
+    modules = _pattern(data, n, n)
+    finder = np.ones((7, 7), dtype=bool)
+    finder[1:6, 1:6] = False
+    finder[2:5, 2:5] = True
+    for y, x in ((0, 0), (0, n - 7), (n - 7, 0)):
+        modules[max(y - 1, 0):y + 8, max(x - 1, 0):x + 8] = False
+        modules[y:y + 7, x:x + 7] = finder
+    return _scale(modules, max(magnification, 1))
+
+
+def datamatrix_placeholder(data: str, module: int):
+    codewords = len(re.sub(r'\d\d', 'x', data)) + sum(1 for c in data if ord(c) > 127)
+    n = next((size for size, capacity in _DATAMATRIX_SIZES if codewords <= capacity), _DATAMATRIX_SIZES[-1][0])
+    modules = _pattern(data, n, n)
+    modules[:, 0] = modules[-1, :] = True
+    modules[0, :] = modules[:, -1] = False
+    modules[0, ::2] = True
+    modules[1::2, -1] = True
+    return _scale(modules, max(module, 1))
+
+
+def code128_placeholder(data: str, module: int, height: int):
+    np = _numpy()
+    symbols = len(re.sub(r'\d\d(?=(\d\d)*(\D|$))', 'x', data)) if re.search(r'\d{4}', data) else len(data)
+    count = 11 * symbols + 35
+    bars = _pattern(data, 1, count)[0]
+    bars[:2] = bars[-2:] = True
+    bars[-3] = False
+    return np.repeat(np.repeat(bars[None, :], max(module, 1), axis=1), max(height, 1), axis=0)
+
+
+def graphic_box(width: int, height: int, thickness: int):
+    np = _numpy()
+    thickness = max(thickness, 1)
+    width, height = max(width, thickness), max(height, thickness)
+    box = np.ones((height, width), dtype=bool)
+    if width > 2 * thickness and height > 2 * thickness:
+        box[thickness:-thickness, thickness:-thickness] = False
+    return box
+
+
+class _Canvas:
+    def __init__(self):
+        np = _numpy()
+        self.dots = np.zeros((0, 0), dtype=bool)
+        self.extent = (0, 0)
+
+    def paint(self, x: int, y: int, bitmap, mode: str = 'black') -> None:
+        """Draw at (x, y): 'black' sets dots, 'white' clears them, 'reverse' inverts them"""
+        np = _numpy()
+        h, w = bitmap.shape
+        if x < 0:
+            bitmap, w, x = bitmap[:, -x:], w + x, 0
+        if y < 0:
+            bitmap, h, y = bitmap[-y:, :], h + y, 0
+        if h <= 0 or w <= 0:
+            return
+        rows, columns = self.dots.shape
+        if y + h > rows or x + w > columns:
+            grown = np.zeros((max(rows, y + h), max(columns, x + w)), dtype=bool)
+            grown[:rows, :columns] = self.dots
+            self.dots = grown
+        self.extent = (max(self.extent[0], y + h), max(self.extent[1], x + w))
+        region = self.dots[y:y + h, x:x + w]
+        if mode == 'reverse':
+            region ^= bitmap
+        elif mode == 'white':
+            region &= ~bitmap
+        else:
+            region |= bitmap
+
+
+def _number(params: List[str], index: int, default: int) -> int:
+    try:
+        return int(params[index].strip())
+    except (IndexError, ValueError):
+        return default
+
+
+def _commands(zpl: str):
+    """(command, parameter string) in order; ^A's font designator starts its parameters"""
+    for piece in re.split(r'[\^~]', zpl)[1:]:
+        if piece[:1].upper() == 'A':
+            yield 'A', piece[1:]
+        else:
+            yield piece[:2].upper(), piece[2:]
+
+
+def rasterize(zpl: str):
+    """
+    Dots of the first label format in zpl as a 2-D bool array (True = black), one
+    element per printer dot.
+
+    Raises:
+        ImportError: numpy is not installed.
+    """
+    np = _numpy()
+    canvas = _Canvas()
+    home = (0, 0)
+    size: List[Optional[int]] = [None, None]  # ^PW, ^LL
+    default_font = (text_fit.FONT_0, 9, 5)
+    bar = (2, 10)  # ^BY module width, height
+    label_reverse = False
+    field = _new_field()
+    for command, raw in _commands(zpl):
+        params = raw.split(',')
+        if command == 'XZ':
+            break
+        if command == 'LH':
+            home = (_number(params, 0, 0), _number(params, 1, 0))
+        elif command == 'PW':
+            size[0] = _number(params, 0, 0) or None
+        elif command == 'LL':
+            size[1] = _number(params, 0, 0) or None
+        elif command == 'LR':
+            label_reverse = raw.strip().upper().startswith('Y')
+        elif command == 'CF':
+            height = _number(params, 1, default_font[1])
+            font = _font_name(params[0].strip()[:1] or '0', None)
+            default_font = (font, height, _number(params, 2, height))
+        elif command == 'BY':
+            bar = (_number(params, 0, bar[0]), _number(params, 2, bar[1]))
+        elif command == 'FO':
+            field['origin'] = (_number(params, 0, 0), _number(params, 1, 0))
+        elif command == 'A':
+            # ^A0N,30,30 or ^A@N,30,30,E:71028264.TTF
+            designator, params = raw[:1], raw[1:].split(',')
+            height = _number(params, 1, default_font[1])
+            field['font'] = (_font_name(designator, params[3].strip() if len(params) > 3 else None),
+                             height, _number(params, 2, height))
+            field['orientation'] = params[0].strip()[:1].upper() or 'N'
+        elif command == 'FB':
+            field['block'] = (_number(params, 0, 0), max(_number(params, 1, 1), 1), _number(params, 2, 0),
+                              params[3].strip().upper()[:1] if len(params) > 3 else 'L')
+        elif command == 'FR':
+            field['reverse'] = True
+        elif command == 'FD':
+            field['data'] = raw.replace('\r', '').replace('\n', '')
+        elif command == 'GB':
+            field['bitmap'] = graphic_box(_number(params, 0, 1), _number(params, 1, 1), _number(params, 2, 1))
+            field['white'] = len(params) > 3 and params[3].strip().upper() == 'W'
+        elif command == 'GF':
+            bytes_per_row, packed = zpl_graphics.decode('^GF' + raw)
+            rows = np.frombuffer(packed, dtype=np.uint8).reshape(-1, bytes_per_row)
+            field['bitmap'] = np.unpackbits(rows, axis=1).astype(bool)
+        elif command in ('BC', 'BQ', 'BX'):
+            field['barcode'] = (command, params, bar)
+            field['orientation'] = params[0].strip()[:1].upper() or 'N'
+        elif command == 'FS':
+            _draw_field(canvas, field, home, default_font, label_reverse)
+            field = _new_field()
+    height = size[1] or canvas.extent[0]
+    width = size[0] or canvas.extent[1]
+    dots = np.zeros((max(height, 1), max(width, 1)), dtype=bool)
+    h, w = min(height, canvas.dots.shape[0]), min(width, canvas.dots.shape[1])
+    dots[:h, :w] = canvas.dots[:h, :w]
+    return dots
+
+
+def _new_field() -> Dict:
+    return {'origin': (0, 0), 'font': None, 'orientation': 'N', 'block': None, 'reverse': False,
+            'data': None, 'bitmap': None, 'white': False, 'barcode': None}
+
+
+def _font_name(designator: str, file: Optional[str]) -> str:
+    if file and file.upper() in _TTF_FONTS:
+        return file.upper()
+    return text_fit.FONT_0
+
+
+def _draw_field(canvas: _Canvas, field: Dict, home: Tuple[int, int], default_font, label_reverse: bool) -> None:
+    np = _numpy()
+    x, y = field['origin'][0] + home[0], field['origin'][1] + home[1]
+    mode = 'reverse' if label_reverse or field['reverse'] else 'white' if field['white'] else 'black'
+    if field['bitmap'] is not None:
+        canvas.paint(x, y, field['bitmap'], mode)
+        return
+    data = field['data']
+    if not data:
+        return
+    font, height, width = field['font'] or default_font
+    if field['barcode'] is not None:
+        command, params, (module, bar_height) = field['barcode']
+        if command == 'BQ':
+            # ^FD<error correction><input mode>,<data>
+            ecc, _, text = data.partition(',')
+            bitmap = qr_placeholder(text[1:] if text else data, _number(params, 2, 2), ecc[:1].upper() or 'Q')
+        elif command == 'BX':
+            bitmap = datamatrix_placeholder(data, _number(params, 1, 1))
+        else:
+            bitmap = code128_placeholder(data, module, _number(params, 1, bar_height))
+            if (params[2].strip().upper() if len(params) > 2 else 'Y') != 'N':
+                line = draw_text(data, font, height, width)
+                below = np.zeros((bitmap.shape[0] + 2 + line.shape[0], max(bitmap.shape[1], line.shape[1])),
+                                 dtype=bool)
+                below[:bitmap.shape[0], :bitmap.shape[1]] = bitmap
+                offset = (below.shape[1] - line.shape[1]) // 2
+                below[bitmap.shape[0] + 2:, offset:offset + line.shape[1]] = line
+                bitmap = below
+        canvas.paint(x, y, np.rot90(bitmap, _ROTATIONS.get(field['orientation'], 0)), mode)
+        return
+    if field['block'] is None:
+        bitmap = draw_text(data, font, height, width)
+    else:
+        block, max_lines, spacing, justify = field['block']
+        lines = _wrap(data, font, width, block)
+        pitch = height + spacing
+        bitmap = np.zeros((pitch * (max_lines - 1) + height, max(block, 1)), dtype=bool)
+        for i, line in enumerate(lines):
+            # Lines beyond the block's last overprint it, as on the printer
+            drawn = draw_text(line, font, height, width)[:, :block]
+            offset = {'C': (block - drawn.shape[1]) // 2, 'R': block - drawn.shape[1]}.get(justify, 0)
+            top = pitch * min(i, max_lines - 1)
+            bitmap[top:top + height, offset:offset + drawn.shape[1]] |= drawn
+    canvas.paint(x, y, np.rot90(bitmap, _ROTATIONS.get(field['orientation'], 0)), mode)
+
+
+def to_png(dots, dpmm: int = DEFAULT_DPMM) -> bytes:
+    """A 1-bit grayscale PNG of dots, with the printer's resolution as its physical size"""
+    np = _numpy()
+    height, width = dots.shape
+    rows = np.packbits(~dots, axis=1)
+    raw = np.zeros((height, rows.shape[1] + 1), dtype=np.uint8)  # filter byte 0 per row
+    raw[:, 1:] = rows
+
+    def chunk(kind: bytes, body: bytes) -> bytes:
+        return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0))
+            + chunk(b'pHYs', struct.pack('>IIB', dpmm * 1000, dpmm * 1000, 1))
+            + chunk(b'IDAT', zlib.compress(raw.tobytes(), 9))
+            + chunk(b'IEND', b''))
+
+
+def read_png(data: bytes):
+    """Dots of a PNG written by to_png (1-bit grayscale, unfiltered rows)"""
+    np = _numpy()
+    position, idat, header = 8, b'', None
+    while position < len(data):
+        length, kind = struct.unpack('>I4s', data[position:position + 8])
+        body = data[position + 8:position + 8 + length]
+        if kind == b'IHDR':
+            header = struct.unpack('>IIBBBBB', body)
+        elif kind == b'IDAT':
+            idat += body
+        position += 12 + length
+    if header is None or header[2:5] != (1, 0, 0):
+        raise ValueError('Not a 1-bit grayscale PNG')
+    width, height = header[:2]
+    raw = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(height, -1)
+    if raw[:, 0].any():
+        raise ValueError('Filtered PNG rows are not supported')
+    return ~np.unpackbits(raw[:, 1:], axis=1)[:, :width].astype(bool)
+
+
+_cache = RenderCache(max_entries=256, max_bytes=16 * 1024 * 1024)
+
+
+def render_png(zpl: str, dpmm: int = DEFAULT_DPMM, cache: Optional[RenderCache] = _cache) -> bytes:
+    """PNG of a label; identical ZPL is answered from the cache"""
+    key = hashlib.sha256(f"{RASTER_VERSION}\0{dpmm}\0{zpl}".encode('utf-8')).hexdigest()
+    png = cache.get(key) if cache is not None else None
+    if png is None:
+        png = to_png(rasterize(zpl), dpmm)
+        if cache is not None:
+            cache.put(key, png)
+    return png
+
+
+def render_label_types(payloads: Optional[Dict[str, Dict]] = None, dpmm: int = DEFAULT_DPMM) -> Dict[str, bytes]:
+    """PNG of every label type, rendered from the benchmark sample payloads by default"""
+    from labels import LABEL_TYPES
+    if payloads is None:
+        from benchmarks.payloads import PAYLOADS as payloads
+    return {name: render_png(label.generate(**payloads[name]), dpmm)
+            for name, label in LABEL_TYPES.items() if name in payloads}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Rasterize ZPL to PNG')
+    parser.add_argument('zpl', nargs='?', help='ZPL file (- for stdin)')
+    parser.add_argument('--output', '-o', help='PNG file (default: stdout)')
+    parser.add_argument('--all', action='store_true', help='render every label type from sample payloads')
+    parser.add_argument('--output-dir', default='.', help='directory for --all')
+    parser.add_argument('--dpmm', type=int, default=DEFAULT_DPMM, help='dots per mm written into the PNG')
+    args = parser.parse_args()
+    if args.all:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for name, png in render_label_types(dpmm=args.dpmm).items():
+            with open(os.path.join(args.output_dir, f'{name}.png'), 'wb') as f:
+                f.write(png)
+        return
+    if not args.zpl:
+        parser.error('a ZPL file or --all is required')
+    if args.zpl == '-':
+        zpl = sys.stdin.read()
+    else:
+        with open(args.zpl, encoding='utf-8') as f:
+            zpl = f.read()
+    png = render_png(zpl, args.dpmm)
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(png)
+    else:
+        sys.stdout.buffer.write(png)
+
+
+if __name__ == '__main__':
+    main()